@@ -0,0 +1,278 @@
+"""
+Batched UserActivityLog ingestion.
+
+POST /api/activity-logs/batch/ takes the events a client has queued:
+
+    {"sent_at": 1760000000000,
+     "events": [{"activity_type": "heartbeat", "path": "StudentPortal/Videos",
+                 "metadata": {}, "duration": 60, "ts": 1759999940000}, ...]}
+
+`ts` and `sent_at` are the client's clock in epoch milliseconds. An event's
+stored timestamp is server receive time minus (sent_at - ts), so client clock
+skew doesn't move events, and events are kept in their client order.
+Events are validated with plain checks (no serializer per event); invalid
+ones are reported back by index and the rest are accepted.
+
+Accepted events go into a bounded in-process queue. A per-worker thread
+drains it every FLUSH_SECONDS: one block of ids reserved from Djongo's
+auto-increment counter (so ORM reads of the rows keep working), the
+students' rollup watermark (activity_rollup.watermark), one insert_many,
+then the rollup update (activity_rollup.record) for the rows that were
+inserted. Rows whose insert failed are retried on the next flushes (up to
+MAX_ATTEMPTS, within MAX_QUEUE) and only reach the rollups once stored.
+When the queue is full the request flushes it inline instead of growing
+it. Gunicorn's worker_exit hook drains whatever is left.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+
+from .models import UserActivityLog
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = 'api_useractivitylog'
+
+MAX_EVENTS_PER_REQUEST = 200
+MAX_QUEUE = int(os.getenv('ACTIVITY_QUEUE_MAX', '5000'))
+FLUSH_SECONDS = float(os.getenv('ACTIVITY_FLUSH_SECONDS', '2'))
+INSERT_BATCH = 1000
+MAX_ATTEMPTS = 5  # flushes a failed batch is tried in before it is dropped
+DUPLICATE_KEY = 11000
+
+MAX_DURATION = 6 * 3600
+MAX_PATH = UserActivityLog._meta.get_field('path').max_length
+MAX_METADATA_KEYS = 20
+# How far back a queued client event may be dated (older ones are clamped)
+MAX_CLIENT_AGE = timedelta(hours=24)
+
+ACTIVITY_TYPES = {key for key, _ in UserActivityLog.ACTIVITY_TYPES}
+
+
+class BatchError(ValueError):
+    pass
+
+
+# ── Validation ────────────────────────────────────────────────────────────────
+
+def _int(value, name):
+    if isinstance(value, bool):
+        raise ValueError(f"{name} must be a number")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a number")
+
+
+def _event(raw, user_id, now, sent_at_ms):
+    if not isinstance(raw, dict):
+        raise ValueError("event must be an object")
+    kind = raw.get('activity_type')
+    if kind not in ACTIVITY_TYPES:
+        raise ValueError(f"unknown activity_type {kind!r}")
+    path = raw.get('path')
+    if not isinstance(path, str) or not path:
+        raise ValueError("path is required")
+    metadata = raw.get('metadata') or {}
+    if not isinstance(metadata, dict) or len(metadata) > MAX_METADATA_KEYS:
+        raise ValueError("metadata must be a small object")
+    duration = _int(raw.get('duration') or 0, 'duration')
+    if not 0 <= duration <= MAX_DURATION:
+        raise ValueError("duration out of range")
+
+    timestamp = now
+    if raw.get('ts') is not None:
+        age_ms = sent_at_ms - _int(raw['ts'], 'ts')  # both on the client's clock
+        timestamp = now - timedelta(milliseconds=max(0, age_ms))
+        timestamp = max(timestamp, now - MAX_CLIENT_AGE)
+    return {
+        'user_id': user_id,
+        'activity_type': kind,
+        'path': path[:MAX_PATH],
+        'metadata': metadata,
+        'duration': duration,
+        'timestamp': timestamp,
+    }
+
+
+def parse_batch(data, user):
+    """(events ready to store, [{"index", "error"}]) for one request body."""
+    if isinstance(data, list):
+        raw_events, sent_at = data, None
+    elif isinstance(data, dict) and isinstance(data.get('events'), list):
+        raw_events, sent_at = data['events'], data.get('sent_at')
+    else:
+        raise BatchError("Expected a list of events or {\"events\": [...]}")
+    if len(raw_events) > MAX_EVENTS_PER_REQUEST:
+        raise BatchError(f"At most {MAX_EVENTS_PER_REQUEST} events per request")
+
+    now = datetime.now()
+    try:
+        sent_at_ms = _int(sent_at, 'sent_at') if sent_at is not None else None
+    except ValueError as e:
+        raise BatchError(str(e))
+
+    user_id = user.pk if isinstance(user.pk, ObjectId) else ObjectId(str(user.pk))
+    events, rejected = [], []
+    for index, raw in enumerate(raw_events):
+        try:
+            if sent_at_ms is None and isinstance(raw, dict) and raw.get('ts') is not None:
+                raise ValueError("ts requires sent_at")
+            events.append((index, _event(raw, user_id, now, sent_at_ms)))
+        except ValueError as e:
+            rejected.append({'index': index, 'error': str(e)})
+
+    # keep client order; equal timestamps stay in the order they were sent
+    events.sort(key=lambda pair: (pair[1]['timestamp'], pair[0]))
+    return [e for _, e in events], rejected
+
+
+# ── Queue ─────────────────────────────────────────────────────────────────────
+
+_queue = []
+_queue_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_retry = []  # [(attempts, events)] whose insert failed; guarded by _flush_lock
+
+
+def enqueue(events):
+    """Queue events for the next flush; flushes inline when the queue is full."""
+    ensure_flusher()
+    with _queue_lock:
+        _queue.extend(events)
+        full = len(_queue) >= MAX_QUEUE
+    if full:
+        flush()
+
+
+def _reserve_ids(db, n):
+    """Take n ids from Djongo's auto-increment counter for this table, or None."""
+    schema = db['__schema__'].find_one_and_update(
+        {'name': COLLECTION, 'auto': {'$exists': True}},
+        {'$inc': {'auto.seq': n}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if not schema:
+        return None
+    last = schema['auto']['seq']
+    return range(last - n + 1, last + 1)
+
+
+def _write(events):
+    """Store one batch; returns the events whose insert failed (to retry)."""
+    from .db_utils import get_db
+    from . import activity_rollup
+
+    db = get_db()
+    if db is None:
+        UserActivityLog.objects.bulk_create([UserActivityLog(**e) for e in events])
+        return []
+    fresh = [e for e in events if 'id' not in e]  # a retried event keeps its id
+    ids = _reserve_ids(db, len(fresh)) if fresh else None
+    if ids is not None:
+        for event, pk in zip(fresh, ids):
+            event['id'] = pk
+    try:
+        # before the insert: a backfill racing this flush then leaves these rows to record()
+        activity_rollup.watermark([e['user_id'] for e in events], datetime.now())
+    except Exception as e:
+        logger.warning(f"[activity] Rollup watermark for {len(events)} events failed: {e}")
+
+    failed = []
+    try:
+        db[COLLECTION].insert_many(events, ordered=False)
+        written = events
+    except BulkWriteError as e:
+        # a duplicate _id is a row an earlier, interrupted attempt already stored
+        bad = {err['index'] for err in e.details.get('writeErrors', []) if err.get('code') != DUPLICATE_KEY}
+        written = [ev for i, ev in enumerate(events) if i not in bad]
+        failed = [ev for i, ev in enumerate(events) if i in bad]
+    if written:
+        try:
+            activity_rollup.record(written)
+        except Exception as e:
+            logger.warning(f"[activity] Rollup update for {len(written)} events failed: {e}")
+    return failed
+
+
+def _requeue(events, attempts, error):
+    queued = sum(len(batch) for _, batch in _retry)
+    if attempts >= MAX_ATTEMPTS or queued + len(events) > MAX_QUEUE:
+        logger.warning(f"[activity] Dropped {len(events)} events after {attempts} attempt(s): {error}")
+        return
+    _retry.append((attempts, events))
+
+
+def flush():
+    """Write everything queued so far, retrying failed batches. Returns the number of events written."""
+    with _flush_lock:
+        with _queue_lock:
+            pending = _queue[:]
+            del _queue[:]
+        batches = _retry[:] + [(0, pending[i:i + INSERT_BATCH]) for i in range(0, len(pending), INSERT_BATCH)]
+        del _retry[:]
+        written = 0
+        for n, (attempts, batch) in enumerate(batches):
+            try:
+                failed = _write(batch)
+            except Exception as e:
+                # nothing known to be stored; leave the rest for the next flush too
+                logger.warning(f"[activity] Flush of {len(batch)} events failed, will retry: {e}")
+                _requeue(batch, attempts + 1, e)
+                for later_attempts, later in batches[n + 1:]:
+                    _requeue(later, later_attempts, e)
+                break
+            written += len(batch) - len(failed)
+            if failed:
+                _requeue(failed, attempts + 1, "insert errors")
+        return written
+
+
+_flusher = {'pid': None}
+_flusher_lock = threading.Lock()
+
+
+def _flush_loop():
+    from django.db import close_old_connections
+    while True:
+        time.sleep(FLUSH_SECONDS)
+        if not _queue and not _retry:
+            continue
+        close_old_connections()
+        try:
+            flush()
+        except Exception as e:
+            logger.warning(f"[activity] Flush loop error: {e}")
+
+
+def ensure_flusher():
+    """Start this process's flush thread (once per pid, so it survives gunicorn's fork)."""
+    if _flusher['pid'] == os.getpid():
+        return
+    with _flusher_lock:
+        if _flusher['pid'] == os.getpid():
+            return
+        _flusher['pid'] = os.getpid()
+        del _queue[:]  # a forked child must not re-write its parent's queue
+        threading.Thread(target=_flush_loop, name='activity-flusher', daemon=True).start()
+        atexit.register(flush_on_exit)
+
+
+def flush_on_exit():
+    if _flusher['pid'] != os.getpid():
+        return
+    try:
+        n = flush()
+        if n:
+            logger.info(f"[activity] Flushed {n} events on exit")
+        if _retry:
+            logger.warning(f"[activity] Dropped {sum(len(b) for _, b in _retry)} unwritable events on exit")
+    except Exception as e:
+        logger.warning(f"[activity] Exit flush failed: {e}")
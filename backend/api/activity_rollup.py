@@ -0,0 +1,308 @@
+"""
+Per-student daily activity rollups (UserActivityLog pre-aggregated).
+
+Two collections, written with PyMongo alongside the raw `api_useractivitylog`
+rows:
+
+    api_activityrollup   one document per student per day
+        {_id: "<user_id>:<YYYY-MM-DD>", user_id, day, last_at,
+         types: {<activity_type>: {duration, sessions, paths: {<path>: seconds}}}}
+
+    api_activitytotals   one lifetime document per student
+        {_id: user_id, first_at, last_at, ingested_from, backfilled,
+         types: {...same shape...},
+         videos: {<video key>: {id, title, seconds, plays, last_play_at}}}
+
+`sessions` counts logged events (one heartbeat, one play...), `paths` keeps
+seconds per section so distinct paths and the time distribution come from
+the rollup too. Path and video keys are escaped for use as Mongo field names.
+
+Rollups are maintained on ingest (record(), $inc upserts merged per
+document) and backfilled per student on first read from the raw logs plus
+the archive collection. The split between the two is `ingested_from`, the
+server time the student's first rolled-up rows were received (watermark(),
+set before those rows are inserted): the backfill counts only rows
+inserted before it, by their ObjectId creation time, so a backdated client
+event can't hide older raw history from the backfill or be counted twice. After a student is backfilled their raw rows are no longer needed for
+the analytics screens, so `manage.py rollup_activity --archive-days N`
+moves old rows to `api_useractivitylog_archive`; `--rebuild` recomputes a
+student's rollups from raw + archive.
+"""
+import json
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from django.core.cache import cache
+from pymongo import UpdateOne
+
+LOG_COLLECTION = 'api_useractivitylog'
+ARCHIVE_COLLECTION = 'api_useractivitylog_archive'
+DAILY_COLLECTION = 'api_activityrollup'
+TOTALS_COLLECTION = 'api_activitytotals'
+
+BACKFILL_LOCK_SECONDS = 300
+ARCHIVE_BATCH = 1000
+
+VIDEO_TYPES = ('video_play', 'video_pause', 'video_complete')
+
+
+def _collection(name):
+    from api.db_utils import get_db
+    db = get_db()
+    return db[name] if db is not None else None
+
+
+def _user_id(value):
+    if isinstance(value, ObjectId):
+        return value
+    try:
+        return ObjectId(str(value))
+    except Exception:
+        return value
+
+
+def escape_key(value):
+    """Mongo field names can't contain '.' or start with '$'."""
+    key = str(value or 'unknown')
+    return key.replace('%', '%25').replace('.', '%2E').replace('$', '%24')
+
+
+def unescape_key(key):
+    return key.replace('%24', '$').replace('%2E', '.').replace('%25', '%')
+
+
+def _metadata(value):
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return {}
+    return value if isinstance(value, dict) else {}
+
+
+def video_key(metadata, path):
+    """Same identity the admin summary used: video id, else title, else path."""
+    return metadata.get('video_id') or metadata.get('video_title') or path
+
+
+# ── Ingest ────────────────────────────────────────────────────────────────────
+
+class _Updates:
+    """Merges any number of events into one $inc/$max/$min/$set per document."""
+
+    def __init__(self):
+        self.docs = defaultdict(lambda: {'$inc': defaultdict(int), '$max': {}, '$min': {}, '$set': {}, '$setOnInsert': {}})
+
+    def inc(self, doc_id, field, amount):
+        self.docs[doc_id]['$inc'][field] += amount
+
+    def max(self, doc_id, field, value):
+        cur = self.docs[doc_id]['$max'].get(field)
+        if cur is None or value > cur:
+            self.docs[doc_id]['$max'][field] = value
+
+    def min(self, doc_id, field, value):
+        cur = self.docs[doc_id]['$min'].get(field)
+        if cur is None or value < cur:
+            self.docs[doc_id]['$min'][field] = value
+
+    def set(self, doc_id, field, value, on_insert=False):
+        self.docs[doc_id]['$setOnInsert' if on_insert else '$set'][field] = value
+
+    def operations(self):
+        ops = []
+        for doc_id, update in self.docs.items():
+            update = {op: dict(fields) for op, fields in update.items() if fields}
+            ops.append(UpdateOne({'_id': doc_id}, update, upsert=True))
+        return ops
+
+
+def _add_event(daily, totals, event):
+    uid = _user_id(event['user_id'])
+    ts = event.get('timestamp') or datetime.now()
+    kind = event.get('activity_type') or 'unknown'
+    path = event.get('path') or 'unknown'
+    duration = int(event.get('duration') or 0)
+    day = ts.strftime('%Y-%m-%d')
+
+    for updates, doc_id in ((daily, f"{uid}:{day}"), (totals, uid)):
+        updates.inc(doc_id, f'types.{kind}.duration', duration)
+        updates.inc(doc_id, f'types.{kind}.sessions', 1)
+        updates.inc(doc_id, f'types.{kind}.paths.{escape_key(path)}', duration)
+        updates.max(doc_id, 'last_at', ts)
+    daily.set(f"{uid}:{day}", 'user_id', uid, on_insert=True)
+    daily.set(f"{uid}:{day}", 'day', day, on_insert=True)
+    totals.min(uid, 'first_at', ts)
+
+    if kind in VIDEO_TYPES:
+        meta = _metadata(event.get('metadata'))
+        key = f"videos.{escape_key(video_key(meta, path))}"
+        totals.inc(uid, f'{key}.seconds', duration)
+        if meta.get('video_id'):
+            totals.set(uid, f'{key}.id', str(meta['video_id']))
+        if kind == 'video_play':
+            totals.inc(uid, f'{key}.plays', 1)
+            totals.max(uid, f'{key}.last_play_at', ts)
+            if meta.get('video_title'):
+                totals.set(uid, f'{key}.title', meta['video_title'])
+
+
+def _write(daily, totals):
+    daily_ops, totals_ops = daily.operations(), totals.operations()
+    if daily_ops:
+        _collection(DAILY_COLLECTION).bulk_write(daily_ops, ordered=False)
+    if totals_ops:
+        _collection(TOTALS_COLLECTION).bulk_write(totals_ops, ordered=False)
+
+
+def _as_event(log):
+    if isinstance(log, dict):
+        return log
+    return {'user_id': log.user_id, 'activity_type': log.activity_type, 'path': log.path,
+            'metadata': log.metadata, 'duration': log.duration, 'timestamp': log.timestamp}
+
+
+def watermark(user_ids, received_at):
+    """Start ingest counting for these students at `received_at` (server time).
+
+    Call it before inserting the rows that record() will count: rows inserted
+    earlier are left to the backfill, so a backfill running meanwhile can't
+    count the new rows as well.
+    """
+    coll = _collection(TOTALS_COLLECTION)
+    if coll is None:
+        return
+    ops = [UpdateOne({'_id': uid}, {'$min': {'ingested_from': received_at}}, upsert=True)
+           for uid in {_user_id(u) for u in user_ids}]
+    if ops:
+        coll.bulk_write(ops, ordered=False)
+
+
+def record(events):
+    """Fold new UserActivityLog rows (model instances or dicts) into the rollups.
+
+    Only rows that were actually inserted, after a watermark() for their students.
+    """
+    if _collection(DAILY_COLLECTION) is None:
+        return
+    daily, totals = _Updates(), _Updates()
+    for e in map(_as_event, events):
+        _add_event(daily, totals, e)
+    _write(daily, totals)
+
+
+# ── Backfill / rebuild ────────────────────────────────────────────────────────
+
+def _raw_events(uid, before=None):
+    """The student's raw rows, only those inserted before `before` (naive server time) if given."""
+    query = {'user_id': uid}
+    if before is not None:
+        query['_id'] = {'$lt': ObjectId.from_datetime(before.astimezone(timezone.utc))}
+    projection = {'activity_type': 1, 'path': 1, 'metadata': 1, 'duration': 1, 'timestamp': 1}
+    for name in (LOG_COLLECTION, ARCHIVE_COLLECTION):
+        coll = _collection(name)
+        if coll is None:
+            continue
+        for doc in coll.find(query, projection):
+            doc['user_id'] = uid
+            yield doc
+
+
+def ensure_backfilled(user_id):
+    """Fold a student's pre-rollup history into their rollups, once."""
+    uid = _user_id(user_id)
+    totals_coll = _collection(TOTALS_COLLECTION)
+    if totals_coll is None:
+        return None
+    doc = totals_coll.find_one({'_id': uid})
+    if doc and doc.get('backfilled'):
+        return doc
+
+    lock_key = f"activity_backfill_{uid}"
+    if not cache.add(lock_key, 1, BACKFILL_LOCK_SECONDS):
+        return doc  # another request is backfilling; serve what we have
+    try:
+        doc = totals_coll.find_one({'_id': uid})
+        if doc and doc.get('backfilled'):
+            return doc
+        # Rows inserted at or after ingested_from are counted by record()
+        before = doc.get('ingested_from') if doc else datetime.now()
+        daily, totals = _Updates(), _Updates()
+        n = 0
+        for event in _raw_events(uid, before):
+            _add_event(daily, totals, event)
+            n += 1
+        totals.set(uid, 'backfilled', True)
+        if not doc:
+            totals.set(uid, 'ingested_from', before, on_insert=True)
+        _write(daily, totals)
+        if n:
+            print(f"[ACTIVITY ROLLUP] Backfilled {n} events for {uid}")
+        return totals_coll.find_one({'_id': uid})
+    finally:
+        cache.delete(lock_key)
+
+
+def rebuild(user_id):
+    """Drop a student's rollups and recompute them from raw + archived logs."""
+    uid = _user_id(user_id)
+    _collection(DAILY_COLLECTION).delete_many({'user_id': uid})
+    _collection(TOTALS_COLLECTION).delete_one({'_id': uid})
+    return ensure_backfilled(uid)
+
+
+def archive_before(cutoff, stdout=None):
+    """Move raw logs older than `cutoff` to the archive, backfilling their students first."""
+    raw, archive = _collection(LOG_COLLECTION), _collection(ARCHIVE_COLLECTION)
+    if raw is None:
+        return 0
+    for uid in raw.distinct('user_id', {'timestamp': {'$lt': cutoff}}):
+        ensure_backfilled(uid)
+    moved = 0
+    while True:
+        batch = list(raw.find({'timestamp': {'$lt': cutoff}}).limit(ARCHIVE_BATCH))
+        if not batch:
+            break
+        try:
+            archive.insert_many(batch, ordered=False)
+        except Exception as e:
+            # duplicates from an interrupted earlier run are fine; anything else stops here
+            if 'E11000' not in str(e):
+                raise
+        raw.delete_many({'_id': {'$in': [d['_id'] for d in batch]}})
+        moved += len(batch)
+        if stdout:
+            stdout.write(f"  archived {moved} rows...")
+    return moved
+
+
+# ── Reads ─────────────────────────────────────────────────────────────────────
+
+def totals(user_id):
+    """The lifetime rollup document ({} if the student has no activity)."""
+    return ensure_backfilled(user_id) or {}
+
+
+def daily(user_id, since=None):
+    """{'YYYY-MM-DD': day document} for days on or after `since` (a date)."""
+    coll = _collection(DAILY_COLLECTION)
+    if coll is None:
+        return {}
+    query = {'user_id': _user_id(user_id)}
+    if since is not None:
+        query['day'] = {'$gte': since.strftime('%Y-%m-%d')}
+    return {doc['day']: doc for doc in coll.find(query)}
+
+
+def type_totals(doc, kind):
+    t = (doc.get('types') or {}).get(kind) or {}
+    return {
+        'duration': t.get('duration', 0),
+        'sessions': t.get('sessions', 0),
+        'paths': {unescape_key(k): v for k, v in (t.get('paths') or {}).items()},
+    }
+
+
+def videos(doc):
+    return [dict(v, key=unescape_key(k)) for k, v in (doc.get('videos') or {}).items()]
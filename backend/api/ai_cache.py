@@ -0,0 +1,333 @@
+"""
+Content-addressed cache for Gemini responses (api/gemini_views.py).
+
+An answer is keyed by a hash of everything that decides it: the feature,
+model name, system instruction, generation config and the normalised
+prompt/contents (whitespace collapsed; images and other binary parts by
+their bytes' hash; chat history in order). Identical requests from any
+student or worker then share one upstream call:
+
+    result, state = ai_cache.generate(
+        'chapter_test', 'gemini-flash-lite-latest', [prompt],
+        call=lambda: model.generate_content(prompt).text,
+        parse=_parse_model_json)
+
+`call()` only runs on a miss, so hits never touch the Gemini client; it
+runs under the feature's rate limit (ai_limiter), which may raise
+RateLimited. The model's text is stored only once `parse` accepts it, so a
+malformed answer isn't served again. Lookups go to the shared cache (Redis) first, then the
+`api_aicache` Mongo collection, which keeps entries across restarts and
+cache flushes (a TTL index removes them at `expires_at`).
+
+Concurrent identical misses are single-flight: other threads of the worker
+wait on the leader's call, other workers poll for its entry while the
+leader holds a cache lock. stats() reports per-feature hit ratio, upstream
+latency and the model time saved by hits (shown on /api/system-status/).
+
+stream() is the token-streaming variant used by the chat: a hit yields the
+stored text as one chunk, a miss yields the model's chunks as they arrive
+and stores the joined text once the stream completes. Streamed misses are
+not coalesced; a second identical request just streams its own answer.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from django.core.cache import cache
+
+from . import ai_limiter
+
+KEY_PREFIX = 'ai_v1'
+COLLECTION = 'api_aicache'
+
+# feature -> seconds an answer is reused
+TTLS = {
+    'chapter_test': 24 * 3600,
+    'insights': 30 * 60,
+    'chat_guard': 7 * 24 * 3600,
+    'chat': 3600,
+    'marksheet': 30 * 24 * 3600,
+}
+DEFAULT_TTL = 3600
+
+# AI_CACHE_PERSIST=0 keeps entries in the shared cache only (no Mongo writes or reads)
+PERSIST = os.getenv('AI_CACHE_PERSIST', '1') != '0'
+
+LOCK_SECONDS = 120
+# Model calls take seconds, so a miss waits this long for another worker's call
+MISS_WAIT_SECONDS = 60
+MISS_POLL_SECONDS = 0.25
+
+HIT, MISS, COALESCED = 'HIT', 'MISS', 'COALESCED'
+
+
+# ── Stats ─────────────────────────────────────────────────────────────────────
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _count(feature, outcome=None, upstream_ms=None, failed=False, saved_ms=0.0, tier=None):
+    with _stats_lock:
+        s = _stats.setdefault(feature, {
+            HIT: 0, MISS: 0, COALESCED: 0, 'mongo_hits': 0,
+            'upstream_calls': 0, 'upstream_errors': 0, 'upstream_ms_total': 0.0, 'saved_ms': 0.0,
+        })
+        if outcome:
+            s[outcome] += 1
+        if tier == 'mongo':
+            s['mongo_hits'] += 1
+        if upstream_ms is not None:
+            s['upstream_calls'] += 1
+            s['upstream_ms_total'] += upstream_ms
+        if failed:
+            s['upstream_errors'] += 1
+        s['saved_ms'] += saved_ms
+
+
+def stats():
+    """This worker's counters per feature, with hit ratio and model time saved."""
+    out = {}
+    with _stats_lock:
+        for feature, s in _stats.items():
+            served = s[HIT] + s[MISS] + s[COALESCED]
+            out[feature] = {
+                'requests': served,
+                'hit': s[HIT],
+                'mongo_hits': s['mongo_hits'],
+                'miss': s[MISS],
+                'coalesced': s[COALESCED],
+                'hit_ratio': round((served - s[MISS]) / served, 3) if served else None,
+                'upstream_calls': s['upstream_calls'],
+                'upstream_errors': s['upstream_errors'],
+                'upstream_ms_avg': round(s['upstream_ms_total'] / s['upstream_calls'], 1) if s['upstream_calls'] else None,
+                'saved_seconds': round(s['saved_ms'] / 1000, 1),
+            }
+    return out
+
+
+# ── Keys ──────────────────────────────────────────────────────────────────────
+
+def _normalise(value):
+    """A JSON-able form of prompt parts that ignores formatting-only differences."""
+    if isinstance(value, str):
+        return ' '.join(value.split())
+    if isinstance(value, (bytes, bytearray)):
+        return {'sha256': hashlib.sha256(value).hexdigest()}
+    if isinstance(value, dict):
+        if 'data' in value and isinstance(value['data'], (str, bytes, bytearray)) and len(value['data']) > 256:
+            # inline_data parts: the payload by hash, the rest (mime type) as is
+            data = value['data'].encode() if isinstance(value['data'], str) else value['data']
+            value = dict(value, data={'sha256': hashlib.sha256(data).hexdigest()})
+        return {str(k): _normalise(v) for k, v in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        return [_normalise(v) for v in value]
+    return value if isinstance(value, (int, float, bool)) or value is None else repr(value)
+
+
+def cache_key(feature, model_name, contents, system_instruction=None, history=None, config=None):
+    material = json.dumps({
+        'model': model_name,
+        'system': _normalise(system_instruction),
+        'config': _normalise(config),
+        'history': _normalise(history),
+        'contents': _normalise(contents),
+    }, sort_keys=True, separators=(',', ':'))
+    return f"{KEY_PREFIX}:{feature}:{hashlib.sha256(material.encode()).hexdigest()}"
+
+
+# ── Store ─────────────────────────────────────────────────────────────────────
+
+def _collection():
+    if not PERSIST:
+        return None
+    from .db_utils import get_db
+    db = get_db()
+    return db[COLLECTION] if db is not None else None
+
+
+def _read(key):
+    """(entry, tier) from the shared cache, else from Mongo; (None, None) when absent."""
+    try:
+        entry = cache.get(key)
+        if entry is not None:
+            return entry, 'cache'
+    except Exception:
+        pass
+    try:
+        coll = _collection()
+        doc = coll.find_one({'_id': key, 'expires_at': {'$gt': datetime.utcnow()}}) if coll is not None else None
+    except Exception:
+        doc = None
+    if doc is None:
+        return None, None
+    entry = {'text': doc['text'], 'latency_ms': doc.get('latency_ms', 0.0)}
+    remaining = int((doc['expires_at'] - datetime.utcnow()).total_seconds())
+    if remaining > 0:
+        try:
+            cache.set(key, entry, remaining)
+        except Exception:
+            pass
+    return entry, 'mongo'
+
+
+def _write(feature, key, model_name, entry):
+    ttl = TTLS.get(feature, DEFAULT_TTL)
+    try:
+        cache.set(key, entry, ttl)
+    except Exception:
+        pass
+    try:
+        coll = _collection()
+        if coll is not None:
+            now = datetime.utcnow()
+            coll.replace_one({'_id': key}, {
+                '_id': key, 'feature': feature, 'model': model_name,
+                'text': entry['text'], 'latency_ms': entry['latency_ms'],
+                'created_at': now, 'expires_at': now + timedelta(seconds=ttl),
+            }, upsert=True)
+    except Exception as e:
+        print(f"[AI CACHE] Failed to persist {feature} entry: {e}")
+
+
+def invalidate(key):
+    cache.delete(key)
+    coll = _collection()
+    if coll is not None:
+        coll.delete_one({'_id': key})
+
+
+# ── Single-flight misses ──────────────────────────────────────────────────────
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.entry = None
+
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _upstream(feature, key, model_name, call, parse):
+    """Call the model once; store the text if `parse` accepts it. Returns (entry, value)."""
+    start = time.perf_counter()
+    try:
+        with ai_limiter.admit(feature):
+            text = call()
+    except ai_limiter.RateLimited:
+        raise
+    except Exception:
+        _count(feature, upstream_ms=(time.perf_counter() - start) * 1000, failed=True)
+        raise
+    latency_ms = (time.perf_counter() - start) * 1000
+    _count(feature, upstream_ms=latency_ms)
+    value = parse(text) if parse else text  # a parse error propagates and nothing is cached
+    entry = {'text': text, 'latency_ms': latency_ms}
+    _write(feature, key, model_name, entry)
+    return entry, value
+
+
+def _wait_for_entry(key, lock_key):
+    """Poll for another worker's call to land. None if it didn't within MISS_WAIT_SECONDS."""
+    deadline = time.monotonic() + MISS_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(MISS_POLL_SECONDS)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+        if cache.get(lock_key) is None:
+            return None  # that call finished without storing anything
+    return None
+
+
+def _load(feature, key, model_name, call, parse):
+    with _inflight_lock:
+        flight = _inflight.get(key)
+        leader = flight is None
+        if leader:
+            flight = _inflight[key] = _Flight()
+
+    if not leader:
+        if flight.done.wait(MISS_WAIT_SECONDS) and flight.entry is not None:
+            _count(feature, COALESCED, saved_ms=flight.entry['latency_ms'])
+            text = flight.entry['text']
+            return (parse(text) if parse else text), COALESCED
+        _, value = _upstream(feature, key, model_name, call, parse)
+        _count(feature, MISS)
+        return value, MISS
+
+    try:
+        lock_key = f"{key}:call"
+        if not cache.add(lock_key, 1, LOCK_SECONDS):
+            entry = _wait_for_entry(key, lock_key)
+            if entry is not None:
+                _count(feature, COALESCED, saved_ms=entry['latency_ms'])
+                flight.entry = entry
+                return (parse(entry['text']) if parse else entry['text']), COALESCED
+            lock_key = None
+        try:
+            flight.entry, value = _upstream(feature, key, model_name, call, parse)
+        finally:
+            if lock_key:
+                cache.delete(lock_key)
+        _count(feature, MISS)
+        return value, MISS
+    finally:
+        flight.done.set()
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+def stream(feature, model_name, contents, call_stream, system_instruction=None, history=None, config=None):
+    """Yield the answer's text in chunks as the model produces them.
+
+    `call_stream()` starts the model request and returns an iterable of text
+    chunks; it runs only on a miss, under the feature's rate limit. A stream
+    that fails or is closed early (client went away) stores nothing.
+    """
+    key = cache_key(feature, model_name, contents, system_instruction, history, config)
+    entry, tier = _read(key)
+    if entry is not None:
+        _count(feature, HIT, saved_ms=entry.get('latency_ms', 0.0), tier=tier)
+        yield entry['text']
+        return
+
+    start = time.perf_counter()
+    chunks = []
+    try:
+        with ai_limiter.admit(feature):
+            for chunk in call_stream():
+                if chunk:
+                    chunks.append(chunk)
+                    yield chunk
+    except ai_limiter.RateLimited:
+        raise
+    except Exception:
+        _count(feature, upstream_ms=(time.perf_counter() - start) * 1000, failed=True)
+        raise
+    latency_ms = (time.perf_counter() - start) * 1000
+    _count(feature, MISS, upstream_ms=latency_ms)
+    _write(feature, key, model_name, {'text': ''.join(chunks), 'latency_ms': latency_ms})
+
+
+def generate(feature, model_name, contents, call, system_instruction=None, history=None, config=None, parse=None):
+    """(value, HIT|MISS|COALESCED) for one model request.
+
+    `call()` performs the model request and returns its text; it runs only on
+    a miss. `value` is `parse(text)` (or the text itself without `parse`).
+    """
+    key = cache_key(feature, model_name, contents, system_instruction, history, config)
+    entry, tier = _read(key)
+    if entry is not None:
+        try:
+            value = parse(entry['text']) if parse else entry['text']
+        except Exception:
+            invalidate(key)  # stored by an older parser that accepted it
+        else:
+            _count(feature, HIT, saved_ms=entry.get('latency_ms', 0.0), tier=tier)
+            return value, HIT
+    return _load(feature, key, model_name, call, parse)
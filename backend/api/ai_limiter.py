@@ -0,0 +1,302 @@
+"""
+Shared rate limiter and admission control for Gemini calls.
+
+Every upstream model call (ai_cache misses, the study plan and college
+views, ExtractAIView pages) runs inside
+
+    with ai_limiter.admit('chat'):
+        text = model.generate_content(...).text
+
+which takes one token from two Redis token buckets in a single Lua call:
+
+  - the global bucket (GEMINI_RPM requests/minute, burst GEMINI_BURST),
+    shared by every worker. Lower-priority features leave a reserve in it:
+    HIGH may take the last token, NORMAL stops at 20% of the burst, LOW at 40%,
+    so a wave of insights requests can't drain the quota chat needs;
+  - the feature's own bucket (`share` of the global rate), so one feature,
+    e.g. a 200-page admin extraction, can't take the whole quota either.
+
+Per process, each feature also has a cap on calls in flight and on threads
+waiting for a slot. When the wait for a token or slot would exceed the
+feature's max_wait, or the waiting line is full, admit() raises RateLimited
+straight away with a retry-after, and views answer 429 (too_many_requests)
+instead of parking a gunicorn thread.
+
+Without Redis (LocMem, or Redis errors) the buckets live in-process, sized
+to this worker's slice of the quota. Limiter takes a clock and sleep
+function, so it can be driven by FakeClock in scripts/bench_ai_limiter.py.
+"""
+import math
+import os
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+GLOBAL_RPM = float(os.getenv('GEMINI_RPM', '120'))
+GLOBAL_BURST = float(os.getenv('GEMINI_BURST', '20'))
+# Workers sharing the quota when the buckets fall back to in-process
+LOCAL_WORKERS = int(os.getenv('GEMINI_LOCAL_WORKERS', os.getenv('WEB_CONCURRENCY', '1')))
+
+HIGH, NORMAL, LOW = 0, 1, 2
+RESERVE = {HIGH: 0.0, NORMAL: 0.2, LOW: 0.4}  # fraction of the global burst left untouched
+
+# share: fraction of the global rate for this feature's own bucket
+# max_wait: seconds a call may wait for a token / slot before it is refused
+Feature = namedtuple('Feature', 'priority share max_concurrent max_waiting max_wait')
+
+FEATURES = {
+    'chat': Feature(HIGH, 0.5, 16, 16, 5),
+    'chat_guard': Feature(HIGH, 0.5, 16, 16, 5),
+    'extract': Feature(HIGH, 0.5, 8, 8, 60),  # admin extraction pages; runs off the request thread with ?async=1
+    'chapter_test': Feature(NORMAL, 0.3, 4, 4, 10),
+    'marksheet': Feature(NORMAL, 0.2, 4, 4, 10),
+    'study_plan': Feature(NORMAL, 0.3, 4, 4, 10),
+    'insights': Feature(LOW, 0.3, 4, 4, 3),
+    'college': Feature(LOW, 0.2, 2, 2, 3),
+}
+DEFAULT_FEATURE = Feature(NORMAL, 0.2, 4, 4, 5)
+
+KEY_PREFIX = 'ai_bucket_v1'
+
+EPSILON = 1e-6  # float slack when comparing token counts
+MIN_SLEEP = 0.01
+
+
+class RateLimited(Exception):
+    def __init__(self, feature, retry_after, reason):
+        super().__init__(f"Gemini {feature} limited ({reason}); retry after {retry_after}s")
+        self.feature = feature
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class FakeClock:
+    """Manual time for driving Limiter deterministically: sleep() just advances now()."""
+
+    def __init__(self, start=1_000_000.0):
+        self.now = start
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        with self._lock:
+            self.now += max(0.0, seconds)
+
+
+# ── Buckets ───────────────────────────────────────────────────────────────────
+
+def _refill(state, rate, burst, now):
+    tokens, ts = state if state else (burst, now)
+    return min(burst, tokens + max(0.0, now - ts) * rate)
+
+
+def _decide(g_tokens, f_tokens, g_rate, g_floor, f_rate):
+    """(taken, seconds until both buckets could give a token)."""
+    if g_tokens - 1 >= g_floor - EPSILON and f_tokens >= 1 - EPSILON:
+        return True, 0.0
+    g_wait = max(0.0, (g_floor + 1 - g_tokens) / g_rate)
+    f_wait = max(0.0, (1 - f_tokens) / f_rate)
+    return False, max(g_wait, f_wait)
+
+
+class LocalBuckets:
+    """In-process buckets (LocMem setups, or while Redis is unreachable)."""
+
+    def __init__(self):
+        self._state = {}
+        self._lock = threading.Lock()
+
+    def take(self, g_key, f_key, now, g_rate, g_burst, g_floor, f_rate, f_burst):
+        with self._lock:
+            g = _refill(self._state.get(g_key), g_rate, g_burst, now)
+            f = _refill(self._state.get(f_key), f_rate, f_burst, now)
+            taken, wait = _decide(g, f, g_rate, g_floor, f_rate)
+            if taken:
+                g, f = g - 1, f - 1
+            self._state[g_key], self._state[f_key] = (g, now), (f, now)
+            return taken, wait
+
+
+_TAKE_LUA = """
+local function refill(key, rate, burst, now)
+  local v = redis.call('HMGET', key, 't', 'ts')
+  local t, ts = tonumber(v[1]), tonumber(v[2])
+  if t == nil then return burst end
+  return math.min(burst, t + math.max(0, now - ts) * rate)
+end
+local now = tonumber(ARGV[1])
+local g_rate, g_burst, g_floor = tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local f_rate, f_burst = tonumber(ARGV[5]), tonumber(ARGV[6])
+local g = refill(KEYS[1], g_rate, g_burst, now)
+local f = refill(KEYS[2], f_rate, f_burst, now)
+local taken, wait = 0, 0
+if g - 1 >= g_floor - 1e-6 and f >= 1 - 1e-6 then
+  g, f, taken = g - 1, f - 1, 1
+else
+  wait = math.max((g_floor + 1 - g) / g_rate, (1 - f) / f_rate, 0)
+end
+redis.call('HSET', KEYS[1], 't', g, 'ts', now)
+redis.call('HSET', KEYS[2], 't', f, 'ts', now)
+redis.call('EXPIRE', KEYS[1], 3600)
+redis.call('EXPIRE', KEYS[2], 3600)
+return {taken, tostring(wait)}
+"""
+
+
+class RedisBuckets:
+    def __init__(self, conn):
+        self._script = conn.register_script(_TAKE_LUA)
+
+    def take(self, g_key, f_key, now, g_rate, g_burst, g_floor, f_rate, f_burst):
+        taken, wait = self._script(keys=[g_key, f_key], args=[now, g_rate, g_burst, g_floor, f_rate, f_burst])
+        return bool(int(taken)), float(wait)
+
+
+def _redis():
+    """Raw redis client behind the default cache, or None (LocMem)."""
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+    except Exception:
+        return None
+
+
+# ── Limiter ───────────────────────────────────────────────────────────────────
+
+class Limiter:
+    """buckets: None finds Redis behind the default cache; False keeps them in-process."""
+
+    def __init__(self, features=None, rpm=GLOBAL_RPM, burst=GLOBAL_BURST, buckets=None,
+                 clock=time.time, sleep=time.sleep):
+        self.features = FEATURES if features is None else features
+        self.rate = rpm / 60.0
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self._buckets = buckets
+        self._local = LocalBuckets()
+        self._running = {}
+        self._waiting = {}
+        self._cond = threading.Condition()
+        self._stats = {}
+
+    def _shared_buckets(self):
+        if self._buckets is None:
+            conn = _redis()
+            self._buckets = RedisBuckets(conn) if conn is not None else False
+        return self._buckets or None
+
+    def _take(self, name, feature, now):
+        g_floor = RESERVE[feature.priority] * self.burst
+        f_rate = self.rate * feature.share
+        f_burst = max(1.0, self.burst * feature.share)
+        args = (now, self.rate, self.burst, g_floor, f_rate, f_burst)
+        shared = self._shared_buckets()
+        if shared is not None:
+            try:
+                return shared.take(f"{KEY_PREFIX}:global", f"{KEY_PREFIX}:{name}", *args)
+            except Exception as e:
+                print(f"[AI LIMITER] Redis bucket unavailable, using in-process buckets: {e}")
+        # this worker's slice of the shared quota
+        workers = max(1, LOCAL_WORKERS)
+        local = (now, self.rate / workers, max(1.0, self.burst / workers), g_floor / workers,
+                 f_rate / workers, max(1.0, f_burst / workers))
+        return self._local.take('global', name, *local)
+
+    def _count(self, name, outcome):
+        s = self._stats.setdefault(name, {'admitted': 0, 'rejected_queue': 0, 'rejected_wait': 0})
+        s[outcome] += 1
+
+    def _reject(self, name, retry_after, reason):
+        with self._cond:
+            self._count(name, f'rejected_{reason}')
+        raise RateLimited(name, max(1, int(math.ceil(retry_after))), reason)
+
+    def _enter(self, name, feature, deadline):
+        """Take a concurrency slot, waiting in line (bounded) until the deadline."""
+        with self._cond:
+            if self._running.get(name, 0) < feature.max_concurrent:
+                self._running[name] = self._running.get(name, 0) + 1
+                return
+            if self._waiting.get(name, 0) >= feature.max_waiting:
+                self._reject(name, feature.max_wait, 'queue')
+            self._waiting[name] = self._waiting.get(name, 0) + 1
+            try:
+                while self._running.get(name, 0) >= feature.max_concurrent:
+                    remaining = deadline - self.clock()
+                    if remaining <= 0:
+                        self._reject(name, feature.max_wait, 'wait')
+                    self._cond.wait(min(remaining, 1.0))
+                self._running[name] = self._running.get(name, 0) + 1
+            finally:
+                self._waiting[name] -= 1
+
+    def _exit(self, name):
+        with self._cond:
+            self._running[name] -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def admit(self, name):
+        """Run the body once a token and a slot are available, or raise RateLimited."""
+        feature = self.features.get(name, DEFAULT_FEATURE)
+        deadline = self.clock() + feature.max_wait
+        self._enter(name, feature, deadline)
+        try:
+            while True:
+                now = self.clock()
+                taken, wait = self._take(name, feature, now)
+                if taken:
+                    break
+                if now + wait > deadline:
+                    # No token in time: refuse now rather than hold the thread
+                    self._reject(name, wait, 'wait')
+                self.sleep(max(wait, MIN_SLEEP))
+            with self._cond:
+                self._count(name, 'admitted')
+            yield
+        finally:
+            self._exit(name)
+
+    def stats(self):
+        with self._cond:
+            return {
+                name: dict(s, running=self._running.get(name, 0), waiting=self._waiting.get(name, 0))
+                for name, s in self._stats.items()
+            }
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = Limiter()
+    return _limiter
+
+
+def admit(feature):
+    return get_limiter().admit(feature)
+
+
+def stats():
+    return get_limiter().stats() if _limiter is not None else {}
+
+
+def too_many_requests(e, **extra):
+    """429 with Retry-After for a RateLimited error."""
+    from rest_framework import status
+    from rest_framework.response import Response
+
+    body = {"error": "The AI service is busy. Please try again shortly.", "retry_after": e.retry_after}
+    body.update(extra)
+    response = Response(body, status=status.HTTP_429_TOO_MANY_REQUESTS)
+    response['Retry-After'] = str(e.retry_after)
+    return response
@@ -2,6 +2,7 @@ import requests
 from django.contrib.auth.backends import BaseBackend
 from django.conf import settings
 from .models import CustomUser
+from . import erp_client
 
 class ERPStudentBackend(BaseBackend):
     """
@@ -68,7 +69,7 @@ class ERPStudentBackend(BaseBackend):
             # ALWAYS validate against ERP for students
             login_url = f"{erp_url}/api/student-portal/login"
             # Reduced timeout to 10s for faster failover
-            resp = requests.post(login_url, json=auth_payload, timeout=10)
+            resp = erp_client.post(login_url, json=auth_payload)
             
             if resp.status_code == 200:
                 data = resp.json()
@@ -322,7 +323,7 @@ class ERPTeacherBackend(BaseBackend):
             # Step 1: Try Standard ERP Login (if user set a real password in ERP)
             login_url = f"{erp_url}/api/hr/employee/login"
             print(f"[ERP TEACHER] Trying standard login: {login_url}")
-            resp = requests.post(login_url, json=auth_payload, timeout=15)
+            resp = erp_client.post(login_url, json=auth_payload)
             
             erp_token = None
             employee_data = {}
@@ -352,7 +353,7 @@ class ERPTeacherBackend(BaseBackend):
                     found_teacher = None
                     for url in endpoints:
                         try:
-                            t_resp = requests.get(url, headers={"Authorization": f"Bearer {admin_token}"}, timeout=15)
+                            t_resp = erp_client.get(url, headers={"Authorization": f"Bearer {admin_token}"})
                             if t_resp.status_code == 200:
                                 t_data = t_resp.json()
                                 t_list = t_data if isinstance(t_data, list) else (t_data.get('data') or t_data.get('employees') or [])
@@ -53,6 +53,32 @@ def ensure_database_indexes():
         doubt_coll.create_index([('student_id', 1)], background=True)
         doubt_coll.create_index([('teacher_id', 1)], background=True)
 
+        # questions_question — cursor-paginated question bank listing (_id order within a filter)
+        q_coll = db['questions_question']
+        q_coll.create_index([('chapter_id', 1), ('_id', -1)], background=True)
+        q_coll.create_index([('subject_id', 1), ('_id', -1)], background=True)
+        q_coll.create_index([('topic_id', 1), ('_id', -1)], background=True)
+
+        # api_job — background job status; finished jobs expire after a week
+        db['api_job'].create_index([('created_at', 1)], expireAfterSeconds=7 * 24 * 3600, background=True)
+
+        # api_erpstudent — local ERP mirror; lookups by adm_/email_ key and centre
+        erp_coll = db['api_erpstudent']
+        erp_coll.create_index([('keys', 1)], background=True)
+        erp_coll.create_index([('centre', 1)], background=True)
+
+        # api_useractivitylog — per-student scans for rollup backfill, date scans for archiving
+        log_coll = db['api_useractivitylog']
+        log_coll.create_index([('user_id', 1), ('timestamp', -1)], background=True)
+        log_coll.create_index([('timestamp', 1)], background=True)
+        db['api_useractivitylog_archive'].create_index([('user_id', 1), ('timestamp', -1)], background=True)
+
+        # api_activityrollup — a student's daily rollups by day
+        db['api_activityrollup'].create_index([('user_id', 1), ('day', 1)], background=True)
+
+        # api_aicache — cached Gemini answers, removed once expires_at passes
+        db['api_aicache'].create_index([('expires_at', 1)], expireAfterSeconds=0, background=True)
+
         _indexes_created = True
         print("[INDEX] Essential MongoDB Atlas indexes ensured in background.")
     except Exception as e:
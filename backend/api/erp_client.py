@@ -0,0 +1,289 @@
+"""
+Shared HTTP client for every call to the ERP.
+
+    from api import erp_client
+    resp = erp_client.get(f"{erp_url}/api/centre", headers=..., fallback_ttl=86400)
+
+What it adds over bare `requests.get/post`:
+
+  - one pooled `requests.Session` per worker process (keep-alive, no new
+    TCP/TLS handshake per call), re-created after gunicorn forks,
+  - per-endpoint timeout budgets (BUDGETS, matched on the URL path): a
+    connect timeout, a per-attempt read timeout and a total deadline that
+    retries must fit in,
+  - jittered exponential-backoff retries for idempotent calls (GET) on
+    connection errors, timeouts and 429/502/503/504,
+  - a circuit breaker: after FAILURE_THRESHOLD consecutive transport
+    failures the ERP is treated as down for COOLDOWN_SECONDS (shared with
+    the other workers through the cache), calls fail fast with
+    ERPUnavailable, then a single trial call decides whether to close it,
+  - optional last-good fallback: GETs made with `fallback_ttl` remember
+    their last 200 body, and when the ERP is down or failing that body is
+    returned instead (response header `X-ERP-Stale: 1`).
+
+ERPUnavailable subclasses requests.RequestException, so existing
+`except requests.exceptions.RequestException` branches keep working.
+"""
+import hashlib
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.core.cache import cache
+
+POOL_SIZE = int(os.getenv('ERP_POOL_SIZE', '16'))
+FAILURE_THRESHOLD = int(os.getenv('ERP_BREAKER_THRESHOLD', '5'))
+COOLDOWN_SECONDS = int(os.getenv('ERP_BREAKER_COOLDOWN', '30'))
+BREAKER_CACHE_KEY = 'erp_circuit_open_until'
+FALLBACK_PREFIX = 'erp_last_good_'
+# How long a last-good body may stand in for the ERP (callers pass it as fallback_ttl)
+FALLBACK_TTL = int(os.getenv('ERP_FALLBACK_TTL', str(6 * 3600)))
+
+RETRY_STATUSES = {429, 502, 503, 504}
+BREAKER_STATUSES = {502, 503, 504}
+BACKOFF_BASE = 0.25
+BACKOFF_CAP = 2.0
+
+
+class Budget:
+    def __init__(self, connect, read, total, retries):
+        self.connect = connect  # seconds to establish the connection
+        self.read = read        # seconds to wait for a response, per attempt
+        self.total = total      # deadline for the call including retries
+        self.retries = retries  # extra attempts for idempotent calls
+
+
+# First matching path prefix wins
+BUDGETS = [
+    # Render-hosted ERP has long cold-start wake times
+    ('/api/superAdmin/login', Budget(5, 60, 60, 0)),
+    # A user is waiting on the login form
+    ('/api/student-portal/login', Budget(3.05, 10, 12, 0)),
+    ('/api/hr/employee/login', Budget(3.05, 15, 15, 0)),
+    # Full roster pulls run in the background
+    ('/api/admission', Budget(5, 90, 120, 1)),
+    ('/api/student-portal/teachers', Budget(3.05, 30, 45, 1)),
+    ('/api/hr/employee', Budget(3.05, 30, 45, 1)),
+    ('/api/student-portal/', Budget(3.05, 15, 20, 1)),
+    ('/api/teacher-portal/', Budget(3.05, 15, 20, 1)),
+    ('/api/centre', Budget(3.05, 30, 40, 2)),
+    ('/api/session', Budget(3.05, 30, 40, 2)),
+    ('/api/class', Budget(3.05, 30, 40, 2)),
+    ('/api/examTag', Budget(3.05, 20, 30, 2)),
+]
+DEFAULT_BUDGET = Budget(3.05, 20, 25, 1)
+
+
+class ERPUnavailable(requests.exceptions.RequestException):
+    """The ERP is down (circuit open) or did not answer within its budget."""
+
+
+def budget_for(url):
+    path = urlsplit(url).path
+    for prefix, budget in BUDGETS:
+        if path.startswith(prefix):
+            return budget
+    return DEFAULT_BUDGET
+
+
+# ── Session pool ──────────────────────────────────────────────────────────────
+
+_session = {'pid': None, 'session': None}
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """This process's pooled Session (a fresh one after fork, so sockets aren't shared)."""
+    if _session['pid'] == os.getpid():
+        return _session['session']
+    with _session_lock:
+        if _session['pid'] != os.getpid():
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE, max_retries=0)
+            s.mount('https://', adapter)
+            s.mount('http://', adapter)
+            _session['session'] = s
+            _session['pid'] = os.getpid()
+    return _session['session']
+
+
+# ── Circuit breaker ───────────────────────────────────────────────────────────
+
+class CircuitBreaker:
+    def __init__(self, threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN_SECONDS):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    def _shared_open_until(self):
+        try:
+            return cache.get(BREAKER_CACHE_KEY) or 0.0
+        except Exception:
+            return 0.0
+
+    def allow(self):
+        """True if a call may go out. After the cooldown one trial call is let through."""
+        now = time.time()
+        open_until = max(self.open_until, self._shared_open_until())
+        if open_until <= 0:
+            return True
+        if now < open_until:
+            return False
+        with self.lock:
+            if self.trial_running:
+                return False
+            self.trial_running = True
+            self.open_until = open_until  # a failed trial re-opens the circuit
+            return True
+
+    def success(self):
+        with self.lock:
+            was_open = self.open_until > 0
+            self.failures = 0
+            self.open_until = 0.0
+            self.trial_running = False
+        if was_open or self._shared_open_until():
+            cache.delete(BREAKER_CACHE_KEY)
+            print("[ERP CLIENT] Circuit closed: ERP is responding again")
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.failures < self.threshold and self.open_until <= 0:
+                return
+            self.open_until = time.time() + self.cooldown
+        try:
+            cache.set(BREAKER_CACHE_KEY, self.open_until, self.cooldown * 4)
+        except Exception:
+            pass
+        print(f"[ERP CLIENT] Circuit open for {self.cooldown}s after {self.failures} consecutive failures")
+
+    def state(self):
+        now = time.time()
+        open_until = max(self.open_until, self._shared_open_until())
+        if open_until <= 0:
+            return 'closed'
+        return 'open' if now < open_until else 'half-open'
+
+
+breaker = CircuitBreaker()
+
+
+# ── Last-good fallback ────────────────────────────────────────────────────────
+
+def _fallback_key(url, params):
+    items = sorted((params or {}).items()) if hasattr(params, 'items') else params
+    raw = f"{url}|{items}".encode()
+    return FALLBACK_PREFIX + hashlib.sha1(raw).hexdigest()
+
+
+def _remember(url, params, resp, ttl):
+    try:
+        cache.set(_fallback_key(url, params), resp.content, ttl)
+    except Exception:
+        pass
+
+
+def _stale_response(url, params):
+    try:
+        content = cache.get(_fallback_key(url, params))
+    except Exception:
+        content = None
+    if content is None:
+        return None
+    resp = requests.Response()
+    resp.status_code = 200
+    resp._content = content
+    resp.url = url
+    resp.headers['Content-Type'] = 'application/json'
+    resp.headers['X-ERP-Stale'] = '1'
+    return resp
+
+
+# ── Requests ──────────────────────────────────────────────────────────────────
+
+def _backoff(attempt):
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+
+def request(method, url, *, retries=None, fallback_ttl=None, **kwargs):
+    """Send one logical ERP call within its budget. Returns a requests.Response.
+
+    Raises ERPUnavailable when the circuit is open or every attempt failed
+    (unless a last-good body is available for this GET).
+    """
+    method = method.upper()
+    budget = budget_for(url)
+    idempotent = method in ('GET', 'HEAD')
+    retries = budget.retries if retries is None and idempotent else (retries or 0)
+    params = kwargs.get('params')
+    kwargs.pop('timeout', None)  # budgets are owned here
+
+    if not breaker.allow():
+        stale = _stale_response(url, params) if fallback_ttl else None
+        if stale is not None:
+            return stale
+        raise ERPUnavailable(f"ERP circuit open; not calling {urlsplit(url).path}")
+
+    deadline = time.monotonic() + budget.total
+    session = get_session()
+    last_error = None
+    resp = None
+    settled = False  # set once the breaker has been told how this call went
+    try:
+        for attempt in range(retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                resp = session.request(method, url, timeout=(min(budget.connect, remaining), min(budget.read, remaining)), **kwargs)
+                last_error = None
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                resp, last_error = None, e
+            except requests.exceptions.RequestException as e:
+                resp, last_error = None, e
+                break  # bad URL, redirect loop, broken body: retrying won't help
+            if resp is not None and resp.status_code not in RETRY_STATUSES:
+                break
+            if attempt < retries:
+                pause = _backoff(attempt)
+                if deadline - time.monotonic() <= pause + budget.connect:
+                    break
+                time.sleep(pause)
+
+        if resp is not None and resp.status_code not in BREAKER_STATUSES:
+            settled = True
+            breaker.success()
+            if fallback_ttl and resp.status_code == 200:
+                _remember(url, params, resp, fallback_ttl)
+            return resp
+
+        settled = True
+        breaker.failure()
+    finally:
+        if not settled:
+            breaker.failure()  # unexpected error: don't leave trial_running set
+
+    if fallback_ttl:
+        stale = _stale_response(url, params)
+        if stale is not None:
+            return stale
+    if resp is not None:
+        return resp  # a 5xx the caller can inspect
+    raise ERPUnavailable(f"ERP {method} {urlsplit(url).path} failed: {last_error}") from last_error
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
@@ -0,0 +1,226 @@
+"""
+Stale-while-revalidate cache for the ERP student-portal proxies
+(profile, report and ongoing/upcoming/previous classes in erp_views).
+
+Entries are keyed by endpoint, the ERP student id the request resolved to
+(after the proxy's own access check) and the query string, and stored in
+the shared cache with the time they were fetched:
+
+  - fresh (age < fresh TTL)        returned as is,
+  - stale (within the stale window) returned as is while one background
+    refresh runs; the refresh lock lives in the cache, so only one worker
+    refreshes a given key,
+  - missing                        fetched once: other threads of the
+    worker wait for that fetch, other workers wait (briefly) for its entry.
+
+Only 200 responses are stored; ERP errors pass straight through. Responses
+carry `X-Cache: HIT|STALE|MISS|COALESCED`, and stats() gives this worker's
+per-endpoint hit ratio and upstream latency (shown on /api/system-status/).
+"""
+import hashlib
+import json
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import close_old_connections
+
+KEY_PREFIX = 'erp_proxy_v1'
+
+# endpoint -> (fresh seconds, extra seconds a stale copy may be served while refreshing)
+TTLS = {
+    'profile': (6 * 3600, 24 * 3600),
+    'report': (30 * 60, 6 * 3600),
+    'classes/ongoing': (60, 10 * 60),
+    'classes/upcoming': (10 * 60, 3600),
+    'classes/previous': (30 * 60, 6 * 3600),
+}
+DEFAULT_TTL = (5 * 60, 30 * 60)
+
+LOCK_SECONDS = 30
+# How long a miss waits for another worker's in-flight fetch before fetching itself
+MISS_WAIT_SECONDS = 10
+MISS_POLL_SECONDS = 0.1
+
+HIT, STALE, MISS, COALESCED = 'HIT', 'STALE', 'MISS', 'COALESCED'
+
+
+# ── Stats ─────────────────────────────────────────────────────────────────────
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _count(endpoint, outcome=None, upstream_ms=None, failed=False):
+    with _stats_lock:
+        s = _stats.setdefault(endpoint, {
+            HIT: 0, STALE: 0, MISS: 0, COALESCED: 0,
+            'upstream_calls': 0, 'upstream_errors': 0, 'upstream_ms_total': 0.0, 'upstream_ms_max': 0.0,
+        })
+        if outcome:
+            s[outcome] += 1
+        if upstream_ms is not None:
+            s['upstream_calls'] += 1
+            s['upstream_ms_total'] += upstream_ms
+            s['upstream_ms_max'] = max(s['upstream_ms_max'], upstream_ms)
+        if failed:
+            s['upstream_errors'] += 1
+
+
+def stats():
+    """This worker's counters per endpoint, with hit ratio and mean upstream latency."""
+    out = {}
+    with _stats_lock:
+        for endpoint, s in _stats.items():
+            served = s[HIT] + s[STALE] + s[MISS] + s[COALESCED]
+            out[endpoint] = {
+                'requests': served,
+                'hit': s[HIT],
+                'stale': s[STALE],
+                'miss': s[MISS],
+                'coalesced': s[COALESCED],
+                'hit_ratio': round((served - s[MISS]) / served, 3) if served else None,
+                'upstream_calls': s['upstream_calls'],
+                'upstream_errors': s['upstream_errors'],
+                'upstream_ms_avg': round(s['upstream_ms_total'] / s['upstream_calls'], 1) if s['upstream_calls'] else None,
+                'upstream_ms_max': round(s['upstream_ms_max'], 1),
+            }
+    return out
+
+
+# ── Cache entries ─────────────────────────────────────────────────────────────
+
+def cache_key(endpoint, identity, params):
+    if hasattr(params, 'lists'):
+        query = sorted((k, sorted(v)) for k, v in params.lists())
+    else:
+        query = sorted((params or {}).items())
+    digest = hashlib.sha1(json.dumps(query, default=str).encode()).hexdigest()[:16]
+    return f"{KEY_PREFIX}:{endpoint}:{identity}:{digest}"
+
+
+def _read(key):
+    try:
+        return cache.get(key)
+    except Exception:
+        return None
+
+
+def _upstream(endpoint, key, fetch):
+    """Call the ERP once; store the body if it was a 200. Returns (status, body)."""
+    fresh, stale = TTLS.get(endpoint, DEFAULT_TTL)
+    start = time.perf_counter()
+    try:
+        status_code, body = fetch()
+    except Exception:
+        _count(endpoint, upstream_ms=(time.perf_counter() - start) * 1000, failed=True)
+        raise
+    _count(endpoint, upstream_ms=(time.perf_counter() - start) * 1000, failed=status_code != 200)
+    if status_code == 200:
+        try:
+            cache.set(key, {'at': time.time(), 'body': body}, fresh + stale)
+        except Exception:
+            pass
+    return status_code, body
+
+
+def _refresh_in_background(endpoint, key, fetch):
+    lock_key = f"{key}:refresh"
+    if not cache.add(lock_key, 1, LOCK_SECONDS):
+        return  # another thread or worker is already refreshing this entry
+
+    def run():
+        close_old_connections()
+        try:
+            _upstream(endpoint, key, fetch)
+        except Exception as e:
+            print(f"[ERP PROXY] Background refresh of {endpoint} failed: {e}")
+        finally:
+            cache.delete(lock_key)
+            close_old_connections()
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+# ── Single-flight misses ──────────────────────────────────────────────────────
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _wait_for_entry(key, lock_key):
+    """Poll for another worker's fetch to land. None if it didn't within MISS_WAIT_SECONDS."""
+    deadline = time.monotonic() + MISS_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(MISS_POLL_SECONDS)
+        entry = _read(key)
+        if entry is not None:
+            return entry
+        if cache.get(lock_key) is None:
+            return None  # that fetch finished without storing anything
+    return None
+
+
+def _load(endpoint, key, fetch):
+    with _inflight_lock:
+        flight = _inflight.get(key)
+        leader = flight is None
+        if leader:
+            flight = _inflight[key] = _Flight()
+
+    if not leader:
+        if flight.done.wait(MISS_WAIT_SECONDS) and flight.result is not None:
+            _count(endpoint, COALESCED)
+            status_code, body, _ = flight.result
+            return status_code, body, COALESCED
+        status_code, body = _upstream(endpoint, key, fetch)
+        _count(endpoint, MISS)
+        return status_code, body, MISS
+
+    try:
+        lock_key = f"{key}:fetch"
+        if not cache.add(lock_key, 1, LOCK_SECONDS):
+            entry = _wait_for_entry(key, lock_key)
+            if entry is not None:
+                _count(endpoint, COALESCED)
+                flight.result = (200, entry['body'], COALESCED)
+                return flight.result
+            lock_key = None
+        try:
+            status_code, body = _upstream(endpoint, key, fetch)
+        finally:
+            if lock_key:
+                cache.delete(lock_key)
+        _count(endpoint, MISS)
+        flight.result = (status_code, body, MISS)
+        return flight.result
+    finally:
+        flight.done.set()
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+def fetch(endpoint, identity, params, fetch_upstream):
+    """(status, body, cache state) for one proxied ERP read.
+
+    `fetch_upstream()` performs the ERP call and returns (status, body); it
+    may run on a background thread, so it must not touch the request's
+    response.
+    """
+    key = cache_key(endpoint, identity, params)
+    entry = _read(key)
+    if entry is not None:
+        fresh, _ = TTLS.get(endpoint, DEFAULT_TTL)
+        if time.time() - entry['at'] < fresh:
+            _count(endpoint, HIT)
+            return 200, entry['body'], HIT
+        _refresh_in_background(endpoint, key, fetch_upstream)
+        _count(endpoint, STALE)
+        return 200, entry['body'], STALE
+    return _load(endpoint, key, fetch_upstream)
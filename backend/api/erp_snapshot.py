@@ -0,0 +1,201 @@
+"""
+Memory-mapped ERP lookup snapshot shared by every gunicorn worker.
+
+The adm_/email_ index is written once per host into a compact, immutable
+file and mapped read-only by each worker, so the pages live once in the
+page cache instead of once per worker, and lookups need no Redis round-trip.
+
+File layout (little-endian):
+
+    header   MAGIC (8s) | built_at (d) | n_keys (I) | n_records (I)
+    table    n_keys x (key hash Q | key offset Q | key len I | record no. I)   sorted by hash
+    offsets  n_records x (record offset Q | record len I)
+    blob     utf-8 keys, then JSON-encoded records (each record stored once)
+
+A lookup hashes the key, binary-searches the table and verifies the key
+bytes, then decodes just that record. Refreshes write a new file and
+os.replace() it over the old one; readers notice the new inode and remap,
+while mappings of the old file stay valid until dropped.
+"""
+import bisect
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+MAGIC = b'ERPIDX01'
+HEADER = struct.Struct('<8sdII')
+ENTRY = struct.Struct('<QQII')
+OFFSET = struct.Struct('<QI')
+
+SNAPSHOT_DIR = os.getenv('ERP_SNAPSHOT_DIR') or ('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir())
+SNAPSHOT_PATH = os.path.join(SNAPSHOT_DIR, 'pathfinder_erp_index.bin')
+BUILD_LOCK_PATH = SNAPSHOT_PATH + '.lock'
+BUILD_LOCK_STALE_SECONDS = 5 * 60
+# How often a worker stat()s the file to pick up a swapped snapshot
+RECHECK_SECONDS = 5
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+
+def write_snapshot(entries, path=SNAPSHOT_PATH, built_at=None):
+    """Write {key: record} atomically to `path`. Records shared by several keys are stored once."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    built_at = time.time() if built_at is None else built_at
+    records, record_no = [], {}
+    table = []
+    for key, record in entries.items():
+        rid = id(record)
+        if rid not in record_no:
+            record_no[rid] = len(records)
+            records.append(json.dumps(record, separators=(',', ':'), default=str).encode())
+        k = key.encode()
+        table.append((_hash(k), k, record_no[rid]))
+    table.sort(key=lambda t: (t[0], t[1]))
+
+    n_keys, n_records = len(table), len(records)
+    blob_start = HEADER.size + n_keys * ENTRY.size + n_records * OFFSET.size
+    pos = blob_start
+    entry_bytes = bytearray()
+    for h, k, rno in table:
+        entry_bytes += ENTRY.pack(h, pos, len(k), rno)
+        pos += len(k)
+    offset_bytes = bytearray()
+    for r in records:
+        offset_bytes += OFFSET.pack(pos, len(r))
+        pos += len(r)
+
+    fd, tmp = tempfile.mkstemp(prefix='.erp_index_', dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, built_at, n_keys, n_records))
+            f.write(entry_bytes)
+            f.write(offset_bytes)
+            for _, k, _ in table:
+                f.write(k)
+            for r in records:
+                f.write(r)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except Exception:
+        try: os.unlink(tmp)
+        except OSError: pass
+        raise
+    return n_keys
+
+
+class Snapshot:
+    """Read-only view over one mapped snapshot file."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.inode = os.fstat(f.fileno()).st_ino
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.built_at, self.n_keys, self.n_records = HEADER.unpack_from(self.buf, 0)
+        if magic != MAGIC:
+            self.buf.close()
+            raise ValueError(f"{path} is not an ERP index snapshot")
+        self._table = HEADER.size
+        self._offsets = self._table + self.n_keys * ENTRY.size
+        self._hashes = _HashColumn(self)
+
+    def get(self, key, default=None):
+        k = key.encode()
+        h = _hash(k)
+        i = bisect.bisect_left(self._hashes, h)
+        while i < self.n_keys:
+            eh, k_off, k_len, rno = ENTRY.unpack_from(self.buf, self._table + i * ENTRY.size)
+            if eh != h:
+                break
+            if self.buf[k_off:k_off + k_len] == k:
+                r_off, r_len = OFFSET.unpack_from(self.buf, self._offsets + rno * OFFSET.size)
+                return json.loads(self.buf[r_off:r_off + r_len])
+            i += 1
+        return default
+
+
+class _HashColumn:
+    """Sequence view of the sorted key-hash column, for bisect."""
+
+    def __init__(self, snap):
+        self.snap = snap
+
+    def __len__(self):
+        return self.snap.n_keys
+
+    def __getitem__(self, i):
+        return struct.unpack_from('<Q', self.snap.buf, self.snap._table + i * ENTRY.size)[0]
+
+
+_current = {'snapshot': None, 'checked': 0.0}
+_open_lock = threading.Lock()
+
+
+def get_snapshot():
+    """The mapped snapshot for this process, remapped when the file is swapped; None if absent."""
+    now = time.monotonic()
+    snap = _current['snapshot']
+    if snap is not None and now - _current['checked'] < RECHECK_SECONDS:
+        return snap
+    with _open_lock:
+        _current['checked'] = now
+        try:
+            inode = os.stat(SNAPSHOT_PATH).st_ino
+        except OSError:
+            _current['snapshot'] = None
+            return None
+        if snap is None or snap.inode != inode:
+            try:
+                _current['snapshot'] = Snapshot(SNAPSHOT_PATH)
+            except Exception as e:
+                print(f"[ERP SNAPSHOT] Failed to map {SNAPSHOT_PATH}: {e}")
+                _current['snapshot'] = None
+        return _current['snapshot']
+
+
+def _acquire_build_lock():
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    try:
+        fd = os.open(BUILD_LOCK_PATH, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        os.close(fd)
+        return True
+    except FileExistsError:
+        try:
+            if time.time() - os.stat(BUILD_LOCK_PATH).st_mtime > BUILD_LOCK_STALE_SECONDS:
+                os.unlink(BUILD_LOCK_PATH)
+        except OSError:
+            pass
+        return False
+
+
+def build_snapshot(records):
+    """Build the host snapshot from (doc) dicts with keys/has_sections/record.
+
+    Returns the number of keys written, or None if another process on this
+    host is already building it.
+    """
+    if not _acquire_build_lock():
+        return None
+    try:
+        owners, entries = {}, {}
+        for doc in records:
+            has_sects = bool(doc.get('has_sections'))
+            for key in doc.get('keys') or []:
+                cur = owners.get(key)
+                if cur is None or (not cur and has_sects):
+                    owners[key] = has_sects
+                    entries[key] = doc['record']
+        n = write_snapshot(entries)
+        print(f"[ERP SNAPSHOT] Wrote {n} keys to {SNAPSHOT_PATH}")
+        return n
+    finally:
+        try: os.unlink(BUILD_LOCK_PATH)
+        except OSError: pass
@@ -0,0 +1,489 @@
+"""
+Incremental ERP student store.
+
+ERP admission records are mirrored into the `api_erpstudent` Mongo
+collection, one document per record:
+
+    {_id, record, updatedAt, digest, keys: ['adm_X', 'email_y'], centre, dedupe,
+     has_sections, synced_at}
+
+A sync asks the ERP only for records changed since the stored `updatedAt`
+watermark (ERP_DELTA_PARAM); records whose content digest hasn't changed are
+skipped, so even an ERP that ignores the filter costs one HTTP call and no
+writes. A full refetch runs at most every ERP_FULL_SYNC_SECONDS to pick up
+deletions.
+
+The lookup indexes live in two Redis hashes, so a lookup reads one field
+instead of unpickling the whole roster in every worker:
+
+    erp:student_index   adm_<ADMISSION> / email_<email> -> {"id", "s", "r": record}
+    erp:centre_index    <CENTRE NAME UPPER>             -> [dedupe ids]
+
+Student lookups are served first from a read-only memory-mapped snapshot
+shared by all workers on the host (api/erp_snapshot.py), rebuilt whenever a
+sync changes the roster. Without a snapshot they read the Redis hash, and
+without Redis (LocMem dev setups) an indexed query on `api_erpstudent.keys`.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils import timezone
+
+from api import erp_client
+
+ERP_STUDENT_COLLECTION = 'api_erpstudent'
+ERP_SYNC_STATE_COLLECTION = 'api_erpsyncstate'
+STATE_ID = 'students'
+
+STUDENT_HASH = 'erp:student_index'
+CENTRE_HASH = 'erp:centre_index'
+
+# Query parameter the ERP uses for "changed since" filtering on /api/admission
+ERP_DELTA_PARAM = os.getenv('ERP_DELTA_PARAM', 'updatedAfter')
+ERP_DELTA_SECONDS = int(os.getenv('ERP_DELTA_SECONDS', 10 * 60))
+ERP_FULL_SYNC_SECONDS = int(os.getenv('ERP_FULL_SYNC_SECONDS', 24 * 60 * 60))
+
+SYNC_LOCK_KEY = 'erp_student_sync_lock'
+SYNC_LOCK_SECONDS = 5 * 60
+STATE_MEMO_SECONDS = 30
+HASH_WRITE_CHUNK = 1000
+
+_state_memo = {'checked': 0.0, 'state': None}
+
+
+# ── Record helpers ────────────────────────────────────────────────────────────
+
+def has_sections(record):
+    sa = (record or {}).get('sectionAllotment', {}) or {}
+    return bool(sa.get('examSection') or sa.get('studySection'))
+
+
+def record_centre(record):
+    c_raw = record.get('centre')
+    if not c_raw:
+        v = record.get('venue')
+        c_raw = (v.get('centreName') or v.get('name')) if isinstance(v, dict) else v
+    return str(c_raw or '').upper().strip()
+
+
+def _record_doc(record):
+    """The api_erpstudent document for one ERP admission record."""
+    adm_no = str(record.get('admissionNumber') or '').strip().upper()
+    keys = [f"adm_{adm_no}"] if adm_no else []
+    first_email = ''
+    student_obj = record.get('student') or {}
+    for d in student_obj.get('studentsDetails', []) or []:
+        email = str((d or {}).get('studentEmail') or '').strip().lower()
+        if email:
+            first_email = first_email or email
+            keys.append(f"email_{email}")
+    rid = str(record.get('_id') or adm_no or first_email)
+    return {
+        '_id': rid,
+        'record': record,
+        'updatedAt': record.get('updatedAt'),
+        'digest': hashlib.sha1(json.dumps(record, sort_keys=True, default=str).encode()).hexdigest(),
+        'keys': list(dict.fromkeys(keys)),
+        'centre': record_centre(record),
+        'dedupe': adm_no or first_email,
+        'has_sections': has_sections(record),
+    }
+
+
+def _collection(name):
+    from api.db_utils import get_db
+    db = get_db()
+    return db[name] if db is not None else None
+
+
+# ── Redis hashes ──────────────────────────────────────────────────────────────
+
+def _redis():
+    """Raw redis client behind the default cache, or None (LocMem)."""
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+    except Exception:
+        return None
+
+
+def _entry(doc):
+    return json.dumps({'id': doc['_id'], 's': doc['has_sections'], 'r': doc['record']}, default=str)
+
+
+def _prefer(current, doc):
+    """Keep the existing owner of a key unless it is this record or lacks sections."""
+    return current is None or current['id'] == doc['_id'] or (not current['s'] and doc['has_sections'])
+
+
+def rebuild_indexes(conn=None):
+    """Rebuild both Redis hashes from api_erpstudent and swap them in atomically."""
+    conn = conn or _redis()
+    coll = _collection(ERP_STUDENT_COLLECTION)
+    if conn is None or coll is None:
+        return False
+
+    owners = {}          # key -> (has_sections, doc id)
+    centres = {}
+    entries = {}
+    for doc in coll.find({}, {'record': 1, 'keys': 1, 'centre': 1, 'dedupe': 1, 'has_sections': 1}):
+        doc.setdefault('has_sections', False)
+        for key in doc.get('keys') or []:
+            cur = owners.get(key)
+            if cur is None or (not cur[0] and doc['has_sections']):
+                owners[key] = (doc['has_sections'], doc['_id'])
+                entries[key] = _entry(doc)
+        if doc.get('centre') and doc.get('dedupe'):
+            centres.setdefault(doc['centre'], set()).add(doc['dedupe'])
+
+    tmp_student, tmp_centre = f"{STUDENT_HASH}:tmp", f"{CENTRE_HASH}:tmp"
+    pipe = conn.pipeline(transaction=False)
+    pipe.delete(tmp_student, tmp_centre)
+    items = list(entries.items())
+    for i in range(0, len(items), HASH_WRITE_CHUNK):
+        pipe.hset(tmp_student, mapping=dict(items[i:i + HASH_WRITE_CHUNK]))
+    c_items = [(c, json.dumps(sorted(ids))) for c, ids in centres.items()]
+    for i in range(0, len(c_items), HASH_WRITE_CHUNK):
+        pipe.hset(tmp_centre, mapping=dict(c_items[i:i + HASH_WRITE_CHUNK]))
+    pipe.execute()
+
+    # RENAME is atomic: readers see either the old or the new index, never a mix
+    pipe = conn.pipeline(transaction=True)
+    if items: pipe.rename(tmp_student, STUDENT_HASH)
+    else: pipe.delete(STUDENT_HASH)
+    if c_items: pipe.rename(tmp_centre, CENTRE_HASH)
+    else: pipe.delete(CENTRE_HASH)
+    pipe.execute()
+    print(f"[ERP SYNC] Rebuilt Redis indexes: {len(items)} keys, {len(c_items)} centres")
+    return True
+
+
+def _apply_to_indexes(conn, docs, previous):
+    """Patch both hashes for the changed docs; previous = {id: old doc} before the upsert."""
+    fields = sorted({k for d in docs for k in d['keys']} |
+                    {k for p in previous.values() for k in p.get('keys') or []})
+    sets, dels = {}, []
+    if fields:
+        current = {}
+        for k, raw in zip(fields, conn.hmget(STUDENT_HASH, fields)):
+            if raw is not None:
+                val = json.loads(raw)
+                current[k] = {'id': val['id'], 's': val['s']}
+        for doc in docs:
+            old = previous.get(doc['_id']) or {}
+            for k in set(old.get('keys') or []) - set(doc['keys']):
+                if (current.get(k) or {}).get('id') == doc['_id']:
+                    dels.append(k)
+            for k in doc['keys']:
+                if _prefer(current.get(k), doc):
+                    current[k] = {'id': doc['_id'], 's': doc['has_sections']}
+                    sets[k] = _entry(doc)
+
+    moves = []   # (centre, dedupe, add?)
+    for doc in docs:
+        old = previous.get(doc['_id']) or {}
+        if (old.get('centre'), old.get('dedupe')) != (doc['centre'], doc['dedupe']):
+            if old.get('centre') and old.get('dedupe'):
+                moves.append((old['centre'], old['dedupe'], False))
+            if doc['centre'] and doc['dedupe']:
+                moves.append((doc['centre'], doc['dedupe'], True))
+    buckets = {}
+    if moves:
+        names = sorted({m[0] for m in moves})
+        for name, raw in zip(names, conn.hmget(CENTRE_HASH, names)):
+            buckets[name] = set(json.loads(raw)) if raw else set()
+        for name, dedupe, add in moves:
+            if add: buckets[name].add(dedupe)
+            else: buckets[name].discard(dedupe)
+
+    pipe = conn.pipeline(transaction=False)
+    if dels: pipe.hdel(STUDENT_HASH, *dels)
+    items = list(sets.items())
+    for i in range(0, len(items), HASH_WRITE_CHUNK):
+        pipe.hset(STUDENT_HASH, mapping=dict(items[i:i + HASH_WRITE_CHUNK]))
+    if buckets:
+        pipe.hset(CENTRE_HASH, mapping={c: json.dumps(sorted(ids)) for c, ids in buckets.items()})
+    pipe.execute()
+
+
+# ── Sync ──────────────────────────────────────────────────────────────────────
+
+def _fetch_admissions(params=None):
+    from api.erp_views import _get_erp_url, _get_erp_admin_token
+    erp_token = _get_erp_admin_token()
+    if not erp_token:
+        return None
+    resp = erp_client.get(
+        f"{_get_erp_url()}/api/admission",
+        headers={"Authorization": f"Bearer {erp_token}"},
+        params=params or None
+    )
+    if resp.status_code != 200:
+        print(f"[ERP SYNC] /api/admission returned {resp.status_code}")
+        return None
+    data = resp.json()
+    if isinstance(data, dict):
+        return data.get('data') or data.get('admissions') or data.get('students') or []
+    return data if isinstance(data, list) else []
+
+
+def get_sync_state(fresh=False):
+    now = time.monotonic()
+    if fresh or now - _state_memo['checked'] > STATE_MEMO_SECONDS:
+        coll = _collection(ERP_SYNC_STATE_COLLECTION)
+        _state_memo['state'] = coll.find_one({'_id': STATE_ID}) if coll is not None else None
+        _state_memo['checked'] = now
+    return _state_memo['state']
+
+
+def _age_seconds(dt):
+    if dt is None:
+        return None
+    now = timezone.now()
+    if timezone.is_aware(now) and timezone.is_naive(dt):
+        now = timezone.make_naive(now)
+    elif timezone.is_naive(now) and timezone.is_aware(dt):
+        dt = timezone.make_naive(dt)
+    return (now - dt).total_seconds()
+
+
+def sync_erp_students(full=False):
+    """Pull changed ERP records into api_erpstudent and patch the Redis indexes.
+
+    Returns the number of records written, or None if another worker holds
+    the sync lock or the ERP/DB is unavailable.
+    """
+    from pymongo import ReplaceOne
+
+    coll = _collection(ERP_STUDENT_COLLECTION)
+    state_coll = _collection(ERP_SYNC_STATE_COLLECTION)
+    if coll is None or state_coll is None:
+        return None
+    if not cache.add(SYNC_LOCK_KEY, '1', SYNC_LOCK_SECONDS):
+        return None
+    try:
+        state = state_coll.find_one({'_id': STATE_ID}) or {}
+        watermark = state.get('watermark')
+        full_age = _age_seconds(state.get('last_full_sync'))
+        full = full or not watermark or full_age is None or full_age > ERP_FULL_SYNC_SECONDS
+
+        started = time.monotonic()
+        if full:
+            records = _fetch_admissions()
+        else:
+            records = _fetch_admissions({ERP_DELTA_PARAM: watermark})
+        if records is None:
+            return None
+
+        docs = {}
+        for record in records:
+            if isinstance(record, dict):
+                doc = _record_doc(record)
+                if doc['_id']:
+                    docs[doc['_id']] = doc
+
+        previous = {}
+        ids = list(docs)
+        for i in range(0, len(ids), HASH_WRITE_CHUNK):
+            for old in coll.find({'_id': {'$in': ids[i:i + HASH_WRITE_CHUNK]}},
+                                 {'digest': 1, 'keys': 1, 'centre': 1, 'dedupe': 1}):
+                previous[old['_id']] = old
+        changed = [d for d in docs.values() if (previous.get(d['_id']) or {}).get('digest') != d['digest']]
+
+        now = timezone.now()
+        ops = [ReplaceOne({'_id': d['_id']}, dict(d, synced_at=now), upsert=True) for d in changed]
+        for i in range(0, len(ops), HASH_WRITE_CHUNK):
+            coll.bulk_write(ops[i:i + HASH_WRITE_CHUNK], ordered=False)
+
+        removed = 0
+        if full and docs:
+            removed = coll.delete_many({'_id': {'$nin': ids}}).deleted_count
+
+        conn = _redis()
+        if conn is not None:
+            try:
+                if full and (removed or not conn.exists(STUDENT_HASH)):
+                    rebuild_indexes(conn)
+                elif changed:
+                    _apply_to_indexes(conn, changed, previous)
+            except Exception as e:
+                print(f"[ERP SYNC] Redis index update failed ({e}); rebuilding")
+                rebuild_indexes(conn)
+
+        stamps = [str(d['updatedAt']) for d in docs.values() if d.get('updatedAt')]
+        new_watermark = max(stamps + ([watermark] if watermark else [])) if (stamps or watermark) else None
+        fields = {'watermark': new_watermark, 'last_sync': now, 'count': coll.estimated_document_count()}
+        if full:
+            fields['last_full_sync'] = now
+        if changed or removed or not state.get('changed_at'):
+            fields['changed_at'] = now
+        state_coll.update_one({'_id': STATE_ID}, {'$set': fields}, upsert=True)
+        get_sync_state(fresh=True)
+        if changed or removed:
+            refresh_snapshot()
+
+        print(f"[ERP SYNC] {'Full' if full else 'Delta'} sync: {len(docs)} fetched, "
+              f"{len(changed)} changed, {removed} removed in {time.monotonic() - started:.1f}s")
+        return len(changed)
+    except Exception as e:
+        print(f"[ERP SYNC ERROR] {e}")
+        return None
+    finally:
+        cache.delete(SYNC_LOCK_KEY)
+
+
+def _sync_in_background(full=False):
+    def _bg():
+        try:
+            close_old_connections()
+            sync_erp_students(full=full)
+        finally:
+            close_old_connections()
+    threading.Thread(target=_bg, daemon=True).start()
+
+
+def ensure_synced(force_refresh=False, block=True):
+    """True once the store holds a roster; triggers delta syncs when it is stale."""
+    if force_refresh:
+        sync_erp_students(full=True)
+        return get_sync_state() is not None
+    state = get_sync_state()
+    if state is None:
+        if block:
+            sync_erp_students(full=True)
+            return get_sync_state() is not None
+        _sync_in_background(full=True)
+        return False
+    age = _age_seconds(state.get('last_sync'))
+    if age is None or age > ERP_DELTA_SECONDS:
+        _sync_in_background()
+    _ensure_snapshot(state)
+    return True
+
+
+# ── Host snapshot (api/erp_snapshot.py) ───────────────────────────────────────
+
+_snapshot_build = {'started': 0.0}
+
+
+def refresh_snapshot():
+    """Rebuild this host's memory-mapped lookup snapshot from api_erpstudent."""
+    from .erp_snapshot import build_snapshot
+    coll = _collection(ERP_STUDENT_COLLECTION)
+    if coll is None:
+        return None
+    try:
+        return build_snapshot(coll.find({}, {'record': 1, 'keys': 1, 'has_sections': 1}))
+    except Exception as e:
+        print(f"[ERP SNAPSHOT] Build failed: {e}")
+        return None
+
+
+def _ensure_snapshot(state):
+    """Kick off a background rebuild when this host's snapshot is missing or older
+    than the last roster change (e.g. the sync ran on another host)."""
+    from .erp_snapshot import get_snapshot
+    snap = get_snapshot()
+    changed_at = state.get('changed_at')
+    if snap is not None and (changed_at is None or changed_at.timestamp() <= snap.built_at):
+        return
+    now = time.monotonic()
+    if now - _snapshot_build['started'] < SYNC_LOCK_SECONDS:
+        return
+    _snapshot_build['started'] = now
+
+    def _bg():
+        try:
+            close_old_connections()
+            refresh_snapshot()
+        finally:
+            close_old_connections()
+    threading.Thread(target=_bg, daemon=True).start()
+
+
+# ── Lookups ───────────────────────────────────────────────────────────────────
+
+class ERPStudentIndex:
+    """Read-only {adm_X / email_y: record} view.
+
+    Served from the host's memory-mapped snapshot when one is mapped, else
+    from the Redis hash, else from Mongo. Callers only use .get(); nothing is
+    loaded until a key is asked for.
+    """
+
+    def get(self, key, default=None):
+        from .erp_snapshot import get_snapshot
+        snap = get_snapshot()
+        if snap is not None:
+            return snap.get(key, default)
+        conn = _redis()
+        if conn is not None:
+            try:
+                raw = conn.hget(STUDENT_HASH, key)
+                return json.loads(raw)['r'] if raw is not None else default
+            except Exception as e:
+                print(f"[ERP] Redis lookup failed for {key}: {e}")
+        coll = _collection(ERP_STUDENT_COLLECTION)
+        if coll is None:
+            return default
+        best = None
+        for doc in coll.find({'keys': key}, {'record': 1, 'has_sections': 1}).limit(10):
+            if best is None or (not best.get('has_sections') and doc.get('has_sections')):
+                best = doc
+        return best['record'] if best else default
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __bool__(self):
+        return True
+
+
+class ERPCentreIndex:
+    """Read-only {CENTRE NAME UPPER: set(dedupe ids)} view over the Redis hash."""
+
+    def get(self, centre, default=None):
+        conn = _redis()
+        if conn is not None:
+            try:
+                raw = conn.hget(CENTRE_HASH, centre)
+                return set(json.loads(raw)) if raw is not None else default
+            except Exception as e:
+                print(f"[ERP] Redis centre lookup failed for {centre}: {e}")
+        coll = _collection(ERP_STUDENT_COLLECTION)
+        if coll is None:
+            return default
+        ids = {d['dedupe'] for d in coll.find({'centre': centre}, {'dedupe': 1}) if d.get('dedupe')}
+        return ids or default
+
+    def __bool__(self):
+        return True
+
+
+def erp_centres():
+    """Every centre name (upper-cased, as record_centre) present in the mirror."""
+    coll = _collection(ERP_STUDENT_COLLECTION)
+    if coll is None:
+        return []
+    return [c for c in coll.distinct('centre') if c]
+
+
+def iter_erp_records(centres=None):
+    """Stored ERP admission records, streamed from Mongo; only these centres' when given."""
+    coll = _collection(ERP_STUDENT_COLLECTION)
+    if coll is None:
+        return
+    query = {} if centres is None else {'centre': {'$in': list(centres)}}
+    for doc in coll.find(query, {'record': 1}):
+        yield doc['record']
@@ -2,13 +2,13 @@ from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-import requests
 import os
 import threading
 from django.core.cache import cache
 from django.db import close_old_connections
 from master_data.models import Session, ClassLevel, TargetExam
 from .models import CustomUser
+from . import erp_client, erp_proxy_cache
 
 
 def _get_erp_url():
@@ -45,10 +45,9 @@ def _get_erp_admin_token(force_refresh=False):
     debug_log(f"[TOKEN] Attempting login for {admin_email} at {erp_url}")
     try:
         # 60s timeout — Render-hosted ERP has long cold-start wake times
-        resp = requests.post(
+        resp = erp_client.post(
             f"{erp_url}/api/superAdmin/login",
-            json={"email": admin_email, "password": admin_pass},
-            timeout=60
+            json={"email": admin_email, "password": admin_pass}
         )
         debug_log(f"[TOKEN] Login response status: {resp.status_code}")
         if resp.status_code == 200:
@@ -89,159 +88,57 @@ def _is_profile_rich(data):
     # We previously required 2, but 1 is fine for a fast initial UI
     return real_count >= 1
 
-_MEMORY_CACHE = {}
-
 def get_student_lookup_index(force_refresh=False, block=True):
     """
-    Best Algorithm: O(1) Hash Map lookup instead of O(N) list iteration.
-    Indexes all students by Email and Admission ID for instant retrieval.
-    """
-    index_key = 'erp_student_lookup_index_v1'
-    global _MEMORY_CACHE
+    O(1) lookup of ERP records by 'adm_<ADMISSION>' / 'email_<email>'.
 
-    if force_refresh:
-        cache.delete(index_key)
-        cache.delete('erp_centre_student_index_v1')
-        _MEMORY_CACHE.clear()
-
-    if not force_refresh and index_key in _MEMORY_CACHE:
-        return _MEMORY_CACHE[index_key]
-
-    index = cache.get(index_key)
-    if index and not force_refresh:
-        _MEMORY_CACHE[index_key] = index
-        return index
-
-    # helper for mass data fetch (reused by view and here)
-    bulk_cache = _fetch_all_students_erp(force_refresh=force_refresh, block=block)
-    if not bulk_cache or not isinstance(bulk_cache, list): return None
-
-    print(f"[ERP] O(1) Indexing {len(bulk_cache)} records for high-performance lookup...")
-    idx = {}
-    centre_idx = {}  # centre name (UPPER) -> set of dedupe ids
-    # Helper to check if record has sections
-    def has_sects(r):
-        sa = (r or {}).get('sectionAllotment', {}) or {}
-        return bool(sa.get('examSection') or sa.get('studySection'))
-
-    for record in bulk_cache:
-        # Index by Admission Number (Normalizes to Upper/Strip)
-        adm_no = str(record.get('admissionNumber') or '').strip().upper()
-        if adm_no:
-            key = f"adm_{adm_no}"
-            # Overwrite only if the existing one has no sections and the new one does
-            if key not in idx or (not has_sects(idx[key]) and has_sects(record)):
-                idx[key] = record
-
-        # Index by Student Emails (Normalizes to Lower/Strip)
-        student_obj = record.get('student') or {}
-        details = student_obj.get('studentsDetails', [])
-        em = ''
-        for d in details:
-            email = str(d.get('studentEmail') or '').strip().lower()
-            if email:
-                if not em:
-                    em = email
-                key = f"email_{email}"
-                # Overwrite only if the existing one has no sections and the new one does
-                if key not in idx or (not has_sects(idx[key]) and has_sects(record)):
-                    idx[key] = record
-
-        # Centre-keyed reverse index (stored under a SEPARATE cache key so existing
-        # callers that iterate `idx.values()` expecting dicts are unaffected).
-        c_raw = record.get('centre')
-        if not c_raw:
-            v = record.get('venue')
-            c_raw = (v.get('centreName') or v.get('name')) if isinstance(v, dict) else v
-        s_centre = str(c_raw or '').upper().strip()
-        if s_centre:
-            dedupe_id = adm_no or em
-            if dedupe_id:
-                bucket = centre_idx.get(s_centre)
-                if bucket is None:
-                    bucket = set()
-                    centre_idx[s_centre] = bucket
-                bucket.add(dedupe_id)
-
-    cache.set(index_key, idx, 3600) # 1 hour index life
-    cache.set('erp_centre_student_index_v1', centre_idx, 3600)
-    return idx
+    Backed by the incremental store in api/erp_sync.py: each .get() reads the
+    host's memory-mapped snapshot (api/erp_snapshot.py), falling back to one
+    Redis hash field, so no worker holds (or unpickles) the whole roster.
+    Returns None while the store is still empty and `block` is False.
+    """
+    from .erp_sync import ensure_synced, ERPStudentIndex
+    if not ensure_synced(force_refresh=force_refresh, block=block):
+        return None
+    return ERPStudentIndex()
 
 
 def get_centre_student_index(force_refresh=False, block=True):
-    """Return {CENTRE_NAME_UPPER: set(dedupe_id)} for fast roster computation.
-
-    Side-effect of get_student_lookup_index — call that to (re)build both indexes.
-    """
-    global _MEMORY_CACHE
-    c_key = 'erp_centre_student_index_v1'
-    if not force_refresh and c_key in _MEMORY_CACHE:
-        return _MEMORY_CACHE[c_key]
-
-    centre_idx = cache.get(c_key)
-    if centre_idx is not None and not force_refresh:
-        _MEMORY_CACHE[c_key] = centre_idx
-        return centre_idx
-    
-    get_student_lookup_index(force_refresh=force_refresh, block=block)
-    
-    res = cache.get(c_key) or {}
-    _MEMORY_CACHE[c_key] = res
-    return res
+    """Return {CENTRE_NAME_UPPER: set(dedupe_id)} for fast roster computation."""
+    from .erp_sync import ensure_synced, ERPCentreIndex
+    if not ensure_synced(force_refresh=force_refresh, block=block):
+        return {}
+    return ERPCentreIndex()
 
 def _fetch_all_students_erp(force_refresh=False, block=True):
-    """Fetch full ERP student list.
+    """Full ERP student list, read from the local api_erpstudent mirror.
 
-    When `block=False` and the cache is cold, return an empty list immediately
-    and spawn a background thread to populate the cache. This keeps caller
-    request latency O(ms) even if ERP is in cold-start (90s timeout).
+    The mirror is kept current by delta syncs (api/erp_sync.py). When
+    `block=False` and it has never been filled, return an empty list
+    immediately and fill it in the background, so callers never wait on an
+    ERP cold start (90s timeout).
     """
-    CACHE_KEY = 'erp_all_students_v1'
-    if not force_refresh:
-        cached = cache.get(CACHE_KEY)
-        if cached is not None: return cached
-
-    if not block:
-        # Cache cold and caller refuses to wait — fire-and-forget refresh.
-        lock_key = f"{CACHE_KEY}_bg_lock"
-        if cache.add(lock_key, '1', 120):  # 2 min dedupe window
-            def _bg():
-                try:
-                    close_old_connections()
-                    _fetch_all_students_erp(force_refresh=True, block=True)
-                except Exception as e:
-                    print(f"[ERP SYNC BG ERROR] {e}")
-                finally:
-                    cache.delete(lock_key)
-                    close_old_connections()
-            t = threading.Thread(target=_bg, daemon=True)
-            t.start()
+    from .erp_sync import ensure_synced, iter_erp_records
+    if not ensure_synced(force_refresh=force_refresh, block=block):
         return []
-
     try:
-        erp_url = _get_erp_url()
-        erp_token = _get_erp_admin_token(force_refresh=force_refresh)
-
-        if not erp_token: return []
-
-        print(f"[ERP SYNC] Fetching FRESH data for {CACHE_KEY} (Forced: {force_refresh})...")
-        resp = requests.get(
-            f"{erp_url}/api/admission",
-            headers={"Authorization": f"Bearer {erp_token}"},
-            timeout=90
-        )
+        return list(iter_erp_records())
+    except Exception as e:
+        print(f"[ERP SYNC ERROR] {e}")
+    return []
 
-        if resp.status_code == 200:
-            data = resp.json()
-            final_data = []
-            if isinstance(data, dict):
-                final_data = data.get('data') or data.get('admissions') or data.get('students') or []
-            elif isinstance(data, list):
-                final_data = data
+def _fetch_centre_students_erp(match, force_refresh=False, block=True):
+    """ERP records of the centres for which match(CENTRE NAME UPPER) is true.
 
-            if final_data:
-                cache.set(CACHE_KEY, final_data, 86400)
-                return final_data
+    Reads only those centres' documents through the mirror's `centre` index
+    instead of decoding the whole roster.
+    """
+    from .erp_sync import ensure_synced, erp_centres, iter_erp_records
+    if not ensure_synced(force_refresh=force_refresh, block=block):
+        return []
+    try:
+        centres = [c for c in erp_centres() if match(c)]
+        return list(iter_erp_records(centres)) if centres else []
     except Exception as e:
         print(f"[ERP SYNC ERROR] {e}")
     return []
@@ -264,8 +161,8 @@ def _perform_background_erp_sync(user_id, search_email, student_cache_key, force
         print(f"[BG-SYNC] Starting background sync for {search_email}...")
         
         # 1. Targeted Email Search
-        resp = requests.get(f"{erp_url}/api/admission?studentEmail={search_email}", 
-                            headers={"Authorization": f"Bearer {admin_token}"}, timeout=60)
+        resp = erp_client.get(f"{erp_url}/api/admission?studentEmail={search_email}", 
+                            headers={"Authorization": f"Bearer {admin_token}"})
         
         target_record = None
         if resp.status_code == 200:
@@ -282,14 +179,11 @@ def _perform_background_erp_sync(user_id, search_email, student_cache_key, force
                 if any(d and str(d.get('studentEmail') or '').strip().lower() == search_email for d in details):
                     target_record = potential_record
         
-        # 2. Fallback to Global Sync if target not found
+        # 2. Fallback to the synced ERP mirror if target not found
         if not target_record:
-            all_students = _fetch_all_students_erp(force_refresh=force_refresh)
-            for admission in all_students:
-                details = (admission.get('student') or {}).get('studentsDetails', [])
-                if any(d and str(d.get('studentEmail') or '').strip().lower() == search_email for d in details):
-                    target_record = admission
-                    break
+            index = get_student_lookup_index(force_refresh=force_refresh)
+            if index:
+                target_record = index.get(f"email_{search_email}")
         
         if target_record:
             _sync_user_to_erp(user, target_record)
@@ -661,11 +555,11 @@ def get_all_centres_erp_data(request):
             return Response([], status=200)
 
         # Added timeout to prevent hanging the server
-        resp = requests.get(f"{erp_url}/api/centre", headers={"Authorization": f"Bearer {erp_token}"}, timeout=30)
+        resp = erp_client.get(f"{erp_url}/api/centre", headers={"Authorization": f"Bearer {erp_token}"}, fallback_ttl=erp_client.FALLBACK_TTL)
         
         if resp.status_code == 401:
             erp_token = _get_erp_admin_token(force_refresh=True)
-            resp = requests.get(f"{erp_url}/api/centre", headers={"Authorization": f"Bearer {erp_token}"}, timeout=30)
+            resp = erp_client.get(f"{erp_url}/api/centre", headers={"Authorization": f"Bearer {erp_token}"}, fallback_ttl=erp_client.FALLBACK_TTL)
             
         if resp.status_code == 200:
             data = resp.json()
@@ -722,7 +616,7 @@ def _get_all_teachers_data_list(force_refresh=False):
         teacher_list = []
         try:
             t_url = f"{erp_url}/api/student-portal/teachers?limit=1000"
-            t_resp = requests.get(t_url, headers={"Authorization": f"Bearer {erp_token}"}, timeout=20)
+            t_resp = erp_client.get(t_url, headers={"Authorization": f"Bearer {erp_token}"})
             if t_resp.status_code == 200:
                 data = t_resp.json()
                 teacher_list = data if isinstance(data, list) else (data.get('teachers') or data.get('data') or [])
@@ -733,7 +627,7 @@ def _get_all_teachers_data_list(force_refresh=False):
         emp_lookup = {}
         try:
             e_url = f"{erp_url}/api/hr/employee?limit=1000"
-            e_resp = requests.get(e_url, headers={"Authorization": f"Bearer {erp_token}"}, timeout=20)
+            e_resp = erp_client.get(e_url, headers={"Authorization": f"Bearer {erp_token}"})
             if e_resp.status_code == 200:
                 data = e_resp.json()
                 e_list = data if isinstance(data, list) else (data.get('employees') or data.get('data') or [])
@@ -930,11 +824,11 @@ def get_student_attendance(request):
             debug_log("[ATTENDANCE] Admin token unavailable.")
             return Response([], status=200)
 
-        resp = requests.get(
+        resp = erp_client.get(
             f"{erp_url}/api/student-portal/attendance",
             headers={"Authorization": f"Bearer {erp_token}"},
             params=params,
-            timeout=20
+            fallback_ttl=erp_client.FALLBACK_TTL
         )
 
         debug_log(f"[ATTENDANCE] ERP Response: {resp.status_code} | Params: {dict(params)}")
@@ -975,11 +869,11 @@ def get_student_classes(request):
             debug_log("[CLASSES] Admin token unavailable.")
             return Response([], status=200)
 
-        resp = requests.get(
+        resp = erp_client.get(
             f"{erp_url}/api/student-portal/classes",
             headers={"Authorization": f"Bearer {erp_token}"},
             params=params,
-            timeout=20
+            fallback_ttl=erp_client.FALLBACK_TTL
         )
 
         debug_log(f"[CLASSES] ERP Response: {resp.status_code} | Params: {dict(params)}")
@@ -1033,7 +927,7 @@ def get_student_portal_report(request, studentId=None):
 
 
 def _proxy_portal_endpoint(request, tail, studentId=None):
-    """Internal helper to proxy portal profile/report requests to ERP."""
+    """Internal helper to proxy portal profile/report requests to ERP (cached, see erp_proxy_cache)."""
     user = request.user
     is_privileged = user.user_type in ['superadmin', 'admin', 'teacher', 'faculty', 'staff']
     target_id = studentId if (studentId and is_privileged) else _fetch_erp_student_id(user)
@@ -1041,33 +935,34 @@ def _proxy_portal_endpoint(request, tail, studentId=None):
     if not target_id:
         return Response({"error": "Student ERP identity not found"}, status=404)
 
-    try:
+    params = request.GET.copy()
+
+    def fetch():
         erp_url = _get_erp_url()
         erp_token = _get_erp_admin_token()
         if not erp_token:
-            return Response({"error": "ERP Authentication Failed"}, status=503)
+            return 503, {"error": "ERP Authentication Failed"}
 
         # Profile/Report endpoints usually take studentId as a path param in the ERP
-        erp_endpoint = f"{erp_url}/api/student-portal/{tail}/{target_id}"
-        
-        resp = requests.get(
-            erp_endpoint,
+        resp = erp_client.get(
+            f"{erp_url}/api/student-portal/{tail}/{target_id}",
             headers={"Authorization": f"Bearer {erp_token}"},
-            params=request.GET,
-            timeout=25
+            params=params
         )
-
         if resp.status_code >= 400:
-            return Response({"error": f"ERP Error {resp.status_code}"}, status=resp.status_code)
+            return resp.status_code, {"error": f"ERP Error {resp.status_code}"}
+        return 200, resp.json()
 
-        return Response(resp.json(), status=200)
+    try:
+        status_code, body, cache_state = erp_proxy_cache.fetch(tail, target_id, params, fetch)
+        return Response(body, status=status_code, headers={"X-Cache": cache_state})
     except Exception as e:
         debug_log(f"[PORTAL-{tail.upper()}] Proxy Exception: {str(e)}")
         return Response({"error": str(e)}, status=500)
 
 
 def _proxy_class_endpoint(request, tail, studentId=None):
-    """Internal helper to proxy filtered class requests to ERP with security checks."""
+    """Internal helper to proxy filtered class requests to ERP with security checks (cached, see erp_proxy_cache)."""
     user = request.user
     # Security Check: Only privileged users can look up other students' IDs
     is_privileged = user.user_type in ['superadmin', 'admin', 'teacher', 'faculty', 'staff']
@@ -1079,31 +974,33 @@ def _proxy_class_endpoint(request, tail, studentId=None):
         debug_log(f"[CLASSES-{tail.upper()}] No student ID found for {user.username}")
         return Response({"error": "Student ERP identity not found"}, status=404)
 
-    try:
+    params = request.GET.copy()
+
+    def fetch():
         erp_url = _get_erp_url()
         erp_token = _get_erp_admin_token()
         if not erp_token:
-            return Response({"error": "ERP Authentication Failed"}, status=503)
+            return 503, []
 
         # Always use the path-based studentId variation because we are proxying 
         # using an Admin Token which doesn't contain a student context.
-        erp_endpoint = f"{erp_url}/api/student-portal/classes/{tail}/{target_id}"
-        
-        resp = requests.get(
-            erp_endpoint,
+        resp = erp_client.get(
+            f"{erp_url}/api/student-portal/classes/{tail}/{target_id}",
             headers={"Authorization": f"Bearer {erp_token}"},
-            params=request.GET,
-            timeout=25
+            params=params
         )
-
         debug_log(f"[CLASSES-{tail.upper()}] ERP Proxy Response: {resp.status_code}")
-
-        # Return empty list for 404s/Errors to keep frontend stable
         if resp.status_code >= 400:
             debug_log(f"[CLASSES-{tail.upper()}] ERP Error {resp.status_code}: {resp.text[:100]}")
-            return Response([], status=200)
+            return resp.status_code, []
+        return 200, resp.json()
 
-        return Response(resp.json(), status=200)
+    try:
+        status_code, body, cache_state = erp_proxy_cache.fetch(f"classes/{tail}", target_id, params, fetch)
+        if status_code != 200:
+            # Return empty list for 404s/Errors to keep frontend stable
+            return Response([], status=200, headers={"X-Cache": cache_state})
+        return Response(body, status=200, headers={"X-Cache": cache_state})
     except Exception as e:
         debug_log(f"[CLASSES-{tail.upper()}] Proxy Exception: {str(e)}")
         return Response([], status=200)
@@ -1119,10 +1016,10 @@ def get_exam_tag(request, tagId):
             return Response({"error": "ERP Authentication Failed"}, status=503)
 
         debug_log(f"[EXAM-TAG] Fetching tag {tagId} from ERP")
-        resp = requests.get(
+        resp = erp_client.get(
             f"{erp_url}/api/examTag/{tagId}",
             headers={"Authorization": f"Bearer {erp_token}"},
-            timeout=20
+            fallback_ttl=erp_client.FALLBACK_TTL
         )
 
         if resp.status_code == 200:
@@ -1161,10 +1058,9 @@ def sync_teachers_from_erp(request):
         # --- 1. Fetch teacher list from ERP ---
         teacher_list = []
         try:
-            t_resp = requests.get(
+            t_resp = erp_client.get(
                 f"{erp_url}/api/student-portal/teachers?limit=1000",
-                headers={"Authorization": f"Bearer {erp_token}"},
-                timeout=30
+                headers={"Authorization": f"Bearer {erp_token}"}
             )
             if t_resp.status_code == 200:
                 data = t_resp.json()
@@ -1178,10 +1074,9 @@ def sync_teachers_from_erp(request):
         # --- 2. Fetch HR employee data ---
         emp_lookup = {}
         try:
-            e_resp = requests.get(
+            e_resp = erp_client.get(
                 f"{erp_url}/api/hr/employee?limit=1000",
-                headers={"Authorization": f"Bearer {erp_token}"},
-                timeout=20
+                headers={"Authorization": f"Bearer {erp_token}"}
             )
             if e_resp.status_code == 200:
                 data = e_resp.json()
@@ -1349,7 +1244,7 @@ def get_admin_student_attendance(request, admission_number):
         login_url = f"{erp_url}/api/student-portal/login"
         
         # Step 2: Login as student
-        resp = requests.post(login_url, json=auth_payload, timeout=10)
+        resp = erp_client.post(login_url, json=auth_payload)
         
         # If we can't login, we can't fetch attendance via student token.
         # Alternative: Admin token might work if we pass `?studentId=` using MongoDB _id. Let's try that as a fallback!
@@ -1362,10 +1257,9 @@ def get_admin_student_attendance(request, admission_number):
             erp_token = _get_erp_admin_token()
             if student_id:
                 try:
-                    att_resp = requests.get(
+                    att_resp = erp_client.get(
                         f"{erp_url}/api/student-portal/attendance/previous?studentId={student_id}",
-                        headers={"Authorization": f"Bearer {erp_token}"},
-                        timeout=15
+                        headers={"Authorization": f"Bearer {erp_token}"}
                     )
                     if att_resp.status_code == 200:
                         return Response(att_resp.json(), status=200)
@@ -1374,10 +1268,9 @@ def get_admin_student_attendance(request, admission_number):
             return Response({"error": f"Failed to login to ERP as student {username}. Status: {resp.status_code}"}, status=400)
             
         # Step 3: Fetch attendance
-        att_resp = requests.get(
+        att_resp = erp_client.get(
             f"{erp_url}/api/student-portal/attendance/previous",
-            headers={"Authorization": f"Bearer {student_token}"},
-            timeout=15
+            headers={"Authorization": f"Bearer {student_token}"}
         )
         
         if att_resp.status_code == 200:
@@ -1397,10 +1290,9 @@ def get_teacher_classes(request):
         if admin_token:
             param_email = request.GET.get('email') or request.GET.get('username') or request.GET.get('code')
             teacher_email = param_email or request.user.email or request.user.username
-            resp = requests.get(
+            resp = erp_client.get(
                 f"{erp_url}/api/teacher-portal/classes?email={teacher_email}",
-                headers={"Authorization": f"Bearer {admin_token}"},
-                timeout=15
+                headers={"Authorization": f"Bearer {admin_token}"}
             )
             
             if resp.status_code == 200:
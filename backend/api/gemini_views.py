@@ -6,9 +6,11 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from django.conf import settings
+from django.http import StreamingHttpResponse
 import json
 import logging
 from .models import UploadedFile, CustomUser, StudentMasterPlan, CollegeIntelligence
+from . import ai_cache, ai_limiter, student_context
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +19,15 @@ def _get_gemini_api_key():
     return (getattr(settings, 'GEMINI_API_KEY', None) or '').strip()
 
 
+def _parse_model_json(text):
+    """json.loads a model answer, dropping a ```json fence if the model added one."""
+    text = text.strip()
+    if text.startswith("```json"): text = text[7:]
+    if text.startswith("```"): text = text[3:]
+    if text.endswith("```"): text = text[:-3]
+    return json.loads(text.strip())
+
+
 def _gemini_not_configured_response():
     return Response(
         {"error": "AI service is not configured. Please contact admin."},
@@ -543,7 +554,8 @@ Ensure all metrics are tailored accurately to the student's actual performance d
 """
         content_parts.append(json_schema_prompt)
         
-        response = model.generate_content(content_parts)
+        with ai_limiter.admit('study_plan'):
+            response = model.generate_content(content_parts)
         ai_text = response.text
 
         # Persist plan — upsert by test_id so re-runs update rather than duplicate
@@ -570,6 +582,8 @@ Ensure all metrics are tailored accurately to the student's actual performance d
 
         return Response({"ai_plan": ai_text, "is_update": is_update_request}, status=status.HTTP_200_OK)
 
+    except ai_limiter.RateLimited as e:
+        return ai_limiter.too_many_requests(e)
     except Exception as e:
         logger.error(f"[AI MENTOR] Error generating study plan: {str(e)}", exc_info=True)
         error_name = type(e).__name__
@@ -634,7 +648,8 @@ def get_college_intelligence(request):
         Use realistic historical data based on your knowledge.
         """
 
-        response = model.generate_content(prompt)
+        with ai_limiter.admit('college'):
+            response = model.generate_content(prompt)
         
         # Clean response text
         text = response.text.strip()
@@ -667,6 +682,8 @@ def get_college_intelligence(request):
             logger.error(f"[AI COLLEGE] JSON Decode Error: {je}. Raw text: {text}")
             return Response({"error": "Invalid response format from AI"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    except ai_limiter.RateLimited as e:
+        return ai_limiter.too_many_requests(e)
     except google_exceptions.ResourceExhausted:
         logger.warning("[AI COLLEGE] Quota exceeded for Gemini API.")
         return Response({
@@ -758,9 +775,6 @@ def extract_marksheet_data(request):
         if not api_key:
             return _gemini_not_configured_response()
 
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-flash-latest', generation_config={"response_mime_type": "application/json"})
-
         prompt = """
         Extract the subjects and their marks from this Class 9 marksheet image.
         Return ONLY a JSON array of objects.
@@ -770,23 +784,36 @@ def extract_marksheet_data(request):
         Do not include anything else in your response.
         """
 
-        response = model.generate_content([image_part, prompt])
-        text = response.text.strip()
-        
-        # 3. Parse and return JSON
-        if text.startswith("```json"): text = text[7:]
-        if text.startswith("```"): text = text[3:]
-        if text.endswith("```"): text = text[:-3]
-        text = text.strip()
-
-        import re
-        json_match = re.search(r'(\[.*\])', text, re.DOTALL)
-        if json_match:
-            text = json_match.group(1)
-
-        result = json.loads(text)
+        model_name = 'gemini-flash-latest'
+        config = {"response_mime_type": "application/json"}
+        text = ''
+
+        def call():
+            genai.configure(api_key=api_key)
+            model = genai.GenerativeModel(model_name, generation_config=config)
+            return model.generate_content([image_part, prompt]).text
+
+        def parse(raw):
+            # 3. Parse and return JSON
+            nonlocal text
+            text = raw.strip()
+            if text.startswith("```json"): text = text[7:]
+            if text.startswith("```"): text = text[3:]
+            if text.endswith("```"): text = text[:-3]
+            text = text.strip()
+
+            import re
+            json_match = re.search(r'(\[.*\])', text, re.DOTALL)
+            if json_match:
+                text = json_match.group(1)
+            return json.loads(text)
+
+        # The same marksheet image (by content hash) is only read by the model once
+        result, _ = ai_cache.generate('marksheet', model_name, [image_part, prompt], call, config=config, parse=parse)
         return Response(result, status=status.HTTP_200_OK)
 
+    except ai_limiter.RateLimited as e:
+        return ai_limiter.too_many_requests(e)
     except google_exceptions.ResourceExhausted:
         return Response({"error": "AI Quota Exceeded"}, status=status.HTTP_429_TOO_MANY_REQUESTS)
     except json.JSONDecodeError as je:
@@ -802,12 +829,75 @@ def extract_marksheet_data(request):
 # ─────────────────────────────────────────────────────────────────────────────
 
 def _get_student_context(user):
+    """
+    The student's materialised AI document: the _build_student_context fields
+    plus the prompt pieces derived from them (system instruction, classifier
+    subjects, performance summary). Rebuilt only when the student's data
+    version moves (api/student_context.py).
+    """
+    return student_context.get(user, build=_build_student_document)
+
+
+def _build_student_document(user):
+    ctx = _build_student_context(user)
+    allowed_subjects, refusal_msg = _chat_guard(ctx)
+
+    perf_lines = []
+    if ctx["recent_subjects"] and ctx["recent_scores"]:
+        perf_lines.append("Recent subject performance:")
+        perf_lines += [f"  - {s}: {sc}" for s, sc in zip(ctx["recent_subjects"], ctx["recent_scores"])]
+    if ctx["recent_results"]:
+        perf_lines.append(f"Recent test results ({ctx['tests_taken']} test(s) taken):")
+        perf_lines += [f"  - {r['test']}: {r['score']}" for r in ctx["recent_results"]]
+
+    return dict(
+        ctx,
+        system_instruction=_build_system_instruction(ctx),
+        allowed_subjects=allowed_subjects,
+        refusal_msg=refusal_msg,
+        perf_text="\n".join(perf_lines) or "No recent test data available.",
+        target_label=ctx["target_exam_name"] or ("Foundation" if ctx["is_foundation"] else "General Board"),
+        class_label=ctx["class_name"] or "N/A",
+    )
+
+
+def _recent_results(user, limit=3):
+    """(finalized submissions, [{test, score}] for the latest scored ones), via PyMongo."""
+    from bson import ObjectId
+    from .db_utils import get_db
+    from tests.models import Test
+
+    db = get_db()
+    if db is None:
+        return 0, []
+    try:
+        student_id = ObjectId(user.pk)
+    except Exception:
+        student_id = user.pk
+
+    coll = db['tests_testsubmission']
+    query = {'student_id': student_id, 'is_finalized': True}
+    taken = coll.count_documents(query)
+    if not taken:
+        return 0, []
+    scored = list(coll.find(
+        dict(query, **{'$or': [{'result_generated_at': {'$exists': True}}, {'submission_type': 'OMR_EXCEL'}]}),
+        {'test_id': 1, 'score': 1}
+    ).sort('submitted_at', -1).limit(limit))
+    names = {str(t.pk): t.name for t in Test.objects.filter(pk__in=[s['test_id'] for s in scored]).only('name')}
+    return taken, [
+        {'test': names.get(str(s['test_id']), 'Test'), 'score': round(float(s.get('score') or 0), 2)}
+        for s in scored
+    ]
+
+
+def _build_student_context(user):
     """
     Builds a dict of key student profile data for use in AI prompts.
     Reads class_level, target_exam from the user model (synced from ERP).
     Falls back to exam_section string if target_exam FK is not set.
-    Also reads recent test results from StudentMasterPlan to gather
-    performance history.
+    Also reads subject performance from the latest StudentMasterPlan and
+    the student's latest scored test submissions.
     """
     import re as _re
 
@@ -820,6 +910,8 @@ def _get_student_context(user):
         "is_foundation": False,
         "recent_subjects": [],
         "recent_scores": [],
+        "tests_taken": 0,
+        "recent_results": [],
     }
 
     # Class level
@@ -882,6 +974,12 @@ def _get_student_context(user):
     except Exception:
         pass
 
+    # Latest scored tests (finalized submissions with generated results)
+    try:
+        context["tests_taken"], context["recent_results"] = _recent_results(user)
+    except Exception as e:
+        logger.warning(f"[AI CONTEXT] Could not read test results for {user.username}: {e}")
+
     return context
 
 
@@ -965,6 +1063,30 @@ STRICT RULES:
 """
 
 
+def _chat_guard(ctx):
+    """(allowed subjects for the classifier, refusal message) for this student."""
+    target_exam = ctx.get("target_exam_name") or ""
+    if ctx.get("is_foundation", False):
+        return (
+            "Mathematics, Science (Physics, Chemistry, Biology), English, Social Studies, Olympiad topics (NTSE, NSO, IMO, MAT)",
+            "I'm your school curriculum coach! I can only help you with your class subjects and olympiad preparation. What topic would you like to study today?",
+        )
+    if 'NEET' in target_exam.upper():
+        return (
+            "Physics (NEET syllabus), Chemistry (NEET syllabus), Biology (Botany and Zoology for NEET)",
+            "I'm your NEET prep coach! I can only help you with Physics, Chemistry, and Biology. Let's focus on your NEET preparation!",
+        )
+    if any(k in target_exam.upper() for k in ['JEE', 'WBJEE', 'MHT']):
+        return (
+            "Mathematics (JEE syllabus), Physics (JEE syllabus), Chemistry (JEE syllabus)",
+            "I'm your JEE prep coach! I can only help you with Mathematics, Physics, and Chemistry. Let's focus on your JEE preparation!",
+        )
+    return (
+        "Mathematics, Physics, Chemistry, Biology",
+        "I'm your academic science coach! I can only help you with Mathematics, Physics, Chemistry, and Biology.",
+    )
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_student_ai_insights(request):
@@ -973,12 +1095,14 @@ def get_student_ai_insights(request):
     - Neural Highlights (Breakthrough, Vulnerability, Trajectory)
     - Strategic AI Roadmap (Concept Mastery %, Time Efficiency %, Exam Readiness %)
 
-    Uses the student's recent test data from StudentMasterPlan as context.
-    Results are cached per user for 30 minutes to avoid repeated Gemini calls.
+    Uses the student's materialised AI document (profile, StudentMasterPlan
+    subject performance, latest test results) as context. Results are cached
+    per user and data version for 30 minutes to avoid repeated Gemini calls.
     """
     user = request.user
     force = request.GET.get('refresh', 'false') == 'true'
-    cache_key = f"ai_insights_v1_{user.pk}"
+    # New results / profile changes move the data version, so insights follow them
+    cache_key = f"ai_insights_v2_{user.pk}_{student_context.version(user.pk)}"
 
     from django.core.cache import cache as django_cache
     if not force:
@@ -991,15 +1115,9 @@ def get_student_ai_insights(request):
         return _gemini_not_configured_response()
 
     ctx = _get_student_context(user)
-
-    # Build a summary of the student's performance for the prompt
-    perf_text = "No recent test data available."
-    if ctx["recent_subjects"] and ctx["recent_scores"]:
-        lines = [f"  - {s}: {sc}" for s, sc in zip(ctx["recent_subjects"], ctx["recent_scores"])]
-        perf_text = "Recent subject performance:\n" + "\n".join(lines)
-
-    target_label = ctx["target_exam_name"] or ("Foundation" if ctx["is_foundation"] else "General Board")
-    class_label = ctx["class_name"] or "N/A"
+    perf_text = ctx["perf_text"]
+    target_label = ctx["target_label"]
+    class_label = ctx["class_label"]
 
     prompt = f"""You are an AI academic performance analyst for a student portal.
 
@@ -1047,27 +1165,23 @@ Make the insights feel personal and tailored to {target_label} preparation. Use
 """
 
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel(
-            'gemini-flash-lite-latest',
-            generation_config={"response_mime_type": "application/json"}
-        )
-        response = model.generate_content(prompt)
-        text = response.text.strip()
+        model_name = 'gemini-flash-lite-latest'
+        config = {"response_mime_type": "application/json"}
 
-        # Clean up potential markdown wrapping
-        if text.startswith("```json"): text = text[7:]
-        if text.startswith("```"): text = text[3:]
-        if text.endswith("```"): text = text[:-3]
-        text = text.strip()
+        def call():
+            genai.configure(api_key=api_key)
+            return genai.GenerativeModel(model_name, generation_config=config).generate_content(prompt).text
 
-        result = json.loads(text)
+        # Students with the same profile and scores share one model answer (see ai_cache)
+        result, _ = ai_cache.generate('insights', model_name, [prompt], call, config=config, parse=_parse_model_json)
         django_cache.set(cache_key, result, 1800)  # 30-minute cache
         return Response(result, status=status.HTTP_200_OK)
 
     except json.JSONDecodeError as je:
         logger.error(f"[AI INSIGHTS] JSON Decode Error: {je}")
         return Response({"error": "Invalid response format from AI"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    except ai_limiter.RateLimited as e:
+        return ai_limiter.too_many_requests(e)
     except google_exceptions.ResourceExhausted:
         return Response({"error": "AI Quota Exceeded. Please try again later."}, status=status.HTTP_429_TOO_MANY_REQUESTS)
     except Exception as e:
@@ -1075,6 +1189,94 @@ Make the insights feel personal and tailored to {target_label} preparation. Use
         return Response({"error": "Failed to generate AI insights."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+CHAT_MODEL = 'gemini-flash-lite-latest'
+CHAT_BUSY_REPLY = "I'm currently experiencing high demand. Please try again in a moment."
+CHAT_ERROR_REPLY = "I encountered a technical issue. Please try again."
+
+def _chat_model(api_key, system_instruction=None):
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(model_name=CHAT_MODEL, system_instruction=system_instruction)
+
+
+def _chunk_texts(response):
+    """Text of each streamed chunk; chunks without text (e.g. a safety stop) are skipped."""
+    for chunk in response:
+        try:
+            text = chunk.text
+        except ValueError:
+            continue
+        if text:
+            yield text
+
+
+def _classify_chat_message(api_key, allowed_subjects, new_message):
+    """
+    Hard pre-check classifier. This runs BEFORE the main model. Gemini acts only
+    as a binary classifier; it cannot be "tricked" since we are not answering —
+    only classifying. Returns 'ALLOWED' or 'BLOCKED' (upper-cased model text).
+    """
+    classifier_prompt = f"""You are a strict topic classifier for a student AI tutoring system.
+
+The student is only allowed to ask questions about: {allowed_subjects}.
+
+Student message: "{new_message}"
+
+Is this message related to the allowed subjects above?
+Reply with ONLY one word: ALLOWED or BLOCKED.
+Do not explain. Do not add any other text."""
+
+    def classify():
+        return _chat_model(api_key).generate_content(classifier_prompt).text
+
+    # Verdicts and replies are cached by content (see ai_cache): repeated questions skip the model
+    classification, _ = ai_cache.generate('chat_guard', CHAT_MODEL, [classifier_prompt], classify)
+    return classification.strip().upper()
+
+
+def _chat_history(history):
+    """Gemini-format chat history (the new message is sent separately)."""
+    gemini_history = []
+    for msg in history[-10:]:  # keep last 10 for context window efficiency
+        role = 'user' if msg.get('role') == 'user' else 'model'
+        text = msg.get('text', '')
+        if text:
+            gemini_history.append({'role': role, 'parts': [text]})
+    return gemini_history
+
+
+def _ndjson(payload):
+    return json.dumps(payload) + "\n"
+
+
+def _stream_chat_reply(api_key, system_instruction, gemini_history, new_message):
+    """NDJSON lines: {"delta": ...} per chunk as the model writes, then {"status": "done", "reply": ...}."""
+    def send_stream():
+        chat = _chat_model(api_key, system_instruction).start_chat(history=gemini_history)
+        return _chunk_texts(chat.send_message(new_message, stream=True))
+
+    parts = []
+    try:
+        for chunk in ai_cache.stream('chat', CHAT_MODEL, [new_message], send_stream,
+                                     system_instruction=system_instruction, history=gemini_history):
+            parts.append(chunk)
+            yield _ndjson({"delta": chunk})
+        yield _ndjson({"status": "done", "reply": ''.join(parts).strip()})
+    except ai_limiter.RateLimited as e:
+        yield _ndjson({"status": "error", "reply": CHAT_BUSY_REPLY, "retry_after": e.retry_after})
+    except google_exceptions.ResourceExhausted:
+        yield _ndjson({"status": "error", "reply": CHAT_BUSY_REPLY})
+    except Exception as e:
+        logger.error(f"[AI CHAT] Stream error: {str(e)}", exc_info=True)
+        yield _ndjson({"status": "error", "reply": CHAT_ERROR_REPLY})
+
+
+def _streaming_chat_response(lines):
+    response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def student_ai_insights_chat(request):
@@ -1085,6 +1287,11 @@ def student_ai_insights_chat(request):
       - messages: list of {role: 'user'|'assistant', text: '...'}
       - message: the latest user message string
 
+    With ?stream=1 the reply is sent as NDJSON while the model writes it:
+    {"delta": "..."} lines, then {"status": "done", "reply": "<full text>"}
+    (or {"status": "error", "reply": "..."}); a blocked message is a single
+    {"status": "done", "reply": "...", "blocked": true} line.
+
     Enforces strict academic guardrails based on:
       - target_exam (NEET → Biology/Physics/Chemistry only)
       - target_exam (JEE → Math/Physics/Chemistry only)
@@ -1094,6 +1301,7 @@ def student_ai_insights_chat(request):
     data = request.data
     history = data.get('messages', [])
     new_message = (data.get('message', '') or '').strip()
+    stream = request.query_params.get('stream') in ('1', 'true')
 
     if not new_message:
         return Response({"error": "Message cannot be empty."}, status=status.HTTP_400_BAD_REQUEST)
@@ -1103,79 +1311,47 @@ def student_ai_insights_chat(request):
         return _gemini_not_configured_response()
 
     ctx = _get_student_context(user)
-    system_instruction = _build_system_instruction(ctx)
-
-    # ── Build allowed subjects list and refusal message for the hard classifier ──
-    target_exam = ctx.get("target_exam_name") or ""
-    is_foundation = ctx.get("is_foundation", False)
-
-    if is_foundation:
-        allowed_subjects = "Mathematics, Science (Physics, Chemistry, Biology), English, Social Studies, Olympiad topics (NTSE, NSO, IMO, MAT)"
-        refusal_msg = "I'm your school curriculum coach! I can only help you with your class subjects and olympiad preparation. What topic would you like to study today?"
-    elif 'NEET' in target_exam.upper():
-        allowed_subjects = "Physics (NEET syllabus), Chemistry (NEET syllabus), Biology (Botany and Zoology for NEET)"
-        refusal_msg = "I'm your NEET prep coach! I can only help you with Physics, Chemistry, and Biology. Let's focus on your NEET preparation!"
-    elif any(k in target_exam.upper() for k in ['JEE', 'WBJEE', 'MHT']):
-        allowed_subjects = "Mathematics (JEE syllabus), Physics (JEE syllabus), Chemistry (JEE syllabus)"
-        refusal_msg = "I'm your JEE prep coach! I can only help you with Mathematics, Physics, and Chemistry. Let's focus on your JEE preparation!"
-    else:
-        allowed_subjects = "Mathematics, Physics, Chemistry, Biology"
-        refusal_msg = "I'm your academic science coach! I can only help you with Mathematics, Physics, Chemistry, and Biology."
+    system_instruction = ctx["system_instruction"]
+    allowed_subjects, refusal_msg = ctx["allowed_subjects"], ctx["refusal_msg"]
 
     try:
-        genai.configure(api_key=api_key)
-
         # ── STEP 1: Hard Pre-Check Classifier ────────────────────────────────────
-        # This runs BEFORE the main model. Gemini acts only as a binary classifier.
-        # It cannot be "tricked" since we are not answering — only classifying.
-        classifier_model = genai.GenerativeModel('gemini-flash-lite-latest')
-        classifier_prompt = f"""You are a strict topic classifier for a student AI tutoring system.
-
-The student is only allowed to ask questions about: {allowed_subjects}.
-
-Student message: "{new_message}"
+        classification = _classify_chat_message(api_key, allowed_subjects, new_message)
 
-Is this message related to the allowed subjects above?
-Reply with ONLY one word: ALLOWED or BLOCKED.
-Do not explain. Do not add any other text."""
-
-        classifier_response = classifier_model.generate_content(classifier_prompt)
-        classification = classifier_response.text.strip().upper()
-
-        logger.info(f"[AI CHAT GUARD] User={user.username} | Exam={target_exam} | Classification={classification} | Msg={new_message[:60]}")
+        logger.info(f"[AI CHAT GUARD] User={user.username} | Exam={ctx.get('target_exam_name') or ''} | Classification={classification} | Msg={new_message[:60]}")
 
         if 'BLOCKED' in classification:
+            if stream:
+                return _streaming_chat_response(iter([_ndjson({"status": "done", "reply": refusal_msg, "blocked": True})]))
             return Response({"reply": refusal_msg, "blocked": True}, status=status.HTTP_200_OK)
 
         # ── STEP 2: Main Chat Model (only reached if classifier says ALLOWED) ──
-        main_model = genai.GenerativeModel(
-            model_name='gemini-flash-lite-latest',
-            system_instruction=system_instruction,
-        )
+        gemini_history = _chat_history(history)
 
-        # Build Gemini-format chat history (exclude last message, we send it fresh)
-        gemini_history = []
-        for msg in history[-10:]:  # keep last 10 for context window efficiency
-            role = 'user' if msg.get('role') == 'user' else 'model'
-            text = msg.get('text', '')
-            if text:
-                gemini_history.append({'role': role, 'parts': [text]})
+        if stream:
+            return _streaming_chat_response(_stream_chat_reply(api_key, system_instruction, gemini_history, new_message))
 
-        chat = main_model.start_chat(history=gemini_history)
-        response = chat.send_message(new_message)
-        reply = response.text.strip()
+        def send():
+            chat = _chat_model(api_key, system_instruction).start_chat(history=gemini_history)
+            return chat.send_message(new_message).text
+
+        reply, _ = ai_cache.generate('chat', CHAT_MODEL, [new_message], send,
+                                     system_instruction=system_instruction, history=gemini_history)
+        reply = reply.strip()
 
         return Response({"reply": reply}, status=status.HTTP_200_OK)
 
+    except ai_limiter.RateLimited as e:
+        return ai_limiter.too_many_requests(e, reply=CHAT_BUSY_REPLY)
     except google_exceptions.ResourceExhausted:
         return Response(
-            {"reply": "I'm currently experiencing high demand. Please try again in a moment."},
+            {"reply": CHAT_BUSY_REPLY},
             status=status.HTTP_200_OK  # Return 200 so UI can show the message gracefully
         )
     except Exception as e:
         logger.error(f"[AI CHAT] Error: {str(e)}", exc_info=True)
         return Response(
-            {"reply": "I encountered a technical issue. Please try again."},
+            {"reply": CHAT_ERROR_REPLY},
             status=status.HTTP_200_OK
         )
 
@@ -1196,9 +1372,6 @@ def generate_chapter_test(request):
         if not api_key:
             return _gemini_not_configured_response()
 
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-flash-lite-latest', generation_config={"response_mime_type": "application/json"})
-
         prompt = f"""
         Generate exactly 20 multiple-choice questions for a student test.
         Focus on generating questions similar to those asked in the last 6 years of major board or competitive exams for this topic.
@@ -1224,18 +1397,19 @@ def generate_chapter_test(request):
         Only return the JSON array, no markdown wrappers around the JSON itself.
         """
 
-        response = model.generate_content(prompt)
-        text = response.text.strip()
-        
-        # Clean response text if Gemini wraps it in markdown despite instructions
-        if text.startswith("```json"): text = text[7:]
-        if text.startswith("```"): text = text[3:]
-        if text.endswith("```"): text = text[:-3]
-        text = text.strip()
-        
-        result = json.loads(text)
+        model_name = 'gemini-flash-lite-latest'
+        config = {"response_mime_type": "application/json"}
+
+        def call():
+            genai.configure(api_key=api_key)
+            return genai.GenerativeModel(model_name, generation_config=config).generate_content(prompt).text
+
+        # Same subject / chapter / toughness within a day reuses one generated test (see ai_cache)
+        result, _ = ai_cache.generate('chapter_test', model_name, [prompt], call, config=config, parse=_parse_model_json)
         return Response(result, status=status.HTTP_200_OK)
 
+    except ai_limiter.RateLimited as e:
+        return ai_limiter.too_many_requests(e)
     except google_exceptions.ResourceExhausted:
         return Response({"error": "AI Quota Exceeded"}, status=status.HTTP_429_TOO_MANY_REQUESTS)
     except json.JSONDecodeError as je:
@@ -0,0 +1,21 @@
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework import permissions
+from rest_framework.response import Response
+
+from .jobs import get_job, serialize_job
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def get_job_status(request, job_id):
+    """Poll a background job started by an admin action with ?async=1."""
+    job = get_job(job_id)
+    if not job:
+        return Response({'error': 'Job not found'}, status=404)
+
+    user = request.user
+    is_admin = user.is_superuser or user.is_staff or getattr(user, 'user_type', None) in ('superadmin', 'admin')
+    if job.get('user') != user.username and not is_admin:
+        return Response({'error': 'Job not found'}, status=404)
+
+    return Response(serialize_job(job))
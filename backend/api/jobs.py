@@ -0,0 +1,298 @@
+"""
+Lightweight background job runner for heavy admin actions.
+
+Jobs run on a small per-process thread pool so a gunicorn request thread is
+released as soon as the job is queued. Job state lives in the `api_job`
+Mongo collection (shared by every worker, so any worker can answer the
+status poll) or, with JOB_BACKEND='memory', in a process-local dict for
+local development and tests — no external broker either way.
+
+    job_id = submit_job('generate_result', fn, user=request.user)
+    return job_accepted(job_id)          # 202 {job_id, status_url}
+
+Inside a job, code reports progress with report_progress(); outside a job
+the call is a no-op, so shared code paths can call it unconditionally.
+
+Actions opt in with the @runs_as_job decorator: the request is served
+synchronously as before unless the client passes ?async=1, which the admin
+screens do through postJob() (frontend/src/services/jobService.js).
+"""
+import json
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timezone as dt_timezone
+from functools import wraps
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.utils import timezone
+from django.utils.datastructures import MultiValueDict
+from rest_framework.utils.encoders import JSONEncoder
+
+JOB_COLLECTION = 'api_job'
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_SUCCEEDED = 'succeeded'
+STATUS_FAILED = 'failed'
+
+# A running job that hasn't reported for this long died with its worker
+# (gunicorn max_requests recycling, deploy restart, ...).
+JOB_STALE_SECONDS = 15 * 60
+# Progress writes are coalesced to at most one per interval
+PROGRESS_INTERVAL = 1.0
+
+_executor = None
+_executor_lock = threading.Lock()
+_current = threading.local()
+
+
+# ── Stores ────────────────────────────────────────────────────────────────────
+
+class MemoryJobStore:
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, doc):
+        with self._lock:
+            self._jobs[doc['_id']] = dict(doc)
+
+    def update(self, job_id, fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def get(self, job_id):
+        with self._lock:
+            doc = self._jobs.get(job_id)
+            return dict(doc) if doc else None
+
+
+class MongoJobStore:
+    def _coll(self):
+        from api.db_utils import get_db
+        db = get_db()
+        if db is None:
+            raise RuntimeError('Database unavailable for job store')
+        return db[JOB_COLLECTION]
+
+    def create(self, doc):
+        self._coll().insert_one(dict(doc))
+
+    def update(self, job_id, fields):
+        self._coll().update_one({'_id': job_id}, {'$set': fields})
+
+    def get(self, job_id):
+        return self._coll().find_one({'_id': job_id})
+
+
+_memory_store = MemoryJobStore()
+
+
+def get_store():
+    if getattr(settings, 'JOB_BACKEND', 'mongo') == 'memory':
+        return _memory_store
+    return MongoJobStore()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'JOB_WORKERS', 2),
+                    thread_name_prefix='job'
+                )
+    return _executor
+
+
+# ── Running jobs ──────────────────────────────────────────────────────────────
+
+class JobContext:
+    def __init__(self, job_id, store):
+        self.job_id = job_id
+        self.store = store
+        self.progress = {}
+        self._last_flush = 0.0
+
+    def report(self, force=False, **fields):
+        self.progress.update(fields)
+        now = time.monotonic()
+        if force or now - self._last_flush >= PROGRESS_INTERVAL:
+            self._last_flush = now
+            try:
+                self.store.update(self.job_id, {'progress': dict(self.progress), 'updated_at': timezone.now()})
+            except Exception as e:
+                print(f"[jobs] Failed to record progress for {self.job_id}: {e}")
+
+
+def report_progress(**fields):
+    """Merge fields (done/total/counters) into the current job's progress; no-op outside a job."""
+    ctx = getattr(_current, 'ctx', None)
+    if ctx is not None:
+        ctx.report(**fields)
+
+
+def _run(job_id, store, fn, args, kwargs):
+    from django.db import close_old_connections
+
+    ctx = JobContext(job_id, store)
+    _current.ctx = ctx
+    close_old_connections()
+    try:
+        store.update(job_id, {'status': STATUS_RUNNING, 'started_at': timezone.now(), 'updated_at': timezone.now()})
+        result = fn(*args, **kwargs)
+        fields = {'status': STATUS_SUCCEEDED, 'result': result}
+        # Actions that answer with an HTTP error status count as failed jobs
+        if isinstance(result, dict) and isinstance(result.get('status_code'), int) and result['status_code'] >= 400:
+            fields['status'] = STATUS_FAILED
+            body = result.get('body')
+            message = (body.get('error') or body.get('message')) if isinstance(body, dict) else None
+            fields['error'] = message or f"HTTP {result['status_code']}"
+        ctx.report(force=True)
+        fields.update({'progress': dict(ctx.progress), 'finished_at': timezone.now(), 'updated_at': timezone.now()})
+        store.update(job_id, fields)
+    except Exception as e:
+        traceback.print_exc()
+        try:
+            store.update(job_id, {
+                'status': STATUS_FAILED, 'error': str(e), 'progress': dict(ctx.progress),
+                'finished_at': timezone.now(), 'updated_at': timezone.now(),
+            })
+        except Exception:
+            pass
+    finally:
+        _current.ctx = None
+        close_old_connections()
+
+
+def submit_job(kind, fn, *args, user=None, **kwargs):
+    """Queue fn(*args, **kwargs) on the job pool and return the new job id."""
+    store = get_store()
+    job_id = uuid.uuid4().hex
+    now = timezone.now()
+    store.create({
+        '_id': job_id,
+        'kind': kind,
+        'status': STATUS_QUEUED,
+        'user': getattr(user, 'username', None),
+        'progress': {},
+        'result': None,
+        'error': None,
+        'created_at': now,
+        'updated_at': now,
+    })
+    _get_executor().submit(_run, job_id, store, fn, args, kwargs)
+    return job_id
+
+
+def get_job(job_id):
+    store = get_store()
+    job = store.get(job_id)
+    if job and job.get('status') in (STATUS_QUEUED, STATUS_RUNNING):
+        updated = job.get('updated_at')
+        if updated is not None:
+            now = timezone.now()
+            if timezone.is_aware(now) and timezone.is_naive(updated):
+                updated = updated.replace(tzinfo=dt_timezone.utc)
+            if (now - updated).total_seconds() > JOB_STALE_SECONDS:
+                fields = {'status': STATUS_FAILED, 'error': 'Job was interrupted (worker restarted).'}
+                store.update(job_id, fields)
+                job.update(fields)
+    return job
+
+
+def serialize_job(job):
+    def iso(v):
+        return v.isoformat() if hasattr(v, 'isoformat') else v
+    return {
+        'id': job['_id'],
+        'kind': job.get('kind'),
+        'status': job.get('status'),
+        'progress': job.get('progress') or {},
+        'result': job.get('result'),
+        'error': job.get('error'),
+        'created_at': iso(job.get('created_at')),
+        'started_at': iso(job.get('started_at')),
+        'finished_at': iso(job.get('finished_at')),
+    }
+
+
+def job_accepted(job_id):
+    from rest_framework.response import Response
+    return Response({
+        'job_id': job_id,
+        'status': STATUS_QUEUED,
+        'status_url': f"/api/jobs/{job_id}/",
+    }, status=202)
+
+
+# ── View integration ──────────────────────────────────────────────────────────
+
+def wants_async(request):
+    value = request.query_params.get('async') if hasattr(request, 'query_params') else request.GET.get('async')
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+class _ResultEncoder(JSONEncoder):
+    # DRF's encoder covers Decimal, dates, UUIDs, querysets...; anything else
+    # (ObjectId and friends) is stored as its string form
+    def default(self, obj):
+        try:
+            return super().default(obj)
+        except TypeError:
+            return str(obj)
+
+
+def json_safe(data):
+    """Response data as plain JSON types, so the job store (BSON) can always hold it."""
+    return json.loads(json.dumps(data, cls=_ResultEncoder))
+
+
+def detach_request(request):
+    """Make a DRF request safe to use after its response has been sent.
+
+    Django closes (and for large uploads deletes) uploaded files when the
+    request finishes, so they are copied into memory first.
+    """
+    request.data  # force parsing while the stream is still open
+    files = MultiValueDict()
+    for key, file_list in request.FILES.lists():
+        for f in file_list:
+            f.seek(0)
+            files.appendlist(key, SimpleUploadedFile(f.name, f.read(), getattr(f, 'content_type', None)))
+    if files:
+        request._files = files
+        full = request._data.copy() if hasattr(request._data, 'copy') else request._data
+        if hasattr(full, 'update'):
+            full.update(files)
+        request._full_data = full
+    return request
+
+
+def runs_as_job(kind):
+    """Let a view (method or APIView handler) run in the background on ?async=1.
+
+    The job result is {'status_code': ..., 'body': response.data}, so pollers get
+    exactly what the synchronous call would have returned.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(self, request, *args, **kwargs):
+            if not wants_async(request):
+                return view(self, request, *args, **kwargs)
+
+            detach_request(request)
+
+            def run():
+                response = view(self, request, *args, **kwargs)
+                return {'status_code': response.status_code, 'body': json_safe(getattr(response, 'data', None))}
+
+            return job_accepted(submit_job(kind, run, user=request.user))
+        return wrapper
+    return decorator
@@ -0,0 +1,58 @@
+"""
+Management command: rollup_activity
+
+Maintains the daily activity rollups (api/activity_rollup.py).
+
+Usage:
+    py manage.py rollup_activity --backfill           # fold pre-rollup history in for every student
+    py manage.py rollup_activity --rebuild PATH12345  # recompute one student from raw + archived logs
+    py manage.py rollup_activity --archive-days 90    # move raw logs older than 90 days to the archive
+
+--archive-days backfills the affected students first, so their charts and
+totals are unchanged once the raw rows are gone. Safe to run from cron.
+"""
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from api import activity_rollup
+from api.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Backfill, rebuild or archive behind the per-student daily activity rollups"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backfill', action='store_true', help="Backfill every student with raw activity logs")
+        parser.add_argument('--rebuild', metavar='USERNAME', help="Recompute one student's rollups (username or admission number)")
+        parser.add_argument('--archive-days', type=int, help="Archive raw logs older than this many days")
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            ident = options['rebuild']
+            user = CustomUser.objects.filter(Q(username=ident) | Q(admission_number=ident)).first()
+            if not user:
+                self.stderr.write(f"No user '{ident}'")
+                return
+            doc = activity_rollup.rebuild(user.pk)
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt rollups for {user.username} (last active {doc.get('last_at') if doc else None})"))
+
+        if options['backfill']:
+            raw = activity_rollup._collection(activity_rollup.LOG_COLLECTION)
+            if raw is None:
+                self.stderr.write("MongoDB unavailable")
+                return
+            user_ids = raw.distinct('user_id')
+            self.stdout.write(f"[rollup_activity] Backfilling {len(user_ids)} students...")
+            for n, uid in enumerate(user_ids, start=1):
+                activity_rollup.ensure_backfilled(uid)
+                if n % 100 == 0:
+                    self.stdout.write(f"  {n}/{len(user_ids)}")
+            self.stdout.write(self.style.SUCCESS("Backfill complete"))
+
+        if options['archive_days']:
+            cutoff = datetime.now() - timedelta(days=options['archive_days'])
+            self.stdout.write(f"[rollup_activity] Archiving raw logs before {cutoff:%Y-%m-%d}...")
+            moved = activity_rollup.archive_before(cutoff, stdout=self.stdout)
+            self.stdout.write(self.style.SUCCESS(f"Archived {moved} raw activity rows"))
@@ -37,7 +37,7 @@ class Command(BaseCommand):
         # ── Fetch ERP centres ──────────────────────────────────────────────
         try:
             from api.erp_views import _get_erp_admin_token, _get_erp_url
-            import requests as http_requests
+            from api import erp_client
 
             erp_url = _get_erp_url()
             erp_token = _get_erp_admin_token()
@@ -46,10 +46,9 @@ class Command(BaseCommand):
                 self.stderr.write("Could not obtain ERP admin token. Aborting.")
                 return
 
-            resp = http_requests.get(
+            resp = erp_client.get(
                 f"{erp_url}/api/centre",
-                headers={"Authorization": f"Bearer {erp_token}"},
-                timeout=30
+                headers={"Authorization": f"Bearer {erp_token}"}
             )
 
             if resp.status_code != 200:
@@ -4,6 +4,7 @@ from django.core.cache import cache
 import requests
 import os
 import threading
+from . import erp_client
 
 
 class StudentActiveCheckMiddleware(MiddlewareMixin):
@@ -67,10 +68,9 @@ class StudentActiveCheckMiddleware(MiddlewareMixin):
                 return False
             
             headers = {'Authorization': f'Bearer {erp_token}'}
-            response = requests.get(
+            response = erp_client.get(
                 f"{erp_url}/api/student-portal/profile",
-                headers=headers,
-                timeout=10
+                headers=headers
             )
             
             if response.status_code == 200:
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.contrib.auth.models import AbstractUser
 from djongo import models as djongo_models
 import json
@@ -401,4 +403,17 @@ class DCStoppedRecord(models.Model):
         return f"{self.student_name} ({self.roll_no}) - {self.status}"
 
 
-
+# Move the student's data version so the cached AI context (api/student_context.py)
+# is rebuilt on the next insights request or chat turn
+@receiver(post_save, sender=CustomUser)
+def bump_student_context_on_user_change(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return  # logins don't change anything the context reads
+    from .student_context import bump
+    bump(instance.pk)
+
+@receiver(post_save, sender=StudentMasterPlan)
+@receiver(post_delete, sender=StudentMasterPlan)
+def bump_student_context_on_plan_change(sender, instance, **kwargs):
+    from .student_context import bump
+    bump(instance.user_id)
@@ -0,0 +1,126 @@
+"""
+Materialised per-student AI context (api/gemini_views.py).
+
+The insights view and every chat turn used to rebuild the student's context
+(profile fields, class level, target exam, latest master plan, recent test
+results) from the database and then re-derive the same system instruction,
+classifier subjects and performance summary from it. All of that is now one
+compact document per student, cached under the student's data version:
+
+    doc = student_context.get(user, build=_build_student_document)
+
+    student_ctx_ver_<user pk>           -> version (counter seeded from a ms timestamp)
+    student_ctx_v2_<user pk>_<version>  -> document (profile fields + prompt pieces)
+
+Prompt assembly only reads the document. bump(user_pk) / bump_many(pks) move
+the version when something it is built from changes:
+
+    profile change        CustomUser save (api/models.py)
+    AI study plan         StudentMasterPlan save/delete (api/models.py)
+    submission            TestSubmission save/delete (tests/models.py), and the
+                          update()/PyMongo paths in tests/views.py
+    result generation     generate_result / OMR upload (bump_test_students)
+
+The next request rebuilds the document; old entries simply expire. Each
+worker also keeps recently used documents in memory, so a chat turn costs
+one cache round trip (the version) when nothing has changed.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+
+VERSION_KEY = 'student_ctx_ver_{}'
+CONTEXT_KEY = 'student_ctx_v2_{}_{}'
+CONTEXT_TTL = 60 * 60 * 24
+LOCAL_MAX_ENTRIES = 1024
+
+_local = OrderedDict()  # context key -> document
+_local_lock = threading.Lock()
+
+
+# ── Versions ──────────────────────────────────────────────────────────────────
+
+def version(user_pk):
+    key = VERSION_KEY.format(user_pk)
+    v = cache.get(key)
+    if v is None:
+        v = int(time.time() * 1000)
+        cache.add(key, v, timeout=None)
+        v = cache.get(key, v)
+    return v
+
+
+def bump(user_pk):
+    bump_many([user_pk])
+
+
+def bump_many(user_pks):
+    """Move each version atomically, so every bump is a new version and none goes backwards."""
+    for pk in set(user_pks):
+        if pk is None:
+            continue
+        key = VERSION_KEY.format(pk)
+        try:
+            try:
+                cache.incr(key)
+            except ValueError:  # not set yet, or evicted
+                cache.add(key, int(time.time() * 1000), timeout=None)
+                cache.incr(key)
+        except Exception:
+            pass
+
+
+def bump_test_students(db, test_pk):
+    """Bump every student with a finalized submission for this test (results were regenerated)."""
+    try:
+        student_ids = db['tests_testsubmission'].distinct('student_id', {'test_id': test_pk, 'is_finalized': True})
+    except Exception as e:
+        print(f"[STUDENT CONTEXT] Failed to list students of test {test_pk}: {e}")
+        return
+    bump_many(student_ids)
+
+
+# ── Documents ─────────────────────────────────────────────────────────────────
+
+def _local_get(key):
+    with _local_lock:
+        doc = _local.get(key)
+        if doc is not None:
+            _local.move_to_end(key)
+        return doc
+
+
+def _local_set(key, doc):
+    with _local_lock:
+        _local[key] = doc
+        _local.move_to_end(key)
+        while len(_local) > LOCAL_MAX_ENTRIES:
+            _local.popitem(last=False)
+
+
+def get(user, build):
+    """The student's document for the current data version, built on a miss.
+
+    Documents are shared between requests: treat them as read-only.
+    """
+    try:
+        key = CONTEXT_KEY.format(user.pk, version(user.pk))
+    except Exception:
+        return build(user)
+    doc = _local_get(key)
+    if doc is not None:
+        return doc
+    try:
+        doc = cache.get(key)
+    except Exception:
+        doc = None
+    if doc is None:
+        doc = build(user)
+        try:
+            cache.set(key, doc, CONTEXT_TTL)
+        except Exception:
+            pass
+    _local_set(key, doc)
+    return doc
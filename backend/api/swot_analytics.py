@@ -2,14 +2,8 @@ import datetime
 from django.utils import timezone
 from api.db_utils import get_db
 from tests.models import Test
+from tests.scoring import compile_sections, load_cards
 from bson import ObjectId
-import json
-import re
-
-def clean_html(text):
-    if not text:
-        return ""
-    return re.sub(r'<[^>]+>', '', str(text)).strip().lower()
 
 def calculate_swot_data(user):
     db = get_db()
@@ -25,10 +19,12 @@ def calculate_swot_data(user):
     except:
         student_id_val = student_id
 
+    # Section-level scores come from each submission's stored breakdown; raw
+    # responses are only pulled for submissions whose breakdown is stale.
     submissions = list(db['tests_testsubmission'].find({
         'student_id': student_id_val,
         'is_finalized': True
-    }))
+    }, {'responses': 0}))
     
     # Subject-wise aggregator
     # Structure: { subject_name: { earned: 0.0, max: 0.0, correct: 0, attempted: 0, time_spent: 0, q_count: 0 } }
@@ -46,115 +42,39 @@ def calculate_swot_data(user):
             return "Biology"
         return "General"
 
+    subs_by_test = {}
     for sub in submissions:
-        test_id = sub.get('test_id')
-        try:
-            test = Test.objects.filter(pk=test_id).first()
-        except:
-            test = None
-            
-        if not test:
-            continue
+        subs_by_test.setdefault(sub.get('test_id'), []).append(sub)
 
-        responses = sub.get('responses', {})
-        if isinstance(responses, str):
-            try:
-                responses = json.loads(responses)
-            except:
-                responses = {}
-
-        # Load test sections and questions
-        sections = test.sections.prefetch_related('questions')
-        for sec in sections:
-            correct_marks = float(sec.correct_marks or 0.0)
-            negative_marks = float(sec.negative_marks or 0.0)
-            
-            subject = get_subject_name(sec.name)
-            if subject not in subjects_data:
-                subjects_data[subject] = {
-                    'earned': 0.0,
-                    'max': 0.0,
-                    'correct': 0,
-                    'attempted': 0,
-                    'time_spent': 0,
-                    'q_count': 0
-                }
-            
-            sub_data = subjects_data[subject]
-
-            for q in sec.questions.all():
-                qid = str(q.pk)
-                res_obj = responses.get(qid)
-                if res_obj is None:
-                    try:
-                        res_obj = responses.get(int(qid))
-                    except:
-                        pass
-                
-                ans = res_obj.get('answer') if isinstance(res_obj, dict) else res_obj
-                q_time = res_obj.get('time', 0) if isinstance(res_obj, dict) else 0
-
-                sub_data['max'] += correct_marks
-                sub_data['time_spent'] += q_time
-                sub_data['q_count'] += 1
+    tests = Test.objects.filter(pk__in=list(subs_by_test.keys())).prefetch_related(
+        'sections', 'sections__questions', 'sections__partial_mark_rule'
+    )
+    for test in tests:
+        test_subs = subs_by_test.get(test.pk) or subs_by_test.get(str(test.pk)) or []
+        if not test_subs:
+            continue
 
-                if ans in (None, '', [], {}):
-                    # Unattempted
-                    pass
-                else:
-                    sub_data['attempted'] += 1
-                    qtype = q.question_type or 'SINGLE_CHOICE'
-                    
-                    if qtype == 'SINGLE_CHOICE':
-                        ans_str = str(ans).strip()
-                        is_correct = False
-                        options = q.question_options or []
-                        
-                        # Match by ID
-                        for opt in options:
-                            if ans_str.lower() == str(opt.get('id', '')).lower():
-                                if opt.get('isCorrect'):
-                                    is_correct = True
-                                break
-                        
-                        if is_correct:
-                            sub_data['earned'] += correct_marks
-                            sub_data['correct'] += 1
-                        else:
-                            sub_data['earned'] -= negative_marks
+        key = compile_sections(test.sections.all())
+        for card in load_cards(key, test_subs, db['tests_testsubmission']):
+            for s_card in card['sections']:
+                subject = get_subject_name(s_card['name'])
+                if subject not in subjects_data:
+                    subjects_data[subject] = {
+                        'earned': 0.0,
+                        'max': 0.0,
+                        'correct': 0,
+                        'attempted': 0,
+                        'time_spent': 0,
+                        'q_count': 0
+                    }
 
-                    elif qtype == 'MULTI_CHOICE':
-                        raw_selected = ans if isinstance(ans, list) else [ans]
-                        options = q.question_options or []
-                        correct_options = [str(o.get('id', '')) for o in options if o.get('isCorrect')]
-                        
-                        normalized_selected = set()
-                        for item in raw_selected:
-                            item_str = str(item).strip().lower()
-                            for opt in options:
-                                if item_str == str(opt.get('id', '')).lower():
-                                    normalized_selected.add(str(opt.get('id', '')))
-                                    break
-                        
-                        if normalized_selected == set(correct_options):
-                            sub_data['earned'] += correct_marks
-                            sub_data['correct'] += 1
-                        else:
-                            sub_data['earned'] -= negative_marks
-                            
-                    elif qtype in ('NUMERICAL', 'INTEGER_TYPE'):
-                        try:
-                            val = float(ans)
-                            ans_from = float(q.answer_from) if getattr(q, 'answer_from', None) is not None else None
-                            ans_to = float(q.answer_to) if getattr(q, 'answer_to', None) is not None else None
-                            
-                            if ans_from is not None and ans_to is not None and ans_from <= val <= ans_to:
-                                sub_data['earned'] += correct_marks
-                                sub_data['correct'] += 1
-                            else:
-                                sub_data['earned'] -= negative_marks
-                        except:
-                            sub_data['earned'] -= negative_marks
+                sub_data = subjects_data[subject]
+                sub_data['earned'] += s_card['earned'] - s_card['negative']
+                sub_data['max'] += s_card['max_marks']
+                sub_data['correct'] += s_card['correct']
+                sub_data['attempted'] += s_card['attempted']
+                sub_data['time_spent'] += s_card['time_spent']
+                sub_data['q_count'] += s_card['question_count']
 
     # Compute aggregate stats
     strengths_items = []
@@ -17,6 +17,7 @@ from .erp_views import (
     get_all_centres_erp_data, get_all_teachers_erp_data, get_exam_tag,
     sync_teachers_from_erp, get_admin_student_attendance, get_teacher_classes
 )
+from .job_views import get_job_status
 from .scholarlab_views import get_scholarlab_simulations, initialize_scholarlab_simulation
 from .gemini_views import generate_ai_study_plan, get_college_intelligence, search_college_ai, extract_marksheet_data, get_student_ai_insights, student_ai_insights_chat, generate_chapter_test
 from .portal_requirements_views import (
@@ -38,6 +39,7 @@ router.register(r'class-feedback', ClassFeedbackViewSet, basename='class-feedbac
 
 urlpatterns = [
     path('system-status/', system_status, name='system-status'),
+    path('jobs/<str:job_id>/', get_job_status, name='job-status'),
     path('token/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('profile/', ProfileView.as_view(), name='profile'),
@@ -27,6 +27,7 @@ def system_status(request):
     """Diagnose backend health and Cache/DB connectivity on AWS"""
     from django.core.cache import cache
     from django.conf import settings
+    from . import erp_proxy_cache, ai_cache, ai_limiter
     import os
     
     redis_url = os.getenv('REDIS_URL')
@@ -46,7 +47,10 @@ def system_status(request):
         "cache_backend": cache_backend,
         "redis_configured": bool(redis_url),
         "redis_alive": redis_alive,
-        "database": "Atlas MongoDB (Direct)"
+        "database": "Atlas MongoDB (Direct)",
+        "erp_proxy_cache": erp_proxy_cache.stats(),  # this worker only
+        "ai_cache": ai_cache.stats(),  # this worker only
+        "ai_limiter": ai_limiter.stats(),  # this worker only
     })
 
 class IsSuperAdmin(permissions.BasePermission):
@@ -1263,8 +1267,30 @@ class UserActivityLogViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return UserActivityLog.objects.filter(user=self.request.user)
 
+    @action(detail=False, methods=['post'], url_path='batch')
+    def batch(self, request):
+        """Queued client events in one request (see activity_ingest)."""
+        from . import activity_ingest
+        try:
+            events, rejected = activity_ingest.parse_batch(request.data, request.user)
+        except activity_ingest.BatchError as e:
+            return response.Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if events:
+            activity_ingest.enqueue(events)
+        return response.Response({"accepted": len(events), "rejected": rejected}, status=status.HTTP_202_ACCEPTED)
+
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        from datetime import datetime
+        from . import activity_rollup
+        try:
+            activity_rollup.watermark([self.request.user.pk], datetime.now())
+        except Exception as e:
+            print(f"[ACTIVITY ROLLUP] Failed to set the watermark for {self.request.user.username}: {e}")
+        log = serializer.save(user=self.request.user)
+        try:
+            activity_rollup.record([log])
+        except Exception as e:
+            print(f"[ACTIVITY ROLLUP] Failed to record {log.activity_type} for {self.request.user.username}: {e}")
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
@@ -1283,24 +1309,16 @@ def get_admin_student_activity_summary(request, admission_number):
     # 1. Local App Logins
     login_count = LoginLog.objects.filter(Q(username=admission_number) | (Q(username=student.username) if student else Q())).count()
     
-    # 2. Local Video Watches & Last Active
+    # 2. Local Video Watches & Last Active (from the lifetime activity rollup)
+    from . import activity_rollup
     videos_watched = 0
     last_active = None
+    rollup = {}
     if student:
-        video_logs = UserActivityLog.objects.filter(
-            user=student, 
-            activity_type__in=['video_complete', 'video_play', 'video_pause']
-        )
-        unique_video_ids = set()
-        for log in video_logs:
-            v_id = log.metadata.get('video_id') or log.metadata.get('video_title') or log.path
-            if v_id:
-                unique_video_ids.add(v_id)
-        videos_watched = len(unique_video_ids)
-
-        last_log = UserActivityLog.objects.filter(user=student).order_by('-timestamp').first()
-        if last_log:
-            last_active = last_log.timestamp.isoformat()
+        rollup = activity_rollup.totals(student.pk)
+        videos_watched = len(activity_rollup.videos(rollup))
+        if rollup.get('last_at'):
+            last_active = rollup['last_at'].isoformat()
 
     # 3. Local Portal Tests
     tests_taken = 0
@@ -1310,51 +1328,9 @@ def get_admin_student_activity_summary(request, admission_number):
         tests_taken = TestSubmission.objects.filter(student=student).count()
         
         try:
-            from django.db.models import Q
-            from centres.models import Centre
-            from tests.models import Test
-            
-            c_code = str(getattr(student, 'centre_code', '') or '').lower().strip()
-            c_name = str(getattr(student, 'centre_name', '') or '').lower().strip()
-            
-            centre_test_ids = []
-            if c_code or c_name:
-                matching_centre_ids = list(
-                    Centre.objects.filter(
-                        Q(code__iexact=c_code) | Q(name__iexact=c_name)
-                    ).values_list('_id', flat=True)
-                )
-                if matching_centre_ids:
-                    centre_test_ids = list(
-                        Test.objects.filter(centres__in=matching_centre_ids).values_list('pk', flat=True)
-                    )
-
-            if student.class_level:
-                qs_academic = Test.objects.filter(class_level=student.class_level)
-            else:
-                qs_academic = Test.objects.filter(class_level__isnull=True)
-
-            if student.target_exam:
-                te_test_ids = list(
-                    Test.objects.filter(target_exams=student.target_exam).values_list('pk', flat=True)
-                )
-                qs_academic = qs_academic.filter(pk__in=te_test_ids)
-
-            if student.session:
-                session_m2m_ids = list(
-                    Test.objects.filter(sessions=student.session).values_list('pk', flat=True)
-                )
-                qs_academic = qs_academic.filter(
-                    Q(exam_type__name__icontains='STUDY PLANNER') |
-                    Q(exam_type__name__icontains='STUDY_PLANNER') |
-                    Q(session=student.session) |
-                    Q(pk__in=session_m2m_ids)
-                )
-
-            academic_test_ids = list(qs_academic.values_list('pk', flat=True))
-            eligible_ids = set(str(pk) for pk in centre_test_ids) & set(str(pk) for pk in academic_test_ids)
-            
-            total_tests = len(eligible_ids)
+            # Same eligibility the student's test list uses (tests/visibility.py)
+            from tests.visibility import eligible_test_ids
+            total_tests = len(eligible_test_ids(student))
         except Exception as e:
             print(f"[TESTS] Error fetching total tests for student: {e}")
 
@@ -1365,14 +1341,14 @@ def get_admin_student_activity_summary(request, admission_number):
     if erp_id:
         try:
             from api.erp_views import _get_erp_url, _get_erp_admin_token
-            import requests
+            from api import erp_client
             erp_url = _get_erp_url()
             erp_token = _get_erp_admin_token()
-            resp = requests.get(
+            resp = erp_client.get(
                 f"{erp_url}/api/student-portal/attendance",
                 headers={'Authorization': f"Bearer {erp_token}"},
                 params={'studentId': erp_id},
-                timeout=15
+                fallback_ttl=erp_client.FALLBACK_TTL
             )
             if resp.status_code == 200:
                 data = resp.json()
@@ -1389,11 +1365,7 @@ def get_admin_student_activity_summary(request, admission_number):
     total_study_time_seconds = 0
     if student:
         # standard study time
-        agg = UserActivityLog.objects.filter(
-            user=student,
-            activity_type='heartbeat'
-        ).aggregate(total=Sum('duration'))
-        total_study_time_seconds = agg['total'] or 0
+        total_study_time_seconds = activity_rollup.type_totals(rollup, 'heartbeat')['duration']
         
         # add test submission time
         from tests.models import TestSubmission
@@ -1650,14 +1622,14 @@ def get_admin_student_activity_detail(request, admission_number):
             return response.Response([], status=200)
         try:
             from api.erp_views import _get_erp_url, _get_erp_admin_token
-            import requests as ext_requests
+            from api import erp_client
             erp_url = _get_erp_url()
             erp_token = _get_erp_admin_token()
-            resp = ext_requests.get(
+            resp = erp_client.get(
                 f"{erp_url}/api/student-portal/attendance",
                 headers={'Authorization': f"Bearer {erp_token}"},
                 params={'studentId': erp_id},
-                timeout=15
+                fallback_ttl=erp_client.FALLBACK_TTL
             )
             if resp.status_code == 200:
                 data = resp.json()
@@ -1672,13 +1644,16 @@ def get_admin_student_activity_detail(request, admission_number):
         if not student:
             return response.Response([], status=200)
         
-        # 1. Get ALL portal heartbeats (no limit — frontend groups by date anyway)
-        records = list(
-            UserActivityLog.objects.filter(
-                user=student,
-                activity_type='heartbeat'
-            ).order_by('-timestamp').values('timestamp', 'duration', 'path')
-        )
+        # 1. Portal heartbeats, one record per day and section from the daily rollups
+        # (the frontend groups by date and tab anyway)
+        from . import activity_rollup
+        from datetime import datetime as _dt
+        activity_rollup.ensure_backfilled(student.pk)
+        records = []
+        for day, doc in activity_rollup.daily(student.pk).items():
+            day_start = _dt.strptime(day, '%Y-%m-%d')
+            for path, seconds in activity_rollup.type_totals(doc, 'heartbeat')['paths'].items():
+                records.append({'timestamp': day_start, 'duration': seconds, 'path': path})
         
         # 2. Get test submissions and treat their time_spent as study time
         from tests.models import TestSubmission
@@ -1718,30 +1693,29 @@ def get_student_activity_analytics(request):
         from django.utils import timezone
         from datetime import timedelta
         from collections import defaultdict
-        import requests
+        from . import erp_client
         from .erp_views import _get_erp_url, _get_erp_admin_token, _fetch_erp_student_id
 
+        from datetime import datetime as _dt
+        from . import activity_rollup
+
         user = request.user
         now = timezone.now()
-        last_35_days = now - timedelta(days=35)
 
-        # Fetch raw logs — avoid ORM date-cast (Djongo/MongoDB incompatible)
-        heartbeat_logs = list(UserActivityLog.objects.filter(
-            user=user,
-            activity_type='heartbeat'
-        ).values('timestamp', 'duration', 'path'))
+        # Pre-aggregated rollups: the lifetime totals plus at most 35 daily rows
+        rollup = activity_rollup.totals(user.pk)
+        heartbeats = activity_rollup.type_totals(rollup, 'heartbeat')
 
         # 1. Total study time
-        total_seconds = sum(log['duration'] or 0 for log in heartbeat_logs)
+        total_seconds = heartbeats['duration']
         total_hours = round(total_seconds / 3600, 1)
 
-        # 2. Per-day intensity map for heatmap (Python-side grouping)
+        # 2. Per-day intensity map for heatmap
         intensity_map = defaultdict(int)  # date -> total seconds
-        for log in heartbeat_logs:
-            ts = log['timestamp']
-            if ts and ts >= last_35_days:
-                day = ts.date()
-                intensity_map[day] += log['duration'] or 0
+        for day, doc in activity_rollup.daily(user.pk, since=(now - timedelta(days=35)).date()).items():
+            day_heartbeats = activity_rollup.type_totals(doc, 'heartbeat')
+            if day_heartbeats['sessions']:
+                intensity_map[_dt.strptime(day, '%Y-%m-%d').date()] += day_heartbeats['duration']
 
         heatmap_data = []
         for i in range(35):
@@ -1761,10 +1735,8 @@ def get_student_activity_analytics(request):
                 'hours': round(seconds / 3600, 2)
             })
 
-        # 3. Time distribution by section (Python-side grouping)
-        path_seconds = defaultdict(int)
-        for log in heartbeat_logs:
-            path_seconds[log.get('path') or 'unknown'] += log['duration'] or 0
+        # 3. Time distribution by section
+        path_seconds = heartbeats['paths']
 
         total_dist_sec = sum(path_seconds.values()) or 1
         colors = ['bg-indigo-500', 'bg-orange-500', 'bg-blue-500', 'bg-emerald-500', 'bg-slate-400']
@@ -1805,11 +1777,10 @@ def get_student_activity_analytics(request):
                 erp_url = _get_erp_url()
                 erp_token = _get_erp_admin_token()
                 if erp_token:
-                    report_resp = requests.get(
+                    report_resp = erp_client.get(
                         f"{erp_url}/api/student-portal/report",
                         headers={"Authorization": f"Bearer {erp_token}"},
-                        params={"studentId": erp_sid},
-                        timeout=10
+                        params={"studentId": erp_sid}
                     )
                     if report_resp.status_code == 200:
                         report_data = report_resp.json()
@@ -1860,44 +1831,19 @@ def get_student_activity_analytics(request):
         # is what makes sense to show as "Videos Accessed"
         active_days = len(intensity_map)
         unique_sections = len(path_seconds)
-        all_play_events = list(UserActivityLog.objects.filter(
-            user=user, activity_type='video_play'
-        ).values_list('metadata', flat=True))
-        unique_video_ids = {
-            m.get('video_id') for m in all_play_events
-            if isinstance(m, dict) and m.get('video_id')
-        }
-        video_plays = len(unique_video_ids)
+        played = [v for v in activity_rollup.videos(rollup) if v.get('id') and v.get('plays')]
+        video_plays = len(played)
 
 
         # 7. Recent video activity (Deduplicated)
-        all_play_logs = list(UserActivityLog.objects.filter(
-            user=user, activity_type='video_play'
-        ).order_by('-timestamp'))
-        
-        all_video_logs = list(UserActivityLog.objects.filter(
-            user=user, activity_type__startswith='video_'
-        ))
-        
         recent_videos_data = []
-        seen_ids = set()
-        
-        for rlog in all_play_logs:
-            v_id = rlog.metadata.get('video_id')
-            if not v_id or v_id in seen_ids:
-                continue
-            
-            seen_ids.add(v_id)
-            total_sec = sum(v.duration for v in all_video_logs if v.metadata.get('video_id') == v_id)
-            
+        for v in sorted(played, key=lambda v: v['last_play_at'], reverse=True)[:5]:
             recent_videos_data.append({
-                'title': rlog.metadata.get('video_title', 'Unknown Video'),
-                'timestamp': rlog.timestamp,
-                'id': v_id,
-                'duration_watched': f"{round(total_sec / 60, 1)} min"
+                'title': v.get('title', 'Unknown Video'),
+                'timestamp': v['last_play_at'],
+                'id': v['id'],
+                'duration_watched': f"{round(v.get('seconds', 0) / 60, 1)} min"
             })
-            if len(recent_videos_data) >= 5:
-                break
 
         return response.Response({
             'total_hours': total_hours,
@@ -25,8 +25,8 @@ class CentreViewSet(viewsets.ModelViewSet):
         if not (user.is_staff or user.is_superuser or user_type in ('admin', 'superadmin', 'staff')):
             return Response({"error": "Permission denied. Only administrators can sync centres."}, status=status.HTTP_403_FORBIDDEN)
 
-        import requests
         from django.core.cache import cache
+        from api import erp_client
         from api.erp_views import _get_erp_url, _get_erp_admin_token, sync_local_centres_with_erp
 
         try:
@@ -36,7 +36,7 @@ class CentreViewSet(viewsets.ModelViewSet):
             if not erp_token:
                 return Response({"error": "ERP Authentication Failed. Token unavailable."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
-            resp = requests.get(f"{erp_url}/api/centre", headers={"Authorization": f"Bearer {erp_token}"}, timeout=30)
+            resp = erp_client.get(f"{erp_url}/api/centre", headers={"Authorization": f"Bearer {erp_token}"}, fallback_ttl=erp_client.FALLBACK_TTL)
             if resp.status_code == 200:
                 data = resp.json()
                 if isinstance(data, dict):
@@ -369,6 +369,11 @@ else:
 
 AUTH_USER_MODEL = 'api.CustomUser'
 
+# Background jobs for heavy admin actions (?async=1). 'mongo' shares job state
+# across gunicorn workers; 'memory' keeps it in-process for local runs/tests.
+JOB_BACKEND = os.getenv('JOB_BACKEND', 'mongo')
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
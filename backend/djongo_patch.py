@@ -1,10 +1,146 @@
+import os
 import sys
 import re
 import logging
+import threading
+from collections import OrderedDict
 
 logging.basicConfig(level=logging.ERROR)
 logger = logging.getLogger(__name__)
 
+# Bounded LRU caches for SQL translation. Django emits the same handful of
+# statement shapes over and over (params are passed separately), so both the
+# regex rewrites below and Djongo's sqlparse pass are memoised per SQL
+# template. 0 disables caching.
+SQL_CACHE_SIZE = int(os.getenv('DJONGO_SQL_CACHE_SIZE', 2048))
+
+
+class _LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data), 'maxsize': self.maxsize,
+                'hits': self.hits, 'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+_rewrite_cache = _LRUCache(SQL_CACHE_SIZE)
+_parse_cache = _LRUCache(SQL_CACHE_SIZE)
+_MISSING = object()
+_SUPPRESSED = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT',
+               'BEGIN', 'COMMIT', 'ROLLBACK', 'SET SEARCH_PATH', 'SET TIME ZONE')
+
+
+def translation_cache_stats():
+    """Hit/miss counters for the SQL rewrite and sqlparse caches."""
+    return {'rewrite': _rewrite_cache.stats(), 'parse': _parse_cache.stats()}
+
+
+def clear_translation_cache():
+    _rewrite_cache.clear()
+    _parse_cache.clear()
+
+
+def rewrite_sql(sql):
+    """Apply the Django 4.x -> Djongo SQL rewrites to one statement template.
+
+    Returns None for transaction/system commands that must be skipped, else
+    (rewritten_sql, extra_true_params): the number of `True` params appended
+    for bare boolean columns. Depends only on the SQL text, so it is cached.
+    """
+    cached = _rewrite_cache.get(sql, _MISSING)
+    if cached is not _MISSING:
+        return cached
+    result = _rewrite_sql(sql)
+    _rewrite_cache.put(sql, result)
+    return result
+
+
+def _rewrite_sql(sql):
+    sql_upper = sql.strip().upper()
+
+    # A. Suppress Transaction & System commands
+    if any(sql_upper.startswith(cmd) for cmd in _SUPPRESSED):
+        return None
+
+    # B. Fix Placeholder Syntax: %(0)s -> %s
+    # We transform to %s but InsertQuery patch must handle it
+    sql = re.sub(r'%\(\d+\)s', '%s', sql)
+
+    # C. Remove RETURNING clause (Djongo doesn't support it)
+    sql = re.sub(r'\s+RETURNING\s+.*$', '', sql, flags=re.IGNORECASE)
+
+    # D. Fix Table Aliases (Django 4.x)
+    sql = re.sub(r'WHERE\s+[\w\d_"]+\.id\s*=', 'WHERE id =', sql, flags=re.IGNORECASE)
+
+    # E. Boolean Handling
+    keywords = r'(?:NOT|EXISTS|TRUE|FALSE|NULL|SELECT|FROM|WHERE|AND|OR|ORDER|LIMIT|GROUP|BY|IN|IS)'
+    col_pat  = r'("?[\w\d._]+"?(?:\."?[\w\d._]+"?)?)'
+    neg_op   = r'(?!\s*(?:=|<|>|!|IS|IN))'
+    pos_term = r'(?=\s*(?:AND|OR|ORDER|LIMIT|GROUP|BY|\)|,|\s*$))'
+
+    extra = [0]
+
+    def replace_bare(match):
+        prefix, col = match.group(1), match.group(2)
+        if re.match('^' + keywords + '$', col, re.IGNORECASE):
+            return match.group(0)
+        extra[0] += 1
+        return f"{prefix}{col} = %s"
+
+    sql = re.sub(r'(\b(?:WHERE|AND|OR)\b\s+)' + col_pat + neg_op + pos_term, replace_bare, sql, flags=re.IGNORECASE)
+    sql = re.sub(r'((?:\b(?:WHERE|AND|OR|NOT|ON)\b|\()\s*\(\s*)' + col_pat + neg_op + pos_term, replace_bare, sql, flags=re.IGNORECASE)
+    return sql, extra[0]
+
+
+def make_cached_sqlparse(parse):
+    """Wrap sqlparse.parse with the template cache. Djongo only reads the token
+    tree (params are bound from %(n)s placeholders at conversion time), so one
+    parsed statement can be shared by every execution of the same SQL."""
+    def cached_sqlparse(sql, *args, **kwargs):
+        if args or kwargs:
+            return parse(sql, *args, **kwargs)
+        statements = _parse_cache.get(sql, _MISSING)
+        if statements is _MISSING:
+            statements = parse(sql)
+            _parse_cache.put(sql, statements)
+        return statements
+    return cached_sqlparse
+
 def apply_djongo_patches():
     """
     Djongo Universal Adapter for Django 4.x + MongoDB.
@@ -13,7 +149,6 @@ def apply_djongo_patches():
     try:
         from djongo import cursor as djongo_cursor
         from djongo.sql2mongo import query as djongo_query
-        from sqlparse import parse as sql_parse_lib
         from sqlparse import tokens as sql_tokens_lib
         from sqlparse.sql import Parenthesis, Identifier
         from djongo.exceptions import SQLDecodeError
@@ -35,47 +170,14 @@ def apply_djongo_patches():
         if not isinstance(sql, str):
             return Cursor._original_execute(self, sql, params)
 
-        # 2. Universal SQL Sanitization
+        # 2. Universal SQL Sanitization (memoised per SQL template, see rewrite_sql)
         sql_upper = sql.strip().upper()
-        
-        # A. Suppress Transaction & System commands
-        if any(sql_upper.startswith(cmd) for cmd in [
-            'SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT', 
-            'BEGIN', 'COMMIT', 'ROLLBACK', 'SET SEARCH_PATH', 'SET TIME ZONE'
-        ]):
+        rewritten = rewrite_sql(sql)
+        if rewritten is None:
             return
-
-        # B. Fix Placeholder Syntax: %(0)s -> %s
-        # We transform to %s but InsertQuery patch must handle it
-        sql = re.sub(r'%\(\d+\)s', '%s', sql)
-
-        # C. Remove RETURNING clause (Djongo doesn't support it)
-        sql = re.sub(r'\s+RETURNING\s+.*$', '', sql, flags=re.IGNORECASE)
-
-        # D. Fix Table Aliases (Django 4.x)
-        sql = re.sub(r'WHERE\s+[\w\d_"]+\.id\s*=', 'WHERE id =', sql, flags=re.IGNORECASE)
-
-        # E. Boolean Handling
-        keywords = r'(?:NOT|EXISTS|TRUE|FALSE|NULL|SELECT|FROM|WHERE|AND|OR|ORDER|LIMIT|GROUP|BY|IN|IS)'
-        col_pat  = r'("?[\w\d._]+"?(?:\."?[\w\d._]+"?)?)'
-        neg_op   = r'(?!\s*(?:=|<|>|!|IS|IN))'
-        pos_term = r'(?=\s*(?:AND|OR|ORDER|LIMIT|GROUP|BY|\)|,|\s*$))'
-        
-        new_params = list(params) if params else []
-        initial_params_len = len(new_params)
-
-        def replace_bare(match):
-            prefix, col = match.group(1), match.group(2)
-            if re.match('^' + keywords + '$', col, re.IGNORECASE):
-                return match.group(0)
-            new_params.append(True)
-            return f"{prefix}{col} = %s"
-
-        sql = re.sub(r'(\b(?:WHERE|AND|OR)\b\s+)' + col_pat + neg_op + pos_term, replace_bare, sql, flags=re.IGNORECASE)
-        sql = re.sub(r'((?:\b(?:WHERE|AND|OR|NOT|ON)\b|\()\s*\(\s*)' + col_pat + neg_op + pos_term, replace_bare, sql, flags=re.IGNORECASE)
-
-        if len(new_params) > initial_params_len:
-            params = tuple(new_params)
+        sql, extra_true = rewritten
+        if extra_true:
+            params = tuple(list(params) if params else []) + (True,) * extra_true
 
         try:
             # Flatten params if necessary for executemany style or single-list-in-tuple
@@ -91,12 +193,18 @@ def apply_djongo_patches():
 
     Cursor.execute = patched_execute
 
+    # 3. Memoise Djongo's sqlparse pass per SQL template
+    if not hasattr(djongo_query, '_original_sqlparse'):
+        djongo_query._original_sqlparse = djongo_query.sqlparse
+    cached_parse = make_cached_sqlparse(djongo_query._original_sqlparse)
+    djongo_query.sqlparse = cached_parse
+
     # 4. Patch InsertQuery (Complete Overhaul)
     InsertQuery = djongo_query.InsertQuery
     def patched_insert_parse(self):
         stmt_str = str(self.statement)
         try:
-            parsed = sql_parse_lib(stmt_str)[0]
+            parsed = cached_parse(stmt_str)[0]
         except Exception as e:
             raise SQLDecodeError(str(e))
 
@@ -80,3 +80,22 @@ access_log_format = '%(h)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)sB %(D)sus'
 # ---------------------------------------------------------------------------
 # This avoids disk I/O for heartbeat files between Gunicorn master & workers.
 worker_tmp_dir = "/dev/shm"
+
+
+# ---------------------------------------------------------------------------
+# Hooks
+# ---------------------------------------------------------------------------
+def worker_exit(server, worker):
+    # Drain this worker's buffered exam autosaves (tests/autosave.py) before it
+    # goes away — covers max_requests recycling and graceful reloads.
+    try:
+        from tests.autosave import flush_on_exit
+        flush_on_exit()
+    except Exception as e:
+        server.log.warning(f"autosave flush on worker exit failed: {e}")
+    # Same for batched activity events (api/activity_ingest.py).
+    try:
+        from api.activity_ingest import flush_on_exit as flush_activity
+        flush_activity()
+    except Exception as e:
+        server.log.warning(f"activity flush on worker exit failed: {e}")
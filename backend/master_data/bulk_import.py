@@ -0,0 +1,322 @@
+"""
+Bulk CSV import for the syllabus tree (Chapter / Topic / SubTopic).
+
+Instead of several Djongo round-trips per CSV row (class level and subject
+lookups, generate_unique_code's probe loop, one INSERT), an import:
+
+  1. preloads class levels, subjects, chapters, topics and every existing
+     code into normalised in-memory maps (one query per table),
+  2. resolves and de-duplicates each row against those maps and against
+     earlier rows of the same file,
+  3. writes new records with batched bulk_create calls.
+
+Every row ends up in the report as created, skipped (already exists) or
+unresolved (missing fields / unknown parent), with a reason.
+"""
+import csv
+import io
+import logging
+import re
+
+from django.db import transaction
+
+from .models import ClassLevel, Subject, Chapter, Topic, SubTopic
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+STATUS_CREATED = 'created'
+STATUS_SKIPPED = 'skipped'
+STATUS_UNRESOLVED = 'unresolved'
+
+
+def _norm(value):
+    return re.sub(r'\s+', ' ', str(value or '')).strip().lower()
+
+
+def decode_csv(file_obj, label):
+    """DictReader over an uploaded CSV, trying the encodings admins' exports use."""
+    raw = file_obj.read()
+    decoded_file = None
+    used_encoding = None
+    for enc in ('utf-8-sig', 'utf-8', 'cp1252', 'latin-1'):
+        try:
+            decoded_file = raw.decode(enc)
+            used_encoding = enc
+            break
+        except UnicodeDecodeError:
+            continue
+
+    if decoded_file is None:
+        decoded_file = raw.decode('latin-1', errors='replace')
+        used_encoding = 'latin-1-replace'
+
+    logger.info(f"{label} bulk_upload: decoded file using encoding='{used_encoding}'")
+    return csv.DictReader(io.StringIO(decoded_file))
+
+
+class CodeAllocator:
+    """In-memory generate_unique_code: one query for the existing codes, then no probing."""
+
+    def __init__(self, model_class):
+        self.taken = set(model_class.objects.values_list('code', flat=True))
+
+    def allocate(self, name, length=4):
+        clean_name = re.sub(r'[^a-zA-Z0-9]', '', name).upper()
+        base_code = clean_name[:length]
+        code = base_code
+        counter = 1
+        while code in self.taken:
+            code = f"{base_code}_{counter}"
+            counter += 1
+        self.taken.add(code)
+        return code
+
+
+class MasterDataResolver:
+    """Normalised name maps over class levels, subjects, chapters and topics.
+
+    Lookups mirror the per-row queries they replace, including their
+    `.first()` semantics (first row in primary-key order wins).
+    """
+
+    def __init__(self, chapters=False, topics=False):
+        self.class_levels = list(ClassLevel.objects.order_by('pk').values_list('pk', 'name'))
+        self.subjects = list(Subject.objects.order_by('pk').values_list('pk', 'name'))
+        self._class_exact = self._first_by_name(self.class_levels)
+        self._subject_exact = self._first_by_name(self.subjects)
+
+        self.chapters = {}
+        if chapters:
+            for pk, name, cl_id, sub_id in Chapter.objects.order_by('pk').values_list('pk', 'name', 'class_level_id', 'subject_id'):
+                self.chapters.setdefault((_norm(name), cl_id, sub_id), pk)
+
+        self.topics = {}
+        if topics:
+            for pk, name in Topic.objects.order_by('pk').values_list('pk', 'name'):
+                self.topics.setdefault(_norm(name), pk)
+
+    @staticmethod
+    def _first_by_name(rows):
+        out = {}
+        for pk, name in rows:
+            out.setdefault(_norm(name), pk)
+        return out
+
+    @staticmethod
+    def _first_containing(rows, needle):
+        needle = _norm(needle)
+        for pk, name in rows:
+            if needle in _norm(name):
+                return pk
+        return None
+
+    def class_level(self, name, fuzzy=False):
+        pk = self._class_exact.get(_norm(name))
+        if pk is None and fuzzy:
+            # Fallback heuristics when exact match fails (helps with CSV variations like 'Class 7')
+            digits = re.findall(r"\d+", name)
+            if digits:
+                pk = self._first_containing(self.class_levels, digits[0])
+            if pk is None:
+                pk = self._first_containing(self.class_levels, name)
+        return pk
+
+    def subject(self, name, fuzzy=False):
+        pk = self._subject_exact.get(_norm(name))
+        if pk is None and fuzzy:
+            pk = self._first_containing(self.subjects, name)
+        return pk
+
+    def chapter(self, name, class_level_id, subject_id):
+        return self.chapters.get((_norm(name), class_level_id, subject_id))
+
+    def topic(self, name):
+        return self.topics.get(_norm(name))
+
+
+def _row_fields(row):
+    sort_order = str(row.get('Sort Order', '1') or '1').strip()
+    return {
+        'name': str(row.get('Name', '') or '').strip(),
+        'sort_order': int(sort_order) if sort_order.isdigit() else 1,
+        'is_active': str(row.get('Is Active', 'true')).lower() == 'true',
+    }
+
+
+def _bulk_insert(model_class, objs):
+    """bulk_create in batches. Any rows a batch failed to write (checked by code)
+    are retried one by one, so a single bad row can't sink the import."""
+    written = set()
+    for i in range(0, len(objs), BATCH_SIZE):
+        batch = objs[i:i + BATCH_SIZE]
+        codes = [o.code for o in batch]
+        try:
+            with transaction.atomic():
+                model_class.objects.bulk_create(batch)
+        except Exception as e:
+            logger.warning(f"bulk_create of {len(batch)} {model_class.__name__} rows failed ({e}); retrying individually")
+        present = set(model_class.objects.filter(code__in=codes).values_list('code', flat=True))
+        for obj in batch:
+            if obj.code not in present:
+                try:
+                    obj.pk = None
+                    obj.save()
+                    present.add(obj.code)
+                except Exception as e:
+                    logger.warning(f"Failed to create {model_class.__name__} '{obj.name}': {e}")
+        written |= present
+    return written
+
+
+def _finish(model_class, pending, report):
+    """Write pending (row report, obj) pairs and mark each created or failed."""
+    from api.jobs import report_progress
+
+    report_progress(stage='saving', pending=len(pending))
+    written = _bulk_insert(model_class, [obj for _, obj in pending])
+    for entry, obj in pending:
+        if obj.code in written:
+            entry['status'] = STATUS_CREATED
+        else:
+            entry['status'] = STATUS_UNRESOLVED
+            entry['reason'] = 'Database write failed'
+    return report
+
+
+def _iter_rows(reader):
+    from api.jobs import report_progress
+    for row_idx, row in enumerate(reader, start=2):
+        if row_idx % 100 == 0:
+            report_progress(stage='resolving', done=row_idx - 1)
+        yield row_idx, row
+
+
+def import_chapters(reader):
+    resolver = MasterDataResolver(chapters=True)
+    codes = CodeAllocator(Chapter)
+    report, pending = [], []
+    for row_idx, row in _iter_rows(reader):
+        f = _row_fields(row)
+        class_name = str(row.get('Class Level', '') or '').strip()
+        subject_name = str(row.get('Subject', '') or '').strip()
+        entry = {'row': row_idx, 'name': f['name']}
+
+        if not f['name'] or not class_name or not subject_name:
+            if any(row.values()):
+                report.append(dict(entry, status=STATUS_UNRESOLVED, reason='Missing required fields (Name, Class Level, or Subject)'))
+            continue
+        class_level_id = resolver.class_level(class_name, fuzzy=True)
+        subject_id = resolver.subject(subject_name, fuzzy=True)
+        if class_level_id is None:
+            report.append(dict(entry, status=STATUS_UNRESOLVED, reason=f"Class '{class_name}' not found"))
+            continue
+        if subject_id is None:
+            report.append(dict(entry, status=STATUS_UNRESOLVED, reason=f"Subject '{subject_name}' not found"))
+            continue
+
+        key = (_norm(f['name']), class_level_id, subject_id)
+        if key in resolver.chapters:
+            report.append(dict(entry, status=STATUS_SKIPPED, reason='Chapter already exists'))
+            continue
+        resolver.chapters[key] = None  # claim it so later duplicate rows are skipped
+
+        report.append(entry)
+        pending.append((entry, Chapter(
+            name=f['name'], class_level_id=class_level_id, subject_id=subject_id,
+            sort_order=f['sort_order'], is_active=f['is_active'], code=codes.allocate(f['name']),
+        )))
+    return _finish(Chapter, pending, report)
+
+
+def import_topics(reader):
+    resolver = MasterDataResolver(chapters=True, topics=True)
+    codes = CodeAllocator(Topic)
+    existing = set()
+    for name, ch_id, cl_id, sub_id in Topic.objects.values_list('name', 'chapter_id', 'class_level_id', 'subject_id'):
+        existing.add((_norm(name), ch_id, cl_id, sub_id))
+
+    report, pending = [], []
+    for row_idx, row in _iter_rows(reader):
+        f = _row_fields(row)
+        chapter_name = str(row.get('Chapter', '') or '').strip()
+        class_name = str(row.get('Class Level', '') or '').strip()
+        subject_name = str(row.get('Subject', '') or '').strip()
+        entry = {'row': row_idx, 'name': f['name']}
+
+        if not f['name'] or not class_name or not subject_name:
+            if any(row.values()):
+                report.append(dict(entry, status=STATUS_UNRESOLVED, reason='Missing required fields (Name, Class Level, or Subject)'))
+            continue
+        class_level_id = resolver.class_level(class_name)
+        subject_id = resolver.subject(subject_name)
+        if class_level_id is None:
+            report.append(dict(entry, status=STATUS_UNRESOLVED, reason=f"Class '{class_name}' not found"))
+            continue
+        if subject_id is None:
+            report.append(dict(entry, status=STATUS_UNRESOLVED, reason=f"Subject '{subject_name}' not found"))
+            continue
+        chapter_id = resolver.chapter(chapter_name, class_level_id, subject_id) if chapter_name else None
+
+        key = (_norm(f['name']), chapter_id, class_level_id, subject_id)
+        if key in existing:
+            report.append(dict(entry, status=STATUS_SKIPPED, reason='Topic already exists'))
+            continue
+        existing.add(key)
+
+        report.append(entry)
+        pending.append((entry, Topic(
+            name=f['name'], chapter_id=chapter_id, class_level_id=class_level_id, subject_id=subject_id,
+            sort_order=f['sort_order'], is_active=f['is_active'], code=codes.allocate(f['name']),
+        )))
+    return _finish(Topic, pending, report)
+
+
+def import_subtopics(reader):
+    resolver = MasterDataResolver(topics=True)
+    codes = CodeAllocator(SubTopic)
+    existing = {(_norm(name), t_id) for name, t_id in SubTopic.objects.values_list('name', 'topic_id')}
+
+    report, pending = [], []
+    for row_idx, row in _iter_rows(reader):
+        f = _row_fields(row)
+        topic_name = str(row.get('Topic', '') or '').strip()
+        entry = {'row': row_idx, 'name': f['name']}
+
+        if not f['name'] or not topic_name:
+            if any(row.values()):
+                report.append(dict(entry, status=STATUS_UNRESOLVED, reason='Missing required fields (Name or Topic)'))
+            continue
+        topic_id = resolver.topic(topic_name)
+        if topic_id is None:
+            report.append(dict(entry, status=STATUS_UNRESOLVED, reason=f"Topic '{topic_name}' not found"))
+            continue
+
+        key = (_norm(f['name']), topic_id)
+        if key in existing:
+            report.append(dict(entry, status=STATUS_SKIPPED, reason='Sub-topic already exists'))
+            continue
+        existing.add(key)
+
+        report.append(entry)
+        pending.append((entry, SubTopic(
+            name=f['name'], topic_id=topic_id,
+            sort_order=f['sort_order'], is_active=f['is_active'], code=codes.allocate(f['name']),
+        )))
+    return _finish(SubTopic, pending, report)
+
+
+def summarize(report, noun):
+    """Response body for a bulk upload: the old message/errors keys plus the per-row report."""
+    counts = {STATUS_CREATED: 0, STATUS_SKIPPED: 0, STATUS_UNRESOLVED: 0}
+    for entry in report:
+        counts[entry['status']] += 1
+    return {
+        "message": f"Successfully imported {counts[STATUS_CREATED]} {noun}",
+        "created": counts[STATUS_CREATED],
+        "skipped": counts[STATUS_SKIPPED],
+        "unresolved": counts[STATUS_UNRESOLVED],
+        "errors": [f"Row {e['row']}: {e['reason']}" for e in report if e['status'] == STATUS_UNRESOLVED],
+        "rows": report,
+    }
@@ -0,0 +1,151 @@
+"""
+Rendered list responses for CachedListViewSetMixin (master_data/views.py).
+
+A cached master-data list is stored as the final JSON bytes plus a strong
+ETag, not as Python objects that are pickled into Redis and JSON-rendered
+again on every hit:
+
+    redis  md_v3_<ViewSet>_v<version>[_TE.._CL.._S..]  ->  b'<etag>\\n<json bytes>'
+
+The ETag is the model version key plus a hash of the bytes, so a rebuilt
+but unchanged list keeps its ETag and clients that send it back in
+If-None-Match get a 304 with no body:
+
+    entry = list_cache.get(key)              # Entry(etag, body) or None
+    return list_cache.respond(request, entry)
+
+Each worker also keeps recently served entries in a small LRU bounded by
+total bytes (MASTER_DATA_LRU_BYTES) so request bursts don't reach Redis;
+entries there live for LOCAL_TTL seconds, like the old burst cache.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+
+try:
+    import orjson
+except ImportError:  # optional: DRF's renderer produces the same JSON, just slower
+    orjson = None
+
+LOCAL_TTL = 5
+LRU_MAX_BYTES = int(os.getenv('MASTER_DATA_LRU_BYTES', str(32 * 1024 * 1024)))
+LRU_MAX_ENTRIES = 512
+
+Entry = namedtuple('Entry', 'etag body')
+
+
+# ── Encoding ──────────────────────────────────────────────────────────────────
+
+def render(data):
+    """Compact JSON bytes for already-serialized (plain Python) list data."""
+    if orjson is not None:
+        from rest_framework.utils.encoders import JSONEncoder
+        return orjson.dumps(data, default=JSONEncoder().default)
+    from rest_framework.renderers import JSONRenderer
+    return JSONRenderer().render(data)
+
+
+def make_entry(version_key, body):
+    return Entry('"%s-%s"' % (version_key, hashlib.sha1(body).hexdigest()[:16]), body)
+
+
+def _pack(entry):
+    return entry.etag.encode() + b'\n' + entry.body
+
+
+def _unpack(blob):
+    if not isinstance(blob, bytes) or b'\n' not in blob:
+        return None  # a pickled list/dict from before bytes were cached
+    etag, body = blob.split(b'\n', 1)
+    return Entry(etag.decode(), body)
+
+
+# ── Per-worker LRU ────────────────────────────────────────────────────────────
+
+class _LRU:
+    """Entries by cache key, evicting least recently used past max_bytes/max_entries."""
+
+    def __init__(self, max_bytes, max_entries):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._items = OrderedDict()  # key -> (entry, stored_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, max_age):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            if time.time() - item[1] >= max_age:
+                self._remove(key)
+                return None
+            self._items.move_to_end(key)
+            return item[0]
+
+    def set(self, key, entry):
+        size = len(entry.body)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._items[key] = (entry, time.time())
+            self._bytes += size
+            while self._bytes > self.max_bytes or len(self._items) > self.max_entries:
+                self._remove(next(iter(self._items)))
+
+    def discard_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._items if k.startswith(prefix)]:
+                self._remove(key)
+
+    def _remove(self, key):
+        item = self._items.pop(key, None)
+        if item is not None:
+            self._bytes -= len(item[0].body)
+
+
+_local = _LRU(LRU_MAX_BYTES, LRU_MAX_ENTRIES)
+
+
+# ── Cache ─────────────────────────────────────────────────────────────────────
+
+def get(key):
+    """The cached entry for this key: local LRU first, then Redis."""
+    entry = _local.get(key, LOCAL_TTL)
+    if entry is not None:
+        return entry
+    entry = _unpack(cache.get(key))
+    if entry is not None:
+        _local.set(key, entry)
+    return entry
+
+
+def put(key, version_key, data, timeout):
+    """Render `data` once, cache the bytes in Redis and locally, and return the entry."""
+    entry = make_entry(version_key, render(data))
+    cache.set(key, _pack(entry), timeout=timeout)
+    _local.set(key, entry)
+    return entry
+
+
+def discard_local(prefix):
+    _local.discard_prefix(prefix)
+
+
+def respond(request, entry):
+    """Serve cached bytes, or a 304 when the client already holds this ETag."""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+    if entry.etag in [t.strip().replace('W/', '', 1) for t in if_none_match.split(',')]:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(entry.body, content_type='application/json')
+    response['ETag'] = entry.etag
+    # Browsers keep the list but revalidate it (cheap 304) on every load
+    response['Cache-Control'] = 'private, no-cache'
+    return response
@@ -1,6 +1,6 @@
 from django.db import models
 import re
-from django.db.models.signals import m2m_changed
+from django.db.models.signals import m2m_changed, post_save, post_delete
 from django.dispatch import receiver
 
 class MasterSection(models.Model):
@@ -735,3 +735,36 @@ class ChapterTestSetting(models.Model):
 
     def __str__(self):
         return f'Chapter Test Marks: +{self.positive_marks}, -{self.negative_marks}'
+
+
+# Keep the master-section content index (sections/content_index.py) in step
+# with master sections and the study materials / pen-paper tests filed under them
+@receiver(post_save, sender=MasterSection)
+@receiver(post_delete, sender=MasterSection)
+def invalidate_content_index_on_master_section_change(sender, **kwargs):
+    from sections.content_index import invalidate_content_index
+    invalidate_content_index()
+
+@receiver(post_save, sender=LibraryItem)
+@receiver(post_delete, sender=LibraryItem)
+@receiver(post_save, sender=Video)
+@receiver(post_delete, sender=Video)
+@receiver(post_save, sender=PenPaperTest)
+@receiver(post_delete, sender=PenPaperTest)
+@receiver(post_save, sender=Homework)
+@receiver(post_delete, sender=Homework)
+def refresh_content_index_on_material_change(sender, instance, **kwargs):
+    from sections.content_index import refresh_material, kind_for_model
+    refresh_material(kind_for_model(sender), instance.pk)
+
+@receiver(m2m_changed, sender=PenPaperTest.sections.through)
+@receiver(m2m_changed, sender=Homework.sections.through)
+def refresh_content_index_on_material_sections_change(sender, instance, action, reverse, **kwargs):
+    if action not in ["post_add", "post_remove", "post_clear"]:
+        return
+    from sections.content_index import refresh_material, kind_for_model, invalidate_content_index
+    if reverse:
+        # Changed from the master section side (section.pen_paper_tests.add...): may touch many items
+        invalidate_content_index()
+    else:
+        refresh_material(kind_for_model(type(instance)), instance.pk)
@@ -3,11 +3,8 @@ from rest_framework.decorators import action
 from rest_framework.parsers import MultiPartParser, FormParser
 from django.http import HttpResponse
 import csv
-import io
-import time
-import requests
+from api import erp_client
 from api.erp_views import _get_erp_url, _get_erp_admin_token
-import logging
 from .models import Session, TargetExam, ExamType, ClassLevel, ExamDetail, Subject, Topic, Chapter, SubTopic, Teacher, LibraryItem, LibraryPDF, LibraryVideo, LibraryDPP, SolutionItem, Notice, LiveClass, Video, PenPaperTest, Homework, Banner, Seminar, Guide, Community, MasterSection, PartialMarkRule, PsychometricTrait, PsychometricQuestion, MistakeReason, ChapterTestSetting
 from .serializers import SessionSerializer, TargetExamSerializer, ExamTypeSerializer, ClassLevelSerializer, ExamDetailSerializer, SubjectSerializer, TopicSerializer, ChapterSerializer, SubTopicSerializer, TeacherSerializer, LibraryItemSerializer, SolutionItemSerializer, NoticeSerializer, LiveClassSerializer, VideoSerializer, PenPaperTestSerializer, HomeworkSerializer, BannerSerializer, SeminarSerializer, GuideSerializer, CommunitySerializer, MasterSectionSerializer, PartialMarkRuleSerializer, PsychometricTraitSerializer, PsychometricQuestionSerializer, MistakeReasonSerializer, ChapterTestSettingSerializer
 
@@ -15,7 +12,9 @@ class StandardPagination(pagination.PageNumberPagination):
     page_size = 20
 from django.db.models import Q, Count
 from django.core.cache import cache
-import re
+from api.jobs import runs_as_job
+from .bulk_import import decode_csv, import_chapters, import_topics, import_subtopics, summarize
+from . import list_cache
 
 class StudentSectionFilterMixin:
     """
@@ -95,8 +94,10 @@ def deep_serialize(data):
     return data
 
 class CachedListViewSetMixin(object):
-    """Mixin to cache the list response for master data and invalidate on change."""
-    _local_cache = {} # Server-level fast memory to handle parallel request bursts
+    """Mixin to cache the list response for master data and invalidate on change.
+
+    Lists are cached as rendered JSON bytes with an ETag (see list_cache.py), so a
+    hit is served without re-rendering and a client holding the same list gets a 304."""
 
     def get_cache_version(self):
         """Gets the current version for this viewset class. IncrementING this clears all lists."""
@@ -118,7 +119,7 @@ class CachedListViewSetMixin(object):
             cache.set(v_key, v + 1, 86400 * 30)
             
         # Clear local cache memory too
-        self.__class__._local_cache = {}
+        list_cache.discard_local(f"md_v3_{self.__class__.__name__}_")
         
         # Clear stats caches
         cache.delete("dashboard_section_stats_v1")
@@ -131,7 +132,10 @@ class CachedListViewSetMixin(object):
 
     def get_cache_key(self):
         user = self.request.user
-        base_key = f"md_v2_{self.__class__.__name__}_v{self.get_cache_version()}"
+        version = self.get_cache_version()
+        # the ETag carries the version, so a version bump always changes it
+        self._cache_version_label = f"{self.__class__.__name__}-v{version}"
+        base_key = f"md_v3_{self.__class__.__name__}_v{version}"
         
         # If this viewset uses StudentSectionFilterMixin, we must include the targeting in the cache key
         if isinstance(self, StudentSectionFilterMixin) and user.is_authenticated:
@@ -147,44 +151,24 @@ class CachedListViewSetMixin(object):
         # 1. Check for Force Refresh (Frontend requested bypass)
         force_refresh = request.query_params.get('refresh', 'false').lower() == 'true'
         cache_key = self.get_cache_key()
-        now = time.time()
 
         if force_refresh:
             print(f"⚡ Force Refresh: Bypassing cache for {self.__class__.__name__}")
-            res = super(CachedListViewSetMixin, self).list(request, *args, **kwargs)
-            
-            # Deep-convert all nested DRF types to plain Python before caching in Redis
-            data_to_cache = deep_serialize(res.data)
-            
-            cache.set(cache_key, data_to_cache, timeout=86400)
-            self.__class__._local_cache[cache_key] = {'data': data_to_cache, 'time': now}
-            res.data = data_to_cache
-            return res
-
-        # 2. Try Local Server Memory (Fastest - 0ms)
-        local_entry = self.__class__._local_cache.get(cache_key)
-        if local_entry and (now - local_entry['time'] < 5): # 5 second burst protection
-            return response.Response(local_entry['data'])
-
-        # 3. Try Redis/Cache (Fast - 50ms)
-        cached_data = cache.get(cache_key)
-        if cached_data is not None and isinstance(cached_data, (list, dict)):
-            self.__class__._local_cache[cache_key] = {'data': cached_data, 'time': now}
-            return response.Response(cached_data)
+        else:
+            # 2. Local worker LRU (Fastest - 0ms), then Redis/Cache (Fast - 50ms): stored as JSON bytes
+            entry = list_cache.get(cache_key)
+            if entry is not None:
+                return list_cache.respond(request, entry)
         
-        # 4. DB Fallback (Slow - 500ms+)
+        # 3. DB Fallback (Slow - 500ms+)
         res = super(CachedListViewSetMixin, self).list(request, *args, **kwargs)
+        if res.status_code != 200:
+            return res
         timeout = 86400 if not isinstance(self, StudentSectionFilterMixin) else 3600
         
-        # Deep-convert all nested DRF types to plain Python before caching in Redis
-        data_to_cache = deep_serialize(res.data)
-
-        cache.set(cache_key, data_to_cache, timeout=timeout)
-        
-        # Populate local cache
-        self.__class__._local_cache[cache_key] = {'data': data_to_cache, 'time': now}
-        res.data = data_to_cache
-        return res
+        # Deep-convert all nested DRF types to plain Python, then render once to bytes
+        entry = list_cache.put(cache_key, self._cache_version_label, deep_serialize(res.data), timeout)
+        return list_cache.respond(request, entry)
 
     def perform_create(self, serializer):
         serializer.save()
@@ -251,10 +235,9 @@ class SessionViewSet(CachedListViewSetMixin, viewsets.ModelViewSet):
             if not token:
                 return response.Response({"error": "Failed to get ERP token"}, status=status.HTTP_401_UNAUTHORIZED)
 
-            resp = requests.get(
+            resp = erp_client.get(
                 f"{erp_url}/api/session/list",
-                headers={"Authorization": f"Bearer {token}"},
-                timeout=30
+                headers={"Authorization": f"Bearer {token}"}
             )
 
             if resp.status_code == 200:
@@ -308,10 +291,9 @@ class TargetExamViewSet(CachedListViewSetMixin, viewsets.ModelViewSet):
                 return response.Response({"error": "ERP Token Failed"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
             print(f"[ERP-SYNC] Fetching Exam Tags from {erp_url}/api/examTag")
-            resp = requests.get(
+            resp = erp_client.get(
                 f"{erp_url}/api/examTag",
-                headers={"Authorization": f"Bearer {token}"},
-                timeout=30
+                headers={"Authorization": f"Bearer {token}"}
             )
 
             if resp.status_code != 200:
@@ -380,10 +362,9 @@ class ClassLevelViewSet(CachedListViewSetMixin, viewsets.ModelViewSet):
             if not token:
                 return response.Response({"error": "Failed to get ERP token"}, status=status.HTTP_401_UNAUTHORIZED)
 
-            resp = requests.get(
+            resp = erp_client.get(
                 f"{erp_url}/api/class",
-                headers={"Authorization": f"Bearer {token}"},
-                timeout=30
+                headers={"Authorization": f"Bearer {token}"}
             )
 
             if resp.status_code == 200:
@@ -444,85 +425,16 @@ class ChapterViewSet(CachedListViewSetMixin, viewsets.ModelViewSet):
         return res
 
     @action(detail=False, methods=['post'], url_path='bulk-upload')
+    @runs_as_job('chapter_bulk_upload')
     def bulk_upload(self, request):
         file_obj = request.FILES.get('file')
         if not file_obj:
             return response.Response({"error": "No file provided"}, status=status.HTTP_400_BAD_REQUEST)
-            
-        try:
-            raw = file_obj.read()
-            decoded_file = None
-            used_encoding = None
-            for enc in ('utf-8-sig', 'utf-8', 'cp1252', 'latin-1'):
-                try:
-                    decoded_file = raw.decode(enc)
-                    used_encoding = enc
-                    break
-                except UnicodeDecodeError:
-                    continue
-
-            if decoded_file is None:
-                decoded_file = raw.decode('latin-1', errors='replace')
-                used_encoding = 'latin-1-replace'
 
-            logging.getLogger(__name__).info(f"chapters bulk_upload: decoded file using encoding='{used_encoding}'")
-            io_string = io.StringIO(decoded_file)
-            reader = csv.DictReader(io_string)
-            
-            created_count = 0
-            errors = []
-            
-            for row_idx, row in enumerate(reader, start=2):
-                try:
-                    name = row.get('Name', '').strip()
-                    class_name = row.get('Class Level', '').strip()
-                    subject_name = row.get('Subject', '').strip()
-                    sort_order = row.get('Sort Order', '1').strip()
-                    is_active = str(row.get('Is Active', 'true')).lower() == 'true'
-                    
-                    if not name or not class_name or not subject_name:
-                        if any(row.values()):
-                            errors.append(f"Row {row_idx}: Missing required fields (Name, Class Level, or Subject)")
-                        continue
-                        
-                    class_level = ClassLevel.objects.filter(name__iexact=class_name).first()
-                    # Fallback heuristics when exact match fails (helps with CSV variations like 'Class 7')
-                    if not class_level:
-                        # try to match by digit (e.g., 'Class 7' -> '7')
-                        digits = re.findall(r"\d+", class_name)
-                        if digits:
-                            class_level = ClassLevel.objects.filter(name__icontains=digits[0]).first()
-                        # try contains match
-                        if not class_level:
-                            class_level = ClassLevel.objects.filter(name__icontains=class_name).first()
-
-                    subject = Subject.objects.filter(name__iexact=subject_name).first()
-                    if not subject:
-                        subject = Subject.objects.filter(name__icontains=subject_name).first()
-                    
-                    if not class_level:
-                        errors.append(f"Row {row_idx}: Class '{class_name}' not found")
-                        continue
-                    if not subject:
-                        errors.append(f"Row {row_idx}: Subject '{subject_name}' not found")
-                        continue
-                        
-                    Chapter.objects.create(
-                        name=name,
-                        class_level=class_level,
-                        subject=subject,
-                        sort_order=int(sort_order) if sort_order.isdigit() else 1,
-                        is_active=is_active
-                    )
-                    created_count += 1
-                except Exception as e:
-                    errors.append(f"Row {row_idx}: {str(e)}")
-            
+        try:
+            report = import_chapters(decode_csv(file_obj, 'chapters'))
             self.clear_cache()
-            return response.Response({
-                "message": f"Successfully imported {created_count} chapters",
-                "errors": errors
-            }, status=status.HTTP_201_CREATED)
+            return response.Response(summarize(report, 'chapters'), status=status.HTTP_201_CREATED)
         except Exception as e:
             return response.Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -570,76 +482,16 @@ class TopicViewSet(CachedListViewSetMixin, viewsets.ModelViewSet):
         return res
 
     @action(detail=False, methods=['post'], url_path='bulk-upload')
+    @runs_as_job('topic_bulk_upload')
     def bulk_upload(self, request):
         file_obj = request.FILES.get('file')
         if not file_obj:
             return response.Response({"error": "No file provided"}, status=status.HTTP_400_BAD_REQUEST)
-            
-        try:
-            raw = file_obj.read()
-            decoded_file = None
-            used_encoding = None
-            for enc in ('utf-8-sig', 'utf-8', 'cp1252', 'latin-1'):
-                try:
-                    decoded_file = raw.decode(enc)
-                    used_encoding = enc
-                    break
-                except UnicodeDecodeError:
-                    continue
 
-            if decoded_file is None:
-                decoded_file = raw.decode('latin-1', errors='replace')
-                used_encoding = 'latin-1-replace'
-
-            logging.getLogger(__name__).info(f"topics bulk_upload: decoded file using encoding='{used_encoding}'")
-            io_string = io.StringIO(decoded_file)
-            reader = csv.DictReader(io_string)
-            
-            created_count = 0
-            errors = []
-            
-            for row_idx, row in enumerate(reader, start=2):
-                try:
-                    name = row.get('Name', '').strip()
-                    chapter_name = row.get('Chapter', '').strip()
-                    class_name = row.get('Class Level', '').strip()
-                    subject_name = row.get('Subject', '').strip()
-                    sort_order = row.get('Sort Order', '1').strip()
-                    is_active = str(row.get('Is Active', 'true')).lower() == 'true'
-                    
-                    if not name or not class_name or not subject_name:
-                        if any(row.values()):
-                            errors.append(f"Row {row_idx}: Missing required fields (Name, Class Level, or Subject)")
-                        continue
-                        
-                    class_level = ClassLevel.objects.filter(name__iexact=class_name).first()
-                    subject = Subject.objects.filter(name__iexact=subject_name).first()
-                    chapter = Chapter.objects.filter(name__iexact=chapter_name, subject=subject, class_level=class_level).first() if chapter_name else None
-                    
-                    if not class_level:
-                        errors.append(f"Row {row_idx}: Class '{class_name}' not found")
-                        continue
-                    if not subject:
-                        errors.append(f"Row {row_idx}: Subject '{subject_name}' not found")
-                        continue
-                        
-                    Topic.objects.create(
-                        name=name,
-                        chapter=chapter,
-                        class_level=class_level,
-                        subject=subject,
-                        sort_order=int(sort_order) if sort_order.isdigit() else 1,
-                        is_active=is_active
-                    )
-                    created_count += 1
-                except Exception as e:
-                    errors.append(f"Row {row_idx}: {str(e)}")
-            
+        try:
+            report = import_topics(decode_csv(file_obj, 'topics'))
             self.clear_cache()
-            return response.Response({
-                "message": f"Successfully imported {created_count} topics",
-                "errors": errors
-            }, status=status.HTTP_201_CREATED)
+            return response.Response(summarize(report, 'topics'), status=status.HTTP_201_CREATED)
         except Exception as e:
             return response.Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -701,67 +553,16 @@ class SubTopicViewSet(CachedListViewSetMixin, viewsets.ModelViewSet):
         return res
 
     @action(detail=False, methods=['post'], url_path='bulk-upload')
+    @runs_as_job('subtopic_bulk_upload')
     def bulk_upload(self, request):
         file_obj = request.FILES.get('file')
         if not file_obj:
             return response.Response({"error": "No file provided"}, status=status.HTTP_400_BAD_REQUEST)
-            
-        try:
-            raw = file_obj.read()
-            decoded_file = None
-            used_encoding = None
-            for enc in ('utf-8-sig', 'utf-8', 'cp1252', 'latin-1'):
-                try:
-                    decoded_file = raw.decode(enc)
-                    used_encoding = enc
-                    break
-                except UnicodeDecodeError:
-                    continue
 
-            if decoded_file is None:
-                decoded_file = raw.decode('latin-1', errors='replace')
-                used_encoding = 'latin-1-replace'
-
-            logging.getLogger(__name__).info(f"subtopics bulk_upload: decoded file using encoding='{used_encoding}'")
-            io_string = io.StringIO(decoded_file)
-            reader = csv.DictReader(io_string)
-            
-            created_count = 0
-            errors = []
-            
-            for row_idx, row in enumerate(reader, start=2):
-                try:
-                    name = row.get('Name', '').strip()
-                    topic_name = row.get('Topic', '').strip()
-                    sort_order = row.get('Sort Order', '1').strip()
-                    is_active = str(row.get('Is Active', 'true')).lower() == 'true'
-                    
-                    if not name or not topic_name:
-                        if any(row.values()):
-                            errors.append(f"Row {row_idx}: Missing required fields (Name or Topic)")
-                        continue
-                        
-                    topic = Topic.objects.filter(name__iexact=topic_name).first()
-                    
-                    if not topic:
-                        errors.append(f"Row {row_idx}: Topic '{topic_name}' not found")
-                        continue
-                        
-                    SubTopic.objects.create(
-                        name=name,
-                        topic=topic,
-                        sort_order=int(sort_order) if sort_order.isdigit() else 1,
-                        is_active=is_active
-                    )
-                    created_count += 1
-                except Exception as e:
-                    errors.append(f"Row {row_idx}: {str(e)}")
-            
+        try:
+            report = import_subtopics(decode_csv(file_obj, 'subtopics'))
             self.clear_cache()
-            return response.Response({
-                "message": f"Successfully imported {created_count} sub-topics",
-                "errors": errors
-            }, status=status.HTTP_201_CREATED)
+            return response.Response(summarize(report, 'sub-topics'), status=status.HTTP_201_CREATED)
         except Exception as e:
             return response.Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -0,0 +1,231 @@
+"""
+Page pipeline for ExtractAIView (AI question extraction from PDFs / images).
+
+The view used to render every page to a PNG up front, keep all of them in
+memory and call Gemini page by page inside the request thread. Here pages
+are rendered lazily and handed to a small pool of extraction workers:
+
+    for result in extract_pages(source, model, workers=4):
+        ...                              # PageResult, in completion order
+
+At most `workers + 1` rendered pages exist at once (one waiting while the
+others are with the model), so peak memory is the same for a 4-page and a
+400-page paper. PyMuPDF isn't thread-safe, so rendering stays on the calling
+thread; workers only call the model (under the 'extract' Gemini rate
+limit, api/ai_limiter.py), parse its JSON and crop diagrams.
+Diagram crops are uploaded to storage from the workers and their
+QuestionImage rows are created in one bulk insert at the end
+(save_diagrams).
+
+extract_pages() takes the model as an argument, so the pipeline can be
+exercised and benchmarked offline with a stub (scripts/bench_extract_ai.py).
+"""
+import io
+import json
+import os
+import re
+import uuid
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import PIL.Image
+
+from api import ai_limiter
+
+RENDER_DPI = 150
+EXTRACT_WORKERS = int(os.getenv('EXTRACT_AI_WORKERS', '4'))
+DIAGRAM_PADDING = 40
+
+PROMPT = """
+            You are an AI assistant parsing exam questions.
+            Look at the uploaded image. It may contain one or MORE multiple-choice questions.
+            Extract EVERY question text, its options, and its correct answer if visible.
+
+            CRITICAL: Keep the solution concise and to the point. DO NOT repeat the final answer or sentences multiple times.
+
+            CRITICAL: For ANY mathematical equations, formulas, fractions, subscripts, superscripts, or special symbols, you MUST format them using standard LaTeX mathematical notation wrapped in $ for inline math (e.g., $x^2 + y^2 = r^2$) or $$ for block math.
+            BECAUSE you are returning JSON, you MUST double-escape all backslashes in your LaTeX so the JSON is valid. For example, you must output "\\\\frac{n-1}{a_1a_{n+1}}" instead of "\\frac{n-1}{a_1a_{n+1}}". Do NOT output raw text like (n-1)/(a1an+1).
+
+            If there is a detailed solution, a step-by-step explanation, OR ANY short reference text (e.g. "NCERT XII Page No 7") provided for the question after the answer, extract ALL of it into the "solution" field, ensuring ALL mathematical steps are properly formatted in LaTeX with double-escaped backslashes.
+
+            If a question contains a diagram, chart, or icon, you must provide its bounding box coordinates in the format [ymin, xmin, ymax, xmax].
+            The coordinates MUST be integers between 0 and 1000, representing the relative position in the image.
+            If there is no diagram for a question, set "diagramBox" to null.
+
+            Return ONLY a valid JSON ARRAY of objects in this exact structure without markdown formatting or code blocks:
+            [
+              {
+                "question": "Question text here with $math$...",
+                "options": ["$Option A$", "Option B", "Option C", "Option D"],
+                "correctAnswer": "A",
+                "solution": "Detailed step-by-step explanation with $$math$$ here...",
+                "diagramBox": [200, 100, 400, 300]
+              },
+              ...
+            ]
+            """
+
+# questions: parsed list; diagrams: [(question index, storage name)]; error: str or None
+PageResult = namedtuple('PageResult', 'index questions diagrams raw_text error')
+
+
+# ── Models ────────────────────────────────────────────────────────────────────
+
+def get_model(api_key):
+    import google.generativeai as genai
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(
+        'gemini-2.5-flash',
+        generation_config=genai.GenerationConfig(
+            response_mime_type="application/json",
+            temperature=0.4
+        )
+    )
+
+
+# ── Pages ─────────────────────────────────────────────────────────────────────
+
+class PageSource:
+    """An uploaded PDF (rendered a page at a time) or a single image."""
+
+    def __init__(self, file_obj):
+        filename = file_obj.name.lower() if file_obj.name else ''
+        self._doc = None
+        self._image = None
+        if filename.endswith('.pdf') or file_obj.content_type == 'application/pdf':
+            import fitz  # PyMuPDF
+            # Large uploads are already on disk; don't copy them into memory
+            if hasattr(file_obj, 'temporary_file_path'):
+                self._doc = fitz.open(file_obj.temporary_file_path())
+            else:
+                self._doc = fitz.open(stream=file_obj.read(), filetype="pdf")
+        else:
+            self._image = PIL.Image.open(io.BytesIO(file_obj.read()))
+            self._image.load()
+
+    def __len__(self):
+        return len(self._doc) if self._doc is not None else 1
+
+    def __iter__(self):
+        if self._doc is None:
+            yield 0, self._image
+            return
+        for page_num in range(len(self._doc)):
+            pix = self._doc.load_page(page_num).get_pixmap(dpi=RENDER_DPI)
+            image = PIL.Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+            del pix
+            yield page_num, image
+
+    def close(self):
+        if self._doc is not None:
+            self._doc.close()
+
+
+def parse_model_json(raw_text):
+    """The model's JSON array, after repairing the formatting slips it commonly makes."""
+    raw_text = raw_text.strip()
+    if raw_text.startswith("```json"):
+        raw_text = raw_text.replace("```json", "", 1).replace("```", "")
+    elif raw_text.startswith("```"):
+        raw_text = raw_text.replace("```", "", 1).replace("```", "")
+
+    # Add missing comma between string values and the next key
+    raw_text = re.sub(r'("\s*)\n\s*(?="[a-zA-Z0-9_]+"\s*:)', r'\1,\n', raw_text)
+    # Add missing comma between null/numbers/booleans and the next key
+    raw_text = re.sub(r'(null|true|false|\d+)\s*\n\s*(?="[a-zA-Z0-9_]+"\s*:)', r'\1,\n', raw_text)
+    # Add missing comma between closing brackets and the next key
+    raw_text = re.sub(r'([\]}])\s*\n\s*(?="[a-zA-Z0-9_]+"\s*:)', r'\1,\n', raw_text)
+    # Add missing comma between objects in array
+    raw_text = re.sub(r'}\s*\n\s*\{', '},\n{', raw_text)
+
+    return json.loads(raw_text.strip())
+
+
+def _crop_diagram(image, box):
+    ymin, xmin, ymax, xmax = box
+    width, height = image.size
+    left = max(0, (xmin / 1000.0) * width - DIAGRAM_PADDING)
+    top = max(0, (ymin / 1000.0) * height - DIAGRAM_PADDING)
+    right = min(width, (xmax / 1000.0) * width + DIAGRAM_PADDING)
+    bottom = min(height, (ymax / 1000.0) * height + DIAGRAM_PADDING)
+    img_io = io.BytesIO()
+    image.crop((left, top, right, bottom)).save(img_io, format='PNG')
+    return img_io.getvalue()
+
+
+def _store_diagram(png_bytes):
+    """Upload a crop with QuestionImage's storage settings; returns the stored name."""
+    from django.core.files.base import ContentFile
+    from .models import QuestionImage
+
+    field = QuestionImage._meta.get_field('image')
+    name = field.generate_filename(None, f"diagram_{uuid.uuid4().hex[:8]}.png")
+    return field.storage.save(name, ContentFile(png_bytes))
+
+
+def extract_page(model, index, image, store_diagram=_store_diagram):
+    """Model call, JSON parse and diagram upload for one page (runs on a worker)."""
+    raw_text = ''
+    try:
+        with ai_limiter.admit('extract'):
+            raw_text = model.generate_content([PROMPT, image]).text.strip()
+        questions = parse_model_json(raw_text)
+        diagrams = []
+        for q_index, q in enumerate(questions):
+            box = q.pop("diagramBox", None)
+            if box and isinstance(box, list) and len(box) == 4:
+                diagrams.append((q_index, store_diagram(_crop_diagram(image, box))))
+        return PageResult(index, questions, diagrams, raw_text, None)
+    except ai_limiter.RateLimited:
+        raise  # the whole extraction stops with a 429, not a page error
+    except Exception as e:
+        return PageResult(index, [], [], raw_text, str(e))
+    finally:
+        image.close()
+
+
+# ── Pipeline ──────────────────────────────────────────────────────────────────
+
+def extract_pages(source, model, workers=EXTRACT_WORKERS, extract=extract_page):
+    """
+    Yield a PageResult per page as each one completes. Pages are rendered only
+    when a worker is about to be free. Closing the generator early (e.g. on a
+    page error) cancels the pages not yet started.
+    """
+    workers = max(1, workers)
+    pages = iter(source)
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='extract')
+    pending = set()
+    try:
+        exhausted = False
+        while True:
+            # back-pressure: one rendered page waiting on top of the ones being extracted
+            while not exhausted and len(pending) <= workers:
+                page = next(pages, None)
+                if page is None:
+                    exhausted = True
+                    break
+                pending.add(executor.submit(extract, model, *page))
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def save_diagrams(results, build_url):
+    """Create the QuestionImage rows for every crop in one insert and set diagramUrl."""
+    from .models import QuestionImage
+
+    crops = [(result, q_index, name) for result in results for q_index, name in result.diagrams]
+    if not crops:
+        return
+    QuestionImage.objects.bulk_create([QuestionImage(image=name) for _, _, name in crops])
+    storage = QuestionImage._meta.get_field('image').storage
+    for result, q_index, name in crops:
+        result.questions[q_index]["diagramUrl"] = build_url(storage.url(name))
+
@@ -0,0 +1,210 @@
+"""
+Cursor-paginated, projected question listing straight from Mongo.
+
+GET /api/questions/ with any of `cursor`, `limit`, `fields` or
+`include_total` skips the ORM and reads `questions_question` with PyMongo:
+
+    ?chapter=12&limit=100&fields=id,content,question_type,difficulty_level
+
+  - pages are ordered by `_id` descending (ObjectIds grow with insertion
+    time, so this matches the old `-created_at` order) and continue from an
+    opaque `next_cursor` token,
+  - `fields=` becomes a Mongo projection, so solution HTML, options and
+    image URLs are never read unless asked for,
+  - `include_total=true` adds a `total`: the collection's estimated count
+    when unfiltered, else a count_documents() that stops at COUNT_CAP and
+    COUNT_TIMEOUT_MS, cached briefly. `total_approximate` is true when the
+    count hit the cap (`total` is then a lower bound) or timed out (`total`
+    is then null).
+
+Without those parameters the endpoint keeps returning the full serialized
+list, which existing screens rely on.
+"""
+import base64
+import hashlib
+import json
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.core.cache import cache
+from pymongo.errors import OperationFailure
+
+from .models import Question
+from .serializers import QuestionSerializer
+
+COLLECTION = 'questions_question'
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+TOTAL_CACHE_SECONDS = 300
+COUNT_CAP = 10000
+COUNT_TIMEOUT_MS = 2000
+# a timed-out count is remembered briefly so repeated pages don't each wait it out
+TIMEOUT_CACHE_SECONDS = 60
+
+PAGINATION_PARAMS = ('cursor', 'limit', 'fields', 'include_total')
+
+# query param -> FK column (the same filters QuestionViewSet.get_queryset applies)
+FK_FILTERS = {
+    'subject': 'subject_id',
+    'topic': 'topic_id',
+    'class_level': 'class_level_id',
+    'exam_type': 'exam_type_id',
+    'target_exam': 'target_exam_id',
+    'test_name': 'test_name_id',
+    'chapter': 'chapter_id',
+}
+
+
+class ListingError(ValueError):
+    pass
+
+
+def wants_cursor_listing(params):
+    return any(p in params for p in PAGINATION_PARAMS)
+
+
+def _serializer_columns():
+    """Serializer field name -> (model attname, Mongo column)."""
+    out = {}
+    for f in Question._meta.concrete_fields:
+        name = 'id' if f.primary_key else f.name
+        out[name] = (f.attname, f.column)
+    return {name: out[name] for name in QuestionSerializer.Meta.fields if name in out}
+
+
+COLUMNS = _serializer_columns()
+
+
+def _id_value(val):
+    # master data uses integer primary keys; keep anything else as sent
+    return int(val) if str(val).isdigit() else val
+
+
+def mongo_filter(params):
+    query = {}
+    for param, column in FK_FILTERS.items():
+        val = params.get(param)
+        if not val:
+            continue
+        query[column] = None if val.lower() == 'null' else _id_value(val)
+
+    exam_type_name = params.get('exam_type_name')
+    if exam_type_name:
+        if exam_type_name.lower() == 'null':
+            query['exam_type_id'] = None
+        else:
+            from master_data.models import ExamType
+            ids = list(ExamType.objects.filter(name__iexact=exam_type_name).values_list('pk', flat=True))
+            query['exam_type_id'] = {'$in': ids}
+
+    is_wrong = params.get('is_wrong')
+    if is_wrong:
+        query['is_wrong'] = None if is_wrong.lower() == 'null' else is_wrong.lower() == 'true'
+
+    difficulty = params.get('difficulty_level')
+    if difficulty:
+        query['difficulty_level'] = difficulty
+    return query
+
+
+def encode_cursor(oid):
+    return base64.urlsafe_b64encode(oid.binary).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        return ObjectId(raw)
+    except (ValueError, TypeError, InvalidId):
+        raise ListingError("Invalid cursor")
+
+
+def parse_fields(value):
+    """`fields=` -> list of serializer field names (all of them when absent)."""
+    if not value:
+        return list(COLUMNS)
+    names = [n.strip() for n in value.split(',') if n.strip()]
+    unknown = [n for n in names if n not in COLUMNS]
+    if unknown:
+        raise ListingError(f"Unknown fields: {', '.join(unknown)}")
+    if 'id' not in names:
+        names.insert(0, 'id')
+    return names
+
+
+def parse_limit(value):
+    if not value:
+        return DEFAULT_LIMIT
+    try:
+        return max(1, min(int(value), MAX_LIMIT))
+    except ValueError:
+        raise ListingError("limit must be an integer")
+
+
+def _to_instance(doc, names):
+    attrs = {}
+    for name in names:
+        attname, column = COLUMNS[name]
+        value = doc.get(column)
+        if name == 'question_options':
+            # Django's JSONField is stored as a JSON string through Djongo
+            if isinstance(value, str):
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    value = []
+            value = value or []
+        attrs[attname] = value
+    return Question(**attrs)
+
+
+def estimated_total(coll, query):
+    """(total, approximate) for the filter; total is None when the count timed out."""
+    if not query:
+        return coll.estimated_document_count(), False
+    digest = hashlib.md5(json.dumps(query, sort_keys=True, default=str).encode()).hexdigest()
+    cache_key = f"question_listing_total_v2_{digest}"
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return tuple(cached)
+    try:
+        total = coll.count_documents(query, limit=COUNT_CAP, maxTimeMS=COUNT_TIMEOUT_MS)
+    except OperationFailure as e:
+        # ExecutionTimeout (maxTimeMS exceeded) is an OperationFailure too
+        print(f"[QUESTION LISTING] Count skipped for {query}: {e}")
+        cache.set(cache_key, (None, True), TIMEOUT_CACHE_SECONDS)
+        return None, True
+    result = (total, total >= COUNT_CAP)
+    cache.set(cache_key, result, TOTAL_CACHE_SECONDS)
+    return result
+
+
+def list_page(db, params, context=None):
+    """One page of questions as {"results", "next_cursor"[, "total"]}."""
+    names = parse_fields(params.get('fields'))
+    limit = parse_limit(params.get('limit'))
+    query = mongo_filter(params)
+    coll = db[COLLECTION]
+
+    page_query = dict(query)
+    cursor = params.get('cursor')
+    if cursor:
+        page_query['_id'] = {'$lt': decode_cursor(cursor)}
+
+    projection = {COLUMNS[n][1]: 1 for n in names}
+    docs = list(coll.find(page_query, projection).sort('_id', -1).limit(limit + 1))
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+
+    serializer = QuestionSerializer([_to_instance(d, names) for d in docs], many=True, context=context or {})
+    for name in list(serializer.child.fields):
+        if name not in names:
+            serializer.child.fields.pop(name)
+
+    body = {
+        'results': serializer.data,
+        'next_cursor': encode_cursor(docs[-1]['_id']) if has_more else None,
+    }
+    if str(params.get('include_total', '')).lower() == 'true':
+        body['total'], body['total_approximate'] = estimated_total(coll, query)
+    return body
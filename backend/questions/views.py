@@ -6,20 +6,20 @@ from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from .models import Question, QuestionImage
 from .serializers import QuestionSerializer, QuestionImageSerializer
+from .listing import wants_cursor_listing, list_page, ListingError
 from master_data.models import ClassLevel, Subject, Topic, ExamType, TargetExam
 from bson import ObjectId
 import csv
 import io
 import os
 import json
-import uuid
 from datetime import timedelta
-import fitz  # PyMuPDF
-import PIL.Image
-import google.generativeai as genai
-from django.core.files.base import ContentFile
 from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser
+from django.http import StreamingHttpResponse
+from api.jobs import runs_as_job, report_progress, wants_async
+from api import ai_limiter
+from . import extraction
 
 class QuestionPagination(pagination.PageNumberPagination):
     page_size = 20
@@ -63,6 +63,20 @@ class QuestionViewSet(viewsets.ModelViewSet):
 
         return queryset.order_by('-created_at')
 
+    def list(self, request, *args, **kwargs):
+        # Opt-in cursor pagination + projection (see questions/listing.py)
+        if not wants_cursor_listing(request.query_params):
+            return super().list(request, *args, **kwargs)
+
+        from api.db_utils import get_db
+        db = get_db()
+        if db is None:
+            return super().list(request, *args, **kwargs)
+        try:
+            return Response(list_page(db, request.query_params, self.get_serializer_context()))
+        except ListingError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
     def get_object(self):
         """
         Override get_object to explicitly handle ObjectId conversion which Djongo sometimes misses in ViewSets.
@@ -283,6 +297,7 @@ class QuestionViewSet(viewsets.ModelViewSet):
             return Response({"error": str(e)}, status=500)
 
     @action(detail=False, methods=['post'], url_path='bulk-upload')
+    @runs_as_job('question_bulk_upload')
     def bulk_upload(self, request):
         file_obj = request.FILES.get('file')
         if not file_obj:
@@ -298,6 +313,7 @@ class QuestionViewSet(viewsets.ModelViewSet):
             errors = []
             
             for row_idx, row in enumerate(reader, start=2):
+                report_progress(done=row_idx - 1, created=created_count, errors=len(errors))
                 try:
                     if not row or len(row) < 18:
                         if any(row):
@@ -417,6 +433,7 @@ class ExtractAIView(APIView):
     parser_classes = (MultiPartParser, FormParser)
     permission_classes = [permissions.IsAuthenticated]
 
+    @runs_as_job('extract_ai')
     def post(self, request, *args, **kwargs):
         try:
             file_obj = request.FILES.get('file')
@@ -427,128 +444,42 @@ class ExtractAIView(APIView):
             if not api_key:
                 return Response({"status": "error", "message": "GEMINI_API_KEY not configured"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel(
-                'gemini-2.5-flash',
-                generation_config=genai.GenerationConfig(
-                    response_mime_type="application/json",
-                    temperature=0.4
-                )
-            )
-
-            file_bytes = file_obj.read()
-            images_to_process = []
-            filename = file_obj.name.lower() if file_obj.name else ''
+            model = extraction.get_model(api_key)
 
             try:
-                if filename.endswith('.pdf') or file_obj.content_type == 'application/pdf':
-                    doc = fitz.open(stream=file_bytes, filetype="pdf")
-                    for page_num in range(len(doc)):
-                        page = doc.load_page(page_num)
-                        pix = page.get_pixmap(dpi=150)
-                        img_bytes = pix.tobytes("png")
-                        images_to_process.append(PIL.Image.open(io.BytesIO(img_bytes)))
-                    doc.close()
-                else:
-                    images_to_process.append(PIL.Image.open(io.BytesIO(file_bytes)))
+                source = extraction.PageSource(file_obj)
             except Exception as e:
                 return Response({"status": "error", "message": f"Failed to parse file: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
 
-            all_questions = []
-            raw_texts = []
-
-            prompt = """
-            You are an AI assistant parsing exam questions.
-            Look at the uploaded image. It may contain one or MORE multiple-choice questions.
-            Extract EVERY question text, its options, and its correct answer if visible.
-            
-            CRITICAL: Keep the solution concise and to the point. DO NOT repeat the final answer or sentences multiple times.
-            
-            CRITICAL: For ANY mathematical equations, formulas, fractions, subscripts, superscripts, or special symbols, you MUST format them using standard LaTeX mathematical notation wrapped in $ for inline math (e.g., $x^2 + y^2 = r^2$) or $$ for block math.
-            BECAUSE you are returning JSON, you MUST double-escape all backslashes in your LaTeX so the JSON is valid. For example, you must output "\\\\frac{n-1}{a_1a_{n+1}}" instead of "\\frac{n-1}{a_1a_{n+1}}". Do NOT output raw text like (n-1)/(a1an+1).
-            
-            If there is a detailed solution, a step-by-step explanation, OR ANY short reference text (e.g. "NCERT XII Page No 7") provided for the question after the answer, extract ALL of it into the "solution" field, ensuring ALL mathematical steps are properly formatted in LaTeX with double-escaped backslashes.
-            
-            If a question contains a diagram, chart, or icon, you must provide its bounding box coordinates in the format [ymin, xmin, ymax, xmax].
-            The coordinates MUST be integers between 0 and 1000, representing the relative position in the image.
-            If there is no diagram for a question, set "diagramBox" to null.
-            
-            Return ONLY a valid JSON ARRAY of objects in this exact structure without markdown formatting or code blocks:
-            [
-              {
-                "question": "Question text here with $math$...",
-                "options": ["$Option A$", "Option B", "Option C", "Option D"],
-                "correctAnswer": "A",
-                "solution": "Detailed step-by-step explanation with $$math$$ here...",
-                "diagramBox": [200, 100, 400, 300]
-              },
-              ...
-            ]
-            """
-
-            for idx, image in enumerate(images_to_process):
-                image_width, image_height = image.size
-                try:
-                    response = model.generate_content([prompt, image])
-                    raw_text = response.text.strip()
-                    raw_texts.append(f"--- PAGE {idx + 1} ---\n{raw_text}")
-                    
-                    if raw_text.startswith("```json"):
-                        raw_text = raw_text.replace("```json", "", 1).replace("```", "")
-                    elif raw_text.startswith("```"):
-                        raw_text = raw_text.replace("```", "", 1).replace("```", "")
-                        
-                    import re
-                    # Add missing comma between string values and the next key
-                    raw_text = re.sub(r'("\s*)\n\s*(?="[a-zA-Z0-9_]+"\s*:)', r'\1,\n', raw_text)
-                    # Add missing comma between null/numbers/booleans and the next key
-                    raw_text = re.sub(r'(null|true|false|\d+)\s*\n\s*(?="[a-zA-Z0-9_]+"\s*:)', r'\1,\n', raw_text)
-                    # Add missing comma between closing brackets and the next key
-                    raw_text = re.sub(r'([\]}])\s*\n\s*(?="[a-zA-Z0-9_]+"\s*:)', r'\1,\n', raw_text)
-                    # Add missing comma between objects in array
-                    raw_text = re.sub(r'}\s*\n\s*\{', '},\n{', raw_text)
-                    
-                    questions = json.loads(raw_text.strip())
-                    
-                    for q in questions:
-                        box = q.get("diagramBox")
-                        if box and isinstance(box, list) and len(box) == 4:
-                            ymin, xmin, ymax, xmax = box
-                            left = (xmin / 1000.0) * image_width
-                            top = (ymin / 1000.0) * image_height
-                            right = (xmax / 1000.0) * image_width
-                            bottom = (ymax / 1000.0) * image_height
-                            
-                            padding = 40
-                            left = max(0, left - padding)
-                            top = max(0, top - padding)
-                            right = min(image_width, right + padding)
-                            bottom = min(image_height, bottom + padding)
-                            
-                            cropped_img = image.crop((left, top, right, bottom))
-                            img_io = io.BytesIO()
-                            cropped_img.save(img_io, format='PNG')
-                            img_io.seek(0)
-                            
-                            unique_filename = f"diagram_{uuid.uuid4().hex[:8]}.png"
-                            q_image = QuestionImage.objects.create(image=ContentFile(img_io.read(), name=unique_filename))
-                            
-                            # Use build_absolute_uri to provide full path to frontend
-                            q["diagramUrl"] = request.build_absolute_uri(q_image.image.url)
-                        
-                        if "diagramBox" in q:
-                            del q["diagramBox"]
-
-                    all_questions.extend(questions)
-                    
-                except Exception as e:
-                    import traceback
-                    tb = traceback.format_exc()
-                    with open("extract_error.log", "w") as f:
-                        f.write(f"Error on page {idx+1}:\n{str(e)}\n\n{tb}\n\nRAW TEXT:\n{raw_text}")
-                    return Response({"status": "error", "message": f"Error on page {idx + 1}: {str(e)}", "traceback": tb}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            if request.query_params.get('stream') in ('1', 'true') and not wants_async(request):
+                # NDJSON: one line per page as it completes, then a final summary line
+                response = StreamingHttpResponse(self._stream_pages(request, source, model), content_type='application/x-ndjson')
+                response['Cache-Control'] = 'no-cache'
+                response['X-Accel-Buffering'] = 'no'
+                return response
+
+            # Pages are extracted concurrently (see questions/extraction.py); the answer keeps page order
+            results = []
+            total = len(source)
+            pages = extraction.extract_pages(source, model)
+            try:
+                for result in pages:
+                    if result.error:
+                        pages.close()  # stop rendering / cancel the pages not started yet
+                        self._log_page_error(result)
+                        return Response({"status": "error", "message": f"Error on page {result.index + 1}: {result.error}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                    results.append(result)
+                    report_progress(done=len(results), total=total, questions=sum(len(r.questions) for r in results))
+            finally:
+                source.close()
+
+            results.sort(key=lambda r: r.index)
+            extraction.save_diagrams(results, request.build_absolute_uri)
+            all_questions = [q for r in results for q in r.questions]
 
             return Response({"status": "success", "data": all_questions})
+        except ai_limiter.RateLimited as e:
+            return ai_limiter.too_many_requests(e, status="error", message="AI rate limit reached, please retry shortly")
         except Exception as e:
             import traceback
             tb = traceback.format_exc()
@@ -557,6 +488,33 @@ class ExtractAIView(APIView):
             return Response({"status": "error", "message": str(e), "traceback": tb}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+    def _stream_pages(self, request, source, model):
+        total = len(source)
+        done = questions = 0
+        pages = extraction.extract_pages(source, model)
+        try:
+            for result in pages:
+                if result.error:
+                    pages.close()
+                    self._log_page_error(result)
+                    yield json.dumps({"status": "error", "page": result.index + 1, "message": f"Error on page {result.index + 1}: {result.error}"}) + "\n"
+                    return
+                # Diagram rows per page here, so each line already carries its diagramUrls
+                extraction.save_diagrams([result], request.build_absolute_uri)
+                done += 1
+                questions += len(result.questions)
+                yield json.dumps({"page": result.index + 1, "done": done, "total": total, "data": result.questions}) + "\n"
+            yield json.dumps({"status": "success", "pages": total, "questions": questions}) + "\n"
+        except ai_limiter.RateLimited as e:
+            yield json.dumps({"status": "error", "message": "AI rate limit reached, please retry shortly", "retry_after": e.retry_after}) + "\n"
+        finally:
+            source.close()
+
+    def _log_page_error(self, result):
+        with open("extract_error.log", "w") as f:
+            f.write(f"Error on page {result.index + 1}:\n{result.error}\n\nRAW TEXT:\n{result.raw_text}")
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class QuestionImageViewSet(viewsets.ModelViewSet):
     queryset = QuestionImage.objects.all()
@@ -0,0 +1,93 @@
+"""
+Exercise the Gemini response cache (api/ai_cache.py) with a stub model.
+
+No Gemini key or network needed: StubModel sleeps for a configurable
+latency and counts its calls. Two scenarios:
+
+    burst    --threads identical requests at once -> expect 1 upstream call
+    repeat   --students requests spread over --prompts distinct prompts
+             -> expect --prompts upstream calls, the rest hits
+
+Entries use the 'bench' feature and a per-run nonce, in the configured
+shared cache only (AI_CACHE_PERSIST=0, so nothing is written to Mongo).
+Run from backend/:
+
+    python scripts/bench_ai_cache.py --threads 50 --students 500 --prompts 20 --latency 3
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+os.environ['AI_CACHE_PERSIST'] = '0'
+
+import django
+django.setup()
+
+from api import ai_cache
+
+MODEL = 'stub-model'
+
+
+class StubModel:
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        return json.dumps({'answer': f"stub answer for {len(prompt)} chars"})
+
+
+def ask(model, prompt):
+    return ai_cache.generate('bench', MODEL, [prompt], lambda: model.generate_content(prompt), parse=json.loads)
+
+
+def burst(model, nonce, threads):
+    prompt = f"[{nonce}] Generate 20 MCQs on Electrostatics, toughness MEDIUM"
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        states = list(pool.map(lambda _: ask(model, prompt)[1], range(threads)))
+    elapsed = time.perf_counter() - started
+    print(f"burst   requests={threads:<5} upstream_calls={model.calls:<3} time={elapsed:6.2f}s  "
+          f"states={ {s: states.count(s) for s in set(states)} }")
+
+
+def repeat(model, nonce, students, prompts, threads):
+    before = model.calls
+    # formatting differences (whitespace) must not create new entries
+    requests = [f"[{nonce}]   Insights for profile {n % prompts}\n" + " " * (n % 3) for n in range(students)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda p: ask(model, p), requests))
+    elapsed = time.perf_counter() - started
+    print(f"repeat  requests={students:<5} upstream_calls={model.calls - before:<3} time={elapsed:6.2f}s  "
+          f"(uncached: ~{students * model.latency:.0f}s of model time)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=50)
+    parser.add_argument('--students', type=int, default=500)
+    parser.add_argument('--prompts', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=2.0)
+    args = parser.parse_args()
+
+    model = StubModel(args.latency)
+    nonce = uuid.uuid4().hex[:8]
+    burst(model, nonce, args.threads)
+    repeat(model, nonce, args.students, args.prompts, args.threads)
+    print(json.dumps(ai_cache.stats(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Simulate Gemini traffic through the rate limiter (api/ai_limiter.py) on a
+fake clock, with a stub model: no Redis, Gemini key or real waiting.
+
+Each simulated second, students open insights (LOW priority), send chat
+messages (HIGH) and an admin extraction submits pages (HIGH, own share).
+Calls that can't get a token within their feature's max_wait are refused
+with a retry-after, exactly as the views would answer 429. Prints admitted /
+refused per feature and the model calls per minute, to check that insights
+bursts can't starve chat and extraction can't take the whole quota.
+Run from backend/:
+
+    python scripts/bench_ai_limiter.py --seconds 300 --rpm 120 --insights 5 --chat 1 --extract 2
+"""
+import argparse
+import heapq
+import os
+import random
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import ai_limiter
+
+
+class Retry(Exception):
+    def __init__(self, seconds):
+        super().__init__(seconds)
+        self.seconds = seconds
+
+
+def _reschedule(seconds):
+    raise Retry(seconds)
+
+
+class StubModel:
+    def __init__(self, clock):
+        self.clock = clock
+        self.calls = []
+
+    def generate_content(self, prompt):
+        self.calls.append(self.clock())
+        return 'ok'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=int, default=300)
+    parser.add_argument('--rpm', type=float, default=120)
+    parser.add_argument('--burst', type=float, default=20)
+    parser.add_argument('--insights', type=float, default=5, help="insights requests per second")
+    parser.add_argument('--chat', type=float, default=1, help="chat messages per second")
+    parser.add_argument('--extract', type=float, default=2, help="extraction pages per second")
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    clock = ai_limiter.FakeClock()
+    limiter = ai_limiter.Limiter(rpm=args.rpm, burst=args.burst, buckets=False, clock=clock, sleep=_reschedule)
+    model = StubModel(clock)
+    admitted, refused, waited = Counter(), Counter(), Counter()
+    start = clock()
+
+    # Poisson arrivals for the whole run; a call that has to wait for a token is
+    # put back on the timeline instead of sleeping, so concurrent callers don't
+    # hold each other up the way a single thread would
+    events = []
+    seq = 0
+    for feature, rate in (('insights', args.insights), ('chat', args.chat), ('extract', args.extract)):
+        t = 0.0
+        while rate > 0:
+            t += random.expovariate(rate)
+            if t >= args.seconds:
+                break
+            seq += 1
+            heapq.heappush(events, (start + t, seq, feature, start + t))
+
+    while events:
+        at, n, feature, arrived = heapq.heappop(events)
+        clock.sleep(at - clock())
+        max_wait = ai_limiter.FEATURES[feature].max_wait
+        try:
+            with limiter.admit(feature):
+                model.generate_content(feature)
+            admitted[feature] += 1
+            waited[feature] += at - arrived
+        except Retry as r:
+            if at + r.seconds - arrived > max_wait:
+                refused[feature] += 1
+            else:
+                heapq.heappush(events, (at + r.seconds, n, feature, arrived))
+        except ai_limiter.RateLimited:
+            refused[feature] += 1
+
+    elapsed_min = max(clock() - start, 1) / 60
+    print(f"{'feature':<10} {'offered':>8} {'admitted':>9} {'refused':>8} {'admitted/min':>13} {'avg wait':>9}")
+    for feature in ('chat', 'extract', 'insights'):
+        offered = admitted[feature] + refused[feature]
+        avg_wait = waited[feature] / admitted[feature] if admitted[feature] else 0.0
+        print(f"{feature:<10} {offered:>8} {admitted[feature]:>9} {refused[feature]:>8} "
+              f"{admitted[feature] / elapsed_min:>13.1f} {avg_wait:>8.2f}s")
+    print(f"model calls/min: {len(model.calls) / elapsed_min:.1f} (limit {args.rpm:.0f})")
+    print(limiter.stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Time-to-first-byte of the AI tutor chat reply, streamed vs blocking, against
+an offline stub chat model (StubChatModel below, patched in for
+api/gemini_views.py's _chat_model).
+
+    blocking   ai_cache.generate(...) -> the whole reply, as the plain endpoint
+    stream     _stream_chat_reply(...) -> NDJSON lines, as ?stream=1
+
+Each request uses a fresh message so every reply is a cache miss, then one
+repeated message shows a streamed cache hit. Replies are cached in the
+configured shared cache only (AI_CACHE_PERSIST=0). Run from backend/:
+
+    python scripts/bench_chat_stream.py --requests 20 --threads 10 --token-latency 0.03
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+os.environ['AI_CACHE_PERSIST'] = '0'
+# measure the model path, not the Gemini quota (api/ai_limiter.py)
+os.environ.setdefault('GEMINI_RPM', '100000')
+os.environ.setdefault('GEMINI_BURST', '1000')
+
+import django
+django.setup()
+
+from api import ai_cache, gemini_views
+
+SYSTEM = "You are the Personal AI Academic Coach (bench)."
+
+_StubText = namedtuple('StubText', 'text')  # a stub response or streamed chunk
+
+
+class StubChatModel:
+    """
+    Offline stand-in for the chat model: the classifier says ALLOWED and
+    replies are a canned answer sent a word at a time, after a first-token
+    delay and then token_latency seconds per word.
+    """
+
+    def __init__(self, first_token_latency=0.3, token_latency=0.03, words=150):
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.words = words
+
+    def generate_content(self, prompt):
+        time.sleep(self.first_token_latency)
+        return _StubText("ALLOWED")
+
+    def start_chat(self, history=None):
+        return self
+
+    def send_message(self, message, stream=False):
+        chunks = self._chunks()
+        if stream:
+            return chunks
+        return _StubText(''.join(c.text for c in chunks))
+
+    def _chunks(self):
+        time.sleep(self.first_token_latency)
+        for n in range(self.words):
+            if n:
+                time.sleep(self.token_latency * random.uniform(0.5, 1.5))
+            yield _StubText(f"word{n + 1} ")
+
+
+def blocking(message):
+    started = time.perf_counter()
+
+    def send():
+        chat = gemini_views._chat_model('', SYSTEM).start_chat(history=[])
+        return chat.send_message(message).text
+
+    ai_cache.generate('chat', gemini_views.CHAT_MODEL, [message], send, system_instruction=SYSTEM, history=[])
+    elapsed = time.perf_counter() - started
+    return elapsed, elapsed
+
+
+def streamed(message):
+    started = time.perf_counter()
+    first = None
+    for _ in gemini_views._stream_chat_reply('', SYSTEM, [], message):
+        if first is None:
+            first = time.perf_counter() - started
+    return first, time.perf_counter() - started
+
+
+def report(label, timings):
+    ttfb = sorted(t[0] for t in timings)
+    total = sorted(t[1] for t in timings)
+    p95 = ttfb[max(0, int(len(ttfb) * 0.95) - 1)]
+    print(f"{label:<10} requests={len(timings):<4} ttfb p50={statistics.median(ttfb):6.3f}s p95={p95:6.3f}s  "
+          f"complete p50={statistics.median(total):6.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--threads', type=int, default=10)
+    parser.add_argument('--token-latency', type=float, default=0.03, help="Stub delay per word (seconds)")
+    args = parser.parse_args()
+    gemini_views._chat_model = lambda api_key, system_instruction=None: StubChatModel(token_latency=args.token_latency)
+
+    nonce = uuid.uuid4().hex[:8]
+    for label, run in (('blocking', blocking), ('stream', streamed)):
+        messages = [f"[{nonce}:{label}] Explain Gauss's law, question {n}" for n in range(args.requests)]
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            report(label, list(pool.map(run, messages)))
+
+    repeated = f"[{nonce}:stream] Explain Gauss's law, question 0"
+    report('stream-hit', [streamed(repeated)])
+
+
+if __name__ == '__main__':
+    main()
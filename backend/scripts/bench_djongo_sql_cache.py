@@ -0,0 +1,80 @@
+"""
+Micro-benchmark for the Djongo SQL translation cache (djongo_patch.py).
+
+Compiles typical Test / CustomUser / Question lookups to the SQL Django
+sends to Djongo, then times the per-query translation work done before any
+Mongo round-trip (regex rewrites + sqlparse) with the cache cold (cleared
+before every statement, i.e. the old behaviour) and warm.
+
+No database connection is needed. Run from backend/:
+
+    python scripts/bench_djongo_sql_cache.py [iterations]
+"""
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+
+import django
+django.setup()
+
+from django.db import connection
+from sqlparse import parse as sqlparse
+
+import djongo_patch
+from djongo_patch import rewrite_sql, make_cached_sqlparse, clear_translation_cache, translation_cache_stats
+
+
+def lookups():
+    from tests.models import Test
+    from api.models import CustomUser
+    from questions.models import Question
+    return {
+        'Test by pk': Test.objects.filter(pk=1),
+        'Test list (student)': Test.objects.filter(pk__in=['1', '2', '3'], is_result_published=True).order_by('-created_at'),
+        'CustomUser by username': CustomUser.objects.filter(username='PATH12345', is_active=True),
+        'CustomUser by admission_number': CustomUser.objects.filter(admission_number__in=['PATH1', 'PATH2']),
+        'Question by pk': Question.objects.filter(pk='65f000000000000000000000'),
+        'Question bank page': Question.objects.filter(subject_id=1, chapter_id=2).order_by('-created_at')[:50],
+    }
+
+
+def translate(sql, parse):
+    """What patched_execute + Djongo's Query.__init__ do before talking to Mongo."""
+    rewritten = rewrite_sql(sql)
+    if rewritten is None:
+        return None
+    sql, _ = rewritten
+    counter = iter(range(10 ** 6))
+    sql = re.sub(r'%s', lambda _: '%({})s'.format(next(counter)), sql)
+    return parse(sql)
+
+
+def bench(sql, iterations, cold):
+    parse = make_cached_sqlparse(sqlparse)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        if cold:
+            clear_translation_cache()
+        translate(sql, parse)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print(f"SQL cache size: {djongo_patch.SQL_CACHE_SIZE}, iterations: {iterations}\n")
+    print(f"{'lookup':34} {'cold us':>10} {'warm us':>10} {'speedup':>9}")
+    for name, qs in lookups().items():
+        sql, _ = qs.query.get_compiler(connection=connection).as_sql()
+        cold = bench(sql, iterations, cold=True)
+        clear_translation_cache()
+        warm = bench(sql, iterations, cold=False)
+        print(f"{name:34} {cold:10.1f} {warm:10.1f} {cold / warm:8.1f}x")
+    print(f"\n{translation_cache_stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""
+Offline benchmark for the AI question-extraction page pipeline
+(questions/extraction.py), using StubModel below instead of Gemini.
+
+Generates a synthetic PDF and runs it through:
+
+    legacy     render every page up front, then one model call per page in order
+               (what ExtractAIView used to do)
+    pipeline   lazy rendering + a bounded pool of extraction workers
+
+and reports wall time and peak RSS growth. Each mode runs in its own process
+so the memory numbers don't mix. Nothing touches the database or storage.
+Run from backend/:
+
+    python scripts/bench_extract_ai.py --pages 40
+    python scripts/bench_extract_ai.py --pages 200 --workers 8 --latency 3
+"""
+import argparse
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from questions import extraction
+
+
+class StubModel:
+    """Offline stand-in for the Gemini model: canned questions after a delay."""
+
+    def __init__(self, latency=2.0, questions_per_page=3):
+        self.latency = latency
+        self.questions_per_page = questions_per_page
+
+    def generate_content(self, parts):
+        time.sleep(self.latency * random.uniform(0.5, 1.5))
+        questions = [{
+            "question": f"Stub question {n + 1}: evaluate $x^{n + 2}$ at $x = 2$",
+            "options": ["$2$", "$4$", "$8$", "$16$"],
+            "correctAnswer": "B",
+            "solution": "Substitute $x = 2$.",
+            "diagramBox": [100, 100, 300, 400] if n == 0 else None,
+        } for n in range(self.questions_per_page)]
+        return namedtuple('StubResponse', 'text')(json.dumps(questions))
+
+
+class Upload:
+    """The bits of an UploadedFile that PageSource uses."""
+
+    def __init__(self, data):
+        self.name = 'bench.pdf'
+        self.content_type = 'application/pdf'
+        self._data = data
+
+    def read(self):
+        return self._data
+
+
+def make_pdf(pages):
+    import fitz  # PyMuPDF
+    doc = fitz.open()
+    for n in range(pages):
+        page = doc.new_page()
+        for line in range(40):
+            page.insert_text((50, 50 + line * 18), f"Q{n * 5 + line // 8 + 1}. Evaluate $x^{line}$ for x = 2 ... page {n + 1}")
+        page.draw_rect(fitz.Rect(300, 500, 500, 700))
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+class PeakRSS:
+    """Samples this process's resident set size in the background."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.start = self.peak = self._rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def _rss():
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self._rss())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._rss())
+
+
+def _no_upload(png_bytes):
+    return 'question_images/bench.png'
+
+
+def run_legacy(source, model):
+    import PIL.Image
+    images = []
+    for _, image in source:
+        buf = io.BytesIO()
+        image.save(buf, format='PNG')  # the old path went through PNG bytes
+        images.append(PIL.Image.open(io.BytesIO(buf.getvalue())))
+    questions = 0
+    for idx, image in enumerate(images):
+        questions += len(extraction.extract_page(model, idx, image, store_diagram=_no_upload).questions)
+    return questions
+
+
+def run_pipeline(source, model, workers):
+    extract = partial(extraction.extract_page, store_diagram=_no_upload)
+    questions = 0
+    for result in extraction.extract_pages(source, model, workers=workers, extract=extract):
+        if result.error:
+            raise RuntimeError(f"page {result.index + 1}: {result.error}")
+        questions += len(result.questions)
+    return questions
+
+
+def run_mode(args):
+    data = make_pdf(args.pages)
+    model = StubModel(latency=args.latency)
+    source = extraction.PageSource(Upload(data))
+    started = time.perf_counter()
+    with PeakRSS() as rss:
+        if args.mode == 'legacy':
+            questions = run_legacy(source, model)
+        else:
+            questions = run_pipeline(source, model, args.workers)
+    elapsed = time.perf_counter() - started
+    source.close()
+    print(f"{args.mode:<9} pages={args.pages:<4} workers={args.workers if args.mode == 'pipeline' else 1:<3} "
+          f"time={elapsed:7.2f}s  pages/s={args.pages / elapsed:6.2f}  "
+          f"questions={questions:<5} peak_rss_growth={(rss.peak - rss.start) / 2**20:7.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=['legacy', 'pipeline', 'all'], default='all')
+    parser.add_argument('--pages', type=int, default=40)
+    parser.add_argument('--workers', type=int, default=extraction.EXTRACT_WORKERS)
+    parser.add_argument('--latency', type=float, default=2.0, help="Mean stub model latency per page (seconds)")
+    args = parser.parse_args()
+
+    if args.mode != 'all':
+        run_mode(args)
+        return
+    for mode in ('legacy', 'pipeline'):
+        subprocess.run([sys.executable, __file__, '--mode', mode, '--pages', str(args.pages),
+                        '--workers', str(args.workers), '--latency', str(args.latency)], check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+"""
+Local fake ERP for exercising api/erp_client.py (pooling, budgets, retries,
+circuit breaker, last-good fallback) without touching the real ERP.
+
+Serves just enough of the ERP API for the portal: the login endpoints,
+/api/admission (with `updatedAfter`), /api/centre and /api/student-portal/*,
+and can inject latency, jitter, errors or a full outage:
+
+    python scripts/fake_erp.py --port 8765 --latency 0.2 --jitter 0.1 --error-rate 0.05
+    ERP_API_URL=http://127.0.0.1:8765 python manage.py runserver
+
+Faults can be changed while it runs:
+
+    curl -X POST 'http://127.0.0.1:8765/__fault?latency=12&error_rate=0&down=0'
+
+`--selftest` starts the server in-process, points the client at it and
+walks through healthy / slow / failing / recovered phases, printing what
+the client did in each. Run from backend/.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+
+
+class Faults:
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, down=False):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.down = down
+        self.requests = 0
+        self.connections = set()
+        self.lock = threading.Lock()
+
+    def update(self, **values):
+        for key, value in values.items():
+            if key == 'down':
+                self.down = str(value).lower() in ('1', 'true', 'yes')
+            elif hasattr(self, key):
+                setattr(self, key, float(value))
+
+
+def _students(n=50):
+    now = int(time.time())
+    return [{
+        '_id': f"{i:024x}",
+        'admissionNumber': f"PATH{10000 + i}",
+        'studentEmail': f"student{i}@example.com",
+        'centre': f"C{i % 5}",
+        'updatedAt': now - i * 3600,
+    } for i in range(n)]
+
+
+STUDENTS = _students()
+CENTRES = [{'_id': f"c{i}", 'centreName': f"Centre {i}", 'enterCode': f"C{i}"} for i in range(5)]
+
+
+def route(method, path, query):
+    """(status, body) for a request, or None for 404."""
+    if method == 'POST' and path.endswith('/login'):
+        return 200, {'token': 'fake-token', 'accessToken': 'fake-token', 'data': {}}
+    if path == '/api/admission':
+        rows = STUDENTS
+        if 'updatedAfter' in query:
+            try:
+                since = int(query['updatedAfter'][0])
+                rows = [s for s in rows if s['updatedAt'] > since]
+            except ValueError:
+                pass
+        if 'studentEmail' in query:
+            rows = [s for s in rows if s['studentEmail'] == query['studentEmail'][0]]
+        return 200, {'data': rows}
+    if path == '/api/centre':
+        return 200, {'data': CENTRES}
+    if path.startswith('/api/student-portal/'):
+        return 200, {'data': [], 'path': path}
+    if path.startswith('/api/'):
+        return 200, {'data': []}
+    return None
+
+
+def make_handler(faults):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, so pooling is observable
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body):
+            raw = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def _handle(self, method):
+            parts = urlsplit(self.path)
+            query = parse_qs(parts.query)
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                self.rfile.read(length)
+
+            if parts.path == '/__fault':
+                with faults.lock:
+                    faults.update(**{k: v[0] for k, v in query.items()})
+                return self._send(200, {k: getattr(faults, k) for k in ('latency', 'jitter', 'error_rate', 'down', 'requests')})
+
+            with faults.lock:
+                faults.requests += 1
+                faults.connections.add(self.client_address)
+                latency, jitter, error_rate, down = faults.latency, faults.jitter, faults.error_rate, faults.down
+            if down:
+                self.close_connection = True
+                return  # drop the connection without answering
+            time.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+            if random.random() < error_rate:
+                return self._send(random.choice([502, 503, 504]), {'error': 'injected'})
+            result = route(method, parts.path, query)
+            if result is None:
+                return self._send(404, {'error': 'not found'})
+            self._send(*result)
+
+        def do_GET(self):
+            self._handle('GET')
+
+        def do_POST(self):
+            self._handle('POST')
+
+    return Handler
+
+
+def serve(port, faults):
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(faults))
+    server.daemon_threads = True
+    return server
+
+
+def selftest(port):
+    faults = Faults()
+    server = serve(port, faults)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{port}"
+    os.environ['ERP_API_URL'] = base
+
+    import django
+    django.setup()
+    from django.core.cache import cache
+    from api import erp_client
+
+    cache.delete(erp_client.BREAKER_CACHE_KEY)
+    erp_client.breaker = erp_client.CircuitBreaker(threshold=3, cooldown=2)
+    erp_client.BUDGETS.insert(0, ('/api/centre', erp_client.Budget(0.5, 1.0, 2.5, 2)))
+    url = f"{base}/api/centre"
+
+    def call(n, label):
+        ok = stale = failed = 0
+        start = time.perf_counter()
+        for _ in range(n):
+            try:
+                resp = erp_client.get(url, fallback_ttl=60)
+                if resp.headers.get('X-ERP-Stale'):
+                    stale += 1
+                elif resp.status_code == 200:
+                    ok += 1
+                else:
+                    failed += 1
+            except erp_client.ERPUnavailable:
+                failed += 1
+        elapsed = time.perf_counter() - start
+        print(f"{label:28} ok={ok:3} stale={stale:3} failed={failed:3} "
+              f"{elapsed / n * 1000:7.1f} ms/call  breaker={erp_client.breaker.state():9} "
+              f"server_requests={faults.requests} connections={len(faults.connections)}")
+
+    call(20, 'healthy')
+    faults.update(latency=3)
+    call(5, 'slow (3s > 1s read budget)')
+    faults.update(latency=0, error_rate=1)
+    call(10, 'all 5xx')
+    faults.update(error_rate=0, down=True)
+    call(10, 'down, circuit open')
+    faults.update(down=False)
+    time.sleep(2.1)
+    call(20, 'recovered after cooldown')
+    server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='+/- seconds of random latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered 502/503/504')
+    parser.add_argument('--down', action='store_true', help='drop every connection')
+    parser.add_argument('--selftest', action='store_true')
+    args = parser.parse_args()
+
+    if args.selftest:
+        return selftest(args.port)
+    faults = Faults(args.latency, args.jitter, args.error_rate, args.down)
+    server = serve(args.port, faults)
+    print(f"Fake ERP on http://127.0.0.1:{args.port} (POST /__fault?latency=&jitter=&error_rate=&down= to change faults)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
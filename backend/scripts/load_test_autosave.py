@@ -0,0 +1,215 @@
+"""
+Load test for exam autosave (tests/autosave.py) against a local Mongo.
+
+Replays autosave traffic recorded with AUTOSAVE_RECORD_PATH=<file> (one JSON
+line per save_progress call), or synthesises it, through three write paths:
+
+    legacy    find_one + full `responses` upsert per save (the old save_progress)
+    direct    targeted $set on responses.<qid> per save (no Redis)
+    buffered  Redis buffer + periodic unordered bulk flush (production path)
+
+and reports wall time, saves/s and Mongo write operations. Everything goes to
+a scratch database and Redis DB, never the app's. Run from backend/:
+
+    python scripts/load_test_autosave.py --mode all --students 1500 --saves 40
+    python scripts/load_test_autosave.py --mode buffered --replay autosave.jsonl
+
+Env: LOADTEST_MONGO_URL (mongodb://localhost:27017), LOADTEST_REDIS_URL
+(redis://localhost:6379/15).
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+
+import django
+django.setup()
+
+from pymongo import MongoClient
+
+from tests import autosave
+
+DB_NAME = 'autosave_loadtest'
+
+
+def synthesize(students, saves, questions, test_id=1):
+    """Each student answers/revisits random questions, sending deltas like the exam screen."""
+    events = []
+    for s in range(students):
+        sid = f"{s:024x}"
+        t = random.random() * 5
+        for n in range(saves):
+            t += random.uniform(2, 6)
+            qid = f"{random.randrange(questions):024x}"
+            if n == 0:
+                events.append({'ts': t, 'test_id': test_id, 'student_id': sid, 'changes': {}, 'responses': {}, 'time_spent': int(t)})
+                continue
+            answer = None if random.random() < 0.05 else {'answer': random.choice('ABCD'), 'status': 'answered', 'time': random.randint(5, 300)}
+            events.append({'ts': t, 'test_id': test_id, 'student_id': sid, 'changes': {qid: answer}, 'responses': None, 'time_spent': int(t)})
+    events.sort(key=lambda e: e['ts'])
+    return events
+
+
+def load(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def replay(save, events, threads):
+    """One student's saves stay in order (the exam screen sends them sequentially);
+    different students run concurrently."""
+    per_student = {}
+    for e in events:
+        per_student.setdefault((e['test_id'], e['student_id']), []).append(e)
+
+    def run(seq):
+        for e in seq:
+            save(e)
+
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(run, per_student.values()))
+
+
+class Counter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reads = self.writes = 0
+
+    def add(self, reads=0, writes=0):
+        with self.lock:
+            self.reads += reads
+            self.writes += writes
+
+
+def run_legacy(events, coll, threads, counter):
+    state = {}
+    state_lock = threading.Lock()
+
+    def save(e):
+        key = (e['test_id'], e['student_id'])
+        with state_lock:
+            full = dict(e['responses']) if e.get('responses') is not None else dict(state.get(key, {}))
+            for qid, v in (e.get('changes') or {}).items():
+                if v is None:
+                    full.pop(qid, None)
+                else:
+                    full[qid] = v
+            state[key] = full
+        coll.find_one({'test_id': e['test_id'], 'student_id': e['student_id'], 'is_finalized': True}, {'_id': 1})
+        coll.update_one(
+            {'test_id': e['test_id'], 'student_id': e['student_id'], 'is_finalized': False},
+            {'$set': {'responses': full, 'time_spent': e['time_spent'], 'submission_type': 'MANUAL'}},
+            upsert=True,
+        )
+        counter.add(reads=1, writes=1)
+
+    replay(save, events, threads)
+
+
+def run_direct(events, coll, threads, counter):
+    def save(e):
+        autosave.write_progress(e['test_id'], e['student_id'], changes=e.get('changes') or {},
+                                full=e.get('responses'), time_spent=e['time_spent'], coll=coll)
+        counter.add(writes=1)
+
+    replay(save, events, threads)
+
+
+def run_buffered(events, coll, conn, threads, counter, interval):
+    stop = threading.Event()
+    flushes = []
+
+    def flusher():
+        while not stop.is_set():
+            stop.wait(interval)
+            n = autosave.flush(conn=conn, coll=coll)
+            if n:
+                flushes.append(n)
+
+    def save(e):
+        autosave.buffer_progress(e['test_id'], e['student_id'], changes=e.get('changes') or {},
+                                 full=e.get('responses'), time_spent=e['time_spent'], conn=conn, flusher=False)
+
+    t = threading.Thread(target=flusher, daemon=True)
+    t.start()
+    replay(save, events, threads)
+    stop.set()
+    t.join()
+    while autosave.flush(conn=conn, coll=coll):
+        pass
+    counter.add(writes=sum(flushes))
+    return len(flushes)
+
+
+def verify(events, coll):
+    """Every student's final document must equal the replayed state."""
+    expected = {}
+    for e in events:
+        key = (e['test_id'], e['student_id'])
+        full = dict(e['responses']) if e.get('responses') is not None else expected.get(key, {})
+        for qid, v in (e.get('changes') or {}).items():
+            if v is None:
+                full.pop(qid, None)
+            else:
+                full[qid] = v
+        expected[key] = full
+    bad = 0
+    for (test_id, sid), full in expected.items():
+        doc = coll.find_one({'test_id': test_id, 'student_id': sid})
+        if not doc or doc.get('responses') != full:
+            bad += 1
+    return len(expected), bad
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=['legacy', 'direct', 'buffered', 'all'], default='all')
+    parser.add_argument('--replay', help='JSONL recorded via AUTOSAVE_RECORD_PATH')
+    parser.add_argument('--students', type=int, default=1500)
+    parser.add_argument('--saves', type=int, default=40)
+    parser.add_argument('--questions', type=int, default=90)
+    parser.add_argument('--threads', type=int, default=64)
+    parser.add_argument('--flush-interval', type=float, default=autosave.FLUSH_SECONDS)
+    args = parser.parse_args()
+
+    events = load(args.replay) if args.replay else synthesize(args.students, args.saves, args.questions)
+    for e in events:
+        e['student_id'] = autosave._student_id(e['student_id'])  # as save_progress sees user.pk
+    client = MongoClient(os.getenv('LOADTEST_MONGO_URL', 'mongodb://localhost:27017'))
+    db = client[DB_NAME]
+    modes = ['legacy', 'direct', 'buffered'] if args.mode == 'all' else [args.mode]
+
+    conn = None
+    if 'buffered' in modes:
+        import redis
+        conn = redis.Redis.from_url(os.getenv('LOADTEST_REDIS_URL', 'redis://localhost:6379/15'))
+        conn.flushdb()
+
+    print(f"{len(events)} saves from {len({e['student_id'] for e in events})} students, {args.threads} threads\n")
+    print(f"{'mode':10} {'seconds':>9} {'saves/s':>10} {'mongo reads':>12} {'mongo writes':>13} {'mismatched':>11}")
+    for mode in modes:
+        coll = db[f'submissions_{mode}']
+        coll.drop()
+        coll.create_index([('test_id', 1), ('student_id', 1)], unique=True)
+        counter = Counter()
+        start = time.perf_counter()
+        if mode == 'legacy':
+            run_legacy(events, coll, args.threads, counter)
+        elif mode == 'direct':
+            run_direct(events, coll, args.threads, counter)
+        else:
+            run_buffered(events, coll, conn, args.threads, counter, args.flush_interval)
+        elapsed = time.perf_counter() - start
+        students, bad = verify(events, coll)
+        print(f"{mode:10} {elapsed:9.2f} {len(events) / elapsed:10.0f} {counter.reads:12} {counter.writes:13} {bad:>5}/{students}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,337 @@
+"""
+Materialized master-section content index.
+
+list_master_sections used to load every Test, allotment and material on a
+cache miss and name-match test sections against master sections in a nested
+loop. This index keeps the result of that work in one cached document:
+
+    v                 the version this index reflects
+    master_sections   [{pk, name, subject_code, priority}]  in (priority, name) order
+    tests             {test pk: {name, is_omr, created_at, sections: {section pk: name key},
+                                 centres: [{id, name, code, location}]}}   (centres from allotments)
+    tests_by_name     {section name key: [test pk, ...]}    name key = name.strip().lower()
+    materials         {kind: {item pk: {name, sections: [master section pk]}}}
+    by_section        {master section pk: {kind: {item pk: name}}}
+
+so the section endpoints become dictionary lookups:
+
+    index = get_index()
+    test_pks = index['tests_by_name'].get(name_key(section.name), [])
+
+Rows are refreshed in place from the save/delete/M2M receivers of Test,
+Section, TestCentreAllotment and the material models (tests/models.py,
+master_data/models.py); centre, exam type and master section changes drop
+the index and the next reader rebuilds it. Every change bumps the version
+(cache.incr, so it only moves forward), which is part of the
+list_master_sections response cache key. The index carries the version it
+reflects; readers rebuild it when it is older than the current version, so
+a change that couldn't be applied in place (lock contention, an error, a
+rebuild racing an edit) is never lost.
+"""
+import threading
+import time
+
+from django.core.cache import cache
+
+INDEX_KEY = 'section_content_index'
+VERSION_KEY = 'section_content_version'
+LOCK_KEY = 'section_content_lock'
+INDEX_TTL = 60 * 60 * 24
+
+# kind -> (app label, model, label field, master section relation, relation is M2M)
+MATERIALS = {
+    'pen_paper': ('master_data', 'PenPaperTest', 'name', 'sections', True),
+    'library': ('master_data', 'LibraryItem', 'name', 'section', False),
+    'homework': ('master_data', 'Homework', 'name', 'sections', True),
+    'video': ('master_data', 'Video', 'title', 'section', False),
+}
+
+_local = threading.local()
+
+
+def _s(pk):
+    return str(pk) if pk is not None else None
+
+
+def name_key(name):
+    return (name or '').strip().lower()
+
+
+def pk_order(pk):
+    """Sort key for stringified pks: integers numerically, anything else after."""
+    return (0, int(pk), '') if str(pk).isdigit() else (1, 0, str(pk))
+
+
+def _model(kind):
+    from django.apps import apps
+    app_label, model_name, _, _, _ = MATERIALS[kind]
+    return apps.get_model(app_label, model_name)
+
+
+def kind_for_model(model):
+    for kind, (app_label, model_name, _, _, _) in MATERIALS.items():
+        if model._meta.app_label == app_label and model.__name__ == model_name:
+            return kind
+    return None
+
+
+# ── Rows ──────────────────────────────────────────────────────────────────────
+
+def _master_sections():
+    from master_data.models import MasterSection
+    return [
+        {'pk': _s(pk), 'name': name, 'subject_code': code, 'priority': priority}
+        for pk, name, code, priority in MasterSection.objects.order_by('priority', 'name').values_list(
+            'pk', 'name', 'subject_code', 'priority')
+    ]
+
+
+def _test_rows(test_pks=None):
+    from centres.models import Centre
+    from tests.models import Test, TestCentreAllotment
+    from .models import Section
+
+    tests = Test.objects.all()
+    sections = Section.objects.filter(test__isnull=False)
+    allotments = TestCentreAllotment.objects.all()
+    if test_pks is not None:
+        tests = tests.filter(pk__in=list(test_pks))
+        sections = sections.filter(test_id__in=list(test_pks))
+        allotments = allotments.filter(test_id__in=list(test_pks))
+
+    rows = {}
+    for pk, name, et_name, created_at in tests.values_list('pk', 'name', 'exam_type__name', 'created_at'):
+        et_name = (et_name or '').lower()
+        rows[_s(pk)] = {
+            'name': name,
+            'is_omr': 'omr' in et_name or 'offline' in et_name,
+            'created_at': created_at.isoformat() if created_at else '',
+            'sections': {},
+            'centres': [],
+        }
+    if not rows:
+        return rows
+
+    for s_pk, t_id, s_name in sections.values_list('_id', 'test_id', 'name'):
+        if _s(t_id) in rows:
+            rows[_s(t_id)]['sections'][_s(s_pk)] = name_key(s_name)
+
+    pairs = list(allotments.values_list('test_id', 'centre_id'))
+    centres = {
+        _s(pk): {'id': _s(pk), 'name': name, 'code': code, 'location': location}
+        for pk, name, code, location in Centre.objects.filter(pk__in={c for _, c in pairs}).values_list(
+            '_id', 'name', 'code', 'location')
+    }
+    for t_id, c_id in pairs:
+        if _s(t_id) in rows and _s(c_id) in centres:
+            rows[_s(t_id)]['centres'].append(centres[_s(c_id)])
+    for row in rows.values():
+        row['centres'].sort(key=lambda c: c['name'] or '')  # TestCentreAllotment's ordering
+    return rows
+
+
+def _material_rows(kind, item_pks=None):
+    _, _, label, relation, is_m2m = MATERIALS[kind]
+    model = _model(kind)
+    items = model.objects.all()
+    if item_pks is not None:
+        items = items.filter(pk__in=list(item_pks))
+
+    if is_m2m:
+        rows = {_s(pk): {'name': name, 'sections': []} for pk, name in items.values_list('pk', label)}
+        through = getattr(model, relation).through
+        item_column = f"{model.__name__.lower()}_id"
+        links = through.objects.all()
+        if item_pks is not None:
+            links = links.filter(**{f"{item_column}__in": list(item_pks)})
+        for item_pk, ms_pk in links.values_list(item_column, 'mastersection_id'):
+            if _s(item_pk) in rows:
+                rows[_s(item_pk)]['sections'].append(_s(ms_pk))
+    else:
+        rows = {
+            _s(pk): {'name': name, 'sections': [_s(ms_pk)] if ms_pk is not None else []}
+            for pk, name, ms_pk in items.values_list('pk', label, f"{relation}_id")
+        }
+    return rows
+
+
+# ── Index maintenance ─────────────────────────────────────────────────────────
+
+def _link_test(index, test_pk, row):
+    for key in set(row['sections'].values()):
+        index['tests_by_name'].setdefault(key, []).append(test_pk)
+
+
+def _unlink_test(index, test_pk):
+    row = index['tests'].pop(test_pk, None)
+    if not row:
+        return
+    for key in set(row['sections'].values()):
+        pks = index['tests_by_name'].get(key, [])
+        if test_pk in pks:
+            pks.remove(test_pk)
+        if not pks:
+            index['tests_by_name'].pop(key, None)
+
+
+def _link_material(index, kind, item_pk, row):
+    index['materials'][kind][item_pk] = row
+    for ms_pk in row['sections']:
+        index['by_section'].setdefault(ms_pk, {}).setdefault(kind, {})[item_pk] = row['name']
+
+
+def _unlink_material(index, kind, item_pk):
+    row = index['materials'][kind].pop(item_pk, None)
+    if not row:
+        return
+    for ms_pk in row['sections']:
+        index['by_section'].get(ms_pk, {}).get(kind, {}).pop(item_pk, None)
+
+
+def build_index():
+    """Full rebuild: a handful of queries, then cached for every worker."""
+    index = {
+        'v': version(),  # read before the queries: every change bumped up to here is included
+        'master_sections': _master_sections(),
+        'tests': {},
+        'tests_by_name': {},
+        'materials': {kind: {} for kind in MATERIALS},
+        'by_section': {},
+    }
+    for test_pk, row in _test_rows().items():
+        index['tests'][test_pk] = row
+        _link_test(index, test_pk, row)
+    for kind in MATERIALS:
+        for item_pk, row in _material_rows(kind).items():
+            _link_material(index, kind, item_pk, row)
+    cache.set(INDEX_KEY, index, timeout=INDEX_TTL)
+    return index
+
+
+def version():
+    v = cache.get(VERSION_KEY)
+    if v is None:
+        v = int(time.time() * 1000)
+        cache.add(VERSION_KEY, v, timeout=None)
+        v = cache.get(VERSION_KEY, v)
+    return v
+
+
+def _bump_version():
+    """Move the version atomically (never backwards); returns it, or None if the cache failed."""
+    try:
+        try:
+            return cache.incr(VERSION_KEY)
+        except ValueError:  # not set yet, or evicted
+            cache.add(VERSION_KEY, int(time.time() * 1000), timeout=None)
+            return cache.incr(VERSION_KEY)
+    except Exception:
+        return None
+
+
+def get_index(v=None):
+    """The index, from a per-thread copy when the version hasn't moved."""
+    v = version() if v is None else v
+    local = getattr(_local, 'index', None)
+    if local is not None and local[0] == v:
+        return local[1]
+    index = cache.get(INDEX_KEY)
+    if index is None or index.get('v', 0) < v:
+        # missing, or older than a change that couldn't be applied in place
+        index = build_index()
+    _local.index = (v, index)
+    return index
+
+
+def invalidate_content_index():
+    """Drop the whole index (centre / exam type / master section changes)."""
+    try:
+        cache.delete(INDEX_KEY)
+    except Exception:
+        pass
+    _bump_version()
+
+
+def _update(label, apply):
+    """
+    Read-modify-write the cached index under a lock. The index is stamped with
+    the version it reflects, and a change is applied in place only when the
+    index is current; otherwise (contention, a gap, an error) the change just
+    bumps the version and the next reader rebuilds.
+    """
+    try:
+        if not cache.add(LOCK_KEY, 1, timeout=30):
+            _bump_version()
+            return
+        try:
+            current = version()
+            index = cache.get(INDEX_KEY)
+            if index is None or index.get('v') != current:
+                _bump_version()
+                return
+            apply(index)
+            v = _bump_version()
+            if v is None:
+                return
+            # A bump from another writer in between means its change isn't in here:
+            # keep the older stamp so readers rebuild
+            index['v'] = v if v == current + 1 else current
+            cache.set(INDEX_KEY, index, timeout=INDEX_TTL)
+        finally:
+            cache.delete(LOCK_KEY)
+    except Exception as e:
+        print(f"[section index] Failed to refresh {label}: {e}")
+        invalidate_content_index()
+
+
+def refresh_tests(test_pks):
+    """Re-read these tests' rows (sections, allotted centres); drops deleted ones."""
+    test_pks = {_s(pk) for pk in test_pks if pk is not None}
+    if not test_pks:
+        return
+
+    def apply(index):
+        rows = _test_rows(test_pks)
+        for test_pk in test_pks:
+            _unlink_test(index, test_pk)
+            if test_pk in rows:
+                index['tests'][test_pk] = rows[test_pk]
+                _link_test(index, test_pk, rows[test_pk])
+
+    _update(f"tests {sorted(test_pks)}", apply)
+
+
+def refresh_section(section_pk, test_pk):
+    """A test Section changed: refresh its current test and any test that listed it."""
+    section_pk = _s(section_pk)
+    index = cache.get(INDEX_KEY)
+    affected = {test_pk}
+    if index is not None:
+        affected |= {t for t, row in index['tests'].items() if section_pk in row['sections']}
+    refresh_tests(affected)
+
+
+def refresh_material(kind, item_pk):
+    item_pk = _s(item_pk)
+
+    def apply(index):
+        rows = _material_rows(kind, [item_pk])
+        _unlink_material(index, kind, item_pk)
+        if item_pk in rows:
+            _link_material(index, kind, item_pk, rows[item_pk])
+
+    _update(f"{kind} {item_pk}", apply)
+
+
+# ── Lookups ───────────────────────────────────────────────────────────────────
+
+def test_pks_for_section_name(name, index=None):
+    index = index or get_index()
+    return sorted(index['tests_by_name'].get(name_key(name), []), key=pk_order)
+
+
+def materials_for_section(master_section_pk, kind, index=None):
+    """[(item pk, name)] in primary-key order."""
+    index = index or get_index()
+    items = index['by_section'].get(_s(master_section_pk), {}).get(kind, {})
+    return sorted(items.items(), key=lambda pair: pk_order(pair[0]))
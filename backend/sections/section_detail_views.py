@@ -5,6 +5,7 @@ from rest_framework import status
 from .models import Section
 from tests.models import Test, TestCentreAllotment
 from master_data.models import MasterSection
+from . import content_index
 
 
 def _serialize_section_summary(section):
@@ -46,9 +47,27 @@ def _serialize_centre_allotment(allotment):
     }
 
 
-def _serialize_test_full(test):
+def _assigned_tests(section):
+    """Tests with a section of this name, looked up in the content index instead of a name join."""
+    test_pks = [int(pk) for pk in content_index.test_pks_for_section_name(section.name)]
+    return Test.objects.filter(pk__in=test_pks).select_related(
+        'session', 'exam_type', 'class_level', 'package').prefetch_related('target_exams', 'centres')
+
+
+def _allotments_by_test(tests):
+    """{test id: [allotment]} for all the tests in one query."""
+    grouped = {t.id: [] for t in tests}
+    if grouped:
+        for a in TestCentreAllotment.objects.filter(test_id__in=list(grouped)).select_related('centre'):
+            grouped.setdefault(a.test_id, []).append(a)
+    return grouped
+
+
+def _serialize_test_full(test, allotments=None):
     """Full test info including all centres and their allotment details."""
-    allotments = list(TestCentreAllotment.objects.filter(test=test).select_related('centre'))
+    if allotments is None:
+        allotments = list(TestCentreAllotment.objects.filter(test=test).select_related('centre'))
+    target_exams = list(test.target_exams.all())
     centre_list = [_serialize_centre_allotment(a) for a in allotments]
 
     # Also include direct centres not yet in allotments
@@ -82,7 +101,7 @@ def _serialize_test_full(test):
         'description': test.description,
         'instructions': test.instructions,
         'session': test.session.name if test.session else None,
-        'target_exam': test.target_exam.name if test.target_exam else None,
+        'target_exam': target_exams[0].name if target_exams else None,
         'exam_type': test.exam_type.name if test.exam_type else None,
         'class_level': test.class_level.name if test.class_level else None,
         'package': test.package.name if test.package else None,
@@ -137,20 +156,20 @@ def list_master_sections(request):
         
         # 0. Check Cache First (High Performance)
         # Instead of querying 5 collections for 'updated_at', use a single cached 'Global Test Version'
+        # plus the content index version (bumped by every test / section / material edit)
         last_update = cache.get("global_test_update_v1", 0)
+        index_version = content_index.version()
         
         user_id = user.pk if user.is_authenticated else "public"
-        cache_key = f"master_sections_v5_{user_id}_{last_update}"
+        cache_key = f"master_sections_v6_{user_id}_{last_update}_{index_version}"
         
         cached_data = cache.get(cache_key)
         if cached_data:
             return Response(cached_data, status=status.HTTP_200_OK)
 
-        from master_data.models import LibraryItem, PenPaperTest, Homework, Video
-        from collections import defaultdict
-
-        # 1. Fetch Master Sections from the dedicated MasterSection model
-        sections_query = MasterSection.objects.all().order_by('priority', 'name')
+        # 1. Master Sections, tests and materials all come from the content index
+        index = content_index.get_index(index_version)
+        sections = index['master_sections']
         
         # Student specific filtering
         exam_secs = []
@@ -165,124 +184,54 @@ def list_master_sections(request):
             
             allowed_names = list(set(exam_secs + study_secs))
             if allowed_names:
-                sections_query = sections_query.filter(name__in=allowed_names)
+                sections = [ms for ms in sections if ms['name'] in allowed_names]
             else:
                 return Response({'count': 0, 'sections': []}, status=status.HTTP_200_OK)
 
-        sections = list(sections_query)
-        section_ids = [s.pk for s in sections]
-
-        # 2. Bulk Fetch All Related Content
-        # Fetch ALL tests (No longer filtered by allotted_sections)
-        all_tests = list(Test.objects.all().select_related('exam_type').prefetch_related('sections'))
-        test_ids = [t.pk for t in all_tests]
-        
-        # Allotments for these tests
-        all_allotments = list(TestCentreAllotment.objects.filter(test_id__in=test_ids).select_related('centre'))
-        
-        # Materials
-        all_pp_tests = list(PenPaperTest.objects.filter(sections__in=section_ids).prefetch_related('sections'))
-        all_lib_items = list(LibraryItem.objects.filter(section_id__in=section_ids))
-        all_hw_items = list(Homework.objects.filter(sections__in=section_ids).prefetch_related('sections'))
-        all_vid_items = list(Video.objects.filter(section_id__in=section_ids))
-
-        # 3. Grouping in Python Memory
-        test_allotments_map = defaultdict(list)
-        for a in all_allotments:
-            test_allotments_map[a.test_id].append(a)
-
-        tests_by_section = defaultdict(list)
-        # Group tests by their internal sections matching the master section name
-        for t in all_tests:
-            for s in t.sections.all():
-                # Find matching master section by name
-                for ms in sections:
-                    if ms.name.strip().lower() == s.name.strip().lower():
-                        tests_by_section[str(ms.pk)].append(t)
-                        break
-
-        pp_by_section = defaultdict(list)
-        for ppt in all_pp_tests:
-            for s in ppt.sections.all():
-                pp_by_section[str(s.pk)].append(ppt)
-
-        lib_by_section = defaultdict(list)
-        for item in all_lib_items:
-            lib_by_section[str(item.section_id)].append(item)
-
-        hw_by_section = defaultdict(list)
-        for item in all_hw_items:
-            for s in item.sections.all():
-                hw_by_section[str(s.pk)].append(item)
-
-        vid_by_section = defaultdict(list)
-        for item in all_vid_items:
-            vid_by_section[str(item.section_id)].append(item)
-
-        # 4. Final Construction
+        # 2. Final Construction
         result = []
         for section in sections:
-            s_id = str(section.pk)
+            s_id = section['pk']
             
             # Find all unique centres for this section across all its tests
             section_centres_map = {}
-            s_tests = tests_by_section[s_id]
             
             online_exam_list = []
             offline_exam_list = []
             
-            # Process Tests
-            if not is_student or section.name in exam_secs or section.name == omr_sec:
-                for test in s_tests:
-                    t_type_name = (test.exam_type.name or "").lower() if test.exam_type else ""
-                    is_omr = "omr" in t_type_name or "offline" in t_type_name
-                    
-                    t_allotments = test_allotments_map[test.id]
-                    t_centres = []
-                    for a in t_allotments:
-                        cid = str(a.centre._id)
-                        c_data = {
-                            'id': cid,
-                            'name': a.centre.name,
-                            'code': a.centre.code,
-                            'location': a.centre.location
-                        }
-                        t_centres.append(c_data)
-                        if cid not in section_centres_map:
-                            section_centres_map[cid] = c_data
+            # Process Tests (tests whose own sections carry this master section's name)
+            if not is_student or section['name'] in exam_secs or section['name'] == omr_sec:
+                for test_pk in content_index.test_pks_for_section_name(section['name'], index):
+                    test = index['tests'][test_pk]
+                    t_centres = [dict(c) for c in test['centres']]
+                    for c_data in t_centres:
+                        section_centres_map.setdefault(c_data['id'], c_data)
 
                     if not is_student or t_centres:
                         item_data = {
-                            'id': str(test.id),
-                            'name': test.name,
-                            'type': 'Online Test' if not is_omr else 'Offline Test',
+                            'id': test_pk,
+                            'name': test['name'],
+                            'type': 'Online Test' if not test['is_omr'] else 'Offline Test',
                             'centres': t_centres
                         }
-                        if is_omr: offline_exam_list.append(item_data)
+                        if test['is_omr']: offline_exam_list.append(item_data)
                         else: online_exam_list.append(item_data)
 
             # Process PenPaperTests
-            s_pp = pp_by_section[s_id]
-            for ppt in s_pp:
+            for item_pk, name in content_index.materials_for_section(s_id, 'pen_paper', index):
                 offline_exam_list.append({
-                    'id': str(ppt.id),
-                    'name': ppt.name,
+                    'id': item_pk,
+                    'name': name,
                     'type': 'Pen Paper Test',
                     'centres': [] 
                 })
 
             # Study Materials
             study_material_list = []
-            if not is_student or section.name in study_secs:
-                # Lib
-                for item in lib_by_section[s_id]:
-                    study_material_list.append({'id': str(item.id), 'name': item.name, 'type': 'Library Item', 'centres': []})
-                # HW
-                for item in hw_by_section[s_id]:
-                    study_material_list.append({'id': str(item.id), 'name': item.name, 'type': 'Homework', 'centres': []})
-                # Vid
-                for item in vid_by_section[s_id]:
-                    study_material_list.append({'id': str(item.id), 'name': item.title, 'type': 'Video', 'centres': []})
+            if not is_student or section['name'] in study_secs:
+                for kind, label in (('library', 'Library Item'), ('homework', 'Homework'), ('video', 'Video')):
+                    for item_pk, name in content_index.materials_for_section(s_id, kind, index):
+                        study_material_list.append({'id': item_pk, 'name': name, 'type': label, 'centres': []})
 
             all_centres = list(section_centres_map.values())
             # Add centres to those that don't have them
@@ -292,10 +241,10 @@ def list_master_sections(request):
                 item['centres'] = all_centres
 
             result.append({
-                'id': str(section.id),  # MasterSection uses standard int id
-                'name': section.name,
-                'subject_code': section.subject_code,
-                'priority': section.priority,
+                'id': s_id,  # MasterSection uses standard int id
+                'name': section['name'],
+                'subject_code': section['subject_code'],
+                'priority': section['priority'],
                 'online_exam_centres': online_exam_list,
                 'offline_exam_centres': offline_exam_list,
                 'study_material_centres': study_material_list,
@@ -334,12 +283,13 @@ def section_full_detail(request, section_id):
             return Response({'error': 'Section not found'}, status=status.HTTP_404_NOT_FOUND)
 
         # allotted_sections removed. We now filter by matching section names.
-        assigned_tests = Test.objects.filter(sections__name__iexact=section.name).distinct().order_by('-created_at')
+        assigned_tests = list(_assigned_tests(section).order_by('-created_at'))
+        allotments = _allotments_by_test(assigned_tests)
 
         tests_data = []
         total_centres = 0
         for test in assigned_tests:
-            test_data = _serialize_test_full(test)
+            test_data = _serialize_test_full(test, allotments[test.id])
             tests_data.append(test_data)
             total_centres += test_data['centres_count']
 
@@ -370,8 +320,9 @@ def section_tests(request, section_id):
         except Exception:
             return Response({'error': 'Section not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        assigned_tests = Test.objects.filter(sections__name__iexact=section.name).distinct().order_by('-created_at')
-        tests_data = [_serialize_test_full(t) for t in assigned_tests]
+        assigned_tests = list(_assigned_tests(section).order_by('-created_at'))
+        allotments = _allotments_by_test(assigned_tests)
+        tests_data = [_serialize_test_full(t, allotments[t.id]) for t in assigned_tests]
 
         return Response({
             'section_id': section_id,
@@ -399,12 +350,13 @@ def section_centres(request, section_id):
         except Exception:
             return Response({'error': 'Section not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        assigned_tests = Test.objects.filter(sections__name__iexact=section.name).distinct()
+        test_pks = [int(pk) for pk in content_index.test_pks_for_section_name(section.name)]
+        assigned_tests = list(Test.objects.filter(pk__in=test_pks))
+        allotments_by_test = _allotments_by_test(assigned_tests)
 
         seen_centres = {}
         for test in assigned_tests:
-            allotments = TestCentreAllotment.objects.filter(test=test).select_related('centre')
-            for allotment in allotments:
+            for allotment in allotments_by_test[test.id]:
                 cid = str(allotment.centre._id)
                 if cid not in seen_centres:
                     seen_centres[cid] = {
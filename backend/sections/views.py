@@ -67,23 +67,25 @@ class SectionViewSet(viewsets.ModelViewSet):
             else:
                 valid_ids.append(qid)
                 
+        # Two lookups for the whole selection instead of a get() + exists() per question
+        found = {str(pk) for pk in Question.objects.filter(pk__in=valid_ids).values_list('pk', flat=True)}
+        assigned = {str(pk) for pk in section.questions.values_list('pk', flat=True)}
+        if not isinstance(section.question_order, list):
+            section.question_order = []
+
         # To preserve order from the selection, we add them one by one or 
         # use a loop that respects the question_ids sequence.
         for vid in valid_ids:
-            try:
-                q = Question.objects.get(pk=vid)
-                if not section.questions.filter(pk=vid).exists():
-                    section.questions.add(q)
-                
-                # Update our explicit order Array
-                vid_str = str(vid)
-                if not isinstance(section.question_order, list):
-                    section.question_order = []
-                if vid_str not in section.question_order:
-                    section.question_order.append(vid_str)
-                    
-            except Question.DoesNotExist:
+            vid_str = str(vid)
+            if vid_str not in found:
                 continue
+            if vid_str not in assigned:
+                section.questions.add(vid)
+                assigned.add(vid_str)
+
+            # Update our explicit order Array
+            if vid_str not in section.question_order:
+                section.question_order.append(vid_str)
                 
         section.save()
         
@@ -29,6 +29,9 @@ class TestsConfig(AppConfig):
                 # 2. Build the admin test list cache synchronously in this thread
                 #    so the very first admin page load gets a cache hit.
                 _build_admin_test_cache()
+                # 3. Materialize the student visibility index
+                from tests.visibility import build_catalog
+                build_catalog()
                 print("[STARTUP] Cache invalidated & background roster warm-up triggered.")
             except Exception as e:
                 print(f"[STARTUP] Roster warm-up failed: {e}")
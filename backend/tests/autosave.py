@@ -0,0 +1,411 @@
+"""
+Write-coalescing autosave for live exams.
+
+save_progress used to do a find_one plus a full `responses` upsert on every
+autosave. Now:
+
+  - the client may send `changes` ({question_id: response, or null to
+    clear}) instead of the whole `responses` dict; a full `responses` body
+    is still accepted and simply replaces the buffered state,
+  - each save is buffered in a Redis hash per (test, student)
+    (`autosave:buf:<test>:<student>`), so bursts from one student collapse
+    into one pending entry per question,
+  - a flusher thread in every worker drains dirty buffers every
+    FLUSH_SECONDS under a cache lock, and writes them as one unordered
+    bulk_write of targeted `$set` / `$unset` on `responses.<qid>` paths,
+  - the "already submitted?" check is served from the cache instead of a
+    Mongo round-trip per save.
+
+Durability:
+  - An acknowledged autosave is in Redis and reaches Mongo on the next flush
+    (normally within FLUSH_SECONDS). Buffers are also drained when a
+    gunicorn worker exits (`worker_exit` hook). A failed flush puts entries
+    back without overwriting newer ones. A Redis loss can drop at most the
+    last few seconds of autosaves; the exam screen also keeps answers in
+    localStorage and resends them.
+  - `submit` is never buffered. It drops this student's pending autosaves,
+    writes the final responses synchronously and only then responds, and
+    marks the submission finalized so no later flush can touch it.
+
+Without Redis (LocMem cache, local dev) saves are written straight to Mongo
+with the same targeted updates.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+
+from django.core.cache import cache
+
+from .scoring import parse_responses
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = 'tests_testsubmission'
+FLUSH_SECONDS = float(os.getenv('AUTOSAVE_FLUSH_SECONDS', '3'))
+FLUSH_BATCH = 500
+FLUSH_LOCK_KEY = 'autosave_flush_lock'
+BUFFER_PREFIX = 'autosave:buf:'
+DIRTY_SET = 'autosave:dirty'
+# A buffer nobody flushes (e.g. every worker gone) still expires eventually
+BUFFER_TTL = 6 * 60 * 60
+FINALIZED_TTL = 24 * 60 * 60
+NOT_FINALIZED_TTL = 30
+# Set to a file path to append every autosave as JSONL (replayed by scripts/load_test_autosave.py)
+RECORD_PATH = os.getenv('AUTOSAVE_RECORD_PATH')
+
+FULL_FIELD = '__full__'
+TIME_FIELD = '__time__'
+KEY_FIELD = '__key__'
+CHANGE_PREFIX = 'r:'
+
+
+def _redis():
+    """Raw redis client behind the default cache, or None (LocMem)."""
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+    except Exception:
+        return None
+
+
+def _collection():
+    from api.db_utils import get_db
+    db = get_db()
+    return db[COLLECTION] if db is not None else None
+
+
+def _buffer_key(test_id, student_id):
+    return f"{BUFFER_PREFIX}{test_id}:{student_id}"
+
+
+def _final_key(test_id, student_id):
+    return f"autosave_final_{test_id}_{student_id}"
+
+
+def _student_id(raw):
+    from bson import ObjectId
+    return ObjectId(raw) if ObjectId.is_valid(raw) else raw
+
+
+def valid_changes(changes):
+    """Drop keys that would be unsafe as a `responses.<qid>` Mongo path."""
+    if not isinstance(changes, dict):
+        return {}
+    return {str(k): v for k, v in changes.items() if k and '.' not in str(k) and not str(k).startswith('$')}
+
+
+# ── Finalized guard ───────────────────────────────────────────────────────────
+
+def is_finalized(test_id, student_id, coll=None):
+    cached = cache.get(_final_key(test_id, student_id))
+    if cached is not None:
+        return cached
+    coll = coll if coll is not None else _collection()
+    if coll is None:
+        return False
+    finalized = coll.find_one(
+        {'test_id': test_id, 'student_id': student_id, 'is_finalized': True}, {'_id': 1}
+    ) is not None
+    cache.set(_final_key(test_id, student_id), finalized, FINALIZED_TTL if finalized else NOT_FINALIZED_TTL)
+    return finalized
+
+
+def mark_finalized(test_id, student_id):
+    cache.set(_final_key(test_id, student_id), True, FINALIZED_TTL)
+
+
+def clear_finalized(test_id, student_id):
+    """After an admin reset/unlock: forget the marker and any stale buffered saves."""
+    cache.delete(_final_key(test_id, student_id))
+    discard_pending(test_id, student_id)
+
+
+# ── Mongo writes ──────────────────────────────────────────────────────────────
+
+def _update_doc(changes, full, time_spent):
+    """The update document for one submission's coalesced saves."""
+    set_fields = {'submission_type': 'MANUAL'}  # progress is always manual
+    unset_fields = {}
+    if time_spent is not None:
+        set_fields['time_spent'] = time_spent
+    if full is not None:
+        merged = dict(full)
+        for qid, value in changes.items():
+            if value is None:
+                merged.pop(qid, None)
+            else:
+                merged[qid] = value
+        set_fields['responses'] = merged
+    else:
+        for qid, value in changes.items():
+            if value is None:
+                unset_fields[f'responses.{qid}'] = ''
+            else:
+                set_fields[f'responses.{qid}'] = value
+    update = {'$set': set_fields}
+    if unset_fields:
+        update['$unset'] = unset_fields
+    return update
+
+
+def _filter(test_id, student_id):
+    return {'test_id': test_id, 'student_id': student_id, 'is_finalized': False}
+
+
+def _rewrite_whole(coll, test_id, student_id, changes, full, time_spent):
+    """Fallback when `responses` can't take path updates (stored as a JSON string by the ORM)."""
+    doc = coll.find_one(_filter(test_id, student_id), {'responses': 1})
+    base = full if full is not None else parse_responses(doc.get('responses') if doc else None)
+    coll.update_one(_filter(test_id, student_id), _update_doc(changes, base, time_spent), upsert=True)
+
+
+def write_progress(test_id, student_id, changes=None, full=None, time_spent=None, coll=None):
+    """Write one save straight to Mongo (no buffering)."""
+    coll = coll if coll is not None else _collection()
+    changes = changes or {}
+    try:
+        coll.update_one(_filter(test_id, student_id), _update_doc(changes, full, time_spent), upsert=True)
+    except Exception as e:
+        from pymongo.errors import DuplicateKeyError
+        if isinstance(e, DuplicateKeyError):
+            return  # finalized meanwhile; the submission is authoritative
+        _rewrite_whole(coll, test_id, student_id, changes, full, time_spent)
+
+
+# ── Buffer ────────────────────────────────────────────────────────────────────
+
+def record(test_id, student_id, changes, full, time_spent):
+    if not RECORD_PATH:
+        return
+    try:
+        line = json.dumps({'ts': time.time(), 'test_id': test_id, 'student_id': str(student_id),
+                           'changes': changes, 'responses': full, 'time_spent': time_spent}, default=str)
+        with open(RECORD_PATH, 'a') as f:
+            f.write(line + '\n')
+    except Exception:
+        pass
+
+
+def buffer_progress(test_id, student_id, changes=None, full=None, time_spent=None, conn=None, flusher=True):
+    """Buffer one save. Returns False when there is no Redis to buffer in."""
+    conn = conn or _redis()
+    if conn is None:
+        return False
+    key = _buffer_key(test_id, student_id)
+    fields = {KEY_FIELD: json.dumps([test_id, str(student_id)])}
+    if time_spent is not None:
+        fields[TIME_FIELD] = json.dumps(time_spent)
+    if full is not None:
+        fields[FULL_FIELD] = json.dumps(full)
+    for qid, value in (changes or {}).items():
+        fields[CHANGE_PREFIX + qid] = json.dumps(value)
+
+    pipe = conn.pipeline(transaction=True)
+    if full is not None:
+        pipe.delete(key)  # a full snapshot supersedes anything buffered before it
+    pipe.hset(key, mapping=fields)
+    pipe.expire(key, BUFFER_TTL)
+    pipe.sadd(DIRTY_SET, key)
+    pipe.execute()
+    if flusher:
+        ensure_flusher()
+    return True
+
+
+def _decode(raw):
+    """Redis hash -> (test_id, student_id, changes, full, time_spent)."""
+    raw = {k.decode() if isinstance(k, bytes) else k: v for k, v in raw.items()}
+    test_id, student_id = json.loads(raw[KEY_FIELD])
+    changes = {k[len(CHANGE_PREFIX):]: json.loads(v) for k, v in raw.items() if k.startswith(CHANGE_PREFIX)}
+    full = json.loads(raw[FULL_FIELD]) if FULL_FIELD in raw else None
+    time_spent = json.loads(raw[TIME_FIELD]) if TIME_FIELD in raw else None
+    return test_id, _student_id(student_id), changes, full, time_spent
+
+
+def _drain(conn, key):
+    pipe = conn.pipeline(transaction=True)
+    pipe.hgetall(key)
+    pipe.delete(key)
+    raw, _ = pipe.execute()
+    return raw
+
+
+def pending_progress(test_id, student_id, conn=None):
+    """Buffered-but-unflushed saves as (changes, full, time_spent), or None."""
+    conn = conn or _redis()
+    if conn is None:
+        return None
+    try:
+        raw = conn.hgetall(_buffer_key(test_id, student_id))
+        if not raw:
+            return None
+        _, _, changes, full, time_spent = _decode(raw)
+    except Exception:
+        return None
+    return changes, full, time_spent
+
+
+def apply_pending(responses, time_spent, pending):
+    """Overlay pending saves on what Mongo returned (for the resume/status view)."""
+    if not pending:
+        return responses, time_spent
+    changes, full, pending_time = pending
+    merged = dict(full) if full is not None else dict(responses or {})
+    for qid, value in changes.items():
+        if value is None:
+            merged.pop(qid, None)
+        else:
+            merged[qid] = value
+    return merged, pending_time if pending_time is not None else time_spent
+
+
+def discard_pending(test_id, student_id, conn=None):
+    conn = conn or _redis()
+    if conn is None:
+        return
+    key = _buffer_key(test_id, student_id)
+    try:
+        pipe = conn.pipeline(transaction=True)
+        pipe.delete(key)
+        pipe.srem(DIRTY_SET, key)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"[autosave] Failed to discard {key}: {e}")
+
+
+def _requeue(conn, key, raw):
+    """Put drained fields back without clobbering anything saved since."""
+    try:
+        if conn.hexists(key, FULL_FIELD):
+            return  # a newer full snapshot already supersedes these entries
+        pipe = conn.pipeline(transaction=True)
+        for field, value in raw.items():
+            pipe.hsetnx(key, field, value)
+        pipe.expire(key, BUFFER_TTL)
+        pipe.sadd(DIRTY_SET, key)
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"[autosave] Lost buffered progress for {key}: {e}")
+
+
+# ── Flushing ──────────────────────────────────────────────────────────────────
+
+def flush(conn=None, coll=None):
+    """Drain every dirty buffer into Mongo.
+
+    Returns the number of submissions written, or None if another worker is
+    flushing. Flushes are serialised so an older drained entry can never be
+    written after a newer one.
+    """
+    conn = conn or _redis()
+    if conn is None:
+        return 0
+    if not cache.add(FLUSH_LOCK_KEY, 1, timeout=max(30, int(FLUSH_SECONDS * 10))):
+        return None
+    written = 0
+    try:
+        coll = coll if coll is not None else _collection()
+        if coll is None:
+            return 0
+        while True:
+            keys = conn.spop(DIRTY_SET, FLUSH_BATCH)
+            if not keys:
+                break
+            written += _flush_keys(conn, coll, [k.decode() if isinstance(k, bytes) else k for k in keys])
+            if len(keys) < FLUSH_BATCH:
+                break
+    finally:
+        cache.delete(FLUSH_LOCK_KEY)
+    return written
+
+
+def _flush_keys(conn, coll, keys):
+    from pymongo import UpdateOne
+    from pymongo.errors import BulkWriteError
+
+    drained = []
+    for key in keys:
+        raw = _drain(conn, key)
+        if not raw:
+            continue
+        try:
+            drained.append((key, raw, _decode(raw)))
+        except (KeyError, ValueError) as e:
+            logger.warning(f"[autosave] Dropping malformed buffer {key}: {e}")
+    if not drained:
+        return 0
+
+    finals = cache.get_many([_final_key(t, s) for _, _, (t, s, _, _, _) in drained])
+    ops, batch = [], []
+    for key, raw, (test_id, student_id, changes, full, time_spent) in drained:
+        if finals.get(_final_key(test_id, student_id)):
+            continue
+        ops.append(UpdateOne(_filter(test_id, student_id), _update_doc(changes, full, time_spent), upsert=True))
+        batch.append((key, raw, (test_id, student_id, changes, full, time_spent)))
+    if not ops:
+        return 0
+
+    try:
+        coll.bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        for err in e.details.get('writeErrors', []):
+            key, raw, (test_id, student_id, changes, full, time_spent) = batch[err['index']]
+            if err.get('code') == 11000:
+                continue  # finalized meanwhile; the submission is authoritative
+            try:
+                _rewrite_whole(coll, test_id, student_id, changes, full, time_spent)
+            except Exception as retry_err:
+                logger.warning(f"[autosave] Flush of {key} failed ({retry_err}); requeued")
+                _requeue(conn, key, raw)
+    except Exception as e:
+        logger.warning(f"[autosave] Flush of {len(ops)} submissions failed ({e}); requeued")
+        for key, raw, _ in batch:
+            _requeue(conn, key, raw)
+        return 0
+    return len(ops)
+
+
+_flusher = {'pid': None}
+_flusher_lock = threading.Lock()
+
+
+def _flush_loop():
+    from django.db import close_old_connections
+    while True:
+        time.sleep(FLUSH_SECONDS)
+        close_old_connections()
+        try:
+            flush()
+        except Exception as e:
+            logger.warning(f"[autosave] Flush loop error: {e}")
+
+
+def ensure_flusher():
+    """Start this process's flush thread (once per pid, so it survives gunicorn's fork)."""
+    if _flusher['pid'] == os.getpid():
+        return
+    with _flusher_lock:
+        if _flusher['pid'] == os.getpid():
+            return
+        _flusher['pid'] = os.getpid()
+        threading.Thread(target=_flush_loop, name='autosave-flusher', daemon=True).start()
+        atexit.register(flush_on_exit)
+
+
+def flush_on_exit():
+    """Drain buffers before this worker goes away (gunicorn worker_exit / interpreter exit)."""
+    if _flusher['pid'] != os.getpid():
+        return  # this process never buffered anything
+    try:
+        for _ in range(10):
+            n = flush()
+            if n is not None:
+                if n:
+                    logger.info(f"[autosave] Flushed {n} submissions on exit")
+                return
+            time.sleep(0.5)  # wait out another worker's flush
+    except Exception as e:
+        logger.warning(f"[autosave] Exit flush failed: {e}")
@@ -0,0 +1,270 @@
+"""
+Vectorized batch scoring for result generation.
+
+All finalized submissions of a test are encoded once into a dense
+student x question response matrix:
+
+    choice[i, j] = -1                       not attempted
+                 = bitmask of option index  choice questions (0 = nothing matched)
+                 = 0                        attempted numeric / other questions
+    value[i, j]  = float answer             numeric questions
+    parsed[i, j] = value[i, j] holds a parsed answer (a literal "nan" parses
+                   too, so NaN alone can't tell it from an unparseable one)
+    time[i, j]   = seconds spent on the question (kept for the section breakdown)
+
+Marks, negatives, grace questions and PartialMarkRule logic are then applied
+as NumPy array operations over the whole matrix. Per-question parameters and
+partial-mark lookup tables come from the same compiled AnswerKey used by
+AnswerKey.score(), so both paths award identical marks.
+"""
+import numpy as np
+
+from .scoring import (
+    parse_responses, extract_answer, extract_time, is_blank,
+    STATUS_UNATTEMPTED, STATUS_CORRECT, STATUS_INCORRECT, STATUS_PARTIAL, STATUS_GRACE,
+    STATUS_CHARS,
+)
+
+# int8 status codes used in the matrices; index into STATUS_CODES for the string form
+NA, CA, IA, PA, GR = 0, 1, 2, 3, 4
+STATUS_CODES = (STATUS_UNATTEMPTED, STATUS_CORRECT, STATUS_INCORRECT, STATUS_PARTIAL, STATUS_GRACE)
+
+_KIND_SINGLE, _KIND_MULTI, _KIND_NUMERIC, _KIND_OTHER = 0, 1, 2, 3
+_RULES = {None: 0, 'JEE_ADVANCED': 1, 'WBJEE': 2, 'CUSTOM_FRACTIONAL': 3, 'STANDARD': 4}
+
+
+def _kind(q_type):
+    if q_type == 'SINGLE_CHOICE': return _KIND_SINGLE
+    if q_type == 'MULTI_CHOICE': return _KIND_MULTI
+    if q_type in ('NUMERICAL', 'INTEGER_TYPE'): return _KIND_NUMERIC
+    return _KIND_OTHER
+
+
+def _popcount(arr, n_bits):
+    out = np.zeros(arr.shape, dtype=np.int64)
+    for b in range(n_bits):
+        out += (arr >> b) & 1
+    return out
+
+
+def encode_responses(key, submissions):
+    """Build the (choice, value, parsed, time) matrices for a list of submission documents."""
+    n, m = len(submissions), len(key.questions)
+    choice = np.full((n, m), -1, dtype=np.int64)
+    value = np.full((n, m), np.nan, dtype=np.float64)
+    parsed = np.zeros((n, m), dtype=bool)
+    time = np.zeros((n, m), dtype=np.float64)
+
+    plan = [(j, cq.id, _kind(cq.type), cq.bits) for j, cq in enumerate(key.questions)]
+    for i, sub in enumerate(submissions):
+        responses = parse_responses(sub.get('responses'))
+        if not responses:
+            continue
+        row_c = choice[i]
+        row_v = value[i]
+        row_p = parsed[i]
+        row_t = time[i]
+        for j, qid, kind, bits in plan:
+            res_obj = responses.get(qid)
+            if res_obj is None:
+                continue
+            row_t[j] = extract_time(res_obj)
+            ans = extract_answer(res_obj)
+            if is_blank(ans):
+                continue
+            if kind == _KIND_SINGLE:
+                if isinstance(ans, list):
+                    ans = ans[0] if len(ans) == 1 else None
+                row_c[j] = bits.get(str(ans).strip().lower(), 0) if ans is not None else 0
+            elif kind == _KIND_MULTI:
+                mask = 0
+                for item in (ans if isinstance(ans, list) else [ans]):
+                    mask |= bits.get(str(item).strip().lower(), 0)
+                row_c[j] = mask
+            else:
+                row_c[j] = 0
+                if kind == _KIND_NUMERIC:
+                    try:
+                        row_v[j] = float(ans)
+                        row_p[j] = True
+                    except (TypeError, ValueError): pass
+    return choice, value, parsed, time
+
+
+def score_matrix(key, choice, value, parsed, time=None, grace=None):
+    """Score an encoded response matrix against a compiled AnswerKey.
+
+    Returns a dict of arrays: `status` (int8, n x m), `earned`, `negative`
+    (n x m), per-student `positive`/`negative_total`/`score`, and `sections`:
+    one dict of per-student arrays per key section.
+    """
+    n, m = choice.shape
+    qs = key.questions
+    grace_qs = set(str(qid) for qid in grace) if grace else set()
+
+    n_bits = max([cq.option_count for cq in qs] + [1])
+    kind = np.array([_kind(cq.type) for cq in qs], dtype=np.int8)
+    rule = np.array([_RULES.get(cq.rule_type, 0) for cq in qs], dtype=np.int8)
+    correct_mask = np.array([cq.correct_mask for cq in qs], dtype=np.int64)
+    c_marks = np.array([cq.correct_marks for cq in qs], dtype=np.float64)
+    n_marks = np.array([cq.negative_marks for cq in qs], dtype=np.float64)
+    r_correct = np.array([cq.rule_correct for cq in qs], dtype=np.float64)
+    r_neg = np.array([cq.rule_negative for cq in qs], dtype=np.float64)
+    lo = np.array([cq.answer_from if cq.answer_from is not None else np.nan for cq in qs], dtype=np.float64)
+    hi = np.array([cq.answer_to if cq.answer_to is not None else np.nan for cq in qs], dtype=np.float64)
+    graced = np.array([cq.id in grace_qs for cq in qs], dtype=bool)
+
+    # Partial-credit lookup tables, rounded with Python's round() exactly like
+    # CompiledQuestion._evaluate_multi: table[j, k] = marks for k options.
+    n_correct = [len(cq.correct) for cq in qs]
+    prop_table = np.zeros((m, n_bits + 1), dtype=np.float64)   # no rule: k correct picked
+    frac_table = np.zeros((m, n_bits + 1), dtype=np.float64)   # WBJEE / CUSTOM_FRACTIONAL
+    for j, cq in enumerate(qs):
+        for k in range(n_bits + 1):
+            if n_correct[j]:
+                prop_table[j, k] = round(cq.correct_marks * (k / n_correct[j]), 2)
+                frac_table[j, k] = round(cq.rule_correct * (k / n_correct[j]), 2)
+
+    attempted = choice >= 0
+    sel = np.where(attempted, choice, 0)
+    hit_mask = sel & correct_mask
+    hit = _popcount(hit_mask, n_bits)
+    n_sel = _popcount(sel, n_bits)
+    eq = sel == correct_mask
+    subset = (sel & ~correct_mask) == 0
+    cols = np.arange(m)[None, :]
+
+    status = np.full((n, m), IA, dtype=np.int8)
+    earned = np.zeros((n, m), dtype=np.float64)
+    neg = np.zeros((n, m), dtype=np.float64)
+
+    def apply(col_mask, cond, st, e, ng):
+        where = col_mask[None, :] & cond
+        status[where] = st
+        earned[where] = np.broadcast_to(e, (n, m))[where] if np.ndim(e) else e
+        neg[where] = np.broadcast_to(ng, (n, m))[where] if np.ndim(ng) else ng
+
+    ones = np.ones((n, m), dtype=bool)
+    c_b = np.broadcast_to(c_marks, (n, m))
+    n_b = np.broadcast_to(n_marks, (n, m))
+    rc_b = np.broadcast_to(r_correct, (n, m))
+    rn_b = np.broadcast_to(r_neg, (n, m))
+
+    # SINGLE_CHOICE
+    single = kind == _KIND_SINGLE
+    apply(single, ones, IA, 0.0, n_b)
+    apply(single, hit_mask != 0, CA, c_b, 0.0)
+
+    # MULTI_CHOICE — no rule: proportional credit for correct options picked
+    multi = kind == _KIND_MULTI
+    col = multi & (rule == _RULES[None])
+    apply(col, ones, IA, 0.0, n_b)
+    apply(col, hit > 0, PA, prop_table[cols, hit], 0.0)
+    apply(col, eq, CA, c_b, 0.0)
+
+    # JEE_ADVANCED step marks
+    col = multi & (rule == _RULES['JEE_ADVANCED'])
+    apply(col, ones, PA, np.minimum(n_sel, 3).astype(np.float64), 0.0)
+    apply(col, eq, CA, rc_b, 0.0)
+    apply(col, ~subset, IA, 0.0, rn_b)
+
+    # WBJEE / CUSTOM_FRACTIONAL
+    for rule_name in ('WBJEE', 'CUSTOM_FRACTIONAL'):
+        col = multi & (rule == _RULES[rule_name])
+        apply(col, ones, PA, frac_table[cols, n_sel], 0.0)
+        apply(col, eq, CA, rc_b, 0.0)
+        apply(col, ~subset, IA, 0.0, rn_b if rule_name == 'CUSTOM_FRACTIONAL' else 0.0)
+
+    # STANDARD: all-or-nothing
+    col = multi & (rule == _RULES['STANDARD'])
+    apply(col, ones, IA, 0.0, rn_b)
+    apply(col, eq, CA, rc_b, 0.0)
+
+    # NUMERICAL / INTEGER_TYPE
+    numeric = kind == _KIND_NUMERIC
+    has_range = ~np.isnan(lo) & ~np.isnan(hi)
+    with np.errstate(invalid='ignore'):
+        in_range = (value >= lo[None, :]) & (value <= hi[None, :])
+    apply(numeric, ones, IA, 0.0, n_b)
+    # like CompiledQuestion.evaluate: no key configured never penalises a parsed
+    # answer, but an unparseable one is always wrong with the negative mark
+    apply(numeric & ~has_range, parsed, IA, 0.0, 0.0)
+    apply(numeric & has_range, in_range, CA, c_b, 0.0)
+
+    # Other types are not auto-scored (IA, 0, 0)
+    apply(kind == _KIND_OTHER, ones, IA, 0.0, 0.0)
+
+    # Grace overrides everything that was attempted; blanks override everything.
+    apply(graced, ones, GR, c_b, 0.0)
+    status[~attempted] = NA
+    earned[~attempted] = 0.0
+    neg[~attempted] = 0.0
+
+    sections = []
+    for sec in key.sections:
+        s, e = sec['start'], sec['end']
+        st = status[:, s:e]
+        sections.append({
+            'name': sec['name'],
+            'earned': earned[:, s:e].sum(axis=1),
+            'negative': neg[:, s:e].sum(axis=1),
+            'correct': ((st == CA) | (st == GR)).sum(axis=1),
+            'partial': (st == PA).sum(axis=1),
+            'incorrect': (st == IA).sum(axis=1),
+            'unattempted': (st == NA).sum(axis=1),
+            'time_spent': time[:, s:e].sum(axis=1) if time is not None else np.zeros(n),
+        })
+
+    positive = earned.sum(axis=1)
+    negative_total = neg.sum(axis=1)
+    return {
+        'status': status,
+        'earned': earned,
+        'negative': neg,
+        'positive': positive,
+        'negative_total': negative_total,
+        # Python round() per student keeps parity with AnswerKey.score()
+        'score': [round(float(p - q), 2) for p, q in zip(positive, negative_total)],
+        'sections': sections,
+    }
+
+
+def score_submissions(key, submissions, grace=None):
+    """Encode + score a list of submission documents in one batch."""
+    choice, value, parsed, time = encode_responses(key, submissions)
+    return score_matrix(key, choice, value, parsed, time=time, grace=grace)
+
+
+def breakdowns(key, batch, grace=None):
+    """Per-student persisted breakdowns (same shape as AnswerKey.breakdown)."""
+    version = key.version(grace)
+    chars = np.array([STATUS_CHARS[code] for code in STATUS_CODES])
+    q_strings = [''.join(row) for row in chars[batch['status']]]
+    out = []
+    for i, score in enumerate(batch['score']):
+        out.append({
+            'v': version,
+            'score': score,
+            'positive': round(float(batch['positive'][i]), 4),
+            'negative': round(float(batch['negative_total'][i]), 4),
+            'sections': [
+                {
+                    'name': sec['name'],
+                    'earned': round(float(sec['earned'][i]), 4),
+                    'negative': round(float(sec['negative'][i]), 4),
+                    'correct': int(sec['correct'][i]),
+                    'incorrect': int(sec['incorrect'][i]),
+                    'partial': int(sec['partial'][i]),
+                    'unattempted': int(sec['unattempted'][i]),
+                    'time_spent': _num(sec['time_spent'][i]),
+                }
+                for sec in batch['sections']
+            ],
+            'q': q_strings[i],
+        })
+    return out
+
+
+def _num(x):
+    x = float(x)
+    return int(x) if x.is_integer() else x
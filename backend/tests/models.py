@@ -1,6 +1,10 @@
 from django.db import models
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
 from master_data.models import Session, ExamType, ClassLevel, TargetExam
 from centres.models import Centre
+from sections.models import Section
+from questions.models import Question
 
 class Test(models.Model):
     name = models.CharField(max_length=255)
@@ -116,3 +120,114 @@ class OMRFailedRecord(models.Model):
 
     def __str__(self):
         return f"Failed OMR | Test: {self.test.code} | Enrollment: {self.original_enrollment}"
+
+
+# Keep the student visibility index (tests/visibility.py) in step with tests
+@receiver(post_save, sender=Test)
+@receiver(post_delete, sender=Test)
+def refresh_visibility_on_test_change(sender, instance, **kwargs):
+    from .visibility import refresh_test_visibility
+    refresh_test_visibility(instance.pk)
+
+@receiver(m2m_changed, sender=Test.centres.through)
+@receiver(m2m_changed, sender=Test.class_levels.through)
+@receiver(m2m_changed, sender=Test.target_exams.through)
+@receiver(m2m_changed, sender=Test.sessions.through)
+def refresh_visibility_on_m2m_change(sender, instance, action, reverse, **kwargs):
+    if action not in ["post_add", "post_remove", "post_clear"]:
+        return
+    from .visibility import refresh_test_visibility, invalidate_visibility_index
+    if reverse:
+        # Changed from the related side (e.g. centre.tests.add): may touch many tests
+        invalidate_visibility_index()
+    else:
+        refresh_test_visibility(instance.pk)
+
+@receiver(post_save, sender=Centre)
+@receiver(post_delete, sender=Centre)
+@receiver(post_save, sender=TargetExam)
+@receiver(post_delete, sender=TargetExam)
+@receiver(post_save, sender=ExamType)
+@receiver(post_delete, sender=ExamType)
+def invalidate_visibility_on_master_change(sender, **kwargs):
+    from .visibility import invalidate_visibility_index
+    invalidate_visibility_index()
+
+
+# Drop precompiled question papers (tests/paper.py) only for the tests whose
+# sections, question order or questions actually changed
+def _invalidate_papers(test_ids):
+    from .paper import invalidate_paper
+    for test_id in set(test_ids):
+        if test_id is not None:
+            invalidate_paper(test_id)
+
+@receiver(post_save, sender=Section)
+@receiver(post_delete, sender=Section)
+def invalidate_paper_on_section_change(sender, instance, **kwargs):
+    _invalidate_papers([instance.test_id])
+
+@receiver(m2m_changed, sender=Section.questions.through)
+def invalidate_paper_on_section_questions_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == "pre_clear":
+        # question.assigned_sections.clear(): find the sections before the rows go
+        _invalidate_papers(Section.objects.filter(questions=instance.pk).values_list('test_id', flat=True))
+    elif action in ["post_add", "post_remove", "post_clear"]:
+        if not reverse:
+            _invalidate_papers([instance.test_id])
+        elif pk_set:
+            _invalidate_papers(Section.objects.filter(pk__in=list(pk_set)).values_list('test_id', flat=True))
+
+@receiver(post_save, sender=Question)
+@receiver(pre_delete, sender=Question)
+def invalidate_paper_on_question_change(sender, instance, created=False, **kwargs):
+    if created:
+        return  # a new question isn't on any paper yet
+    try:
+        _invalidate_papers(Section.objects.filter(questions=instance.pk).values_list('test_id', flat=True))
+    except Exception as e:
+        print(f"[CACHE] Failed to invalidate papers for question {instance.pk}: {e}")
+
+
+# Keep the master-section content index (sections/content_index.py) in step
+# with tests, their sections and centre allotments
+@receiver(post_save, sender=Test)
+@receiver(post_delete, sender=Test)
+def refresh_content_index_on_test_change(sender, instance, **kwargs):
+    from sections.content_index import refresh_tests
+    refresh_tests([instance.pk])
+
+@receiver(post_save, sender=TestCentreAllotment)
+@receiver(post_delete, sender=TestCentreAllotment)
+def refresh_content_index_on_allotment_change(sender, instance, **kwargs):
+    from sections.content_index import refresh_tests
+    refresh_tests([instance.test_id])
+
+@receiver(post_save, sender=Section)
+@receiver(post_delete, sender=Section)
+def refresh_content_index_on_section_change(sender, instance, **kwargs):
+    from sections.content_index import refresh_section
+    refresh_section(instance.pk, instance.test_id)
+
+@receiver(post_save, sender=Centre)
+@receiver(post_delete, sender=Centre)
+@receiver(post_save, sender=ExamType)
+@receiver(post_delete, sender=ExamType)
+def invalidate_content_index_on_master_change(sender, **kwargs):
+    from sections.content_index import invalidate_content_index
+    invalidate_content_index()
+
+
+# A finalized (or removed) submission changes the student's AI context
+# document (api/student_context.py)
+@receiver(post_save, sender=TestSubmission)
+def bump_student_context_on_submission(sender, instance, **kwargs):
+    if not instance.is_finalized:
+        return  # in-progress saves aren't part of the context
+    from api.student_context import bump
+    bump(instance.student_id)
+
+@receiver(post_delete, sender=TestSubmission)
+def bump_student_context_on_submission_delete(sender, instance, **kwargs):
+    from api.student_context import bump
+    bump(instance.student_id)
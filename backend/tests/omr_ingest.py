@@ -0,0 +1,367 @@
+"""
+Streaming OMR sheet ingestion.
+
+The uploaded sheet is read row-by-row (csv.reader for CSV, openpyxl read-only
+mode for .xlsx) and processed in chunks of CHUNK_SIZE rows. Per chunk:
+
+  1. enrollments are normalised and de-duplicated across the whole sheet,
+  2. students are resolved against a map that is filled with one query per
+     chunk (ERP-only students are created with a single bulk_create),
+  3. the fNNN answer columns are decoded column-wise through a per-column
+     memo (an OMR column only ever holds a handful of distinct marks),
+  4. submissions are upserted with one unordered bulk_write; rows that will be
+     inserted get an id reserved from Djongo's counter, as bulk_create would.
+
+Memory stays bounded by the chunk size regardless of sheet length.
+"""
+import csv
+import io
+
+from bson import ObjectId
+from django.db.models import Q
+from django.utils import timezone
+
+CHUNK_SIZE = 1000
+
+ENROLL_COLUMNS = ['frmid', 'enrollment number', 'enrollment', 'admission number', 'admission', 'student id', 'id', 'username']
+SCORE_COLUMNS = ['score', 'total score', 'marks', 'total marks', 'total']
+BLANK_MARKS = ('NAN', 'NONE', '', 'NULL')
+
+
+class OMRSheetError(Exception):
+    """The sheet's header is unusable; the message is safe to show the admin."""
+
+
+def normalize_enrollment(val):
+    if val is None:
+        return ''
+    if isinstance(val, float):
+        if val != val:  # NaN
+            return ''
+        if val.is_integer():
+            val = int(val)
+    enroll = str(val).strip().upper()
+    if enroll.endswith('.0'): enroll = enroll[:-2]
+    if enroll.isdigit(): enroll = f"PATH{enroll}"
+    return enroll
+
+
+def _cell_str(val):
+    if val is None:
+        return ''
+    if isinstance(val, float):
+        if val != val:
+            return ''
+        if val.is_integer():
+            val = int(val)
+    return str(val).strip().upper()
+
+
+def _reserve_ids(db, n):
+    """Take n ids from Djongo's auto-increment counter for submissions, or None."""
+    from pymongo import ReturnDocument
+    schema = db['__schema__'].find_one_and_update(
+        {'name': 'tests_testsubmission', 'auto': {'$exists': True}},
+        {'$inc': {'auto.seq': n}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if not schema:
+        return None
+    last = schema['auto']['seq']
+    return range(last - n + 1, last + 1)
+
+
+def iter_sheet_rows(file):
+    """Yields the header row, then each data row as a tuple, without loading the sheet."""
+    name = (file.name or '').lower()
+    if name.endswith('.csv'):
+        text = io.TextIOWrapper(file, encoding='utf-8-sig', errors='replace', newline='')
+        try:
+            for row in csv.reader(text):
+                yield tuple(row)
+        finally:
+            text.detach()
+    elif name.endswith('.xls'):
+        # Legacy binary workbooks can't be streamed by openpyxl; fall back to pandas.
+        import pandas as pd
+        df = pd.read_excel(file, dtype=object)
+        yield tuple(df.columns)
+        for row in df.itertuples(index=False, name=None):
+            yield tuple(None if pd.isna(v) else v for v in row)
+    else:
+        from openpyxl import load_workbook
+        wb = load_workbook(file, read_only=True, data_only=True)
+        try:
+            for row in wb.active.iter_rows(values_only=True):
+                yield row
+        finally:
+            wb.close()
+
+
+def iter_chunks(rows, size=CHUNK_SIZE):
+    """Groups (row_num, row) pairs into lists of at most `size`; row_num is the sheet row."""
+    chunk = []
+    for row_num, row in enumerate(rows, start=2):
+        if not row or all(v is None or v == '' for v in row):
+            continue
+        chunk.append((row_num, row))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class StudentResolver:
+    """Enrollment -> CustomUser, filled one chunk at a time.
+
+    Unknown enrollments that exist in the ERP index are created in bulk, the
+    same way the old per-row path auto-synced them.
+    """
+
+    def __init__(self, erp_idx):
+        self.erp_idx = erp_idx or {}
+        self.users = {}
+        self.looked_up = set()
+
+    def _remember(self, users):
+        for u in users:
+            if u.admission_number: self.users[u.admission_number.upper()] = u
+            if u.username: self.users[u.username.upper()] = u
+
+    def _fetch(self, keys):
+        keys = [k for k in keys if k not in self.looked_up]
+        if not keys:
+            return
+        self.looked_up.update(keys)
+        from api.models import CustomUser
+        self._remember(CustomUser.objects.filter(Q(admission_number__in=keys) | Q(username__in=keys)))
+
+    def resolve(self, enrolls):
+        """Returns {enrollment: CustomUser} for every enrollment that could be matched."""
+        from api.models import CustomUser
+
+        self._fetch(enrolls)
+
+        # ERP fallback for the rest: the ERP email is the username of auto-synced accounts
+        pending = {}
+        for enroll in enrolls:
+            if enroll in self.users:
+                continue
+            erp_record = self.erp_idx.get(f"adm_{enroll}")
+            if not erp_record:
+                continue
+            student_obj = erp_record.get('student') or {}
+            details_list = student_obj.get('studentsDetails', [])
+            email = ""
+            first_name = "Student"
+            last_name = ""
+            if details_list and isinstance(details_list, list) and len(details_list) > 0:
+                email = details_list[0].get('studentEmail', '') or ''
+                name = details_list[0].get('studentName', '')
+                if name:
+                    parts = name.strip().split(' ')
+                    first_name = parts[0]
+                    last_name = ' '.join(parts[1:]) if len(parts) > 1 else ''
+            pending[enroll] = {
+                'username': email if email else enroll, 'email': email,
+                'first_name': first_name, 'last_name': last_name,
+            }
+
+        if pending:
+            self._fetch([p['username'].upper() for p in pending.values()])
+            to_create = {}
+            for enroll, p in pending.items():
+                existing = self.users.get(p['username'].upper())
+                if existing:
+                    self.users[enroll] = existing
+                elif p['username'].upper() not in to_create:
+                    to_create[p['username'].upper()] = CustomUser(
+                        _id=ObjectId(), username=p['username'], email=p['email'], admission_number=enroll,
+                        user_type='student', first_name=p['first_name'], last_name=p['last_name']
+                    )
+            if to_create:
+                created = list(to_create.values())
+                try:
+                    CustomUser.objects.bulk_create(created)
+                except Exception as e:
+                    # One bad row must not sink the chunk: fall back to per-user creates
+                    print(f"[omr_ingest] bulk user create failed ({e}); retrying individually")
+                    created = []
+                    for u in to_create.values():
+                        try:
+                            u.save()
+                            created.append(u)
+                        except Exception as ue:
+                            print(f"Auto-sync failed for {u.admission_number}: {ue}")
+                self._remember(created)
+
+        return {e: self.users[e] for e in enrolls if e in self.users}
+
+
+def _answer_plan(test, header_idx):
+    """(column index, question id, option ids, is_single) per fNNN column in paper order."""
+    from .scoring import load_sections, compile_sections
+    sections = load_sections(test)
+    key = compile_sections(sections)
+    q_objs = {str(q.pk): q for sec in sections for q in sec.questions.all()}
+    plan = []
+    for i, cq in enumerate(key.questions):
+        col = f"f{i + 1:03d}"
+        q = q_objs[cq.id]
+        plan.append((
+            header_idx.get(col), cq.id,
+            [str(opt.get('id', '')) for opt in (q.question_options or [])],
+            q.question_type == 'SINGLE_CHOICE',
+        ))
+    return plan
+
+
+def _decode_mark(mark, option_ids, single):
+    ans_list = []
+    for char in mark:
+        if 'A' <= char <= 'Z':
+            idx = ord(char) - ord('A')
+        elif '1' <= char <= '9':
+            idx = int(char) - 1
+        else:
+            continue
+        if 0 <= idx < len(option_ids):
+            ans_list.append(option_ids[idx])
+    if not ans_list:
+        return None
+    return {'answer': ans_list[0]} if single else {'answer': ans_list}
+
+
+def ingest_omr_sheet(db, test, file, replace_existing=False, erp_idx=None, chunk_size=CHUNK_SIZE):
+    """Stream an OMR sheet into tests_testsubmission.
+
+    Returns (success_count, failed_rows) where failed_rows carry the unmatched
+    enrollments and their raw marks for the retry screen.
+    """
+    from pymongo import UpdateOne
+    from api.jobs import report_progress
+
+    rows = iter_sheet_rows(file)
+    header = next(rows, None)
+    if not header:
+        raise OMRSheetError('The uploaded sheet is empty.')
+    original_columns = [str(c) for c in header]
+    columns = [str(c if c is not None else '').strip().lower() for c in header]
+    header_idx = {}
+    for i, c in enumerate(columns):
+        header_idx.setdefault(c, i)
+
+    enroll_col = next((c for c in ENROLL_COLUMNS if c in header_idx), None)
+    if not enroll_col:
+        raise OMRSheetError(f'Could not find enrollment column in sheet. Found: {original_columns}')
+    enroll_i = header_idx[enroll_col]
+
+    is_omr_raw = 'frmid' in header_idx or 'f001' in header_idx
+    if is_omr_raw:
+        plan = _answer_plan(test, header_idx)
+        memo = [{} for _ in plan]
+    else:
+        score_col = next((c for c in SCORE_COLUMNS if c in header_idx), None)
+        if not score_col:
+            raise OMRSheetError(f'Could not identify score columns. Found: {original_columns}')
+        score_i = header_idx[score_col]
+
+    coll = db['tests_testsubmission']
+
+    resolver = StudentResolver(erp_idx)
+    seen_enrollments = set()
+    failed_rows = []
+    success_count = 0
+    uploaded_ids = []  # students written by this sheet
+    now = timezone.now()
+
+    rows_read = 0
+    for chunk in iter_chunks(rows, chunk_size):
+        rows_read += len(chunk)
+        parsed = []
+        for row_num, row in chunk:
+            enroll = normalize_enrollment(row[enroll_i] if enroll_i < len(row) else None)
+            if not enroll:
+                continue
+            if is_omr_raw:
+                if enroll in seen_enrollments:
+                    continue   # skip duplicates silently
+                seen_enrollments.add(enroll)
+                parsed.append((row_num, enroll, row))
+            else:
+                try:
+                    score = float(row[score_i])
+                except (ValueError, TypeError, IndexError):
+                    continue   # skip rows with invalid scores silently
+                if score != score or enroll in seen_enrollments:
+                    continue
+                seen_enrollments.add(enroll)
+                parsed.append((row_num, enroll, score))
+
+        students = resolver.resolve([p[1] for p in parsed])
+
+        updates, chunk_ids = [], []
+        for row_num, enroll, payload in parsed:
+            student = students.get(enroll)
+            if is_omr_raw:
+                row = payload
+                if not student:
+                    raw_data = {}
+                    for col_i, _, _, _ in plan:
+                        if col_i is not None and col_i < len(row):
+                            mark = _cell_str(row[col_i])
+                            if mark: raw_data[columns[col_i]] = mark
+                    failed_rows.append({'original_enrollment': enroll, 'raw_data': raw_data, 'sheet_type': 'raw', 'row_num': row_num})
+                    continue
+
+                responses = {}
+                for j, (col_i, qid, option_ids, single) in enumerate(plan):
+                    if col_i is None or col_i >= len(row):
+                        continue
+                    mark = _cell_str(row[col_i])
+                    if mark in BLANK_MARKS:
+                        continue
+                    col_memo = memo[j]
+                    if mark not in col_memo:
+                        col_memo[mark] = _decode_mark(mark, option_ids, single)
+                    decoded = col_memo[mark]
+                    if decoded is not None:
+                        responses[qid] = dict(decoded)
+                update = {
+                    '$set': {'responses': responses, 'is_finalized': True, 'submission_type': 'OMR_EXCEL'},
+                    '$setOnInsert': {'score': 0.0, 'time_spent': 0, 'allow_resume': False, 'submitted_at': now},
+                    '$unset': {'breakdown': ''},
+                }
+            else:
+                if not student:
+                    failed_rows.append({'original_enrollment': enroll, 'raw_data': {'score': payload}, 'sheet_type': 'score', 'row_num': row_num})
+                    continue
+                update = {
+                    '$set': {'score': payload, 'is_finalized': True, 'submission_type': 'OMR_EXCEL'},
+                    '$setOnInsert': {'responses': {}, 'time_spent': 0, 'allow_resume': False, 'submitted_at': now},
+                }
+            updates.append(update)
+            chunk_ids.append(student.pk)
+
+        if updates:
+            # Rows the upsert will insert need Djongo's integer id, or ORM reads see id=None
+            existing = set(coll.distinct('student_id', {'test_id': test.pk, 'student_id': {'$in': chunk_ids}}))
+            fresh = [u for u, pk in zip(updates, chunk_ids) if pk not in existing]
+            ids = _reserve_ids(db, len(fresh)) if fresh else None
+            if ids is not None:
+                for update, pk in zip(fresh, ids):
+                    update['$setOnInsert']['id'] = pk
+            ops = [UpdateOne({'test_id': test.pk, 'student_id': pk}, update, upsert=True)
+                   for update, pk in zip(updates, chunk_ids)]
+            coll.bulk_write(ops, ordered=False)
+            success_count += len(ops)
+            uploaded_ids += chunk_ids
+        report_progress(rows=rows_read, uploaded=success_count, failed=len(failed_rows))
+
+    if replace_existing:
+        # Only once the whole sheet is in: a read or write error above leaves the
+        # previous OMR results untouched instead of deleted and half-replaced
+        coll.delete_many({'test_id': test.pk, 'submission_type': 'OMR_EXCEL', 'student_id': {'$nin': uploaded_ids}})
+
+    return success_count, failed_rows
@@ -0,0 +1,140 @@
+"""
+Precompiled question papers.
+
+A test's question paper is compiled once into its final JSON bytes plus
+gzip (and brotli, when the `brotli` package is installed) variants. The
+ETag is a hash of the JSON bytes, so a recompiled but unchanged paper keeps
+its ETag and students who already hold it get a 304:
+
+    blob = get_paper(test_pk)            # None if the test doesn't exist
+    return paper_response(request, blob)
+
+The compiled blob is cached under `test_paper_<pk>` and dropped by
+invalidate_paper() when the test, one of its sections (including
+`question_order` and the section's question set) or one of its questions
+changes — see the receivers in tests/models.py.
+"""
+import gzip
+import hashlib
+
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+
+try:
+    import brotli
+except ImportError:  # optional: gzip is always available
+    brotli = None
+
+PAPER_TTL = 60 * 60
+
+
+def _cache_key(test_pk):
+    return f"test_paper_{test_pk}"
+
+
+def invalidate_paper(test_pk):
+    cache.delete(_cache_key(test_pk))
+
+
+def build_paper_data(test):
+    """The question paper payload (sections with ordered, de-duplicated questions)."""
+    from django.db.models import Prefetch
+    from questions.models import Question
+    from sections.serializers import SectionSerializer
+    from questions.serializers import QuestionSerializer
+
+    # Fetch sections and prefetch all questions with select_related in a single pass to eliminate N+1 queries
+    sections = list(test.sections.all().order_by('priority').prefetch_related(
+        Prefetch(
+            'questions',
+            queryset=Question.objects.select_related(
+                'class_level', 'subject', 'chapter', 'topic',
+                'exam_type', 'target_exam', 'test_name'
+            )
+        )
+    ))
+
+    sections_data = []
+    for section in sections:
+        section_dict = SectionSerializer(section).data
+
+        # Deduplicate and order
+        seen_pks = set()
+        unique_qs_list = []
+        for q in section.questions.all():
+            if str(q.pk) not in seen_pks:
+                seen_pks.add(str(q.pk))
+                unique_qs_list.append(q)
+
+        order_map = {str(oid): index for index, oid in enumerate(section.question_order or [])}
+        unique_qs_list.sort(key=lambda q: order_map.get(str(q.pk), 999999))
+
+        section_dict['questions_detail'] = QuestionSerializer(unique_qs_list, many=True).data
+        sections_data.append(section_dict)
+
+    return {
+        'test_name': test.name,
+        'test_code': test.code,
+        'duration': test.duration,
+        'instructions': test.instructions,
+        'sections': sections_data,
+        'exam_type_name': test.exam_type.name if test.exam_type else None
+    }
+
+
+def compile_paper(test):
+    """Render the paper once to JSON bytes and pre-compress it."""
+    from rest_framework.renderers import JSONRenderer
+
+    body = JSONRenderer().render(build_paper_data(test))
+    blob = {
+        'etag': '"%s"' % hashlib.sha1(body).hexdigest(),
+        'json': body,
+        # mtime=0 keeps the gzip bytes identical across recompiles
+        'gzip': gzip.compress(body, compresslevel=6, mtime=0),
+    }
+    if brotli is not None:
+        blob['br'] = brotli.compress(body, quality=5)
+    cache.set(_cache_key(test.pk), blob, timeout=PAPER_TTL)
+    return blob
+
+
+def cached_paper(test_pk):
+    """The compiled blob if it is cached, else None (entries from before precompiling are ignored)."""
+    blob = cache.get(_cache_key(test_pk))
+    return blob if isinstance(blob, dict) and 'etag' in blob else None
+
+
+def get_paper(test_pk):
+    blob = cached_paper(test_pk)
+    if blob is not None:
+        return blob
+    from .models import Test
+    try:
+        test = Test.objects.select_related('exam_type').get(pk=test_pk)
+    except Test.DoesNotExist:
+        return None
+    return compile_paper(test)
+
+
+def paper_response(request, blob):
+    """Serve precompiled bytes: 304 on a matching If-None-Match, else the best encoding."""
+    etag = blob['etag']
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+    if etag in [t.strip().replace('W/', '', 1) for t in if_none_match.split(',')]:
+        response = HttpResponseNotModified()
+    else:
+        accepted = request.META.get('HTTP_ACCEPT_ENCODING', '').lower()
+        if 'br' in accepted and 'br' in blob:
+            response = HttpResponse(blob['br'], content_type='application/json')
+            response['Content-Encoding'] = 'br'
+        elif 'gzip' in accepted:
+            response = HttpResponse(blob['gzip'], content_type='application/json')
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(blob['json'], content_type='application/json')
+    response['ETag'] = etag
+    response['Vary'] = 'Accept-Encoding'
+    # Browsers keep the paper but revalidate it (cheap 304) on every load
+    response['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,100 @@
+"""
+Per-test rank index.
+
+Built once from the finalized submissions of a test and kept in the shared
+cache (Redis), so a student's rank and percentile are a dict lookup and a
+bisect instead of a scan + sort of the whole collection on every request:
+
+    index = get_rank_index(db, test, key)
+    rank, percentile, total = rank_lookup(index, user.pk, score)
+
+Ordering matches the leaderboard: score DESC, then time_spent ASC.
+Anything that changes scores (generate_result, OMR upload, submit, reset)
+must call invalidate_rank_index(test.pk); the next reader rebuilds it.
+"""
+from bisect import bisect_left, bisect_right
+
+from django.core.cache import cache
+
+RANK_INDEX_TTL = 60 * 60 * 24
+
+
+def _cache_key(test_pk):
+    return f"rank_index_{test_pk}"
+
+
+def invalidate_rank_index(test_pk):
+    cache.delete(_cache_key(test_pk))
+
+
+def build_rank_index(db, test, key=None):
+    """Scan the test's finalized submissions once and cache the sorted index.
+
+    Submissions that were never scored (score 0/None, e.g. raw OMR uploads)
+    are scored from their breakdown when `key` is given, and the score is
+    persisted so later builds don't need to repeat it.
+    """
+    from bson import ObjectId
+    from .scoring import load_cards, BREAKDOWN_PROJECTION
+
+    try: t_pk = ObjectId(test.pk)
+    except: t_pk = test.pk
+
+    coll = db['tests_testsubmission']
+    docs = list(coll.find(
+        {'test_id': t_pk, 'is_finalized': True},
+        {'student_id': 1, 'score': 1, 'time_spent': 1, **BREAKDOWN_PROJECTION}
+    ))
+
+    uncalculated = [d for d in docs if d.get('score') is None or float(d.get('score') or 0) == 0]
+    if uncalculated and key is not None:
+        from pymongo import UpdateOne
+        ops = []
+        for doc, card in zip(uncalculated, load_cards(key, uncalculated, coll)):
+            doc['score'] = card['score']
+            ops.append(UpdateOne({'_id': doc['_id']}, {'$set': {'score': card['score']}}))
+        try:
+            coll.bulk_write(ops, ordered=False)
+        except Exception as e:
+            print(f"[rank_index] Failed to persist scores for test {test.pk}: {e}")
+
+    entries = []
+    for doc in docs:
+        try: ts = int(doc.get('time_spent') or 0)
+        except (TypeError, ValueError): ts = 0
+        entries.append((float(doc.get('score') or 0), ts, str(doc.get('student_id'))))
+    entries.sort(key=lambda e: (-e[0], e[1]))
+
+    ranks = {}
+    for i, (_, _, sid) in enumerate(entries):
+        ranks.setdefault(sid, i + 1)
+
+    index = {
+        'scores': sorted(e[0] for e in entries),  # ascending, for bisect
+        'ranks': ranks,
+        'total': len(entries),
+    }
+    cache.set(_cache_key(test.pk), index, timeout=RANK_INDEX_TTL)
+    return index
+
+
+def get_rank_index(db, test, key=None):
+    index = cache.get(_cache_key(test.pk))
+    if index is None:
+        index = build_rank_index(db, test, key)
+    return index
+
+
+def rank_lookup(index, student_id, score):
+    """Returns (rank, percentile, total_students) for a student's score."""
+    total = index['total']
+    rank = index['ranks'].get(str(student_id))
+    if rank is None:
+        # Not in the index (e.g. submitted after it was built): place by score
+        rank = total - bisect_right(index['scores'], score) + 1
+    if total > 1:
+        below = bisect_left(index['scores'], score)
+        percentile = round((below / total) * 100, 2)
+    else:
+        percentile = 100.0
+    return rank, percentile, total
@@ -0,0 +1,450 @@
+"""
+Compiled answer-key scoring shared by every results endpoint.
+
+A test's sections and questions are compiled ONCE into plain lookup tables
+(answer token -> option id, correct-id sets, numeric ranges, partial-mark rule
+parameters). Scoring a submission is then a single pass over the key using only
+dict/set operations — no clean_html regex and no option-list scans per answer.
+
+    key = compile_answer_key(test)
+    card = key.score(responses, grace=sub.get('grace_applied_questions'))
+    card['score'], card['sections'], card['questions']
+
+The result of scoring is also persisted on each submission as a compact
+`breakdown` (see AnswerKey.breakdown). It is stamped with a version derived
+from the answer key and the submission's grace list, so read endpoints can
+serve it directly and only re-score documents whose key has since changed:
+
+    cards = load_cards(key, docs, db['tests_testsubmission'])
+"""
+import hashlib
+import json
+import re
+
+# Per-question status codes (same codes the results UI already understands)
+STATUS_CORRECT = 'CA'
+STATUS_INCORRECT = 'IA'
+STATUS_PARTIAL = 'PA'
+STATUS_UNATTEMPTED = 'NA'
+STATUS_GRACE = 'GR'
+
+# One character per question in the persisted breakdown's status string
+STATUS_CHARS = {
+    STATUS_CORRECT: 'C', STATUS_INCORRECT: 'I', STATUS_PARTIAL: 'P',
+    STATUS_UNATTEMPTED: 'N', STATUS_GRACE: 'G',
+}
+CHAR_STATUS = {ch: st for st, ch in STATUS_CHARS.items()}
+
+# Projection for reads that only need the persisted breakdown
+BREAKDOWN_PROJECTION = {'breakdown': 1, 'grace_applied_questions': 1}
+
+OPTION_LABELS = ['a', 'b', 'c', 'd', 'e', 'f']
+
+_TAG_RE = re.compile('<[^<]+?>')
+
+
+def clean_html(text):
+    if not text: return ""
+    return _TAG_RE.sub('', str(text)).strip().lower()
+
+
+def parse_responses(raw):
+    """Mongo may hold responses as a dict, a JSON string or None."""
+    if isinstance(raw, str):
+        try: raw = json.loads(raw)
+        except Exception: raw = {}
+    return raw if isinstance(raw, dict) else {}
+
+
+def extract_answer(res_obj):
+    return res_obj.get('answer') if isinstance(res_obj, dict) else res_obj
+
+
+def extract_time(res_obj):
+    t = res_obj.get('time', 0) if isinstance(res_obj, dict) else 0
+    return t if isinstance(t, (int, float)) else 0
+
+
+def is_blank(ans):
+    return ans in (None, '', [], {})
+
+
+class CompiledQuestion:
+    __slots__ = (
+        'id', 'type', 'lookup', 'correct', 'answer_from', 'answer_to',
+        'correct_marks', 'negative_marks', 'rule_type', 'rule_correct', 'rule_negative',
+        'is_wrong', 'bits', 'correct_mask', 'option_count',
+    )
+
+    def __init__(self, q, correct_marks, negative_marks, rule):
+        options = q.question_options or []
+        self.id = str(q.pk)
+        self.type = q.question_type or 'SINGLE_CHOICE'
+        self.correct_marks = correct_marks
+        self.negative_marks = negative_marks
+        self.is_wrong = bool(getattr(q, 'is_wrong', False))
+        self.answer_from = float(q.answer_from) if getattr(q, 'answer_from', None) is not None else None
+        self.answer_to = float(q.answer_to) if getattr(q, 'answer_to', None) is not None else None
+        self.correct = frozenset(str(opt.get('id', '')) for opt in options if opt.get('isCorrect'))
+
+        # Answer token -> option id. Fallback tokens (content, a-f label, 1-based
+        # index) are registered first with setdefault so the earliest option wins,
+        # then exact option ids overwrite them — the same precedence as the old
+        # "Pass 1: exact ID, Pass 2: fallback" loops, without the per-answer scans.
+        lookup = {}
+        for oi, opt in enumerate(options):
+            opt_id = str(opt.get('id', ''))
+            content = clean_html(opt.get('content') or opt.get('text', ''))
+            if content: lookup.setdefault(content, opt_id)
+            if oi < len(OPTION_LABELS): lookup.setdefault(OPTION_LABELS[oi], opt_id)
+            lookup.setdefault(str(oi + 1), opt_id)
+        for opt in reversed(options):
+            opt_id = str(opt.get('id', ''))
+            lookup[opt_id.strip().lower()] = opt_id
+        self.lookup = lookup
+
+        # Bitmask form of the same table for the vectorized batch scorer: each
+        # distinct option id owns the bit of its first position in the list.
+        id_bit = {}
+        for oi, opt in enumerate(options):
+            id_bit.setdefault(str(opt.get('id', '')), 1 << oi)
+        self.bits = {token: id_bit[opt_id] for token, opt_id in lookup.items()}
+        self.correct_mask = 0
+        for opt_id in self.correct:
+            self.correct_mask |= id_bit[opt_id]
+        self.option_count = len(options)
+
+        if rule is not None:
+            self.rule_type = rule.logic_type
+            self.rule_correct = float(rule.base_correct_marks or 0)
+            self.rule_negative = float(rule.base_negative_marks or 0)
+        else:
+            self.rule_type = None
+            self.rule_correct = 0.0
+            self.rule_negative = 0.0
+
+    def resolve(self, item):
+        return self.lookup.get(str(item).strip().lower())
+
+    def evaluate(self, ans):
+        """Returns (status, earned, negative) for a non-blank answer."""
+        q_type = self.type
+        if q_type == 'SINGLE_CHOICE':
+            if isinstance(ans, list):
+                ans = ans[0] if len(ans) == 1 else None
+            if ans is not None and self.resolve(ans) in self.correct:
+                return STATUS_CORRECT, self.correct_marks, 0.0
+            return STATUS_INCORRECT, 0.0, self.negative_marks
+
+        if q_type == 'MULTI_CHOICE':
+            lookup = self.lookup
+            selected = set()
+            for item in (ans if isinstance(ans, list) else [ans]):
+                opt_id = lookup.get(str(item).strip().lower())
+                if opt_id is not None:
+                    selected.add(opt_id)
+            return self._evaluate_multi(selected)
+
+        if q_type in ('NUMERICAL', 'INTEGER_TYPE'):
+            try:
+                val = float(ans)
+            except (TypeError, ValueError):
+                return STATUS_INCORRECT, 0.0, self.negative_marks
+            if self.answer_from is None or self.answer_to is None:
+                # No key configured for this question: never penalise.
+                return STATUS_INCORRECT, 0.0, 0.0
+            if self.answer_from <= val <= self.answer_to:
+                return STATUS_CORRECT, self.correct_marks, 0.0
+            return STATUS_INCORRECT, 0.0, self.negative_marks
+
+        # MATRIX / PARAGRAPH etc. are not auto-scored.
+        return STATUS_INCORRECT, 0.0, 0.0
+
+    def _evaluate_multi(self, selected):
+        correct = self.correct
+        logic = self.rule_type
+
+        if logic == 'JEE_ADVANCED':
+            if not selected.issubset(correct):
+                return STATUS_INCORRECT, 0.0, self.rule_negative
+            if selected == correct:
+                return STATUS_CORRECT, self.rule_correct, 0.0
+            # Standard JEE Advanced step marks (+3, +2, +1)
+            return STATUS_PARTIAL, float(min(len(selected), 3)), 0.0
+
+        if logic in ('WBJEE', 'CUSTOM_FRACTIONAL'):
+            if not selected.issubset(correct):
+                # WBJEE Cat 3 typically has 0 negative marks
+                neg = self.rule_negative if logic == 'CUSTOM_FRACTIONAL' else 0.0
+                return STATUS_INCORRECT, 0.0, neg
+            if selected == correct:
+                return STATUS_CORRECT, self.rule_correct, 0.0
+            fraction = len(selected) / len(correct) if correct else 0
+            return STATUS_PARTIAL, round(self.rule_correct * fraction, 2), 0.0
+
+        if logic == 'STANDARD':
+            if selected == correct:
+                return STATUS_CORRECT, self.rule_correct, 0.0
+            return STATUS_INCORRECT, 0.0, self.rule_negative
+
+        # No rule: proportional credit for the correct options picked.
+        if selected == correct:
+            return STATUS_CORRECT, self.correct_marks, 0.0
+        hit = selected & correct
+        if hit:
+            fraction = len(hit) / len(correct) if correct else 0
+            return STATUS_PARTIAL, round(self.correct_marks * fraction, 2), 0.0
+        return STATUS_INCORRECT, 0.0, self.negative_marks
+
+
+class AnswerKey:
+    """A test compiled for scoring.
+
+    `questions` is the flat paper order (sections by priority, questions by
+    `question_order`, de-duplicated within a section). `sections` holds one
+    entry per section with `start`/`end` offsets into `questions`.
+    """
+
+    def __init__(self, sections):
+        self.sections = []
+        self.questions = []
+        self.index = {}
+
+        for sec in sections:
+            c_marks = float(sec.correct_marks or 0)
+            n_marks = float(sec.negative_marks or 0)
+            rule = sec.partial_mark_rule
+
+            order_map = {str(oid): i for i, oid in enumerate(sec.question_order or [])}
+            seen = set()
+            sec_qs = []
+            for q in sec.questions.all():
+                qid = str(q.pk)
+                if qid in seen: continue
+                seen.add(qid)
+                sec_qs.append(q)
+            sec_qs.sort(key=lambda q: order_map.get(str(q.pk), 999999))
+
+            start = len(self.questions)
+            for q in sec_qs:
+                cq = CompiledQuestion(q, c_marks, n_marks, rule)
+                self.index.setdefault(cq.id, len(self.questions))
+                self.questions.append(cq)
+
+            self.sections.append({
+                'name': sec.name,
+                'correct_marks': c_marks,
+                'negative_marks': n_marks,
+                'question_count': len(sec_qs),
+                'max_marks': len(sec_qs) * c_marks,
+                'start': start,
+                'end': len(self.questions),
+            })
+
+        self.wrong_question_ids = [cq.id for cq in self.questions if cq.is_wrong]
+        self.max_marks = sum(s['max_marks'] for s in self.sections)
+        self.fingerprint = self._fingerprint()
+        self._versions = {}
+
+    def _fingerprint(self):
+        # Everything that can change a score: layout, answer tokens, key and marks.
+        # is_wrong is deliberately excluded; grace is folded in by version().
+        h = hashlib.sha1()
+        for sec in self.sections:
+            h.update(repr((sec['name'], sec['start'], sec['end'])).encode())
+        for cq in self.questions:
+            h.update(repr((
+                cq.id, cq.type, sorted(cq.correct), sorted(cq.lookup.items()),
+                cq.answer_from, cq.answer_to, cq.correct_marks, cq.negative_marks,
+                cq.rule_type, cq.rule_correct, cq.rule_negative,
+            )).encode())
+        return h.hexdigest()
+
+    def version(self, grace=None):
+        """Version stamp for a breakdown scored with this key and grace list."""
+        grace_key = tuple(sorted(str(qid) for qid in grace)) if grace else ()
+        v = self._versions.get(grace_key)
+        if v is None:
+            v = hashlib.sha1((self.fingerprint + ','.join(grace_key)).encode()).hexdigest()[:16]
+            self._versions[grace_key] = v
+        return v
+
+    def question_ids(self):
+        return [cq.id for cq in self.questions]
+
+    def score(self, responses, grace=None):
+        """Score one submission in a single pass.
+
+        `grace` is the stored `grace_applied_questions` list (or, for
+        generate_result, the live `wrong_question_ids`). Graced questions that
+        were attempted get full section marks and no negative.
+
+        Returns a dict with totals, a per-section breakdown aligned with
+        `self.sections`, and `questions`: a list of (status, earned, negative)
+        aligned with `self.questions`.
+        """
+        responses = parse_responses(responses)
+        grace_qs = set(str(qid) for qid in grace) if grace else ()
+
+        marks = []
+        sections_out = []
+        tot = {'positive': 0.0, 'negative': 0.0, 'correct': 0, 'incorrect': 0, 'partial': 0, 'unattempted': 0}
+
+        for sec in self.sections:
+            s = {
+                'name': sec['name'],
+                'earned': 0.0, 'negative': 0.0,
+                'correct': 0, 'incorrect': 0, 'partial': 0, 'unattempted': 0,
+                'question_count': sec['question_count'],
+                'max_marks': sec['max_marks'],
+                'time_spent': 0,
+            }
+            for cq in self.questions[sec['start']:sec['end']]:
+                res_obj = responses.get(cq.id)
+                s['time_spent'] += extract_time(res_obj)
+                ans = extract_answer(res_obj)
+                if is_blank(ans):
+                    marks.append((STATUS_UNATTEMPTED, 0.0, 0.0))
+                    s['unattempted'] += 1
+                    continue
+
+                if cq.id in grace_qs:
+                    status, earned, neg = STATUS_GRACE, cq.correct_marks, 0.0
+                else:
+                    status, earned, neg = cq.evaluate(ans)
+                marks.append((status, earned, neg))
+
+                if status == STATUS_CORRECT or status == STATUS_GRACE:
+                    s['correct'] += 1
+                elif status == STATUS_PARTIAL:
+                    s['partial'] += 1
+                else:
+                    s['incorrect'] += 1
+                s['earned'] += earned
+                s['negative'] += neg
+
+            s['attempted'] = s['correct'] + s['partial'] + s['incorrect']
+            s['net'] = round(s['earned'] - s['negative'], 2)
+            for k in ('correct', 'incorrect', 'partial', 'unattempted'):
+                tot[k] += s[k]
+            tot['positive'] += s['earned']
+            tot['negative'] += s['negative']
+            sections_out.append(s)
+
+        tot['attempted'] = tot['correct'] + tot['partial'] + tot['incorrect']
+        tot['score'] = round(tot['positive'] - tot['negative'], 2)
+        tot['sections'] = sections_out
+        tot['questions'] = marks
+        tot['statuses'] = [m[0] for m in marks]
+        return tot
+
+    def breakdown(self, card, grace=None):
+        """Compact, versioned form of a score card for storing on the submission."""
+        return {
+            'v': self.version(grace),
+            'score': card['score'],
+            'positive': round(card['positive'], 4),
+            'negative': round(card['negative'], 4),
+            'sections': [
+                {
+                    'name': s['name'],
+                    'earned': round(s['earned'], 4),
+                    'negative': round(s['negative'], 4),
+                    'correct': s['correct'],
+                    'incorrect': s['incorrect'],
+                    'partial': s['partial'],
+                    'unattempted': s['unattempted'],
+                    'time_spent': s['time_spent'],
+                }
+                for s in card['sections']
+            ],
+            'q': ''.join(STATUS_CHARS[st] for st in card['statuses']),
+        }
+
+    def card_from_breakdown(self, bd):
+        """Rebuild a score card (without per-question marks) from a stored breakdown."""
+        tot = {'positive': bd['positive'], 'negative': bd['negative'], 'score': bd['score'],
+               'correct': 0, 'incorrect': 0, 'partial': 0, 'unattempted': 0}
+        sections_out = []
+        for sec, stored in zip(self.sections, bd['sections']):
+            s = dict(stored)
+            s['question_count'] = sec['question_count']
+            s['max_marks'] = sec['max_marks']
+            s['attempted'] = s['correct'] + s['partial'] + s['incorrect']
+            s['net'] = round(s['earned'] - s['negative'], 2)
+            for k in ('correct', 'incorrect', 'partial', 'unattempted'):
+                tot[k] += s[k]
+            sections_out.append(s)
+        tot['attempted'] = tot['correct'] + tot['partial'] + tot['incorrect']
+        tot['sections'] = sections_out
+        tot['statuses'] = [CHAR_STATUS[ch] for ch in bd['q']]
+        return tot
+
+    def is_current(self, doc):
+        bd = doc.get('breakdown')
+        return isinstance(bd, dict) and bd.get('v') == self.version(doc.get('grace_applied_questions'))
+
+
+def compile_sections(sections):
+    """Compile an already-loaded iterable of Section objects (questions prefetched)."""
+    return AnswerKey(sections)
+
+
+def load_sections(test):
+    """Sections + questions + partial-mark rules for a test in one prefetch pass."""
+    from sections.models import Section
+    return list(
+        Section.objects.filter(test=test)
+        .select_related('partial_mark_rule')
+        .prefetch_related('questions')
+        .order_by('priority')
+    )
+
+
+def compile_answer_key(test):
+    return AnswerKey(load_sections(test))
+
+
+def load_cards(key, docs, collection=None):
+    """One score card per submission doc, aligned with `docs`.
+
+    Docs carrying a breakdown stamped with the current key version are served
+    from it. The rest are re-scored — their `responses` are fetched in one
+    query if the caller's projection left them out — and, when `collection`
+    is given, the fresh breakdowns are written back in a single bulk write.
+    """
+    cards = [None] * len(docs)
+    stale = []
+    for i, doc in enumerate(docs):
+        if key.is_current(doc):
+            cards[i] = key.card_from_breakdown(doc['breakdown'])
+        else:
+            stale.append(i)
+    if not stale:
+        return cards
+
+    fetched = {}
+    missing = [docs[i]['_id'] for i in stale if 'responses' not in docs[i] and '_id' in docs[i]]
+    if missing and collection is not None:
+        try:
+            fetched = {d['_id']: d.get('responses') for d in collection.find({'_id': {'$in': missing}}, {'responses': 1})}
+        except Exception as e:
+            print(f"[load_cards] Failed to fetch responses: {e}")
+
+    ops = []
+    for i in stale:
+        doc = docs[i]
+        grace = doc.get('grace_applied_questions')
+        responses = doc['responses'] if 'responses' in doc else fetched.get(doc.get('_id'))
+        card = key.score(responses, grace=grace)
+        cards[i] = card
+        if '_id' in doc:
+            ops.append((doc['_id'], key.breakdown(card, grace)))
+
+    if ops and collection is not None:
+        from pymongo import UpdateOne
+        try:
+            collection.bulk_write([UpdateOne({'_id': _id}, {'$set': {'breakdown': bd}}) for _id, bd in ops], ordered=False)
+        except Exception as e:
+            print(f"[load_cards] Failed to persist breakdowns: {e}")
+    return cards
@@ -234,11 +234,17 @@ class TestSerializer(serializers.ModelSerializer):
                     total_count += 1
 
             # 2. ERP Students (Global Deduplication)
-            from api.erp_views import _fetch_all_students_erp
-            # Guard: _fetch_all_students_erp can return None on transient errors
-            erp_pool = _fetch_all_students_erp() or []
+            from api.erp_views import _fetch_centre_students_erp
             centre_queries = [(c.name.upper().strip(), c.code.upper().strip()) for c in centres]
-            
+
+            def matches_any(e_centre):
+                # Match if names identical OR codes identical OR partial name match (e.g. 'HOWRAH' in 'HOWRAH_FRANCHISE')
+                return any(c_name == e_centre or c_code == e_centre or c_name in e_centre or e_centre in c_name
+                           for c_name, c_code in centre_queries)
+
+            # Only the matching centres' records are read from the ERP mirror
+            erp_pool = _fetch_centre_students_erp(matches_any) or []
+
             for erp_student in erp_pool:
                 if not isinstance(erp_student, dict): continue
                 
@@ -253,27 +259,6 @@ class TestSerializer(serializers.ModelSerializer):
                 if (e_adm and e_adm in seen_identifiers) or (e_email and e_email in seen_identifiers):
                     continue
 
-                # --- SHOW ALL STUDENTS MATCHING CENTRE ---
-                # 2. Centre Match
-                e_centre_raw = erp_student.get('centre')
-                if not e_centre_raw:
-                    v = erp_student.get('venue')
-                    if isinstance(v, dict): e_centre_raw = v.get('centreName') or v.get('name')
-                    else: e_centre_raw = v
-                
-                e_centre = str(e_centre_raw or '').upper().strip()
-                if not e_centre: continue
-                
-                # Fuzzy match for global roster
-                matches_any = False
-                for c_name, c_code in centre_queries:
-                    # Match if names identical OR codes identical OR partial name match (e.g. 'HOWRAH' in 'HOWRAH_FRANCHISE')
-                    if c_name == e_centre or c_code == e_centre or \
-                       c_name in e_centre or e_centre in c_name:
-                        matches_any = True
-                        break
-                if not matches_any: continue
-                
                 if e_adm: seen_identifiers.add(e_adm)
                 if e_email: seen_identifiers.add(e_email)
                 total_count += 1
@@ -11,12 +11,8 @@ from sections.serializers import SectionSerializer
 from questions.serializers import QuestionSerializer
 import random
 import string
-import re
 import json
-
-def clean_html(text):
-    if not text: return ""
-    return re.sub('<[^<]+?>', '', str(text)).strip().lower()
+from api.jobs import runs_as_job, report_progress
 
 
 def invalidate_my_results_cache():
@@ -108,87 +104,28 @@ def _compute_roster_counts():
 
 
 def _warm_test_paper_cache(test_id):
-    """Pre-cache test paper data to avoid slow loads on first student request.
-    
+    """Precompile a test paper to avoid slow loads on first student request.
+
     Runs in background to avoid blocking user requests.
-    Caches the complete test paper with all sections and questions for 60 minutes.
     """
-    from django.core.cache import cache
     from django.db import close_old_connections
-    from questions.models import Question
-    
+    from .paper import cached_paper, compile_paper
+
     close_old_connections()
     try:
-        cache_key = f"test_paper_{test_id}"
-        
-        # Skip if already cached
-        if cache.get(cache_key):
-            print(f"[CACHE] Test paper {test_id} already cached, skipping warm-up")
+        # Skip if already compiled
+        if cached_paper(test_id) is not None:
             return
-        
+
         try:
             test = Test.objects.select_related('exam_type').get(pk=test_id)
         except Test.DoesNotExist:
             print(f"[CACHE] Test {test_id} not found, cannot warm cache")
             return
-        
-        # Fetch sections
-        sections = list(test.sections.all().order_by('priority'))
-        
-        # Fetch ALL questions for ALL sections in ONE query
-        all_section_ids = [str(s.pk) for s in sections]
-        all_questions = list(Question.objects.filter(
-            section_id__in=all_section_ids
-        ).select_related(
-            'class_level', 'subject', 'chapter', 'topic',
-            'exam_type', 'target_exam', 'test_name'
-        ))
-        
-        # Build section->questions map
-        section_q_map = {}
-        for q in all_questions:
-            sec_id = str(q.section_id)
-            if sec_id not in section_q_map:
-                section_q_map[sec_id] = []
-            section_q_map[sec_id].append(q)
-        
-        # Build response
-        sections_data = []
-        from sections.serializers import SectionSerializer
-        from questions.serializers import QuestionSerializer
-        
-        for section in sections:
-            section_dict = SectionSerializer(section).data
-            section_questions = section_q_map.get(str(section.pk), [])
-            
-            # Deduplicate and order
-            seen_pks = set()
-            unique_qs_list = []
-            for q in section_questions:
-                if str(q.pk) not in seen_pks:
-                    seen_pks.add(str(q.pk))
-                    unique_qs_list.append(q)
-            
-            order_list = section.question_order or []
-            order_map = {str(oid): index for index, oid in enumerate(order_list)}
-            unique_qs_list.sort(key=lambda q: order_map.get(str(q.pk), 999999))
-            
-            section_dict['questions_detail'] = QuestionSerializer(unique_qs_list, many=True).data
-            sections_data.append(section_dict)
-        
-        response_data = {
-            'test_name': test.name,
-            'test_code': test.code,
-            'duration': test.duration,
-            'instructions': test.instructions,
-            'sections': sections_data,
-            'exam_type_name': test.exam_type.name if test.exam_type else None
-        }
-        
-        # Cache for 60 minutes
-        cache.set(cache_key, response_data, timeout=3600)
-        print(f"[CACHE] Warmed test paper {test_id} with {len(sections)} sections and {len(all_questions)} questions")
-        
+
+        blob = compile_paper(test)
+        print(f"[CACHE] Compiled test paper {test_id} ({len(blob['json'])} bytes, etag {blob['etag']})")
+
     except Exception as e:
         print(f"[CACHE ERROR] Failed to warm test paper {test_id}: {e}")
     finally:
@@ -487,10 +424,6 @@ class TestViewSet(viewsets.ModelViewSet):
                     t.start()
                 except: pass
 
-            # Guard against None values: str(None) → 'none' which would match incorrectly
-            c_code = str(getattr(user, 'centre_code', '') or '').lower().strip()
-            c_name = str(getattr(user, 'centre_name', '') or '').lower().strip()
-
             # Pre-fetch submission test IDs for this student (FAST)
             submission_test_ids = []
             if db is not None:
@@ -507,102 +440,12 @@ class TestViewSet(viewsets.ModelViewSet):
                     submission_test_ids = [d['test_id'] for d in sub_docs]
                 except: pass
 
-            # Optimized Filtering: Pre-compute all M2M matches as plain PK lists so the
-            # final queryset uses ONLY simple pk__in conditions — no M2M JOINs, no DISTINCT.
-            # Djongo emulates DISTINCT in Python (full scan + dedup), causing 7+ second
-            # overhead. Replacing every M2M filter with a pre-fetched pk__in eliminates
-            # that entirely and brings the main query down to a single indexed lookup.
-            from django.db.models import Q
-            from centres.models import Centre
-
-            # 1. Centre filter: resolve matching centre IDs, then find tests that include them.
-            centre_test_ids = []
-            if c_code or c_name:
-                matching_centre_ids = list(
-                    Centre.objects.filter(
-                        Q(code__iexact=c_code) | Q(name__iexact=c_name)
-                    ).values_list('_id', flat=True)
-                )
-                if matching_centre_ids:
-                    # One extra query, but avoids M2M JOIN + DISTINCT on the main queryset.
-                    centre_test_ids = list(
-                        Test.objects.filter(centres__in=matching_centre_ids).values_list('pk', flat=True)
-                    )
-
-            # 2. Academic filter: resolve target_exam and session via pre-computed PK lists.
-            academic_test_ids = None  # None means "no academic restriction"
-            if user.class_level:
-                # Match tests where either:
-                #   (a) the single FK class_level matches, OR
-                #   (b) the M2M class_levels field contains the student's class level.
-                # Admins use the M2M class_levels to tag multiple levels on one test
-                # (e.g. both "12" and "REPEATER"), but the old filter only checked (a).
-                class_levels_m2m_ids = list(
-                    Test.objects.filter(class_levels=user.class_level).values_list('pk', flat=True)
-                )
-                qs_academic = Test.objects.filter(
-                    Q(class_level=user.class_level) | Q(pk__in=class_levels_m2m_ids)
-                )
-            else:
-                # If the student has no class, only show tests that have NO class restriction
-                qs_academic = Test.objects.filter(class_level__isnull=True)
-
-            target_match = Q()
-            if user.target_exam:
-                target_match |= Q(target_exams=user.target_exam)
-            
-            exam_instance_names = getattr(user, 'exam_instance_names', "")
-            if exam_instance_names and isinstance(exam_instance_names, str):
-                from master_data.models import TargetExam
-                exam_instances = [x.strip() for x in exam_instance_names.split(',') if x.strip()]
-                # Exact case-insensitive match for each instance
-                instance_qs = TargetExam.objects.none()
-                for inst in exam_instances:
-                    instance_qs |= TargetExam.objects.filter(Q(name__iexact=inst) | Q(name=inst))
-                
-                matching_te_ids = list(instance_qs.values_list('pk', flat=True))
-                if matching_te_ids:
-                    target_match |= Q(target_exams__in=matching_te_ids)
-
-            if target_match:
-                te_test_ids = list(
-                    Test.objects.filter(target_match).values_list('pk', flat=True)
-                )
-                qs_academic = qs_academic.filter(pk__in=te_test_ids)
-
-            if user.session:
-                # Session: include STUDY PLANNER tests (any session) plus tests matching by FK or M2M.
-                session_m2m_ids = list(
-                    Test.objects.filter(sessions=user.session).values_list('pk', flat=True)
-                )
-                qs_academic = qs_academic.filter(
-                    Q(exam_type__name__icontains='STUDY PLANNER') |
-                    Q(exam_type__name__icontains='STUDY_PLANNER') |
-                    Q(session=user.session) |
-                    Q(pk__in=session_m2m_ids)
-                )
-
-            academic_test_ids = list(qs_academic.values_list('pk', flat=True))
-
-            # 3. Combine: submitted tests  OR  (centre match AND academic match) — no DISTINCT needed.
-            eligible_ids = set(str(pk) for pk in centre_test_ids) & set(str(pk) for pk in academic_test_ids)
-            final_ids = list(set(str(pk) for pk in submission_test_ids) | eligible_ids)
-
-            queryset = queryset.filter(pk__in=final_ids)
-
-            # Hide OMR tests from students unless results are published.
-            # Pre-compute unpublished OMR test IDs to bypass Djongo's SQL JOIN/double-negation translation bug in exclude() and boolean translation bugs.
-            from master_data.models import ExamType
-            omr_type_ids = list(ExamType.objects.filter(name__icontains='omr').values_list('pk', flat=True))
-            
-            # Fetch all OMR test IDs and their published status, then filter in python to avoid Djongo boolean bugs
-            from django.db.models import Q
-            all_omr_tests = Test.objects.filter(
-                Q(exam_type_id__in=omr_type_ids) | Q(is_omr_based=True)
-            ).values_list('pk', 'is_result_published')
-            
-            omr_unpublished_test_ids = [pk for pk, is_pub in all_omr_tests if not is_pub]
-            queryset = queryset.exclude(pk__in=omr_unpublished_test_ids)
+            # Eligibility (centre AND class level / target exam / session, minus
+            # unpublished OMR tests) comes from the materialized visibility index:
+            # one cache read per student profile instead of ~8 Djongo queries.
+            # The final queryset is a single pk__in lookup — no M2M JOINs, no DISTINCT.
+            from .visibility import student_test_ids
+            queryset = queryset.filter(pk__in=student_test_ids(user, submission_test_ids))
         
         package_id = self.request.query_params.get('package', None)
         if package_id:
@@ -1131,13 +974,18 @@ class TestViewSet(viewsets.ModelViewSet):
 
                     is_fin = bool(sub_doc.get('is_finalized', False))
                     allow_res = bool(sub_doc.get('allow_resume', False))
+                    time_spent = sub_doc.get('time_spent', 0)
+                    if not is_fin:
+                        # Include autosaves still waiting in the write buffer
+                        from .autosave import pending_progress, apply_pending
+                        raw_res, time_spent = apply_pending(raw_res, time_spent, pending_progress(t_pk, s_pk))
                     
                     return Response({
                         'status': 'submitted' if is_fin else 'in_progress',
                         'is_finalized': is_fin,
                         'allow_resume': allow_res,
                         'responses': raw_res,
-                        'time_spent': int(sub_doc.get('time_spent', 0)),
+                        'time_spent': int(time_spent or 0),
                         'submission_type': str(sub_doc.get('submission_type', 'MANUAL'))
                     })
                 else:
@@ -1377,19 +1225,20 @@ class TestViewSet(viewsets.ModelViewSet):
         })
 
     @action(detail=True, methods=['post'], url_path='upload_omr_excel')
+    @runs_as_job('upload_omr_excel')
     def upload_omr_excel(self, request, pk=None):
         """
         Partial-save OMR upload:
         - Matched students  → saved to TestSubmission immediately.
         - Unmatched students → stored in OMRFailedRecord so admin can edit+retry.
         Any previous OMRFailedRecord entries for this test are cleared on each new upload.
+        The sheet is streamed in row chunks and upserted in bulk (see omr_ingest).
         """
         try:
-            import pandas as pd
-            from django.db.models import Q
-            from .models import TestSubmission, OMRFailedRecord
-            from api.models import CustomUser
             from api.erp_views import get_student_lookup_index
+            from api.db_utils import get_db
+            from .omr_ingest import ingest_omr_sheet, OMRSheetError
+            from api.student_context import bump_test_students
 
             test = self.get_object()
             file = request.FILES.get('file')
@@ -1397,249 +1246,43 @@ class TestViewSet(viewsets.ModelViewSet):
             if not file:
                 return Response({'error': 'No file uploaded'}, status=400)
 
-            if file.name.endswith('.csv'):
-                df = pd.read_csv(file)
-            else:
-                df = pd.read_excel(file)
-
-            original_columns = list(df.columns)
-            df.columns = [str(c).strip().lower() for c in df.columns]
-
-            # --- HIGH PERFORMANCE PREFETCHING ---
-            enroll_col = next((c for c in ['frmid', 'enrollment number', 'enrollment', 'admission number', 'admission', 'student id', 'id', 'username'] if c in df.columns), None)
-            if not enroll_col:
-                return Response({'error': f'Could not find enrollment column in sheet. Found: {original_columns}'}, status=400)
-
-            raw_enrolls = []
-            for val in df[enroll_col]:
-                if pd.isna(val): continue
-                enroll = str(val).strip().upper()
-                if enroll.endswith('.0'): enroll = enroll[:-2]
-                if enroll.isdigit(): enroll = f"PATH{enroll}"
-                if enroll: raw_enrolls.append(enroll)
-
-            existing_users_qs = CustomUser.objects.filter(Q(admission_number__in=raw_enrolls) | Q(username__in=raw_enrolls))
-            existing_user_map = {}
-            for u in existing_users_qs:
-                if u.admission_number: existing_user_map[u.admission_number.upper()] = u
-                if u.username: existing_user_map[u.username.upper()] = u
+            db = get_db()
+            if db is None:
+                return Response({'error': 'Database unavailable.'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
             erp_idx = get_student_lookup_index(force_refresh=False, block=False) or {}
 
-            existing_subs_qs = TestSubmission.objects.filter(test=test, student__in=existing_users_qs)
-            existing_sub_map = {s.student_id: s for s in existing_subs_qs}
-            # ----------------------------------------
-
-            is_omr_raw = 'frmid' in df.columns or 'f001' in df.columns
-            failed_rows = []   # list of { original_enrollment, raw_data }
-            seen_enrollments = set()
-            validated_rows = []
-
-            def _resolve_student(enroll_raw, row_num):
-                """Try to find or auto-create a student. Returns (student|None, error_msg|None)."""
-                student = existing_user_map.get(enroll_raw)
-                if not student:
-                    erp_record = erp_idx.get(f"adm_{enroll_raw}")
-                    if erp_record:
-                        try:
-                            student_obj = erp_record.get('student') or {}
-                            details_list = student_obj.get('studentsDetails', [])
-                            email = ""
-                            first_name = "Student"
-                            last_name = ""
-                            if details_list and isinstance(details_list, list) and len(details_list) > 0:
-                                email = details_list[0].get('studentEmail', '')
-                                name = details_list[0].get('studentName', '')
-                                if name:
-                                    parts = name.strip().split(' ')
-                                    first_name = parts[0]
-                                    last_name = ' '.join(parts[1:]) if len(parts) > 1 else ''
-                            username = email if email else enroll_raw
-                            student = existing_user_map.get(username.upper())
-                            if not student:
-                                student = CustomUser.objects.create(
-                                    username=username, email=email, admission_number=enroll_raw,
-                                    user_type='student', first_name=first_name, last_name=last_name
-                                )
-                                existing_user_map[enroll_raw] = student
-                                existing_user_map[username.upper()] = student
-                        except Exception as e:
-                            print(f"Auto-sync failed for {enroll_raw}: {e}")
-                            student = None
-                if not student:
-                    return None, f"Row {row_num}: Student not found with enrollment '{enroll_raw}'."
-                return student, None
-
-            if is_omr_raw:
-                questions = []
-                for section in test.sections.prefetch_related('questions').order_by('priority'):
-                    seen = set()
-                    order_list = section.question_order or []
-                    order_map = {str(oid): i for i, oid in enumerate(order_list)}
-                    sec_qs = []
-                    for q in section.questions.all():
-                        if str(q.pk) not in seen:
-                            seen.add(str(q.pk))
-                            sec_qs.append(q)
-                    sec_qs.sort(key=lambda q: order_map.get(str(q.pk), 999999))
-                    questions.extend(sec_qs)
-
-                for index, row in df.iterrows():
-                    row_num = index + 2
-                    if pd.isna(row[enroll_col]): continue
-
-                    enroll_raw = str(row[enroll_col]).strip().upper()
-                    if enroll_raw.endswith('.0'): enroll_raw = enroll_raw[:-2]
-                    if enroll_raw.isdigit(): enroll_raw = f"PATH{enroll_raw}"
-
-                    if enroll_raw in seen_enrollments:
-                        continue   # skip duplicates silently
-                    seen_enrollments.add(enroll_raw)
-
-                    student, err = _resolve_student(enroll_raw, row_num)
-                    if not student:
-                        # Build raw_data from all f-columns
-                        raw_data = {}
-                        for i in range(1, len(questions) + 1):
-                            col = f"f{i:03d}"
-                            if col in df.columns:
-                                val = row[col]
-                                if not pd.isna(val):
-                                    raw_data[col] = str(val).strip().upper()
-                        failed_rows.append({'original_enrollment': enroll_raw, 'raw_data': raw_data, 'sheet_type': 'raw', 'row_num': row_num})
-                        continue
-
-                    responses = {}
-                    for i, q in enumerate(questions):
-                        col_name = f"f{i+1:03d}"
-                        if col_name in df.columns:
-                            ans_val = row[col_name]
-                            if pd.isna(ans_val): continue
-                            ans_str = str(ans_val).strip().upper()
-                            if ans_str in ('NAN', 'NONE', '', 'NULL'): continue
-                            options = q.question_options or []
-                            ans_list = []
-                            for char in ans_str:
-                                if 'A' <= char <= 'Z':
-                                    idx = ord(char) - ord('A')
-                                    if 0 <= idx < len(options): ans_list.append(str(options[idx].get('id', '')))
-                                elif '1' <= char <= '9':
-                                    idx = int(char) - 1
-                                    if 0 <= idx < len(options): ans_list.append(str(options[idx].get('id', '')))
-                            if ans_list:
-                                if q.question_type == 'SINGLE_CHOICE':
-                                    responses[str(q.pk)] = {'answer': ans_list[0]}
-                                else:
-                                    responses[str(q.pk)] = {'answer': ans_list}
-
-                    validated_rows.append({'student': student, 'responses': responses})
-
-                if replace_existing:
-                    TestSubmission.objects.filter(test=test, submission_type='OMR_EXCEL').delete()
-                    keys_to_remove = [k for k, v in existing_sub_map.items() if v.submission_type == 'OMR_EXCEL']
-                    for k in keys_to_remove:
-                        del existing_sub_map[k]
-
-                success_count = 0
-                to_create = []
-                for data in validated_rows:
-                    student = data['student']
-                    responses = data['responses']
-                    sub = existing_sub_map.get(student._id)
-                    if sub:
-                        sub.responses = responses
-                        sub.is_finalized = True
-                        sub.submission_type = 'OMR_EXCEL'
-                        sub.save()
-                    else:
-                        to_create.append(TestSubmission(
-                            test=test, student=student, responses=responses, 
-                            is_finalized=True, submission_type='OMR_EXCEL'
-                        ))
-                    success_count += 1
-                
-                if to_create:
-                    TestSubmission.objects.bulk_create(to_create)
-
-            else:
-                score_col = next((c for c in ['score', 'total score', 'marks', 'total marks', 'total'] if c in df.columns), None)
-                if not score_col:
-                    return Response({'error': f'Could not identify score columns. Found: {original_columns}'}, status=400)
-
-                for index, row in df.iterrows():
-                    row_num = index + 2
-                    if pd.isna(row[enroll_col]): continue
-
-                    enroll_num = str(row[enroll_col]).strip().upper()
-                    if enroll_num.endswith('.0'): enroll_num = enroll_num[:-2]
-                    if enroll_num.isdigit(): enroll_num = f"PATH{enroll_num}"
-
-                    try:
-                        score = float(row[score_col])
-                    except (ValueError, TypeError):
-                        continue   # skip rows with invalid scores silently
-
-                    if enroll_num in seen_enrollments:
-                        continue
-                    seen_enrollments.add(enroll_num)
-
-                    student, err = _resolve_student(enroll_num, row_num)
-                    if not student:
-                        failed_rows.append({'original_enrollment': enroll_num, 'raw_data': {'score': score}, 'sheet_type': 'score', 'row_num': row_num})
-                        continue
-
-                    validated_rows.append({'student': student, 'score': score})
-
-                if replace_existing:
-                    TestSubmission.objects.filter(test=test, submission_type='OMR_EXCEL').delete()
-                    keys_to_remove = [k for k, v in existing_sub_map.items() if v.submission_type == 'OMR_EXCEL']
-                    for k in keys_to_remove:
-                        del existing_sub_map[k]
-
-                success_count = 0
-                to_create = []
-                for data in validated_rows:
-                    student = data['student']
-                    score = data['score']
-                    sub = existing_sub_map.get(student._id)
-                    if sub:
-                        sub.score = score
-                        sub.is_finalized = True
-                        sub.submission_type = 'OMR_EXCEL'
-                        sub.save()
-                    else:
-                        to_create.append(TestSubmission(
-                            test=test, student=student, score=score, 
-                            is_finalized=True, submission_type='OMR_EXCEL'
-                        ))
-                    success_count += 1
-
-                if to_create:
-                    TestSubmission.objects.bulk_create(to_create)
+            # Stream the sheet in chunks: one user lookup + one bulk upsert per chunk
+            try:
+                success_count, failed_rows = ingest_omr_sheet(
+                    db, test, file, replace_existing=replace_existing, erp_idx=erp_idx
+                )
+            except OMRSheetError as e:
+                return Response({'error': str(e)}, status=400)
 
             # --- Persist failed rows (replace old ones for this test) ---
-            from api.db_utils import get_db
-            db = get_db()
-            if db is not None:
-                db['tests_omrfailedrecord'].delete_many({'test_id': test.id})
-                if failed_rows:
-                    import datetime
-                    records_to_insert = [
-                        {
-                            'test_id': test.id,
-                            'original_enrollment': r['original_enrollment'],
-                            'raw_data': r['raw_data'],
-                            'sheet_type': r['sheet_type'],
-                            'row_num': r.get('row_num'),
-                            'created_at': datetime.datetime.now()
-                        } for r in failed_rows
-                    ]
-                    db['tests_omrfailedrecord'].insert_many(records_to_insert)
+            db['tests_omrfailedrecord'].delete_many({'test_id': test.id})
+            if failed_rows:
+                import datetime
+                records_to_insert = [
+                    {
+                        'test_id': test.id,
+                        'original_enrollment': r['original_enrollment'],
+                        'raw_data': r['raw_data'],
+                        'sheet_type': r['sheet_type'],
+                        'row_num': r.get('row_num'),
+                        'created_at': datetime.datetime.now()
+                    } for r in failed_rows
+                ]
+                db['tests_omrfailedrecord'].insert_many(records_to_insert)
 
-            # Invalidate admin list cache and my_results cache so results are fresh
+            # Invalidate admin list cache, my_results cache and the rank index so results are fresh
             from django.core.cache import cache
+            from .rank_index import invalidate_rank_index
             cache.delete('admin_test_list')
             invalidate_my_results_cache()
+            invalidate_rank_index(test.pk)
+            bump_test_students(db, test.pk)
             self.__class__._local_cache = {}
 
             failed_records_out = []
@@ -1778,6 +1421,10 @@ class TestViewSet(viewsets.ModelViewSet):
                         'is_finalized': True,
                     }
                 )
+                db['tests_testsubmission'].update_one(
+                    {'test_id': test.pk, 'student_id': user.pk},
+                    {'$unset': {'breakdown': ''}}
+                )
                 db['tests_omrfailedrecord'].delete_one({'_id': ObjectId(rec_id)})
                 resolved_count += 1
             else:
@@ -1793,6 +1440,10 @@ class TestViewSet(viewsets.ModelViewSet):
                     'sheet_type': record.get('sheet_type'),
                 })
 
+        if resolved_count:
+            from .rank_index import invalidate_rank_index
+            invalidate_rank_index(test.pk)
+
         return Response({
             'resolved_count': resolved_count,
             'still_failed': still_failed,
@@ -1837,48 +1488,44 @@ class TestViewSet(viewsets.ModelViewSet):
         """
         from api.db_utils import get_db
         from bson import ObjectId
+        from .scoring import (
+            load_sections, compile_sections, load_cards, BREAKDOWN_PROJECTION,
+            STATUS_CORRECT, STATUS_GRACE, STATUS_PARTIAL, STATUS_UNATTEMPTED,
+        )
 
         test = self.get_object()
-        sections_data = []
-
-        for section in test.sections.prefetch_related('questions').order_by('priority'):
-            seen = set()
-            order_list = section.question_order or []
-            order_map = {str(oid): i for i, oid in enumerate(order_list)}
-
-            unique_qs = []
-            for q in section.questions.all():
-                if str(q.pk) not in seen:
-                    seen.add(str(q.pk))
-                    unique_qs.append(q)
-            unique_qs.sort(key=lambda q: order_map.get(str(q.pk), 999999))
+        sections = load_sections(test)
+        key = compile_sections(sections)
+        q_objs = {str(q.pk): q for sec in sections for q in sec.questions.all()}
 
+        sections_data = []
+        q_rows = []  # aligned with key.questions
+        for sec in key.sections:
             qs = []
-            for q in unique_qs:
-                q_id = str(q.pk)
-                correct_options = [str(opt['id']) for opt in (q.question_options or []) if opt.get('isCorrect')]
-                a_from = float(q.answer_from) if getattr(q, 'answer_from', None) is not None else None
-                a_to   = float(q.answer_to)   if getattr(q, 'answer_to', None)   is not None else None
-                qs.append({
-                    'id': q_id,
+            for cq in key.questions[sec['start']:sec['end']]:
+                q = q_objs[cq.id]
+                row = {
+                    'id': cq.id,
                     'content': q.content or '',
                     'solution': q.solution or '',  # Include the solution/explanation
-                    'type': q.question_type or 'SINGLE_CHOICE',
-                    'correct_marks': float(section.correct_marks or 0),
-                    'negative_marks': float(section.negative_marks or 0),
-                    'correct_options': correct_options,
+                    'type': cq.type,
+                    'correct_marks': cq.correct_marks,
+                    'negative_marks': cq.negative_marks,
+                    'correct_options': [str(opt['id']) for opt in (q.question_options or []) if opt.get('isCorrect')],
                     'options': q.question_options or [],   # full option list with content + isCorrect
-                    'answer_from': a_from,
-                    'answer_to': a_to,
+                    'answer_from': cq.answer_from,
+                    'answer_to': cq.answer_to,
 
                     'correct': 0,
                     'incorrect': 0,
                     'partial': 0,
                     'not_attempted': 0,
                     'total': 0,
-                })
+                }
+                qs.append(row)
+                q_rows.append(row)
             sections_data.append({
-                'name': section.name,
+                'name': sec['name'],
                 'questions': qs,
             })
 
@@ -1893,128 +1540,23 @@ class TestViewSet(viewsets.ModelViewSet):
 
                 sub_docs = list(db['tests_testsubmission'].find(
                     {'test_id': t_pk, 'is_finalized': True},
-                    {'responses': 1}
+                    BREAKDOWN_PROJECTION
                 ))
             except Exception as e:
                 print(f"[question_analysis] PyMongo error: {e}")
                 sub_docs = []
 
-            q_lookup = {}
-            for sec in sections_data:
-                for q in sec['questions']:
-                    q_lookup[q['id']] = q
-
             total = len(sub_docs)
-            for q in q_lookup.values():
-                q['total'] = total
+            for row in q_rows:
+                row['total'] = total
 
-            for doc in sub_docs:
-                raw_responses = doc.get('responses') or {}
-                # MongoDB may store responses as a JSON string depending on how it was saved
-                if isinstance(raw_responses, str):
-                    import json
-                    try:
-                        raw_responses = json.loads(raw_responses)
-                    except Exception:
-                        raw_responses = {}
-                responses = raw_responses if isinstance(raw_responses, dict) else {}
-
-                for q_id, q_data in q_lookup.items():
-                    response = responses.get(q_id)
-                    # response may be a dict {'answer': ...}, a raw value, or None
-                    if isinstance(response, dict):
-                        answer = response.get('answer')
-                    elif response is not None:
-                        answer = response  # raw answer stored directly
-                    else:
-                        answer = None
-
-                    if answer is None or answer == '' or answer == [] or (isinstance(answer, list) and len(answer) == 0):
-                        q_data['not_attempted'] += 1
-                        continue
-                    q_type = q_data['type']
-                    if q_type == 'SINGLE_CHOICE':
-                        ans_str = str(answer).strip()
-                        is_correct = False
-                        matched_id = None
-                        
-                        # Pass 1: exact ID match
-                        for oi, opt in enumerate(q_data['options']):
-                            opt_id = str(opt.get('id', ''))
-                            if ans_str == opt_id or ans_str.lower() == opt_id.lower():
-                                matched_id = opt_id
-                                break
-                        
-                        # Pass 2: fallback
-                        if not matched_id:
-                            keys = ['a', 'b', 'c', 'd', 'e', 'f']
-                            for oi, opt in enumerate(q_data['options']):
-                                opt_id = str(opt.get('id', ''))
-                                opt_content = clean_html(opt.get('content') or opt.get('text', ''))
-                                opt_label = keys[oi] if oi < len(keys) else None
-                                if (ans_str.lower() == opt_content.lower() or 
-                                    (opt_label and ans_str.lower() == opt_label) or 
-                                    ans_str == str(oi + 1)):
-                                    matched_id = opt_id
-                                    break
-                                    
-                        if matched_id and matched_id in q_data['correct_options']:
-                            is_correct = True
-
-                        if is_correct:
-                            q_data['correct'] += 1
-                        else:
-                            q_data['incorrect'] += 1
-                    elif q_type == 'MULTI_CHOICE':
-                        raw_selected = answer if isinstance(answer, list) else [answer]
-                        selected = set()
-                        keys = ['a', 'b', 'c', 'd', 'e', 'f']
-                        
-                        for item in raw_selected:
-                            item_str = str(item).strip().lower()
-                            matched_id = None
-                            
-                            # Pass 1: exact ID match
-                            for oi, opt in enumerate(q_data['options']):
-                                opt_id = str(opt.get('id', ''))
-                                if item_str == opt_id.lower():
-                                    matched_id = opt_id
-                                    break
-                                    
-                            # Pass 2: fallback
-                            if not matched_id:
-                                for oi, opt in enumerate(q_data['options']):
-                                    opt_id = str(opt.get('id', ''))
-                                    opt_content = clean_html(opt.get('content') or opt.get('text', ''))
-                                    opt_label = keys[oi] if oi < len(keys) else None
-                                    if (item_str == opt_content.lower() or 
-                                        (opt_label and item_str == opt_label) or 
-                                        item_str == str(oi + 1)):
-                                        matched_id = opt_id
-                                        break
-                                        
-                            if matched_id:
-                                selected.add(matched_id)
-                                    
-                        correct  = set(q_data['correct_options'])
-                        if selected == correct:
-                            q_data['correct'] += 1
-                        elif selected & correct:
-                            q_data['partial'] += 1
-                        else:
-                            q_data['incorrect'] += 1
-                    elif q_type in ('NUMERICAL', 'INTEGER_TYPE'):
-                        try:
-                            val = float(answer)
-                            lo, hi = q_data['answer_from'], q_data['answer_to']
-                            if lo is not None and hi is not None and lo <= val <= hi:
-                                q_data['correct'] += 1
-                            else:
-                                q_data['incorrect'] += 1
-                        except (TypeError, ValueError):
-                            q_data['incorrect'] += 1
-                    else:
-                        q_data['incorrect'] += 1
+            bucket = {
+                STATUS_CORRECT: 'correct', STATUS_GRACE: 'correct',
+                STATUS_PARTIAL: 'partial', STATUS_UNATTEMPTED: 'not_attempted',
+            }
+            for card in load_cards(key, sub_docs, db['tests_testsubmission']):
+                for row, q_status in zip(q_rows, card['statuses']):
+                    row[bucket.get(q_status, 'incorrect')] += 1
 
         return Response({
             'test_name': test.name,
@@ -2034,41 +1576,16 @@ class TestViewSet(viewsets.ModelViewSet):
         from api.db_utils import get_db
         from bson import ObjectId
         from api.models import CustomUser
+        from .scoring import compile_answer_key, load_cards, BREAKDOWN_PROJECTION, STATUS_CORRECT, STATUS_GRACE
 
         test = self.get_object()
 
-        # 1. Group questions by section
-        flat_questions = []
-        sections_info = []
-        for section in test.sections.prefetch_related('questions').order_by('priority'):
-            order_list = section.question_order or []
-            order_map = {str(oid): i for i, oid in enumerate(order_list)}
-            
-            seen = set()
-            section_qs = []
-            for q in section.questions.all():
-                if str(q.pk) not in seen:
-                    seen.add(str(q.pk))
-                    section_qs.append(q)
-            section_qs.sort(key=lambda q: order_map.get(str(q.pk), 999999))
-
-            count = 0
-            for q in section_qs:
-                count += 1
-                flat_questions.append({
-                    'id': str(q.pk),
-                    'type': q.question_type,
-                    'correct_options': [str(opt['id']) for opt in (q.question_options or []) if opt.get('isCorrect')],
-                    'options': q.question_options or [],
-                    'answer_from': float(q.answer_from) if q.answer_from is not None else None,
-                    'answer_to': float(q.answer_to) if q.answer_to is not None else None,
-                })
-            
-            if count > 0:
-                sections_info.append({
-                    'name': section.name,
-                    'count': count
-                })
+        # 1. Compile the answer key (sections by priority, questions by question_order)
+        key = compile_answer_key(test)
+        sections_info = [
+            {'name': sec['name'], 'count': sec['question_count']}
+            for sec in key.sections if sec['question_count'] > 0
+        ]
 
         # 2. Get finalized submissions from MongoDB
 
@@ -2080,9 +1597,10 @@ class TestViewSet(viewsets.ModelViewSet):
                 except: t_pk = test.pk
                 submissions = list(db['tests_testsubmission'].find(
                     {'test_id': t_pk, 'is_finalized': True},
-                    {'student_id': 1, 'responses': 1}
+                    {'student_id': 1, **BREAKDOWN_PROJECTION}
                 ))
             except: pass
+        cards = load_cards(key, submissions, db['tests_testsubmission'] if db is not None else None)
 
         # 3. Enhance with student names/enrollments
         student_ids = [s['student_id'] for s in submissions]
@@ -2097,71 +1615,20 @@ class TestViewSet(viewsets.ModelViewSet):
 
         # 4. Build the matrix
         matrix_data = []
-        for sub in submissions:
+        for sub, card in zip(submissions, cards):
             sid_str = str(sub['student_id'])
             s_info = s_lookup.get(sid_str) or {'name': 'Unknown', 'enrollment_number': sid_str}
-            
-            # Parse responses
-            raw_res = sub.get('responses') or {}
-            if isinstance(raw_res, str):
-                import json
-                try: raw_res = json.loads(raw_res)
-                except: raw_res = {}
-            responses = raw_res if isinstance(raw_res, dict) else {}
 
-            row = {
+            matrix_data.append({
                 'student_name': s_info['name'],
                 'enrollment_number': s_info['enrollment_number'],
-                'results': []
-            }
-
-            for q in flat_questions:
-                q_id = q['id']
-                res_obj = responses.get(q_id)
-                ans = res_obj.get('answer') if isinstance(res_obj, dict) else res_obj
-                
-                status = 'NA' # Not Attempted
-                if ans not in (None, '', [], {}):
-                    q_type = q['type']
-                    if q_type == 'SINGLE_CHOICE':
-                        ans_str = str(ans)
-                        is_correct = False
-                        if ans_str in q['correct_options']:
-                            is_correct = True
-                        else:
-                            mapping = {'A': '1', 'B': '2', 'C': '3', 'D': '4'}
-                            if ans_str in mapping and mapping[ans_str] in q['correct_options']:
-                                is_correct = True
-                            
-                            if not is_correct:
-                                for opt in q['options']:
-                                    opt_id = str(opt.get('id', ''))
-                                    if opt_id in q['correct_options'] and (ans_str == opt_id or ans_str == opt.get('content')):
-                                        is_correct = True
-                                        break
-                                        
-                        status = 'CA' if is_correct else 'IA'
-                    elif q_type == 'MULTI_CHOICE':
-                        selected = set(map(str, ans if isinstance(ans, list) else [ans]))
-                        correct = set(q['correct_options'])
-                        if selected == correct: status = 'CA'
-                        elif selected & correct: status = 'PA'
-                        else: status = 'IA'
-                    elif q_type in ('NUMERICAL', 'INTEGER_TYPE'):
-                        try:
-                            v = float(ans)
-                            if q['answer_from'] <= v <= q['answer_to']: status = 'CA'
-                            else: status = 'IA'
-                        except: status = 'IA'
-                    else:
-                        status = 'IA'
-                row['results'].append(status)
-            
-            matrix_data.append(row)
+                # Grace is shown as correct here; the matrix only knows CA/IA/PA/NA.
+                'results': [STATUS_CORRECT if st == STATUS_GRACE else st for st in card['statuses']]
+            })
 
         return Response({
             'test_name': test.name,
-            'questions_count': len(flat_questions),
+            'questions_count': len(key.questions),
             'sections_info': sections_info,
             'matrix': matrix_data
         })
@@ -2171,46 +1638,15 @@ class TestViewSet(viewsets.ModelViewSet):
         from api.db_utils import get_db
         from bson import ObjectId
         from api.models import CustomUser
+        from .scoring import compile_answer_key, load_cards
 
         test = self.get_object()
 
-        from sections.models import Section
-        # Use fresh query with prefetch_related to load all questions in a single indexed query
-        sections = list(Section.objects.filter(test=test).select_related('partial_mark_rule').prefetch_related('questions').order_by('priority'))
-        # Build flat q_map and accumulation of max marks
-        q_map = {} 
+        # Compile the answer key once; every submission is scored against it in one pass.
+        key = compile_answer_key(test)
         sections_max = {}
-        section_questions_map = {}
-        for sec in sections:
-            if sec.name not in sections_max:
-                sections_max[sec.name] = 0
-            
-            c_marks = float(sec.correct_marks or 0)
-            seen_q_local = set()
-            
-            sec_questions = list(sec.questions.all())
-            section_questions_map[sec.pk] = sec_questions
-            
-            for q in sec_questions:
-                qid = str(q.pk)
-                if qid in seen_q_local: continue
-                seen_q_local.add(qid)
-                
-                sections_max[sec.name] += c_marks
-                
-                if qid not in q_map:
-                    q_map[qid] = {
-                        'id': qid,
-                        'section': sec.name,
-                        'correct': c_marks,
-                        'negative': float(sec.negative_marks or 0),
-                        'type': q.question_type or 'SINGLE_CHOICE',
-                        'correct_options': [str(opt['id']) for opt in (q.question_options or []) if opt.get('isCorrect')],
-                        'correct_contents': [clean_html(opt.get('content') or opt.get('text', '')) for opt in (q.question_options or []) if opt.get('isCorrect')],
-                        'answer_from': float(q.answer_from) if getattr(q, 'answer_from', None) is not None else None,
-                        'answer_to': float(q.answer_to) if getattr(q, 'answer_to', None) is not None else None,
-                        'options': q.question_options or [],
-                    }
+        for sec in key.sections:
+            sections_max[sec['name']] = sections_max.get(sec['name'], 0) + sec['max_marks']
 
         db = get_db()
         submissions = []
@@ -2218,8 +1654,11 @@ class TestViewSet(viewsets.ModelViewSet):
             try:
                 try: t_pk = ObjectId(test.pk)
                 except: t_pk = test.pk
+                # Scores come from the stored breakdown; raw responses are only
+                # fetched (by load_cards) for submissions that need re-scoring.
                 submissions = list(db['tests_testsubmission'].find(
-                    {'test_id': t_pk, 'is_finalized': True}
+                    {'test_id': t_pk, 'is_finalized': True},
+                    {'responses': 0}
                 ))
             except: pass
 
@@ -2243,165 +1682,22 @@ class TestViewSet(viewsets.ModelViewSet):
         from api.erp_views import get_student_lookup_index
         erp_index = get_student_lookup_index() or {}
 
+        # GRACE MARKS (gated): only applied for questions in the stored grace list, which is
+        # populated when admin clicks 'Generate Result'. Never applied on live is_wrong flag.
+        cards = load_cards(key, submissions, db['tests_testsubmission'] if db is not None else None)
+
         result_data = []
-        for sub in submissions:
+        for sub, card in zip(submissions, cards):
             sid = str(sub['student_id'])
             s_info = s_lookup.get(sid) or {}
-            
-            raw_res = sub.get('responses') or {}
-            if isinstance(raw_res, str):
-                import json
-                try: raw_res = json.loads(raw_res)
-                except: raw_res = {}
-            responses = raw_res if isinstance(raw_res, dict) else {}
-
-            # GRACE MARKS (gated): only applied for questions in the stored grace list, which is
-            # populated when admin clicks 'Generate Result'. Never applied on live is_wrong flag.
-            grace_qs = set(str(qid) for qid in (sub.get('grace_applied_questions') or []))
 
             section_scores = {sec_name: 0.0 for sec_name in sections_max.keys()}
-            total_correct = 0
-            total_attempted = 0
-            total_positive = 0
-            total_negative = 0
-            
-            keys = ['a', 'b', 'c', 'd', 'e', 'f']
-            
-            # Loop over sections and their specific questions to match detailed report logic
-            for sec in sections:
-                sec_name = sec.name
-                sec_earned = 0
-                sec_neg = 0
-                
-                # Fetch questions for this specific section allotment from in-memory cache
-                seen_in_sec = set()
-                sec_questions = section_questions_map.get(sec.pk, [])
-                for q in sec_questions:
-                    qid = str(q.pk)
-                    if qid in seen_in_sec: continue
-                    seen_in_sec.add(qid)
-                    
-                    res_obj = responses.get(qid)
-                    if res_obj is None:
-                        try: res_obj = responses.get(int(qid))
-                        except: pass
-                    
-                    ans = res_obj.get('answer') if isinstance(res_obj, dict) else res_obj
-                    if ans in (None, '', [], {}):
-                        continue
-                    
-                    total_attempted += 1
-                    earned = 0
-                    neg = 0
-                    q_type = q.question_type or 'SINGLE_CHOICE'
-                    c_marks = float(sec.correct_marks or 0)
-                    n_marks = float(sec.negative_marks or 0)
-
-                    # GRACE MARKS: Question in the stored grace list → full marks, no negative
-                    if qid in grace_qs:
-                        earned = c_marks
-                        sec_earned += earned
-                        total_correct += 1
-                        continue
-
-                    if q_type == 'SINGLE_CHOICE':
-                        ans_str = str(ans).strip().lower()
-                        is_correct = False
-                        
-                        opts = q.question_options or []
-                        for oi, opt in enumerate(opts):
-                            opt_id = str(opt.get('id', ''))
-                            opt_label = keys[oi] if oi < len(keys) else None
-                            if ans_str == opt_id or (opt_label and ans_str == opt_label):
-                                if opt.get('isCorrect'): is_correct = True
-                                break
-                        if not is_correct:
-                            pass
-                        
-                        if is_correct:
-                            earned = c_marks
-                            total_correct += 1
-                        else:
-                            neg = n_marks
-                    
-                    elif q_type == 'MULTI_CHOICE':
-                        raw_selected = ans if isinstance(ans, list) else [ans]
-                        normalized_selected = set()
-                        opts = q.question_options or []
-                        for item in raw_selected:
-                            item_str = str(item).strip().lower()
-                            for oi, opt in enumerate(opts):
-                                opt_id = str(opt.get('id', ''))
-                                opt_content = clean_html(opt.get('content') or opt.get('text', ''))
-                                opt_label = keys[oi] if oi < len(keys) else None
-                                if item_str == opt_id or item_str == opt_content or (opt_label and item_str == opt_label):
-                                    normalized_selected.add(opt_id)
-                                    break
-                        correct_set = set([str(opt['id']) for opt in opts if opt.get('isCorrect')])
-                        rule = sec.partial_mark_rule
-                        if rule and rule.logic_type == 'JEE_ADVANCED':
-                            if not normalized_selected.issubset(correct_set):
-                                neg = rule.base_negative_marks
-                            elif normalized_selected == correct_set:
-                                earned = rule.base_correct_marks
-                                total_correct += 1
-                            else:
-                                num_correct_selected = len(normalized_selected)
-                                if num_correct_selected >= 3: earned = 3.0
-                                elif num_correct_selected == 2: earned = 2.0
-                                elif num_correct_selected == 1: earned = 1.0
-                                else: earned = float(num_correct_selected)
-                        elif rule and rule.logic_type in ['WBJEE', 'CUSTOM_FRACTIONAL']:
-                            if not normalized_selected.issubset(correct_set):
-                                if rule.logic_type == 'CUSTOM_FRACTIONAL':
-                                    neg = rule.base_negative_marks
-                                else:
-                                    neg = 0.0
-                            elif normalized_selected == correct_set:
-                                earned = rule.base_correct_marks
-                                total_correct += 1
-                            else:
-                                fraction = len(normalized_selected) / len(correct_set) if correct_set else 0
-                                earned = round(rule.base_correct_marks * fraction, 2)
-                        elif rule and rule.logic_type == 'STANDARD':
-                            if normalized_selected == correct_set:
-                                earned = rule.base_correct_marks
-                                total_correct += 1
-                            else:
-                                neg = rule.base_negative_marks
-                        else:
-                            if normalized_selected == correct_set:
-                                earned = c_marks
-                                total_correct += 1
-                            elif normalized_selected & correct_set:
-                                fraction = len(normalized_selected & correct_set) / len(correct_set) if correct_set else 0
-                                earned = round(c_marks * fraction, 2)
-                            else:
-                                neg = n_marks
-                    
-                    elif q_type in ('NUMERICAL', 'INTEGER_TYPE'):
-                        try:
-                            val = float(ans)
-                            ans_from = float(q.answer_from) if getattr(q, 'answer_from', None) is not None else None
-                            ans_to = float(q.answer_to) if getattr(q, 'answer_to', None) is not None else None
-                            if ans_from is not None and ans_to is not None:
-                                if ans_from <= val <= ans_to:
-                                    earned = c_marks
-                                    total_correct += 1
-                                else:
-                                    neg = n_marks
-                        except:
-                            neg = n_marks
-                    
-                    sec_earned += earned
-                    sec_neg += neg
-                
-                section_scores[sec_name] += (sec_earned - sec_neg)
-                total_positive += sec_earned
-                total_negative += sec_neg
+            for s_card in card['sections']:
+                section_scores[s_card['name']] += (s_card['earned'] - s_card['negative'])
 
-            total_recalculated = round(total_positive - total_negative, 2)
-            accuracy = (total_correct / total_attempted * 100) if total_attempted > 0 else 0
+            total_recalculated = card['score']
+            total_attempted = card['attempted']
+            accuracy = (card['correct'] / total_attempted * 100) if total_attempted > 0 else 0
             
             ts = int(sub.get('time_spent', 0))
             h = ts // 3600
@@ -2455,6 +1751,7 @@ class TestViewSet(viewsets.ModelViewSet):
 
 
     @action(detail=True, methods=['post'], url_path='generate_result')
+    @runs_as_job('generate_result')
     def generate_result(self, request, pk=None):
         """
         Recalculates and persists scores for all finalized submissions for this test.
@@ -2465,46 +1762,31 @@ class TestViewSet(viewsets.ModelViewSet):
         from api.db_utils import get_db
         from bson import ObjectId
         from django.utils import timezone
-        import json
+        from pymongo import UpdateOne
+        from pymongo.errors import BulkWriteError
+        from .scoring import compile_answer_key
+        from .batch_scoring import score_submissions, breakdowns
+        from .rank_index import build_rank_index, invalidate_rank_index
+        from api.student_context import bump_many
 
         test = self.get_object()
         db = get_db()
         if db is None:
             return Response({'error': 'Database unavailable.'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
-        # Load all sections and questions, capturing is_wrong at the moment of generation
-        from sections.models import Section
-        sections = list(Section.objects.filter(test=test).select_related('partial_mark_rule').prefetch_related('questions').order_by('priority'))
-
-        q_map = {}
-        section_questions_map = {}
-        for sec in sections:
-            sec_questions = list(sec.questions.all())
-            section_questions_map[sec.pk] = sec_questions
-            for q in sec_questions:
-                qid = str(q.pk)
-                if qid not in q_map:
-                    q_map[qid] = {
-                        'correct': float(sec.correct_marks or 0),
-                        'negative': float(sec.negative_marks or 0),
-                        'is_wrong': getattr(q, 'is_wrong', False),
-                        'type': q.question_type or 'SINGLE_CHOICE',
-                        'correct_options': [str(opt['id']) for opt in (q.question_options or []) if opt.get('isCorrect')],
-                        'answer_from': float(q.answer_from) if getattr(q, 'answer_from', None) is not None else None,
-                        'answer_to': float(q.answer_to) if getattr(q, 'answer_to', None) is not None else None,
-                        'options': q.question_options or [],
-                        'partial_mark_rule': sec.partial_mark_rule,
-                    }
+        # Compile sections + questions once, capturing is_wrong at the moment of generation
+        key = compile_answer_key(test)
 
         # Collect which question IDs have grace marks at time of generation
-        wrong_question_ids = [qid for qid, qi in q_map.items() if qi.get('is_wrong')]
+        wrong_question_ids = key.wrong_question_ids
 
         # Fetch all finalized submissions
         try:
             try: t_pk = ObjectId(test.pk)
             except: t_pk = test.pk
             submissions = list(db['tests_testsubmission'].find(
-                {'test_id': t_pk, 'is_finalized': True}
+                {'test_id': t_pk, 'is_finalized': True},
+                {'responses': 1, 'student_id': 1}
             ))
         except Exception as e:
             return Response({'error': f'Failed to fetch submissions: {e}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -2517,142 +1799,46 @@ class TestViewSet(viewsets.ModelViewSet):
                 'grace_questions': len(wrong_question_ids)
             })
 
-        keys = ['a', 'b', 'c', 'd', 'e', 'f']
-        processed = 0
+        generated_at = timezone.now()
+
+        # Score every submission in one vectorized pass over the response matrix
+        report_progress(stage='scoring', total=len(submissions))
+        batch = score_submissions(key, submissions, grace=wrong_question_ids)
+
+        ops = [
+            UpdateOne({'_id': sub['_id']}, {'$set': {
+                'score': bd['score'],
+                'breakdown': bd,
+                'grace_applied_questions': wrong_question_ids,
+                'result_generated_at': generated_at
+            }})
+            for sub, bd in zip(submissions, breakdowns(key, batch, grace=wrong_question_ids))
+        ]
+
+        # Persist all scores in a single unordered bulk write
+        report_progress(stage='saving')
         errors = 0
+        try:
+            db['tests_testsubmission'].bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            errors = len(e.details.get('writeErrors', []))
+            print(f"[generate_result] Bulk write reported {errors} error(s)")
+        except Exception as e:
+            return Response({'error': f'Failed to save results: {e}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        processed = len(ops) - errors
+        report_progress(stage='ranking', done=processed, errors=errors)
 
-        for sub in submissions:
-            try:
-                raw_res = sub.get('responses') or {}
-                if isinstance(raw_res, str):
-                    try: raw_res = json.loads(raw_res)
-                    except: raw_res = {}
-                responses = raw_res if isinstance(raw_res, dict) else {}
-
-                total_score = 0.0
-
-                for sec in sections:
-                    sec_earned = 0.0
-                    sec_neg = 0.0
-                    seen = set()
-                    sec_questions = section_questions_map.get(sec.pk, [])
-
-                    for q in sec_questions:
-                        qid = str(q.pk)
-                        if qid in seen: continue
-                        seen.add(qid)
-
-                        qi = q_map.get(qid, {})
-                        c_marks = qi.get('correct', 0)
-                        n_marks = qi.get('negative', 0)
-
-                        res_obj = responses.get(qid)
-                        if res_obj is None:
-                            try: res_obj = responses.get(int(qid))
-                            except: pass
-                        ans = res_obj.get('answer') if isinstance(res_obj, dict) else res_obj
-
-                        if ans in (None, '', [], {}): continue
-
-                        # GRACE MARKS: questions marked wrong at generation time
-                        if qi.get('is_wrong'):
-                            sec_earned += c_marks
-                            continue
-
-                        # Normal scoring
-                        earned = 0.0
-                        neg = 0.0
-                        q_type = qi.get('type', 'SINGLE_CHOICE')
-
-                        if q_type == 'SINGLE_CHOICE':
-                            ans_str = str(ans).strip().lower()
-                            is_correct = False
-                            for oi, opt in enumerate(qi.get('options', [])):
-                                opt_id = str(opt.get('id', ''))
-                                opt_label = keys[oi] if oi < len(keys) else None
-                                if ans_str == opt_id or (opt_label and ans_str == opt_label):
-                                    if opt.get('isCorrect'): is_correct = True
-                                    break
-                            if not is_correct:
-                                pass
-                            if is_correct: earned = c_marks
-                            else: neg = n_marks
-                        elif q_type == 'MULTI_CHOICE':
-                            raw_selected = ans if isinstance(ans, list) else [ans]
-                            normalized_selected = set()
-                            for item in raw_selected:
-                                item_str = str(item).strip().lower()
-                                for oi, opt in enumerate(qi.get('options', [])):
-                                    opt_id = str(opt.get('id', ''))
-                                    opt_content = clean_html(opt.get('content') or opt.get('text', ''))
-                                    opt_label = keys[oi] if oi < len(keys) else None
-                                    if item_str == opt_id or item_str == opt_content or (opt_label and item_str == opt_label):
-                                        normalized_selected.add(opt_id)
-                                        break
-                            correct_set = set(qi.get('correct_options', []))
-                            rule = qi.get('partial_mark_rule')
-                            if rule and rule.logic_type == 'JEE_ADVANCED':
-                                if not normalized_selected.issubset(correct_set):
-                                    neg = rule.base_negative_marks
-                                elif normalized_selected == correct_set:
-                                    earned = rule.base_correct_marks
-                                else:
-                                    num_correct_selected = len(normalized_selected)
-                                    if num_correct_selected >= 3: earned = 3.0
-                                    elif num_correct_selected == 2: earned = 2.0
-                                    elif num_correct_selected == 1: earned = 1.0
-                                    else: earned = float(num_correct_selected)
-                            elif rule and rule.logic_type in ['WBJEE', 'CUSTOM_FRACTIONAL']:
-                                if not normalized_selected.issubset(correct_set):
-                                    if rule.logic_type == 'CUSTOM_FRACTIONAL':
-                                        neg = rule.base_negative_marks
-                                    else:
-                                        neg = 0.0
-                                elif normalized_selected == correct_set:
-                                    earned = rule.base_correct_marks
-                                else:
-                                    fraction = len(normalized_selected) / len(correct_set) if correct_set else 0
-                                    earned = round(rule.base_correct_marks * fraction, 2)
-                            elif rule and rule.logic_type == 'STANDARD':
-                                if normalized_selected == correct_set:
-                                    earned = rule.base_correct_marks
-                                else:
-                                    neg = rule.base_negative_marks
-                            else:
-                                if normalized_selected == correct_set: earned = c_marks
-                                elif normalized_selected & correct_set:
-                                    fraction = len(normalized_selected & correct_set) / len(correct_set) if correct_set else 0
-                                    earned = round(c_marks * fraction, 2)
-                                else: neg = n_marks
-                        elif q_type in ('NUMERICAL', 'INTEGER_TYPE'):
-                            try:
-                                val = float(ans)
-                                if qi.get('answer_from') is not None and qi.get('answer_to') is not None:
-                                    if qi['answer_from'] <= val <= qi['answer_to']: earned = c_marks
-                                    else: neg = n_marks
-                            except: neg = n_marks
-
-                        sec_earned += earned
-                        sec_neg += neg
-
-                    total_score += (sec_earned - sec_neg)
-
-                # Persist updated score + grace info to MongoDB
-                db['tests_testsubmission'].update_one(
-                    {'_id': sub['_id']},
-                    {'$set': {
-                        'score': round(total_score, 2),
-                        'grace_applied_questions': wrong_question_ids,
-                        'result_generated_at': timezone.now()
-                    }}
-                )
-                processed += 1
-            except Exception as e:
-                print(f"[generate_result] Error processing sub {sub.get('_id')}: {e}")
-                errors += 1
+        # Rebuild the leaderboard index from the freshly written scores
+        try:
+            build_rank_index(db, test, key)
+        except Exception as e:
+            print(f"[generate_result] Failed to build rank index: {e}")
+            invalidate_rank_index(test.pk)
 
         # Mark test as completed so frontend shows 'Regenerate' button next time
         Test.objects.filter(pk=test.pk).update(is_completed=True)
+        invalidate_my_results_cache()
+        bump_many(sub.get('student_id') for sub in submissions)  # new scores in their AI context
 
         grace_count = len(wrong_question_ids)
         grace_msg = f" Grace marks applied to {grace_count} question(s)." if grace_count else " No grace marks applied."
@@ -2902,7 +2088,7 @@ class TestViewSet(viewsets.ModelViewSet):
         from api.db_utils import get_db
         from bson import ObjectId
         from api.models import CustomUser
-        import json
+        from .scoring import load_sections, compile_sections, load_cards, parse_responses, BREAKDOWN_PROJECTION
 
         enrollment = request.query_params.get('enrollment', '').strip()
         if not enrollment:
@@ -2917,50 +2103,12 @@ class TestViewSet(viewsets.ModelViewSet):
         student_obj = CustomUser.objects.filter(admission_number__iexact=enrollment).first() \
                    or CustomUser.objects.filter(username__iexact=enrollment).first()
 
-        # 2. Load all sections + questions once
-        sections = list(test.sections.prefetch_related('questions').order_by('priority'))
-        # Build flat q_map: q_id -> metadata
-        q_map = {}
-        sections_meta = []
-        for sec in sections:
-            order_list = sec.question_order or []
-            order_map = {str(oid): i for i, oid in enumerate(order_list)}
-            seen = set()
-            qs = []
-            for q in sec.questions.all():
-                qid = str(q.pk)
-                if qid not in seen:
-                    seen.add(qid)
-                    qs.append(q)
-            qs.sort(key=lambda q: order_map.get(str(q.pk), 999999))
-            total_q_marks = len(qs) * float(sec.correct_marks or 0)
-            sections_meta.append({
-                'name': sec.name,
-                'questions': qs,
-                'correct_marks': float(sec.correct_marks or 0),
-                'negative_marks': float(sec.negative_marks or 0),
-                'total_max_marks': total_q_marks,
-                'question_count': len(qs),
-            })
-            for q in qs:
-                qid = str(q.pk)
-                q_map[qid] = {
-                    'section': sec.name,
-                    'correct_marks': float(sec.correct_marks or 0),
-                    'negative_marks': float(sec.negative_marks or 0),
-                    'partial_mark_rule': sec.partial_mark_rule,
-                    'is_wrong': False,  # Will be patched from grace_applied_questions after sub_doc is loaded
-                    'type': q.question_type or 'SINGLE_CHOICE',
-                    'correct_options': [str(opt['id']) for opt in (q.question_options or []) if opt.get('isCorrect')],
-                    'correct_contents': [clean_html(opt.get('content') or opt.get('text', '')) for opt in (q.question_options or []) if opt.get('isCorrect')],
-                    'answer_from': float(q.answer_from) if getattr(q, 'answer_from', None) is not None else None,
-                    'answer_to': float(q.answer_to) if getattr(q, 'answer_to', None) is not None else None,
-                    'options': q.question_options or [],
-                    'content': q.content or '',
-                    'solution': q.solution or '',
-                }
+        # 2. Load all sections + questions once and compile the answer key
+        sections = load_sections(test)
+        key = compile_sections(sections)
+        q_objs = {str(q.pk): q for sec in sections for q in sec.questions.all()}
 
-        total_questions = sum(s['question_count'] for s in sections_meta)
+        total_questions = len(key.questions)
         db = get_db()
 
         # 3. Fetch the student's submission
@@ -2984,270 +2132,70 @@ class TestViewSet(viewsets.ModelViewSet):
                 'is_missed': True
             }
 
-        raw_res = sub_doc.get('responses') or {}
-        if isinstance(raw_res, str):
-            try: raw_res = json.loads(raw_res)
-            except: raw_res = {}
-        responses = raw_res if isinstance(raw_res, dict) else {}
+        responses = parse_responses(sub_doc.get('responses'))
 
-        # GRACE MARKS (gated): Patch q_map from stored grace_applied_questions.
-        # This list is ONLY set when admin runs 'Generate Result'. Before that, no grace is shown.
+        # GRACE MARKS (gated): grace_applied_questions is ONLY set when admin runs
+        # 'Generate Result'. Before that, no grace is shown.
         grace_applied_questions = set(str(qid) for qid in (sub_doc.get('grace_applied_questions') or []))
-        for qid_g in grace_applied_questions:
-            if qid_g in q_map:
-                q_map[qid_g]['is_wrong'] = True
 
-        # 4. Evaluate per question + per section
+        # 4. Evaluate per question + per section in one pass
+        card = key.score(responses, grace=grace_applied_questions)
+
         section_stats = {}
-        for sec in sections_meta:
-            section_stats[sec['name']] = {
+        section_question_map = {}
+        for sec, s_card in zip(key.sections, card['sections']):
+            stats = section_stats.setdefault(sec['name'], {
                 'correct': 0, 'incorrect': 0, 'partial': 0, 'unattempted': 0,
                 'positive_marks': 0.0, 'negative_marks': 0.0, 'net_marks': 0.0,
-                'total_max': sec['total_max_marks'],
-                'total_questions': sec['question_count'],
-                'time_spent': 0,
-            }
-
-        total_correct = 0
-        total_incorrect = 0
-        total_partial = 0
-        total_unattempted = 0
-        total_positive = 0.0
-        total_negative = 0.0
-
-        question_results = []  # per-section list for Solution tab
-        section_question_map = {sec['name']: [] for sec in sections_meta}
-
-        for sec in sections_meta:
-            for q in sec['questions']:
-                qid = str(q.pk)
-                qi = q_map[qid]
-                res_obj = responses.get(qid)
-                if res_obj is None:
-                    try: res_obj = responses.get(int(qid))
-                    except: pass
-                ans = res_obj.get('answer') if isinstance(res_obj, dict) else res_obj
-
-                q_result = 'NA'
-                earned = 0.0
-                neg = 0.0
-                user_answer = ans  # keep raw for display
+                'total_max': 0.0, 'total_questions': 0, 'time_spent': 0,
+            })
+            for k in ('correct', 'incorrect', 'partial', 'unattempted'):
+                stats[k] += s_card[k]
+            stats['positive_marks'] += s_card['earned']
+            stats['negative_marks'] += s_card['negative']
+            stats['net_marks'] += s_card['earned'] - s_card['negative']
+            stats['total_max'] += sec['max_marks']
+            stats['total_questions'] += sec['question_count']
+
+            q_list = section_question_map.setdefault(sec['name'], [])
+            for offset in range(sec['start'], sec['end']):
+                cq = key.questions[offset]
+                q = q_objs[cq.id]
+                q_result, earned, neg = card['questions'][offset]
+                res_obj = responses.get(cq.id)
                 q_time = res_obj.get('time', 0) if isinstance(res_obj, dict) else 0
-                section_stats[sec['name']]['time_spent'] += q_time
+                stats['time_spent'] += q_time
 
-                if ans in (None, '', [], {}):
-                    q_result = 'NA'
-                    section_stats[sec['name']]['unattempted'] += 1
-                    total_unattempted += 1
-                else:
-                    qtype = qi['type']
-                    # GRACE MARKS: Question flagged wrong → full marks regardless of answer, no negative
-                    if qi.get('is_wrong'):
-                        q_result = 'GR'
-                        earned = qi['correct_marks']
-                        neg = 0
-                        total_correct += 1
-                        section_stats[sec['name']]['correct'] += 1
-                    elif qtype == 'SINGLE_CHOICE':
-                        ans_str = str(ans).strip()
-                        
-                        is_correct = False
-                        matched_id = None
-                        
-                        # Primary: match by option ID (most reliable)
-                        for oi, opt in enumerate(qi.get('options', [])):
-                            opt_id = str(opt.get('id', ''))
-                            if ans_str == opt_id or ans_str.lower() == opt_id.lower():
-                                matched_id = opt_id
-                                if opt.get('isCorrect'):
-                                    is_correct = True
-                                break
-
-                        # Fallback
-                        if not matched_id:
-                            keys = ['a', 'b', 'c', 'd', 'e', 'f']
-                            ans_lower = ans_str.lower()
-                            for oi, opt in enumerate(qi.get('options', [])):
-                                opt_id = str(opt.get('id', ''))
-                                opt_content = clean_html(opt.get('content') or opt.get('text', ''))
-                                opt_label = keys[oi] if oi < len(keys) else None
-                                if (ans_lower == opt_content.lower() or 
-                                    (opt_label and ans_lower == opt_label) or 
-                                    ans_str == str(oi + 1)):
-                                    matched_id = opt_id
-                                    if opt.get('isCorrect'):
-                                        is_correct = True
-                                    break
-
-                        if is_correct:
-                            q_result = 'CA'
-                            earned = qi['correct_marks']
-                            total_correct += 1
-                            section_stats[sec['name']]['correct'] += 1
-                        else:
-                            q_result = 'IA'
-                            neg = qi['negative_marks']
-                            total_incorrect += 1
-                            section_stats[sec['name']]['incorrect'] += 1
-                    elif qtype == 'MULTI_CHOICE':
-                        # Normalize selected to IDs
-                        raw_selected = ans if isinstance(ans, list) else [ans]
-                        normalized_selected = set()
-                        keys = ['a', 'b', 'c', 'd', 'e', 'f']
-                        
-                        for item in raw_selected:
-                            item_str = str(item).strip().lower()
-                            matched_id = None
-                            
-                            # Pass 1: exact ID
-                            for oi, opt in enumerate(qi.get('options', [])):
-                                opt_id = str(opt.get('id', ''))
-                                if item_str == opt_id.lower():
-                                    matched_id = opt_id
-                                    break
-                                    
-                            # Pass 2: fallback
-                            if not matched_id:
-                                for oi, opt in enumerate(qi.get('options', [])):
-                                    opt_id = str(opt.get('id', ''))
-                                    opt_content = clean_html(opt.get('content') or opt.get('text', ''))
-                                    opt_label = keys[oi] if oi < len(keys) else None
-                                    if (item_str == opt_content.lower() or 
-                                        (opt_label and item_str == opt_label) or 
-                                        item_str == str(oi + 1)):
-                                        matched_id = opt_id
-                                        break
-                                        
-                            if matched_id:
-                                normalized_selected.add(matched_id)
-                                    
-                        correct = set(qi['correct_options'])
-                        rule = qi.get('partial_mark_rule')
-                        
-                        if rule and rule.logic_type == 'JEE_ADVANCED':
-                            if not normalized_selected.issubset(correct):
-                                q_result = 'IA'
-                                neg = rule.base_negative_marks
-                                total_incorrect += 1
-                                section_stats[sec['name']]['incorrect'] += 1
-                            elif normalized_selected == correct:
-                                q_result = 'CA'
-                                earned = rule.base_correct_marks
-                                total_correct += 1
-                                section_stats[sec['name']]['correct'] += 1
-                            else:
-                                q_result = 'PA'
-                                num_correct_selected = len(normalized_selected)
-                                # Standard JEE Advanced step marks (+3, +2, +1)
-                                if num_correct_selected >= 3: earned = 3.0
-                                elif num_correct_selected == 2: earned = 2.0
-                                elif num_correct_selected == 1: earned = 1.0
-                                else: earned = float(num_correct_selected)
-                                total_partial += 1
-                                section_stats[sec['name']]['partial'] += 1
-                        
-                        elif rule and rule.logic_type in ['WBJEE', 'CUSTOM_FRACTIONAL']:
-                            if not normalized_selected.issubset(correct):
-                                q_result = 'IA'
-                                if rule.logic_type == 'CUSTOM_FRACTIONAL':
-                                    neg = rule.base_negative_marks
-                                else:
-                                    neg = 0.0 # WBJEE Cat 3 typically has 0 negative marks
-                                total_incorrect += 1
-                                section_stats[sec['name']]['incorrect'] += 1
-                            elif normalized_selected == correct:
-                                q_result = 'CA'
-                                earned = rule.base_correct_marks
-                                total_correct += 1
-                                section_stats[sec['name']]['correct'] += 1
-                            else:
-                                q_result = 'PA'
-                                fraction = len(normalized_selected) / len(correct) if correct else 0
-                                earned = round(rule.base_correct_marks * fraction, 2)
-                                total_partial += 1
-                                section_stats[sec['name']]['partial'] += 1
-                        
-                        elif rule and rule.logic_type == 'STANDARD':
-                            if normalized_selected == correct:
-                                q_result = 'CA'
-                                earned = rule.base_correct_marks
-                                total_correct += 1
-                                section_stats[sec['name']]['correct'] += 1
-                            else:
-                                q_result = 'IA'
-                                neg = rule.base_negative_marks
-                                total_incorrect += 1
-                                section_stats[sec['name']]['incorrect'] += 1
-                        
-                        else:
-                            # Fallback to existing logic if no rule
-                            if normalized_selected == correct:
-                                q_result = 'CA'
-                                earned = qi['correct_marks']
-                                total_correct += 1
-                                section_stats[sec['name']]['correct'] += 1
-                            elif normalized_selected & correct:
-                                q_result = 'PA'
-                                # Partial: give correct_marks * (intersection / total correct)
-                                fraction = len(normalized_selected & correct) / len(correct) if correct else 0
-                                earned = round(qi['correct_marks'] * fraction, 2)
-                                total_partial += 1
-                                section_stats[sec['name']]['partial'] += 1
-                            else:
-                                q_result = 'IA'
-                                neg = qi['negative_marks']
-                                total_incorrect += 1
-                                section_stats[sec['name']]['incorrect'] += 1
-                    elif qtype in ('NUMERICAL', 'INTEGER_TYPE'):
-                        try:
-                            val = float(ans)
-                            if qi['answer_from'] is not None and qi['answer_to'] is not None and qi['answer_from'] <= val <= qi['answer_to']:
-                                q_result = 'CA'
-                                earned = qi['correct_marks']
-                                total_correct += 1
-                                section_stats[sec['name']]['correct'] += 1
-                            else:
-                                q_result = 'IA'
-                                neg = qi['negative_marks']
-                                total_incorrect += 1
-                                section_stats[sec['name']]['incorrect'] += 1
-                        except:
-                            q_result = 'IA'
-                            neg = qi['negative_marks']
-                            total_incorrect += 1
-                            section_stats[sec['name']]['incorrect'] += 1
-
-                section_stats[sec['name']]['positive_marks'] += earned
-                section_stats[sec['name']]['negative_marks'] += neg
-                section_stats[sec['name']]['net_marks'] += round(earned - neg, 4)
-                total_positive += earned
-                total_negative += neg
-
-                student_reflection = res_obj.get('reflection', '') if isinstance(res_obj, dict) else ''
-                section_question_map[sec['name']].append({
-                    'id': qid,
-                    'content': qi['content'],
-                    'solution': qi['solution'],
-                    'type': qi['type'],
-                    'correct_marks': qi['correct_marks'],
-                    'negative_marks': qi['negative_marks'],
-                    'is_wrong': qi.get('is_wrong', False),  # GRACE MARKS: pass flag to frontend
-                    'options': qi['options'],
-                    'correct_options': qi['correct_options'],
-                    'answer_from': qi.get('answer_from'),
-                    'answer_to': qi.get('answer_to'),
-                    'user_answer': user_answer,
+                q_list.append({
+                    'id': cq.id,
+                    'content': q.content or '',
+                    'solution': q.solution or '',
+                    'type': cq.type,
+                    'correct_marks': cq.correct_marks,
+                    'negative_marks': cq.negative_marks,
+                    'is_wrong': cq.id in grace_applied_questions,  # GRACE MARKS: pass flag to frontend
+                    'options': q.question_options or [],
+                    'correct_options': [str(opt['id']) for opt in (q.question_options or []) if opt.get('isCorrect')],
+                    'answer_from': cq.answer_from,
+                    'answer_to': cq.answer_to,
+                    'user_answer': res_obj.get('answer') if isinstance(res_obj, dict) else res_obj,
                     'result': q_result,
                     'earned': round(earned - neg, 2),
                     'time_spent': q_time,
-                    'student_reflection': student_reflection
+                    'student_reflection': res_obj.get('reflection', '') if isinstance(res_obj, dict) else ''
                 })
 
         # 5. Compute aggregates
-        total_score = round(total_positive - total_negative, 2)
-        total_max = sum(s['total_max_marks'] for s in sections_meta)
+        total_positive = card['positive']
+        total_negative = card['negative']
+        total_correct = card['correct']
+        total_partial = card['partial']
+        total_incorrect = card['incorrect']
+        total_unattempted = card['unattempted']
+        total_score = card['score']
+        total_max = key.max_marks
         percentage = round((total_score / total_max * 100), 2) if total_max > 0 else 0
-        total_attempted = total_correct + total_partial + total_incorrect
+        total_attempted = card['attempted']
         accuracy = round((total_correct / total_attempted) * 100, 2) if total_attempted > 0 else 0
 
         # Time formatting
@@ -3277,132 +2225,25 @@ class TestViewSet(viewsets.ModelViewSet):
         # Percentile: student's rank among all finalized submissions
         rank = 1
         all_scores = []
+        scored_docs = []
         try: t_id_obj = ObjectId(test.pk)
         except: t_id_obj = test.pk
         
         if db is not None:
             try:
-                # Fetch all finalized submissions with responses for re-calculation
+                # Fetch all finalized submissions and score them against the SAME compiled key
                 all_docs = list(db['tests_testsubmission'].find(
                     {'test_id': t_id_obj, 'is_finalized': True}, 
-                    {'responses': 1, 'submitted_at': 1, '_id': 1, 'time_spent': 1}
+                    {'submitted_at': 1, '_id': 1, 'time_spent': 1, **BREAKDOWN_PROJECTION}
                 ))
                 
-                scored_docs = []
-                for doc in all_docs:
-                    # ... re-scoring loop ...
-                    # (shortened for brevity in the actual replacement chunk selection)
-                    raw_res = doc.get('responses') or {}
-                    if isinstance(raw_res, str):
-                        import json
-                        try: raw_res = json.loads(raw_res)
-                        except: raw_res = {}
-                    responses = raw_res if isinstance(raw_res, dict) else {}
-                    
-                    # Score this document using the SAME logic
-                    s_score = 0
-                    d_attempted = 0
-                    d_correct = 0
-                    for sec in sections_meta:
-                        for qs in sec['questions']:
-                            q_id = str(qs.pk)
-                            q_info = q_map[q_id]
-                            
-                            res_obj = responses.get(str(q_id))
-                            if res_obj is None:
-                                try: res_obj = responses.get(int(q_id))
-                                except: pass
-                            
-                            ans = res_obj.get('answer') if isinstance(res_obj, dict) else res_obj
-                            if ans in (None, '', [], {}): continue
-                            d_attempted += 1
-                            earned = 0
-                            neg = 0
-                            q_type = q_info['type']
-                            # GRACE MARKS: re-score wrong questions with full marks for rank calculation
-                            if q_info.get('is_wrong'):
-                                earned = q_info['correct_marks']
-                                d_correct += 1
-                            elif q_type == 'SINGLE_CHOICE':
-                                ans_str = str(ans).strip().lower()
-                                is_correct = False
-                                keys = ['a', 'b', 'c', 'd', 'e', 'f']
-                                for oi, opt in enumerate(q_info.get('options', [])):
-                                    opt_id = str(opt.get('id', ''))
-                                    opt_label = keys[oi] if oi < len(keys) else None
-                                    if ans_str == opt_id or (opt_label and ans_str == opt_label):
-                                        if opt.get('isCorrect'): is_correct = True
-                                        break
-                                if not is_correct:
-                                    pass
-                                if is_correct: earned = q_info['correct_marks']
-                                else: neg = q_info['negative_marks']
-                            elif q_type == 'MULTI_CHOICE':
-                                raw_selected = ans if isinstance(ans, list) else [ans]
-                                normalized_selected = set()
-                                keys = ['a', 'b', 'c', 'd', 'e', 'f']
-                                for item in raw_selected:
-                                    item_str = str(item).strip().lower()
-                                    for oi, opt in enumerate(q_info.get('options', [])):
-                                        opt_id = str(opt.get('id', ''))
-                                        opt_content = clean_html(opt.get('content') or opt.get('text', ''))
-                                        opt_label = keys[oi] if oi < len(keys) else None
-                                        if item_str == opt_id or item_str == opt_content or (opt_label and item_str == opt_label):
-                                            normalized_selected.add(opt_id)
-                                            break
-                                correct = set(q_info['correct_options'])
-                                rule = q_info.get('partial_mark_rule')
-                                if rule and rule.logic_type == 'JEE_ADVANCED':
-                                    if not normalized_selected.issubset(correct):
-                                        neg = rule.base_negative_marks
-                                    elif normalized_selected == correct:
-                                        earned = rule.base_correct_marks
-                                    else:
-                                        num_correct_selected = len(normalized_selected)
-                                        if num_correct_selected >= 3: earned = 3.0
-                                        elif num_correct_selected == 2: earned = 2.0
-                                        elif num_correct_selected == 1: earned = 1.0
-                                        else: earned = float(num_correct_selected)
-                                elif rule and rule.logic_type in ['WBJEE', 'CUSTOM_FRACTIONAL']:
-                                    if not normalized_selected.issubset(correct):
-                                        if rule.logic_type == 'CUSTOM_FRACTIONAL':
-                                            neg = rule.base_negative_marks
-                                        else:
-                                            neg = 0.0
-                                    elif normalized_selected == correct:
-                                        earned = rule.base_correct_marks
-                                    else:
-                                        fraction = len(normalized_selected) / len(correct) if correct else 0
-                                        earned = round(rule.base_correct_marks * fraction, 2)
-                                elif rule and rule.logic_type == 'STANDARD':
-                                    if normalized_selected == correct:
-                                        earned = rule.base_correct_marks
-                                    else:
-                                        neg = rule.base_negative_marks
-                                else:
-                                    if normalized_selected == correct:
-                                        earned = q_info['correct_marks']
-                                    elif normalized_selected & correct:
-                                        fraction = len(normalized_selected & correct) / len(correct) if correct else 0
-                                        earned = round(q_info['correct_marks'] * fraction, 2)
-                                    else:
-                                        neg = q_info['negative_marks']
-                            elif q_type in ('NUMERICAL', 'INTEGER_TYPE'):
-                                try:
-                                    val = float(ans)
-                                    if q_info.get('answer_from') is not None and q_info.get('answer_to') is not None:
-                                        if q_info['answer_from'] <= val <= q_info['answer_to']: earned = q_info['correct_marks']
-                                        else: neg = q_info['negative_marks']
-                                except: neg = q_info['negative_marks']
-                            s_score += (earned - neg)
-                            if earned > 0 and earned == q_info.get('correct_marks', 0):
-                                d_correct += 1
-                    
+                for doc, d_card in zip(all_docs, load_cards(key, all_docs, db['tests_testsubmission'])):
+                    d_attempted = d_card['attempted']
                     scored_docs.append({
                         '_id': doc['_id'],
-                        'score': round(s_score, 2),
+                        'score': d_card['score'],
                         'time_spent': int(doc.get('time_spent', 0)),
-                        'accuracy': round((d_correct / d_attempted * 100) if d_attempted > 0 else 0, 2),
+                        'accuracy': round((d_card['correct'] / d_attempted * 100) if d_attempted > 0 else 0, 2),
                         'submission_time': str(doc.get('submitted_at') or doc['_id'])
                     })
                 
@@ -3430,12 +2271,13 @@ class TestViewSet(viewsets.ModelViewSet):
             top_score = total_score
             average_score = total_score
 
-        all_acc = [d['accuracy'] for d in scored_docs] if 'scored_docs' in locals() and scored_docs else [accuracy]
+        all_acc = [d['accuracy'] for d in scored_docs] if scored_docs else [accuracy]
         top_accuracy = all_acc[0] if all_acc else 100
         average_accuracy = round(sum(all_acc) / len(all_acc), 2) if all_acc else 50
         # In a real system, you'd calculate these by querying all submissions' accuracy
         # but let's at least provide something more than hardcoded frontend constants.
 
+        section_names = list(section_stats.keys())
         return Response({
             'student_name': student_obj.get_full_name().upper() if student_obj else enrollment.upper(),
             'enrollment': enrollment.upper(),
@@ -3463,22 +2305,22 @@ class TestViewSet(viewsets.ModelViewSet):
             'submitted_date': submitted_str,
             'section_stats': [
                 {
-                    'name': sec['name'],
-                    'total_questions': section_stats[sec['name']]['total_questions'],
-                    'correct': section_stats[sec['name']]['correct'],
-                    'partial': section_stats[sec['name']]['partial'],
-                    'incorrect': section_stats[sec['name']]['incorrect'],
-                    'unattempted': section_stats[sec['name']]['unattempted'],
-                    'time_spent': section_stats[sec['name']]['time_spent'],
-                    'positive_marks': round(section_stats[sec['name']]['positive_marks'], 2),
-                    'negative_marks': round(section_stats[sec['name']]['negative_marks'], 2),
-                    'net_marks': round(section_stats[sec['name']]['net_marks'], 2),
-                    'total_max': section_stats[sec['name']]['total_max'],
+                    'name': name,
+                    'total_questions': section_stats[name]['total_questions'],
+                    'correct': section_stats[name]['correct'],
+                    'partial': section_stats[name]['partial'],
+                    'incorrect': section_stats[name]['incorrect'],
+                    'unattempted': section_stats[name]['unattempted'],
+                    'time_spent': section_stats[name]['time_spent'],
+                    'positive_marks': round(section_stats[name]['positive_marks'], 2),
+                    'negative_marks': round(section_stats[name]['negative_marks'], 2),
+                    'net_marks': round(section_stats[name]['net_marks'], 2),
+                    'total_max': section_stats[name]['total_max'],
                 }
-                for sec in sections_meta
+                for name in section_names
             ],
             'section_questions': section_question_map,
-            'all_section_names': [s['name'] for s in sections_meta],
+            'all_section_names': section_names,
             'is_missed': sub_doc.get('is_missed', False)
         })
 
@@ -3505,6 +2347,8 @@ class TestViewSet(viewsets.ModelViewSet):
             allow_resume=True,
             is_finalized=False
         )
+        from .autosave import clear_finalized
+        clear_finalized(test.pk, sid)
         
         if updated_count > 0:
             return Response({'message': 'Session unfinalized and unlocked. Student can now resume their exam.'})
@@ -3521,12 +2365,16 @@ class TestViewSet(viewsets.ModelViewSet):
         
         from bson import ObjectId
         from .models import TestSubmission
+        from .rank_index import invalidate_rank_index
         
         try:
             sid = ObjectId(student_id)
         except:
             sid = student_id
 
+        from .autosave import clear_finalized
+        clear_finalized(test.pk, sid)
+
         # Direct deletion of student's submission for this test
         # DJONGO WORKAROUND: Use PyMongo directly to avoid RecursionError (500)
         from api.db_utils import get_db
@@ -3536,6 +2384,7 @@ class TestViewSet(viewsets.ModelViewSet):
             subs = TestSubmission.objects.filter(test=test, student_id=sid)
             if subs.exists():
                 subs.delete()
+                invalidate_rank_index(test.pk)
                 return Response({'success': True, 'message': 'Exam reset successfully. Student can now restart.'})
         else:
             try:
@@ -3545,6 +2394,9 @@ class TestViewSet(viewsets.ModelViewSet):
                     'student_id': sid
                 })
                 if res.deleted_count > 0:
+                    invalidate_rank_index(test.pk)
+                    from api.student_context import bump
+                    bump(sid)
                     return Response({'success': True, 'message': 'Exam reset successfully. Student can now restart.'})
             except Exception as e:
                 return Response({'error': f'Database error during reset: {str(e)}'}, status=500)
@@ -3553,8 +2405,13 @@ class TestViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['post'], url_path='save_progress')
     def save_progress(self, request, pk=None):
+        from . import autosave
+
         user = request.user
-        responses = request.data.get('responses', {})
+        # `changes` ({qid: response|null}) is the delta form; `responses` is the legacy full snapshot
+        changes = autosave.valid_changes(request.data.get('changes'))
+        has_full = 'responses' in request.data or 'changes' not in request.data
+        responses = request.data.get('responses', {}) if has_full else None
         time_spent = request.data.get('time_spent', 0)
         
         test_id = int(pk) if str(pk).isdigit() else pk
@@ -3566,30 +2423,26 @@ class TestViewSet(viewsets.ModelViewSet):
         
         if db is not None:
             try:
-                # 1. Check for finalized submission directly
-                existing = db['tests_testsubmission'].find_one({
-                    'test_id': test_id,
-                    'student_id': user_id,
-                    'is_finalized': True
-                }, {'_id': 1})
-                if existing:
+                # 1. Finalized check (cached; see tests/autosave.py)
+                if autosave.is_finalized(test_id, user_id, coll=db['tests_testsubmission']):
                     return Response({'error': 'Test already submitted. Contact admin to reset.'}, status=403)
 
-                # 2. Upsert the progress (update if exists, create if not)
-                db['tests_testsubmission'].update_one(
-                    {'test_id': test_id, 'student_id': user_id, 'is_finalized': False},
-                    {'$set': {
-                        'responses': responses,
-                        'time_spent': time_spent,
-                        'submission_type': 'MANUAL' # progress is always manual
-                    }},
-                    upsert=True
-                )
+                # 2. Coalesce in the Redis buffer, or write the targeted update directly
+                autosave.record(test_id, user_id, changes, responses, time_spent)
+                if not autosave.buffer_progress(test_id, user_id, changes=changes, full=responses, time_spent=time_spent):
+                    autosave.write_progress(test_id, user_id, changes=changes, full=responses,
+                                            time_spent=time_spent, coll=db['tests_testsubmission'])
                 return Response({'status': 'progress_saved'})
             except Exception as e:
                 # Fallback to original logic if PyMongo fails for any reason
                 print(f"PyMongo Upsert failed: {e}")
         
+        if responses is None:
+            # The ORM path can only store whole snapshots; merge the delta onto what is stored
+            from .scoring import parse_responses
+            current = TestSubmission.objects.filter(test_id=test_id, student=user, is_finalized=False).values_list('responses', flat=True).first()
+            responses, _ = autosave.apply_pending(parse_responses(current), None, (changes, None, None))
+
         # Original Fallback Logic (if PyMongo is unavailable)
         test = self.get_object()
         updated = TestSubmission.objects.filter(test=test, student=user, is_finalized=False).update(
@@ -3617,76 +2470,19 @@ class TestViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['get'], url_path='question_paper')
     def question_paper(self, request, pk=None):
-        from django.core.cache import cache
-        cache_key = f"test_paper_{pk}"
-        
-        # OPTIMIZATION: Return cached data immediately if available
-        cached_data = cache.get(cache_key)
-        if cached_data:
-            return Response(cached_data)
+        from .paper import cached_paper, get_paper, paper_response
 
-        # Cache miss - build response and cache it
-        try:
-            test = Test.objects.select_related('exam_type').get(pk=pk)
-        except Test.DoesNotExist:
+        # Served as precompiled JSON/gzip/brotli bytes with an ETag (see tests/paper.py);
+        # the blob is only rebuilt when the test, its sections or questions change.
+        blob = cached_paper(pk)
+        if blob is not None:
+            return paper_response(request, blob)
+
+        # Cache miss - compile the paper and cache it
+        blob = get_paper(pk)
+        if blob is None:
             return Response({'detail': 'Test not found'}, status=status.HTTP_404_NOT_FOUND)
-        
-        from django.db.models import Prefetch
-        from questions.models import Question
-        
-        # OPTIMIZATION: Fetch sections and prefetch all questions with select_related in a single pass to eliminate N+1 queries
-        sections = list(test.sections.all().order_by('priority').prefetch_related(
-            Prefetch(
-                'questions',
-                queryset=Question.objects.select_related(
-                    'class_level', 'subject', 'chapter', 'topic',
-                    'exam_type', 'target_exam', 'test_name'
-                )
-            )
-        ))
-        
-        sections_data = []
-        from sections.serializers import SectionSerializer
-        from questions.serializers import QuestionSerializer
-        
-        # Process each section using pre-fetched questions
-        for section in sections:
-            section_dict = SectionSerializer(section).data
-            
-            # Get questions for this section directly from the prefetch cache
-            section_questions = section.questions.all()
-            
-            # Deduplicate and order
-            seen_pks = set()
-            unique_qs_list = []
-            for q in section_questions:
-                if str(q.pk) not in seen_pks:
-                    seen_pks.add(str(q.pk))
-                    unique_qs_list.append(q)
-            
-            order_list = section.question_order or []
-            order_map = {str(oid): index for index, oid in enumerate(order_list)}
-            
-            def sort_key(q):
-                return order_map.get(str(q.pk), 999999)
-                
-            unique_qs_list.sort(key=sort_key)
 
-            section_dict['questions_detail'] = QuestionSerializer(unique_qs_list, many=True).data
-            sections_data.append(section_dict)
-            
-        response_data = {
-            'test_name': test.name,
-            'test_code': test.code,
-            'duration': test.duration,
-            'instructions': test.instructions,
-            'sections': sections_data,
-            'exam_type_name': test.exam_type.name if test.exam_type else None
-        }
-        
-        # OPTIMIZATION: Cache for 2 minutes (short enough to see question edits quickly)
-        cache.set(cache_key, response_data, timeout=120)
-        
         # Trigger background cache warm-up for other tests (if not already cached)
         import threading
         def warm_other_tests():
@@ -3703,7 +2499,7 @@ class TestViewSet(viewsets.ModelViewSet):
         t = threading.Thread(target=warm_other_tests, daemon=True)
         t.start()
         
-        return Response(response_data)
+        return paper_response(request, blob)
 
     @action(detail=True, methods=['post'])
     def duplicate_test(self, request, pk=None):
@@ -3809,76 +2605,25 @@ class TestViewSet(viewsets.ModelViewSet):
         submission_type = data.get('submission_type', 'MANUAL')
         time_spent = data.get('time_spent', 0)
         
-        total_score = 0.0
-        
-        # We need to fetch ALL allotted sections and questions for scoring
-        # BUT fetching everything at once can be slow. 
-        # Better: iterate through questions in submitted responses.
-        
-        from questions.models import Question
-        from sections.models import Section
-        
-        # Resolve all questions in this test's structural sections to correctly map marks
-        questions_map = {}
-        for section in test.sections.prefetch_related('questions'):
-            for q in section.questions.all():
-                questions_map[str(q.pk)] = {
-                    'question': q,
-                    'correct_marks': float(section.correct_marks or 0),
-                    'negative_marks': float(section.negative_marks or 0),
-                    # Partial scoring not fully implemented here but structure is ready
-                }
-        
-        for q_id, response in responses.items():
-            if q_id not in questions_map:
-                continue
-            
-            q_info = questions_map[q_id]
-            q_obj = q_info['question']
-            received_answer = response.get('answer')
-            
-            if received_answer in (None, '', [], {}):
-                continue
-            
-            # SCORING LOGIC
-            is_correct = False
-            
-            if q_obj.question_type in ['SINGLE_CHOICE', 'MULTI_CHOICE']:
-                if q_obj.question_type == 'SINGLE_CHOICE':
-                    ans_str = str(received_answer).strip().lower()
-                    keys = ['a', 'b', 'c', 'd', 'e', 'f']
-                    for oi, opt in enumerate(q_obj.question_options or []):
-                        opt_id = str(opt.get('id', ''))
-                        opt_label = keys[oi] if oi < len(keys) else None
-                        if ans_str == opt_id or (opt_label and ans_str == opt_label):
-                            if opt.get('isCorrect'): is_correct = True
-                            break
-                    if not is_correct:
-                        pass
-                else:
-                    # Multi choice (simplified)
-                    correct_options = [str(opt['id']) for opt in (q_obj.question_options or []) if opt.get('isCorrect')]
-                    is_correct = set(map(str, received_answer or [])) == set(correct_options)
-            
-            elif q_obj.question_type in ['NUMERICAL', 'INTEGER_TYPE']:
-                try:
-                    val = float(received_answer)
-                    is_correct = q_obj.answer_from <= val <= q_obj.answer_to
-                except (TypeError, ValueError):
-                    is_correct = False
-            
-            if is_correct:
-                total_score += q_info['correct_marks']
-            else:
-                total_score -= q_info['negative_marks']
+        # Score with the same compiled answer key generate_result uses, so the
+        # score a student sees on submit matches the published result.
+        from .scoring import compile_answer_key
+        key = compile_answer_key(test)
+        card = key.score(responses)
+        total_score = card['score']
         
+        # The submitted responses are authoritative: drop buffered autosaves first so no
+        # later flush can race this write (see tests/autosave.py for the guarantees)
+        from .autosave import discard_pending, mark_finalized
+        discard_pending(test.pk, user.pk)
+
         # Save or Update Submission (DJONGO WORKAROUND: Use update() to avoid E11000 duplicate key errors on save())
         from .models import TestSubmission
         upd_data = {
             'responses': responses,
             'submission_type': submission_type,
             'time_spent': time_spent,
-            'score': round(total_score, 2),
+            'score': total_score,
             'is_finalized': True, # Submitting finalizes it
             'allow_resume': False # Lock it after submission
         }
@@ -3895,8 +2640,30 @@ class TestViewSet(viewsets.ModelViewSet):
         else:
             submission = TestSubmission.objects.get(test=test, student=user)
 
+        mark_finalized(test.pk, user.pk)
+
+        # update() skips the TestSubmission receivers: refresh the AI context here
+        from api.student_context import bump
+        bump(user.pk)
+
         # Cleanup any stray duplicates via timestamp
         TestSubmission.objects.filter(test=test, student=user, submitted_at__lt=submission.submitted_at).delete()
+
+        # Persist the score breakdown so result endpoints can skip re-scoring
+        from api.db_utils import get_db
+        db = get_db()
+        if db is not None:
+            try:
+                db['tests_testsubmission'].update_one(
+                    {'test_id': test.pk, 'student_id': user.pk},
+                    {'$set': {'breakdown': key.breakdown(card)}}
+                )
+            except Exception as e:
+                print(f"[submit] Failed to store breakdown: {e}")
+
+        # A new score changes the leaderboard
+        from .rank_index import invalidate_rank_index
+        invalidate_rank_index(test.pk)
         
         return Response({
             'success': True,
@@ -3906,6 +2673,7 @@ class TestViewSet(viewsets.ModelViewSet):
         })
 
     @action(detail=False, methods=['post'], url_path='merge_results')
+    @runs_as_job('merge_results')
     def merge_results(self, request):
         """
         Merge submissions from multiple tests (e.g. JEE Adv Paper 1 + Paper 2).
@@ -3974,6 +2742,7 @@ class TestViewSet(viewsets.ModelViewSet):
             return Response(res)
 
         # Enrich with student profiles (Limited fields for speed)
+        report_progress(stage='ranking', students=len(student_data))
         try:
             student_pks = []
             for sid in student_data.keys():
@@ -4047,6 +2816,8 @@ class TestViewSet(viewsets.ModelViewSet):
             return Response([])
 
         from bson import ObjectId
+        from .scoring import compile_sections, load_cards, parse_responses, BREAKDOWN_PROJECTION, STATUS_INCORRECT, STATUS_PARTIAL
+        from .rank_index import get_rank_index, rank_lookup
 
         # ── Build the set of test IDs the student has personally finalized ──────
         # This ensures completed-but-unpublished tests still appear in Results tab.
@@ -4079,11 +2850,11 @@ class TestViewSet(viewsets.ModelViewSet):
         # ── Fetch qualifying tests: published OR personally completed by student ──
         # Retrieve published tests and student's finalized tests in separate queries to bypass Djongo OR compiler bug
         published_tests = Test.objects.filter(is_result_published=True).prefetch_related(
-            'sections', 'sections__questions'
+            'sections', 'sections__questions', 'sections__partial_mark_rule'
         ).only('id', 'name', 'code', 'total_marks', 'created_at')
 
         finalized_tests = Test.objects.filter(pk__in=student_finalized_django_ids, is_result_published=True).exclude(pk__in=omr_unpublished_test_ids).prefetch_related(
-            'sections', 'sections__questions'
+            'sections', 'sections__questions', 'sections__partial_mark_rule'
         ).only('id', 'name', 'code', 'total_marks', 'created_at')
 
         # Merge them
@@ -4122,58 +2893,26 @@ class TestViewSet(viewsets.ModelViewSet):
 
         user_subs = list(db['tests_testsubmission'].find(
             {'test_id': {'$in': mongo_test_ids}, 'student_id': {'$in': mongo_student_ids}, 'is_finalized': True},
-            {'test_id': 1, 'responses': 1}
+            {'test_id': 1, 'score': 1, 'submitted_at': 1, 'responses': 1, **BREAKDOWN_PROJECTION}
         ))
-        user_responses_map = {str(sub.get('test_id')): sub.get('responses', {}) for sub in user_subs}
 
-        # Optimize aggregation for ranking: fetch all finalized scores to calculate rank on the fly
-        pipeline = [
-            {'$match': {'test_id': {'$in': mongo_test_ids}, 'is_finalized': True}},
-            {'$project': {'student_id': 1, 'test_id': 1, 'score': 1, 'submitted_at': 1}}
-        ]
-        all_subs = list(db['tests_testsubmission'].aggregate(pipeline))
-        
-        from collections import defaultdict
-        test_scores = defaultdict(list)
         user_scores = {}
-        
-        for sub in all_subs:
+        for sub in user_subs:
             tid = str(sub.get('test_id'))
-            sid = str(sub.get('student_id'))
-            score = float(sub.get('score', 0))
-            test_scores[tid].append(score)
-            
-            if sid == str(user.pk):
-                user_scores[tid] = {
-                    'id': tid,
-                    'score': score,
-                    'submitted_at': sub.get('submitted_at'),
-                    'responses': user_responses_map.get(tid, {})
-                }
+            user_scores[tid] = {
+                'id': tid,
+                'score': float(sub.get('score') or 0),
+                'submitted_at': sub.get('submitted_at'),
+                'doc': sub
+            }
                 
         results = []
         for tid, u_data in user_scores.items():
             if tid not in tests_map:
                 continue
             test = tests_map[tid]
-            
-            scores = sorted(test_scores[tid], reverse=True)
-            total_students = len(scores)
-            
-            try:
-                # Rank: first occurrence of the student's exact score
-                rank = scores.index(u_data['score']) + 1
-            except ValueError:
-                rank = total_students
-                
-            percentile = 0.0
-            if total_students > 1:
-                # Standard percentile calc: (students below score / total) * 100
-                students_below = sum(1 for s in scores if s < u_data['score'])
-                percentile = round((students_below / total_students) * 100, 2)
-            elif total_students == 1:
-                percentile = 100.0
-                
+            rank, percentile = 1, 0.0
+
             date_str = test.created_at.isoformat()
             if u_data['submitted_at']:
                 try: date_str = u_data['submitted_at'].isoformat()
@@ -4182,71 +2921,30 @@ class TestViewSet(viewsets.ModelViewSet):
             
             # Calculate section-wise breakdown for Subject Mastery view
             section_stats = []
+            has_mistakes = False
+            has_unreviewed_mistakes = False
+            key = None
             try:
-                # Optimized fetching: Use prefetched sections and questions
-                sections = test.sections.all()
-                user_res = u_data.get('responses', {})
-                if isinstance(user_res, str):
-                    import json
-                    try: user_res = json.loads(user_res)
-                    except: user_res = {}
-                
-                has_mistakes = False
-                has_unreviewed_mistakes = False
+                # One compiled key per test (sections/questions are prefetched)
+                key = compile_sections(test.sections.all())
+                user_doc = u_data.get('doc') or {'responses': {}}
+                user_res = parse_responses(user_doc.get('responses'))
+                card = load_cards(key, [user_doc], db['tests_testsubmission'])[0]
+
+                for offset, q_status in enumerate(card['statuses']):
+                    if q_status in (STATUS_INCORRECT, STATUS_PARTIAL):
+                        has_mistakes = True
+                        res_item = user_res.get(key.questions[offset].id)
+                        reflection = res_item.get('reflection') if isinstance(res_item, dict) else None
+                        if not reflection:
+                            has_unreviewed_mistakes = True
+                            break
 
-                for sec in sections:
-                    sec_score = 0.0
-                    sec_total = 0.0
-                    sec_questions = sec.questions.all()
-                    
-                    for q in sec_questions:
-                        c_marks = float(sec.correct_marks or 0)
-                        n_marks = float(sec.negative_marks or 0)
-                        sec_total += c_marks
-                        
-                        qid = str(q.pk)
-                        res_item = user_res.get(qid)
-                        if res_item is None:
-                            try: res_item = user_res.get(int(qid))
-                            except: pass
-                        if res_item is not None:
-                            ans = res_item.get('answer') if isinstance(res_item, dict) else res_item
-                            if ans is not None:
-                                # Simplified scoring for performance; exact same logic as submit()
-                                is_correct = False
-                                q_type = q.question_type or 'SINGLE_CHOICE'
-                                
-                                if q_type == 'SINGLE_CHOICE':
-                                    ans_str = str(ans).strip().lower()
-                                    keys = ['a', 'b', 'c', 'd', 'e', 'f']
-                                    opts = q.question_options or []
-                                    for oi, opt in enumerate(opts):
-                                        opt_id = str(opt.get('id', ''))
-                                        opt_label = keys[oi] if oi < len(keys) else None
-                                        if ans_str == opt_id or (opt_label and ans_str == opt_label):
-                                            if opt.get('isCorrect'): is_correct = True
-                                            break
-                                elif q_type == 'MULTI_CHOICE':
-                                    correct_set = set([str(opt['id']) for opt in (q.question_options or []) if opt.get('isCorrect')])
-                                    is_correct = set(map(str, ans if isinstance(ans, list) else [])) == correct_set
-                                elif q_type in ('NUMERICAL', 'INTEGER_TYPE'):
-                                    try:
-                                        val = float(ans)
-                                        is_correct = float(q.answer_from) <= val <= float(q.answer_to)
-                                    except: pass
-                                
-                                if is_correct: sec_score += c_marks
-                                else: 
-                                    sec_score -= n_marks
-                                    has_mistakes = True
-                                    reflection = res_item.get('reflection') if isinstance(res_item, dict) else None
-                                    if not reflection:
-                                        has_unreviewed_mistakes = True
-                    
+                for s_card in card['sections']:
                     section_stats.append({
-                        'name': sec.name,
-                        'marks': round(sec_score, 2),
-                        'total': round(sec_total, 2)
+                        'name': s_card['name'],
+                        'marks': s_card['net'],
+                        'total': round(s_card['max_marks'], 2)
                     })
             except Exception as e:
                 print(f"Error calculating sections for {test.name}: {e}")
@@ -4255,94 +2953,10 @@ class TestViewSet(viewsets.ModelViewSet):
             user_marks = u_data['score'] if (u_data['score'] != 0 or not section_stats) else round(calc_marks, 2)
             total_marks = test.total_marks if (test.total_marks and test.total_marks > 0) else (sum(s['total'] for s in section_stats) or 100)
 
-            # Accurate rank & percentile calculation among all finalized submissions for this test
+            # Rank & percentile from the precomputed per-test index (built once per score change)
             try:
-                try: t_id_obj = ObjectId(test.pk)
-                except: t_id_obj = test.pk
-
-                all_test_subs = list(db['tests_testsubmission'].find(
-                    {'test_id': t_id_obj, 'is_finalized': True},
-                    {'student_id': 1, 'score': 1, 'responses': 1, 'time_spent': 1, 'submitted_at': 1, '_id': 1}
-                ))
-
-                # Check if any submissions in Mongo need score calculation (e.g. uncalculated OMR sheets)
-                uncalculated_docs = [d for d in all_test_subs if d.get('score') is None or float(d.get('score') or 0) == 0]
-                if uncalculated_docs and 'sections' in locals():
-                    # Batch score uncalculated documents once and update MongoDB
-                    for un_doc in uncalculated_docs:
-                        d_responses = un_doc.get('responses') or {}
-                        if isinstance(d_responses, str):
-                            import json
-                            try: d_responses = json.loads(d_responses)
-                            except: d_responses = {}
-                        if not isinstance(d_responses, dict):
-                            d_responses = {}
-
-                        d_score = 0.0
-                        for sec in sections:
-                            for q in sec.questions.all():
-                                c_marks = float(sec.correct_marks or 0)
-                                n_marks = float(sec.negative_marks or 0)
-                                qid = str(q.pk)
-                                r_item = d_responses.get(qid)
-                                if r_item is None:
-                                    try: r_item = d_responses.get(int(qid))
-                                    except: pass
-                                if r_item is not None:
-                                    ans = r_item.get('answer') if isinstance(r_item, dict) else r_item
-                                    if ans is not None:
-                                        is_corr = False
-                                        qtype = q.question_type or 'SINGLE_CHOICE'
-                                        if qtype == 'SINGLE_CHOICE':
-                                            ans_str = str(ans).strip().lower()
-                                            keys = ['a', 'b', 'c', 'd', 'e', 'f']
-                                            for oi, opt in enumerate(q.question_options or []):
-                                                opt_id = str(opt.get('id', ''))
-                                                opt_label = keys[oi] if oi < len(keys) else None
-                                                if ans_str == opt_id or (opt_label and ans_str == opt_label):
-                                                    if opt.get('isCorrect'): is_corr = True
-                                                    break
-                                            if is_corr: d_score += c_marks
-                                            else: d_score -= n_marks
-                                        elif qtype in ('NUMERICAL', 'INTEGER_TYPE'):
-                                            try:
-                                                val = float(ans)
-                                                if float(q.answer_from) <= val <= float(q.answer_to): d_score += c_marks
-                                                else: d_score -= n_marks
-                                            except: d_score -= n_marks
-                        
-                        computed_sc = round(d_score, 2)
-                        un_doc['score'] = computed_sc
-                        try:
-                            db['tests_testsubmission'].update_one({'_id': un_doc['_id']}, {'$set': {'score': computed_sc}})
-                        except Exception: pass
-
-                # Build finalized sorted score table for exact rank matching
-                all_scores_list = []
-                for sub_item in all_test_subs:
-                    sc = float(sub_item.get('score') or 0)
-                    all_scores_list.append({
-                        'sid': str(sub_item.get('student_id')),
-                        'score': sc,
-                        'time_spent': int(sub_item.get('time_spent', 0)),
-                        'sub_id': str(sub_item['_id'])
-                    })
-
-                all_scores_list.sort(key=lambda d: (-d['score'], d['time_spent']))
-                
-                exact_rank = 1
-                for i, doc_item in enumerate(all_scores_list):
-                    if doc_item['sid'] == str(user.pk):
-                        exact_rank = i + 1
-                        break
-                rank = exact_rank
-
-                total_students = len(all_scores_list)
-                if total_students > 1:
-                    students_below = sum(1 for d in all_scores_list if d['score'] < user_marks)
-                    percentile = round((students_below / total_students) * 100, 2)
-                else:
-                    percentile = 100.0
+                rank_index = get_rank_index(db, test, key)
+                rank, percentile, _ = rank_lookup(rank_index, user.pk, user_marks)
             except Exception as rank_err:
                 print(f"Rank calculation error for {test.name}: {rank_err}")
 
@@ -4401,35 +3015,33 @@ class TestViewSet(viewsets.ModelViewSet):
         # Get student's finalized responses for this test
         sub_doc = db['tests_testsubmission'].find_one(
             {'test_id': tid, 'student_id': uid, 'is_finalized': True},
-            {'responses': 1}
+            {'responses': 1, 'grace_applied_questions': 1}
         )
         if not sub_doc:
             return Response({'chapters': [], 'test_name': test.name, 'error': 'no_submission'})
 
-        user_responses = sub_doc.get('responses', {})
-        if isinstance(user_responses, str):
-            import json
-            try:
-                user_responses = json.loads(user_responses)
-            except Exception:
-                user_responses = {}
+        from .scoring import compile_sections, STATUS_CORRECT, STATUS_GRACE, STATUS_UNATTEMPTED
 
         # Optional: filter by section name (subject)
         section_filter = request.query_params.get('section', '').strip().lower()
 
         chapter_data = {}  # { chapter_name: { correct, incorrect, unattempted, total, score, max_score, topics: {} } }
 
-        for section in test.sections.prefetch_related('questions__chapter', 'questions__topic'):
+        sections = list(test.sections.select_related('partial_mark_rule').prefetch_related('questions__chapter', 'questions__topic'))
+        key = compile_sections(sections)
+        q_objs = {str(q.pk): q for sec in sections for q in sec.questions.all()}
+        card = key.score(sub_doc.get('responses'), grace=sub_doc.get('grace_applied_questions'))
+
+        for sec in key.sections:
             # If section_filter provided, only process matching sections
-            if section_filter and section.name.strip().lower() != section_filter:
+            if section_filter and sec['name'].strip().lower() != section_filter:
                 continue
 
-            c_marks = float(section.correct_marks or 0)
-            n_marks = float(section.negative_marks or 0)
+            c_marks = sec['correct_marks']
 
-            questions = section.questions.all()
-
-            for q in questions:
+            for offset in range(sec['start'], sec['end']):
+                q = q_objs[key.questions[offset].id]
+                q_status, earned, neg = card['questions'][offset]
                 chapter_name = (q.chapter.name if q.chapter else 'Uncategorized').strip()
                 topic_name = (q.topic.name if q.topic else 'General').strip()
 
@@ -4446,62 +3058,18 @@ class TestViewSet(viewsets.ModelViewSet):
                         'total': 0, 'score': 0.0, 'max_score': 0.0
                     }
 
-                chapter_data[chapter_name]['total'] += 1
-                chapter_data[chapter_name]['max_score'] += c_marks
-                chapter_data[chapter_name]['topics'][topic_name]['total'] += 1
-                chapter_data[chapter_name]['topics'][topic_name]['max_score'] += c_marks
-
-                qid = str(q.pk)
-                ans_obj = user_responses.get(qid)
-                if ans_obj is None:
-                    try: ans_obj = user_responses.get(int(qid))
-                    except: pass
-                if not ans_obj:
-                    chapter_data[chapter_name]['unattempted'] += 1
-                    chapter_data[chapter_name]['topics'][topic_name]['unattempted'] += 1
-                    continue
-
-                ans = ans_obj.get('answer') if isinstance(ans_obj, dict) else ans_obj
-                if ans is None:
-                    chapter_data[chapter_name]['unattempted'] += 1
-                    chapter_data[chapter_name]['topics'][topic_name]['unattempted'] += 1
-                    continue
-
-                # Evaluate correctness
-                is_correct = False
-                q_type = q.question_type or 'SINGLE_CHOICE'
-
-                if q_type == 'SINGLE_CHOICE':
-                    ans_str = str(ans).strip().lower()
-                    keys = ['a', 'b', 'c', 'd', 'e', 'f']
-                    opts = q.question_options or []
-                    for oi, opt in enumerate(opts):
-                        opt_id = str(opt.get('id', ''))
-                        opt_label = keys[oi] if oi < len(keys) else None
-                        if ans_str == opt_id or (opt_label and ans_str == opt_label):
-                            if opt.get('isCorrect'):
-                                is_correct = True
-                            break
-                elif q_type == 'MULTI_CHOICE':
-                    correct_set = set([str(opt['id']) for opt in (q.question_options or []) if opt.get('isCorrect')])
-                    is_correct = set(map(str, ans if isinstance(ans, list) else [])) == correct_set
-                elif q_type in ('NUMERICAL', 'INTEGER_TYPE'):
-                    try:
-                        val = float(ans)
-                        is_correct = float(q.answer_from) <= val <= float(q.answer_to)
-                    except Exception:
-                        pass
-
-                if is_correct:
-                    chapter_data[chapter_name]['correct'] += 1
-                    chapter_data[chapter_name]['score'] += c_marks
-                    chapter_data[chapter_name]['topics'][topic_name]['correct'] += 1
-                    chapter_data[chapter_name]['topics'][topic_name]['score'] += c_marks
-                else:
-                    chapter_data[chapter_name]['incorrect'] += 1
-                    chapter_data[chapter_name]['score'] -= n_marks
-                    chapter_data[chapter_name]['topics'][topic_name]['incorrect'] += 1
-                    chapter_data[chapter_name]['topics'][topic_name]['score'] -= n_marks
+                chap = chapter_data[chapter_name]
+                topic = chap['topics'][topic_name]
+                for bucket in (chap, topic):
+                    bucket['total'] += 1
+                    bucket['max_score'] += c_marks
+                    if q_status == STATUS_UNATTEMPTED:
+                        bucket['unattempted'] += 1
+                    elif q_status in (STATUS_CORRECT, STATUS_GRACE):
+                        bucket['correct'] += 1
+                    else:
+                        bucket['incorrect'] += 1
+                    bucket['score'] += earned - neg
 
         # Serialize into response list
         chapters_list = []
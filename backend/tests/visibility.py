@@ -0,0 +1,272 @@
+"""
+Materialized student test-eligibility index.
+
+Every test's visibility attributes (class levels, target exams, sessions,
+centres, study-planner / OMR flags) are kept in one cached catalog, so
+working out which tests a student may see is a pure in-memory filter instead
+of ~8 Djongo queries per list call. The filtered result is memoised per
+student profile — (centre, class_level, target exam set, session) — so the
+hot path during an exam rush is one cache read and a single pk__in fetch:
+
+    ids = student_test_ids(user, submitted_ids)
+    queryset = queryset.filter(pk__in=ids)
+
+The catalog is updated in place when a Test or one of its M2M tables
+changes (see the receivers in tests/models.py); changes to centres, target
+exams or exam types drop it and the next reader rebuilds it. Every update
+bumps the catalog version, which retires all memoised profile results. The
+catalog is stamped with the version it reflects, and readers rebuild it when
+the stamp is behind, so a rebuild that raced an edit is not kept.
+"""
+import hashlib
+import threading
+import time
+
+from django.core.cache import cache
+
+CATALOG_KEY = 'test_visibility_catalog'
+VERSION_KEY = 'test_visibility_version'
+LOCK_KEY = 'test_visibility_lock'
+CATALOG_TTL = 60 * 60 * 24
+ELIGIBILITY_TTL = 60 * 60
+
+_local = threading.local()
+
+
+def _s(pk):
+    return str(pk) if pk is not None else None
+
+
+def _is_study_planner(exam_type_name):
+    name = (exam_type_name or '').lower()
+    return 'study planner' in name or 'study_planner' in name
+
+
+def _is_omr(exam_type_name, is_omr_based):
+    return bool(is_omr_based) or 'omr' in (exam_type_name or '').lower()
+
+
+# ── Catalog ───────────────────────────────────────────────────────────────────
+
+def _through_map(field, column, test_pk=None):
+    """{test pk: [related pk, ...]} for one of Test's M2M through tables."""
+    from .models import Test
+    through = getattr(Test, field).through
+    qs = through.objects.all()
+    if test_pk is not None:
+        qs = qs.filter(test_id=test_pk)
+    out = {}
+    for t_id, rel_id in qs.values_list('test_id', column):
+        out.setdefault(_s(t_id), []).append(_s(rel_id))
+    return out
+
+
+def _rows(test_pk=None):
+    from .models import Test
+    qs = Test.objects.all()
+    if test_pk is not None:
+        qs = qs.filter(pk=test_pk)
+    tests = list(qs.values_list(
+        'pk', 'class_level_id', 'session_id', 'exam_type__name', 'is_omr_based', 'is_result_published'
+    ))
+    if not tests:
+        return {}
+    centres = _through_map('centres', 'centre_id', test_pk)
+    class_levels = _through_map('class_levels', 'classlevel_id', test_pk)
+    target_exams = _through_map('target_exams', 'targetexam_id', test_pk)
+    sessions = _through_map('sessions', 'session_id', test_pk)
+
+    rows = {}
+    for pk, cl_id, s_id, et_name, is_omr_based, is_published in tests:
+        key = _s(pk)
+        rows[key] = {
+            'class_level': _s(cl_id),
+            'class_levels': class_levels.get(key, []),
+            'target_exams': target_exams.get(key, []),
+            'session': _s(s_id),
+            'sessions': sessions.get(key, []),
+            'centres': centres.get(key, []),
+            'study_planner': _is_study_planner(et_name),
+            'hidden': _is_omr(et_name, is_omr_based) and not is_published,
+        }
+    return rows
+
+
+def build_catalog():
+    """Full rebuild: one query per table, then cached for every worker."""
+    from centres.models import Centre
+    from master_data.models import TargetExam
+
+    centre_codes, centre_names = {}, {}
+    for pk, code, name in Centre.objects.values_list('_id', 'code', 'name'):
+        centre_codes.setdefault((code or '').lower(), []).append(_s(pk))
+        centre_names.setdefault((name or '').lower(), []).append(_s(pk))
+
+    target_exam_names = {}
+    for pk, name in TargetExam.objects.values_list('pk', 'name'):
+        target_exam_names.setdefault((name or '').lower(), []).append(_s(pk))
+
+    catalog = {
+        'v': _version(),  # read before the queries: every change bumped up to here is included
+        'tests': _rows(),
+        'centre_codes': centre_codes,
+        'centre_names': centre_names,
+        'target_exam_names': target_exam_names,
+    }
+    cache.set(CATALOG_KEY, catalog, timeout=CATALOG_TTL)
+    return catalog
+
+
+def _version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = int(time.time() * 1000)
+        cache.add(VERSION_KEY, version, timeout=None)
+        version = cache.get(VERSION_KEY, version)
+    return version
+
+
+def _bump_version():
+    """Move the version atomically (never backwards); returns it, or None if the cache failed."""
+    try:
+        try:
+            return cache.incr(VERSION_KEY)
+        except ValueError:  # not set yet, or evicted
+            cache.add(VERSION_KEY, int(time.time() * 1000), timeout=None)
+            return cache.incr(VERSION_KEY)
+    except Exception:
+        return None
+
+
+def get_catalog(version=None):
+    """The catalog, from a per-thread copy when the version hasn't moved."""
+    version = _version() if version is None else version
+    local = getattr(_local, 'catalog', None)
+    if local is not None and local[0] == version:
+        return local[1]
+    catalog = cache.get(CATALOG_KEY)
+    if catalog is None or catalog.get('v', 0) < version:
+        # missing, or older than a change that couldn't be applied in place
+        catalog = build_catalog()
+    _local.catalog = (version, catalog)
+    return catalog
+
+
+def invalidate_visibility_index():
+    """Drop the whole catalog (centre / target exam / exam type changes)."""
+    try:
+        cache.delete(CATALOG_KEY)
+    except Exception:
+        pass
+    _bump_version()
+
+
+def refresh_test_visibility(test_pk):
+    """
+    Re-read one test's row into the cached catalog (or drop it if deleted).
+    The row is applied in place only when the catalog is current; otherwise
+    (lock contention, a missing or stale catalog) the version is bumped and
+    the next reader rebuilds.
+    """
+    try:
+        if not cache.add(LOCK_KEY, 1, timeout=30):
+            _bump_version()
+            return
+        try:
+            current = _version()
+            catalog = cache.get(CATALOG_KEY)
+            if catalog is None or catalog.get('v') != current:
+                _bump_version()
+                return
+            catalog['tests'].pop(_s(test_pk), None)
+            catalog['tests'].update(_rows(test_pk))
+            v = _bump_version()
+            if v is None:
+                return
+            # A bump from another writer in between means its change isn't in here:
+            # keep the older stamp so readers rebuild
+            catalog['v'] = v if v == current + 1 else current
+            cache.set(CATALOG_KEY, catalog, timeout=CATALOG_TTL)
+        finally:
+            cache.delete(LOCK_KEY)
+    except Exception as e:
+        print(f"[visibility] Failed to refresh test {test_pk}: {e}")
+        invalidate_visibility_index()
+
+
+# ── Eligibility ───────────────────────────────────────────────────────────────
+
+def student_profile(user):
+    """The attributes that decide test eligibility, normalised for hashing."""
+    instances = getattr(user, 'exam_instance_names', '') or ''
+    if not isinstance(instances, str):
+        instances = ''
+    return (
+        str(getattr(user, 'centre_code', '') or '').lower().strip(),
+        str(getattr(user, 'centre_name', '') or '').lower().strip(),
+        _s(getattr(user, 'class_level_id', None)),
+        _s(getattr(user, 'target_exam_id', None)),
+        tuple(sorted({x.strip().lower() for x in instances.split(',') if x.strip()})),
+        _s(getattr(user, 'session_id', None)),
+    )
+
+
+def _eligible(catalog, profile):
+    c_code, c_name, class_level, target_exam, instances, session = profile
+
+    # Centre filter: tests allotted to any centre matching the student's code or name
+    centre_ids = set()
+    if c_code or c_name:
+        centre_ids.update(catalog['centre_codes'].get(c_code, []))
+        centre_ids.update(catalog['centre_names'].get(c_name, []))
+
+    # Target exams: the student's own plus every ERP exam instance matched by name
+    target_ids = set()
+    if target_exam:
+        target_ids.add(target_exam)
+    for inst in instances:
+        target_ids.update(catalog['target_exam_names'].get(inst, []))
+
+    eligible = []
+    for pk, row in catalog['tests'].items():
+        if row['hidden']:
+            continue
+        if not centre_ids.intersection(row['centres']):
+            continue
+        if class_level:
+            if row['class_level'] != class_level and class_level not in row['class_levels']:
+                continue
+        elif row['class_level'] is not None:
+            continue
+        if target_ids and not target_ids.intersection(row['target_exams']):
+            continue
+        if session and not (
+            row['study_planner'] or row['session'] == session or session in row['sessions']
+        ):
+            continue
+        eligible.append(pk)
+    return eligible
+
+
+def eligible_test_ids(user):
+    """Test pks (as strings) the student is eligible for, memoised per profile."""
+    version = _version()
+    profile = student_profile(user)
+    digest = hashlib.sha1(repr(profile).encode()).hexdigest()[:16]
+    key = f"test_eligibility_{version}_{digest}"
+    ids = cache.get(key)
+    if ids is None:
+        ids = _eligible(get_catalog(version), profile)
+        cache.set(key, ids, timeout=ELIGIBILITY_TTL)
+    return ids
+
+
+def student_test_ids(user, submitted_ids=()):
+    """Everything the student may list: eligible tests plus tests they already
+    submitted, minus OMR tests whose results are not yet published."""
+    ids = set(eligible_test_ids(user))
+    submitted = {str(pk) for pk in submitted_ids}
+    if submitted - ids:
+        tests = get_catalog()['tests']
+        ids.update(pk for pk in submitted if not (tests.get(pk) or {}).get('hidden'))
+    return list(ids)
@@ -74,24 +74,59 @@ const AIInsights = ({ isDarkMode }) => {
         setInput('');
         setIsChatLoading(true);
 
+        // The reply streams in as NDJSON lines ({delta} ..., then {status, reply})
+        let replyShown = false;
+        let text = '';
+        const setReply = (text) => {
+            const append = !replyShown;
+            replyShown = true;
+            setMessages(prev => append
+                ? [...prev, { role: 'assistant', text }]
+                : [...prev.slice(0, -1), { role: 'assistant', text }]);
+        };
+
         try {
             const apiUrl = getApiUrl();
-            const res = await axios.post(
-                `${apiUrl}/api/student/ai-mentor/chat/`,
-                {
+            const res = await fetch(`${apiUrl}/api/student/ai-mentor/chat/?stream=1`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json', Authorization: `Bearer ${token}` },
+                body: JSON.stringify({
                     message: msg,
                     // Send last 10 messages as chat history (excluding the one we just sent)
                     messages: messages.slice(-10),
-                },
-                { headers: { Authorization: `Bearer ${token}` } }
-            );
-            const reply = res.data.reply || 'I could not generate a response. Please try again.';
-            setMessages(prev => [...prev, { role: 'assistant', text: reply }]);
+                }),
+            });
+            if (!res.ok || !res.body) {
+                const data = await res.json().catch(() => ({}));
+                setReply(data.reply || data.error || 'I could not generate a response. Please try again.');
+                return;
+            }
+
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffered = '';
+            let finished = false;
+            while (!finished) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffered += decoder.decode(value, { stream: true });
+                const lines = buffered.split('\n');
+                buffered = lines.pop();
+                for (const line of lines) {
+                    if (!line.trim()) continue;
+                    const event = JSON.parse(line);
+                    if (event.delta) {
+                        text += event.delta;
+                    } else if (event.status) {
+                        text = event.reply || text;
+                        finished = true;
+                    }
+                }
+                if (text) setReply(text);
+            }
+            if (!text) setReply('I could not generate a response. Please try again.');
         } catch (err) {
-            setMessages(prev => [...prev, {
-                role: 'assistant',
-                text: '⚠️ I encountered a connection issue. Please check your internet and try again.'
-            }]);
+            setReply(text || '⚠️ I encountered a connection issue. Please check your internet and try again.');
         } finally {
             setIsChatLoading(false);
         }
@@ -266,7 +301,7 @@ const AIInsights = ({ isDarkMode }) => {
                             ))}
 
                             {/* Typing Indicator */}
-                            {isChatLoading && (
+                            {isChatLoading && messages[messages.length - 1]?.role === 'user' && (
                                 <motion.div initial={{ opacity: 0, y: 10 }} animate={{ opacity: 1, y: 0 }} className="flex justify-start">
                                     <div className="flex gap-4 max-w-[85%]">
                                         <div className="w-8 h-8 shrink-0 rounded-[5px] bg-gradient-to-br from-orange-500 to-indigo-600 text-white flex items-center justify-center">
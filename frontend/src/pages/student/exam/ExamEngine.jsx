@@ -67,6 +67,8 @@ const ExamEngine = () => {
     const [showResumeModal, setShowResumeModal] = useState(false);
     const isSubmittedRef = useRef(false);
     const debounceTimerRef = useRef(null);
+    // Last responses the server acknowledged ({qId: JSON string}); null until the first save
+    const lastSyncedRef = useRef(null);
 
     const handleReturnToDashboard = () => {
         try {
@@ -127,12 +129,30 @@ const ExamEngine = () => {
         if (isSubmitted || isLocked || !paperData) return;
         try {
             setSyncStatus('syncing');
-            await axios.post(`${getApiUrl()}/api/tests/${testId}/save_progress/`, {
-                responses: getBackendResponses(),
-                time_spent: parseInt((paperData.duration || 180) * 60) - timeLeft
-            }, {
+            const current = getBackendResponses();
+            const snapshot = {};
+            Object.entries(current).forEach(([qId, data]) => { snapshot[qId] = JSON.stringify(data); });
+
+            // First save sends everything; later saves only send what changed (null = cleared)
+            const payload = { time_spent: parseInt((paperData.duration || 180) * 60) - timeLeft };
+            const lastSynced = lastSyncedRef.current;
+            if (lastSynced === null) {
+                payload.responses = current;
+            } else {
+                const changes = {};
+                Object.keys(snapshot).forEach((qId) => {
+                    if (lastSynced[qId] !== snapshot[qId]) changes[qId] = current[qId];
+                });
+                Object.keys(lastSynced).forEach((qId) => {
+                    if (!(qId in snapshot)) changes[qId] = null;
+                });
+                payload.changes = changes;
+            }
+
+            await axios.post(`${getApiUrl()}/api/tests/${testId}/save_progress/`, payload, {
                 headers: { 'Authorization': `Bearer ${token}` }
             });
+            lastSyncedRef.current = snapshot;
             setSyncStatus('synced');
             console.log("Progress auto-saved to cloud...");
         } catch (err) {
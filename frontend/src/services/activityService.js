@@ -1,29 +1,90 @@
 import axios from 'axios';
 import { getBaseApiUrl } from './apiConfig';
 
-const logActivity = async (activityType, path, metadata = {}, duration = 0) => {
+// Events are queued and sent to /api/activity-logs/batch/ together instead of
+// one POST per heartbeat. Each event carries its client time (`ts`); the server
+// dates it relative to `sent_at`, so batching doesn't shift timestamps.
+const FLUSH_AT = 10;                    // ~10 minutes of heartbeats per request
+const FLUSH_INTERVAL_MS = 10 * 60 * 1000;
+const MAX_QUEUED = 200;                 // server's per-request limit
+
+let queue = [];
+let flushTimer = null;
+let flushing = false;
+
+const batchUrl = () => `${getBaseApiUrl()}/api/activity-logs/batch/`;
+
+export const flushActivity = async ({ keepalive = false } = {}) => {
     const token = localStorage.getItem('auth_token');
-    const apiUrl = getBaseApiUrl();
+    if (!token || queue.length === 0 || flushing) return;
+
+    const events = queue;
+    queue = [];
+    const body = { sent_at: Date.now(), events };
 
-    if (!token) {
-        // console.warn('[Activity] Skipped: No auth_token');
+    if (keepalive) {
+        // Page is going away: axios can't outlive it, fetch with keepalive can
+        try {
+            fetch(batchUrl(), {
+                method: 'POST',
+                keepalive: true,
+                headers: { 'Content-Type': 'application/json', 'Authorization': `Bearer ${token}` },
+                body: JSON.stringify(body)
+            });
+        } catch (error) {
+            // nothing more we can do during unload
+        }
         return;
     }
 
-    // console.log(`[Activity] Logging: ${activityType} on ${path}`, { metadata, duration });
-
+    flushing = true;
     try {
-        const response = await axios.post(`${apiUrl}/api/activity-logs/`, {
-            activity_type: activityType,
-            path: path,
-            metadata: metadata,
-            duration: duration
-        }, {
+        await axios.post(batchUrl(), body, {
             headers: { 'Authorization': `Bearer ${token}` }
         });
-        // console.log('[Activity] Success:', response.status);
     } catch (error) {
-        // console.error('[Activity] Error:', error.response?.data || error.message);
+        // Network / server trouble: keep the events for the next flush (bounded)
+        if (!error.response || error.response.status >= 500) {
+            queue = events.concat(queue).slice(-MAX_QUEUED);
+        }
+    } finally {
+        flushing = false;
+    }
+};
+
+const scheduleFlush = () => {
+    if (flushTimer) return;
+    flushTimer = setTimeout(() => {
+        flushTimer = null;
+        flushActivity();
+    }, FLUSH_INTERVAL_MS);
+};
+
+if (typeof window !== 'undefined') {
+    window.addEventListener('pagehide', () => flushActivity({ keepalive: true }));
+    document.addEventListener('visibilitychange', () => {
+        if (document.visibilityState === 'hidden') flushActivity({ keepalive: true });
+    });
+}
+
+const logActivity = (activityType, path, metadata = {}, duration = 0) => {
+    if (!localStorage.getItem('auth_token')) {
+        return;
+    }
+
+    queue.push({
+        activity_type: activityType,
+        path: path,
+        metadata: metadata,
+        duration: duration,
+        ts: Date.now()
+    });
+    if (queue.length > MAX_QUEUED) queue = queue.slice(-MAX_QUEUED);
+
+    if (queue.length >= FLUSH_AT) {
+        flushActivity();
+    } else {
+        scheduleFlush();
     }
 };
 
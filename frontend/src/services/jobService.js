@@ -0,0 +1,55 @@
+import axios from 'axios';
+
+// Heavy admin actions (result generation, OMR / bulk uploads, AI extraction,
+// result merging) run as background jobs on the server (api/jobs.py): posted
+// with ?async=1 they answer 202 {job_id, status_url} straight away, and the
+// job's outcome is polled from /api/jobs/<id>/ instead of holding a request
+// open past the gateway timeout.
+//
+// postJob() resolves / rejects like axios.post, so callers keep reading
+// res.data and err.response?.data?.error as before.
+const POLL_INTERVAL_MS = 2000;
+const MAX_POLL_ERRORS = 5;          // consecutive network errors before giving up
+
+const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
+const jobError = (status, data) => {
+    const error = new Error(data?.error || data?.message || `Request failed with status code ${status}`);
+    error.response = { status, data };
+    return error;
+};
+
+export const postJob = async (url, data, config = {}, { onProgress } = {}) => {
+    const res = await axios.post(url, data, {
+        ...config,
+        params: { ...(config.params || {}), async: 1 }
+    });
+    // Endpoints that don't run as jobs just answer synchronously
+    if (res.status !== 202 || !res.data?.job_id) return res;
+
+    const statusUrl = new URL(res.data.status_url || `/api/jobs/${res.data.job_id}/`, url).toString();
+    const pollConfig = { headers: { Authorization: config.headers?.Authorization } };
+    let errors = 0;
+    for (;;) {
+        await sleep(POLL_INTERVAL_MS);
+        let job;
+        try {
+            job = (await axios.get(statusUrl, pollConfig)).data;
+            errors = 0;
+        } catch (err) {
+            if (err.response && err.response.status < 500) throw err;
+            if (++errors >= MAX_POLL_ERRORS) throw err;
+            continue;
+        }
+        if (onProgress && job.progress) onProgress(job.progress);
+
+        if (job.status === 'succeeded' || job.status === 'failed') {
+            const result = job.result;
+            if (result && typeof result.status_code === 'number') {
+                if (result.status_code >= 400) throw jobError(result.status_code, result.body);
+                return { status: result.status_code, data: result.body };
+            }
+            throw jobError(500, { error: job.error || 'Job failed.' });
+        }
+    }
+};
@@ -10,6 +10,7 @@ import toast from 'react-hot-toast';
 import { motion, AnimatePresence } from 'framer-motion';
 import { useTheme } from '../../context/ThemeContext';
 import { useAuth } from '../../context/AuthContext';
+import { postJob } from '../../services/jobService';
 import SmartEditor from './components/SmartEditor';
 import SectionRegistry from '../sections/SectionRegistry';
 import ChapterTestSettings from './components/ChapterTestSettings';
@@ -1060,7 +1061,7 @@ const MasterDataManagement = ({ activeSubTab, setActiveSubTab, onBack, onNavigat
         try {
             const apiUrl = getApiUrl();
             const config = getAuthConfig();
-            const res = await axios.post(`${apiUrl}/api/master-data/${currentTabConfig.endpoint}/bulk-upload/`, formData, {
+            const res = await postJob(`${apiUrl}/api/master-data/${currentTabConfig.endpoint}/bulk-upload/`, formData, {
                 headers: { ...config.headers, 'Content-Type': 'multipart/form-data' }
             });
 
@@ -13,6 +13,7 @@ import {
 } from 'lucide-react';
 import { useTheme } from '../../context/ThemeContext';
 import { useAuth } from '../../context/AuthContext';
+import { postJob } from '../../services/jobService';
 import SmartEditor from './components/SmartEditor';
 import katex from 'katex';
 import 'katex/dist/katex.min.css';
@@ -328,7 +329,7 @@ const QuestionBank = ({ onNavigate, isSelectionMode = false, onAssignQuestions,
 
         try {
             const apiUrl = getApiUrl();
-            const res = await axios.post(`${apiUrl}/api/questions/extract-ai/`, formData, {
+            const res = await postJob(`${apiUrl}/api/questions/extract-ai/`, formData, {
                 headers: {
                     ...config.headers,
                     'Content-Type': 'multipart/form-data'
@@ -500,10 +501,20 @@ const QuestionBank = ({ onNavigate, isSelectionMode = false, onAssignQuestions,
         activeFetchKeysRef.current.add(fetchKey);
         try {
             const apiUrl = getApiUrl();
-            const response = await axios.get(`${apiUrl}/api/questions/`, config);
-            const data = response.data;
-            const questionList = Array.isArray(data) ? data : (data.results || data.questions || []);
-            setQuestions(questionList);
+            // Page through the cursor listing so the first questions render
+            // before the whole bank has been read
+            let cursor = null;
+            let questionList = [];
+            do {
+                const params = new URLSearchParams({ limit: '500' });
+                if (cursor) params.append('cursor', cursor);
+                const response = await axios.get(`${apiUrl}/api/questions/?${params.toString()}`, config);
+                const data = response.data;
+                const page = Array.isArray(data) ? data : (data.results || []);
+                questionList = [...questionList, ...page];
+                setQuestions(questionList);
+                cursor = Array.isArray(data) ? null : data.next_cursor;
+            } while (cursor);
         } catch (err) {
             console.error("Failed to fetch questions", err);
         } finally {
@@ -892,7 +903,7 @@ const QuestionBank = ({ onNavigate, isSelectionMode = false, onAssignQuestions,
             const formData = new FormData();
             formData.append('file', selectedFile);
 
-            const response = await axios.post(`${apiUrl}/api/questions/bulk-upload/`, formData, {
+            const response = await postJob(`${apiUrl}/api/questions/bulk-upload/`, formData, {
                 headers: {
                     'Authorization': `Bearer ${token || localStorage.getItem('auth_token')}`
                 },
@@ -1754,7 +1765,7 @@ const QuestionBank = ({ onNavigate, isSelectionMode = false, onAssignQuestions,
                     </div>
                 </div>
 
-                {isLoadingQuestions ? (
+                {isLoadingQuestions && questions.length === 0 ? (
                     <div className="flex flex-col gap-4 mt-8 animate-pulse">
                         {Array(5).fill(0).map((_, i) => (
                             <div key={i} className={`p-8 rounded-[5px] border flex flex-col lg:flex-row gap-6 ${isDarkMode ? 'bg-white/5 border-white/5' : 'bg-white border-slate-200 shadow-sm'}`}>
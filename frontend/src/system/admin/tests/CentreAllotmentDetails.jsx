@@ -6,6 +6,7 @@ import {
 } from 'lucide-react';
 import { useAuth } from '../../../context/AuthContext';
 import { useTheme } from '../../../context/ThemeContext';
+import { postJob } from '../../../services/jobService';
 
 const CentreAllotmentDetails = ({ test, onBack }) => {
     const { getApiUrl, token } = useAuth();
@@ -89,7 +90,7 @@ const CentreAllotmentDetails = ({ test, onBack }) => {
         setIsActionLoading(true);
         try {
             const apiUrl = getApiUrl();
-            const res = await axios.post(`${apiUrl}/api/tests/${test.id}/generate_result/`, {}, getAuthConfig());
+            const res = await postJob(`${apiUrl}/api/tests/${test.id}/generate_result/`, {}, getAuthConfig());
             triggerAlert(res.data.message || 'Results generated successfully!', 'success');
             // Refresh to show updated test status if needed
         } catch (err) {
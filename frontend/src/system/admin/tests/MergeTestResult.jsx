@@ -5,6 +5,7 @@ import {
 } from 'lucide-react';
 import { useTheme } from '../../../context/ThemeContext';
 import { useAuth } from '../../../context/AuthContext';
+import { postJob } from '../../../services/jobService';
 import axios from 'axios';
 
 const MergeTestResult = ({ isOMR = false }) => {
@@ -129,7 +130,7 @@ const MergeTestResult = ({ isOMR = false }) => {
         activeFetchKeysRef.current.add(fetchKey);
         try {
             const apiUrl = getApiUrl();
-            const res = await axios.post(
+            const res = await postJob(
                 `${apiUrl}/api/tests/merge_results/`,
                 { test_ids: selectedTests },
                 axiosConfig()
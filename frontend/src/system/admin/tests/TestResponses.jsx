@@ -2,6 +2,7 @@ import React, { useState, useEffect, useRef, useMemo } from 'react';
 import { FileSearch, Search, RefreshCw, Users, FileText, ChevronLeft, ChevronRight, Trash2, Unlock, CheckCircle, Filter, Layers, UploadCloud, X, AlertTriangle, Edit3, CheckSquare, Download, FileSpreadsheet } from 'lucide-react';
 import { useTheme } from '../../../context/ThemeContext';
 import { useAuth } from '../../../context/AuthContext';
+import { postJob } from '../../../services/jobService';
 import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import toast from 'react-hot-toast';
@@ -352,7 +353,7 @@ const TestResponses = ({ isOMR = false }) => {
 
         try {
             const apiUrl = getApiUrl();
-            const res = await axios.post(`${apiUrl}/api/tests/${uploadModal.testId}/upload_omr_excel/`, formData, {
+            const res = await postJob(`${apiUrl}/api/tests/${uploadModal.testId}/upload_omr_excel/`, formData, {
                 headers: { 
                     Authorization: `Bearer ${token}`,
                     'Content-Type': 'multipart/form-data'
@@ -460,7 +461,7 @@ const TestResponses = ({ isOMR = false }) => {
         setGeneratingId(testId);
         try {
             const apiUrl = getApiUrl();
-            const res = await axios.post(`${apiUrl}/api/tests/${testId}/generate_result/`, {}, {
+            const res = await postJob(`${apiUrl}/api/tests/${testId}/generate_result/`, {}, {
                 headers: { Authorization: `Bearer ${token}` }
             });
             setSuccessModal({